@@ -0,0 +1,38 @@
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+# The sources are flat modules that import each other by name (as when running from src/).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from ontology_classes import Paper  # noqa: E402
+from synthetic_corpus import CorpusSpec, SyntheticCorpus  # noqa: E402
+
+_DOCUMENTS = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption("--corpus-sizes", default="1000",
+                     help="Comma separated numbers of synthetic papers to benchmark, e.g. 1000,10000,100000")
+
+
+def pytest_generate_tests(metafunc):
+    if "corpus_size" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("corpus_sizes").split(",")]
+        metafunc.parametrize("corpus_size", sizes, ids=[f"{size}papers" for size in sizes])
+
+
+@pytest.fixture
+def documents(corpus_size):
+    """
+    The (filename, TEI bytes) pairs of the synthetic corpus of corpus_size papers, generated once per session.
+    """
+    if corpus_size not in _DOCUMENTS:
+        _DOCUMENTS[corpus_size] = list(SyntheticCorpus(CorpusSpec(papers=corpus_size)).documents())
+    return _DOCUMENTS[corpus_size]
+
+
+def parse_documents(documents):
+    return [Paper(tree=ET.ElementTree(ET.fromstring(content)), filename=filename) for filename, content in documents]
@@ -0,0 +1,140 @@
+"""
+Micro-benchmarks of the pipeline stages on synthetic GROBID corpora, each stage timed in isolation on fresh input
+(see the Benchmarks section of the README).
+"""
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import parse_documents
+from consolidation import TEI, ConsolidationIndex
+from network_analytics import analyze_networks
+from paper_index import resolve_papers
+from parquet_export import TableBuilder
+from rdfparser import RDFParser
+
+ROUNDS = 3
+
+
+class DiscardSink:
+    """
+    An RDFParser sink that only counts the triples, so the benchmark does not time a serializer.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def addN(self, quads):
+        for _ in quads:
+            self.count += 1
+
+
+class PaperSpace:
+    def __init__(self, papers):
+        self.papers = papers
+        self.embeddings = None
+
+
+def resolved(documents):
+    return resolve_papers(parse_documents(documents))[1]
+
+
+@pytest.fixture
+def paper_space():
+    return pytest.importorskip("paper_space")
+
+
+def paper_set(paper_space, documents):
+    """
+    A PaperSet over the resolved corpus without the models (encoder, NER and topic model), which the linking stages
+    do not use.
+    """
+    space = paper_space.PaperSet.__new__(paper_space.PaperSet)
+    space.title_similarity_threshold = 0.8
+    space.papers = resolved(documents)
+    return space
+
+
+def record(benchmark, documents, items=None):
+    benchmark.extra_info["documents"] = len(documents)
+    if items is not None:
+        benchmark.extra_info["items"] = items
+        # There are no stats with --benchmark-disable
+        if benchmark.stats:
+            benchmark.extra_info["items_per_second"] = items / benchmark.stats.stats.mean
+
+
+@pytest.mark.benchmark(group="parse_tei")
+def test_parse_tei(benchmark, documents):
+    papers = benchmark.pedantic(parse_documents, args=(documents,), rounds=ROUNDS)
+    record(benchmark, documents, len(papers))
+
+
+@pytest.mark.benchmark(group="index_papers")
+def test_index_papers(benchmark, documents):
+    papers = benchmark.pedantic(resolve_papers, setup=lambda: ((parse_documents(documents),), {}), rounds=ROUNDS)[1]
+    record(benchmark, documents, len(papers))
+
+
+@pytest.mark.benchmark(group="link_authors")
+def test_link_authors(benchmark, paper_space, documents):
+    authors = benchmark.pedantic(lambda space: space.link_and_get_all_authors(),
+                                 setup=lambda: ((paper_set(paper_space, documents),), {}), rounds=ROUNDS)
+    record(benchmark, documents, len(authors))
+
+
+@pytest.mark.benchmark(group="link_affiliations")
+def test_link_affiliations(benchmark, paper_space, documents):
+    def setup():
+        space = paper_set(paper_space, documents)
+        space.all_authors = space.link_and_get_all_authors()
+        return (space,), {}
+
+    affiliations = benchmark.pedantic(lambda space: space.link_and_get_affiliations(), setup=setup, rounds=ROUNDS)
+    record(benchmark, documents, len(affiliations))
+
+
+@pytest.mark.benchmark(group="link_journals")
+def test_link_journals(benchmark, paper_space, documents):
+    journals = benchmark.pedantic(lambda space: space.link_and_get_all_journals(),
+                                  setup=lambda: ((paper_set(paper_space, documents),), {}), rounds=ROUNDS)
+    record(benchmark, documents, len(journals))
+
+
+@pytest.mark.benchmark(group="analyze_networks")
+def test_analyze_networks(benchmark, documents):
+    papers = resolved(documents)
+    benchmark.pedantic(analyze_networks, args=(papers,), rounds=ROUNDS)
+    record(benchmark, documents, len(papers))
+
+
+@pytest.mark.benchmark(group="rdf_build")
+def test_rdf_build(benchmark, documents):
+    space = PaperSpace(resolved(documents))
+    kg = benchmark.pedantic(lambda: RDFParser(space, hashed_iris=True, sink=DiscardSink()), rounds=ROUNDS)
+    record(benchmark, documents, kg.triple_count)
+
+
+@pytest.mark.benchmark(group="parquet_tables")
+def test_parquet_tables(benchmark, documents):
+    space = PaperSpace(resolved(documents))
+    tables = benchmark.pedantic(lambda: TableBuilder(space).build(), rounds=ROUNDS)
+    record(benchmark, documents, sum(table.num_rows for table in tables.values()))
+
+
+@pytest.mark.benchmark(group="consolidate")
+def test_consolidate(benchmark, documents):
+    # The index learns the papers of the corpus and the references that carry a DOI, as after a first run
+    index = ConsolidationIndex()
+    for paper in parse_documents(documents):
+        index.add_paper(paper)
+    for _, content in documents:
+        index.resolve(ET.fromstring(content))
+
+    def consolidate(roots):
+        return sum(len(index.resolve(root)) for root in roots)
+
+    roots = [ET.fromstring(content) for _, content in documents]
+    benchmark.pedantic(consolidate, setup=lambda: (([ET.fromstring(content) for _, content in documents],), {}),
+                       rounds=ROUNDS)
+    record(benchmark, documents, sum(1 for root in roots for _ in root.iter(f"{TEI}biblStruct")))
@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+from instrumentation import metrics
+from ontology_classes import normalize_identifier
+from title_index import extract_year, normalize_title
+
+TEI = "{http://www.tei-c.org/ns/1.0}"
+# Keeps the TEI namespace as the default one when the documents are written back
+ET.register_namespace("", TEI[1:-1])
+# TEI idno types of the identifier schemes of normalize_identifier
+IDNO_TYPES = {"doi": "DOI", "arxiv": "arXiv", "pmid": "PMID", "pmcid": "PMCID", "md5": "MD5"}
+# The references of a TEI document
+BIBLS = f"{TEI}text/{TEI}back/{TEI}div/{TEI}listBibl/{TEI}biblStruct"
+_NON_ALPHA = re.compile(r'[^a-z]')
+
+
+def _surname(surname):
+    surname = _NON_ALPHA.sub('', (surname or "").lower())
+    return surname if surname and surname != "unknown" else None
+
+
+def bibl_record(bibl):
+    """
+    Reads the bibliographical data of a TEI biblStruct element as Paper.get_references does.
+
+    Parameters:
+        bibl (Element): The biblStruct element.
+
+    Returns:
+        dict: The title, authors ([forename, surname] pairs), date, journal and identifiers of the reference.
+    """
+    analytic, monogr = bibl.find(f"{TEI}analytic"), bibl.find(f"{TEI}monogr")
+    title = analytic.find(f"{TEI}title") if analytic is not None else None
+    journal = monogr.find(f"{TEI}title") if monogr is not None else None
+    if title is None:
+        title, journal = journal, None
+    authors = [part for part in (analytic, monogr) if part is not None and part.find(f"{TEI}author") is not None]
+    date = bibl.find(f"{TEI}monogr/{TEI}imprint/{TEI}date")
+    identifiers = {}
+    for idno in bibl.iter(f"{TEI}idno"):
+        identifier = normalize_identifier(idno.get("type"), idno.text)
+        if identifier and identifier[0] not in identifiers:
+            identifiers[identifier[0]] = identifier[1]
+    return {
+        "title": title.text if title is not None else None,
+        "authors": [[author.findtext(f"{TEI}persName/{TEI}forename"), author.findtext(f"{TEI}persName/{TEI}surname")]
+                    for author in authors[0].findall(f"{TEI}author")] if authors else [],
+        "date": (date.get("when") or date.text) if date is not None else None,
+        "journal": journal.text if journal is not None else None,
+        "identifiers": identifiers,
+    }
+
+
+def paper_record(paper):
+    """
+    Returns the record of a physical Paper, so that references to it are resolved to its identifiers.
+    """
+    return {"title": paper.title, "authors": [[author.forename, author.surname] for author in paper.authors or []],
+            "date": None, "journal": paper.journal.name if paper.journal else None,
+            "identifiers": dict(paper.identifiers)}
+
+
+def citation_text(record):
+    """
+    Writes a record as a raw bibliographical reference, the input of GROBID's processCitationList.
+    """
+    authors = ", ".join(" ".join(part for part in author if part) for author in record["authors"])
+    parts = [authors, record["title"], record["journal"], str(extract_year(record["date"]) or "")]
+    return ". ".join(part for part in parts if part) + "."
+
+
+def apply_record(bibl, record):
+    """
+    Completes a biblStruct element with a resolved record: its identifiers, title, date and, if the reference has
+    none, its authors.
+    """
+    part = bibl.find(f"{TEI}analytic")
+    if part is None or part.find(f"{TEI}title") is None:
+        part = bibl.find(f"{TEI}monogr")
+    if part is None:
+        part = ET.SubElement(bibl, f"{TEI}monogr")
+    current = bibl_record(bibl)
+    title = part.find(f"{TEI}title")
+    if title is None:
+        title = ET.SubElement(part, f"{TEI}title")
+    title.text = record["title"]
+    if not current["authors"]:
+        position = list(part).index(title) + 1
+        for forename, surname in record["authors"]:
+            author = ET.Element(f"{TEI}author")
+            name = ET.SubElement(author, f"{TEI}persName")
+            if forename:
+                ET.SubElement(name, f"{TEI}forename", type="first").text = forename
+            ET.SubElement(name, f"{TEI}surname").text = surname
+            part.insert(position, author)
+            position += 1
+    for scheme, value in record["identifiers"].items():
+        if scheme not in current["identifiers"]:
+            ET.SubElement(part, f"{TEI}idno", type=IDNO_TYPES[scheme]).text = value
+    year = extract_year(record["date"])
+    if current["date"] is None and year is not None:
+        monogr = bibl.find(f"{TEI}monogr")
+        if monogr is None:
+            monogr = ET.SubElement(bibl, f"{TEI}monogr")
+        imprint = monogr.find(f"{TEI}imprint")
+        if imprint is None:
+            imprint = ET.SubElement(monogr, f"{TEI}imprint")
+        ET.SubElement(imprint, f"{TEI}date", type="published", when=str(year)).text = str(year)
+
+
+class ConsolidationIndex:
+    """
+    This class is a local bibliographical database that resolves the references of GROBID documents without
+    consolidating every one of them against an external service. It is built from the references that were already
+    resolved (they have a DOI or another persistent identifier) and from the papers of the corpus, and looked up by
+    identifier or by normalized title, first author surname and year. Every record is appended to a JSON Lines file,
+    so the index grows across runs.
+
+    Parameters:
+        path (str, optional): JSON Lines file of the index, loaded if it exists.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.records = []
+        self.by_identifier = {}
+        self.by_title = {}
+        # Documents are processed from several threads by the ingestion service
+        self.lock = threading.Lock()
+        self.file = None
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.add(json.loads(line), persist=False)
+            logging.info(f'Loaded {len(self.records)} consolidation records from {path}')
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def keys(record):
+        authors = record["authors"]
+        return (normalize_title(record["title"]), _surname(authors[0][1]) if authors else None,
+                extract_year(record["date"]))
+
+    def find_index(self, record):
+        for identifier in record["identifiers"].items():
+            index = self.by_identifier.get(identifier)
+            if index is not None:
+                return index
+        title, author, year = self.keys(record)
+        for index in self.by_title.get(title, ()):
+            _, other_author, other_year = self.keys(self.records[index])
+            agree = [a == b for a, b in ((author, other_author), (year, other_year)) if a and b]
+            if agree and all(agree):
+                return index
+        return None
+
+    def find(self, record):
+        """
+        Looks a reference up by any of its identifiers, then by its normalized title. A title match must agree on
+        the first author surname and the year where both are known, and on at least one of them.
+
+        Parameters:
+            record (dict): The record of the reference, see bibl_record.
+
+        Returns:
+            dict: The resolved record, or None.
+        """
+        index = self.find_index(record)
+        return self.records[index] if index is not None else None
+
+    def add(self, record, persist=True):
+        """
+        Adds a resolved record, or merges its identifiers, date and authors into the record it matches.
+
+        Returns:
+            bool: Whether the index changed.
+        """
+        if not normalize_title(record["title"]):
+            return False
+        with self.lock:
+            index = self.find_index(record)
+            if index is None:
+                index = len(self.records)
+                self.records.append({"title": record["title"], "authors": record["authors"], "date": record["date"],
+                                     "journal": record["journal"], "identifiers": {}})
+                self.by_title.setdefault(normalize_title(record["title"]), []).append(index)
+            existing = self.records[index]
+            new = [identifier for identifier in record["identifiers"].items()
+                   if identifier[0] not in existing["identifiers"]]
+            if not new and (existing["date"] or not record["date"]) and (existing["authors"] or not record["authors"]):
+                return False
+            existing["date"] = existing["date"] or record["date"]
+            existing["authors"] = existing["authors"] or record["authors"]
+            for identifier in new:
+                existing["identifiers"][identifier[0]] = identifier[1]
+                self.by_identifier.setdefault(identifier, index)
+            if persist and self.path is not None:
+                if self.file is None:
+                    self.file = open(self.path, "a", encoding="utf-8")
+                self.file.write(json.dumps(existing) + "\n")
+                self.file.flush()
+            return True
+
+    def add_paper(self, paper):
+        """
+        Adds a physical Paper and the references of its TEI document that have an identifier (resolved by GROBID, the
+        index or a previous run), so that an index started on an already processed corpus knows them.
+
+        Returns:
+            int: The number of records that changed the index.
+        """
+        added = int(self.add(paper_record(paper)))
+        if paper.tree:
+            for bibl in paper.tree.getroot().iterfind(BIBLS):
+                record = bibl_record(bibl)
+                if record["identifiers"] and self.add(record):
+                    added += 1
+        return added
+
+    def resolve(self, root):
+        """
+        Resolves the references of a GROBID TEI document in place.
+
+        Parameters:
+            root (Element): The TEI element of the document.
+
+        Returns:
+            list: The biblStruct elements that were not resolved.
+        """
+        run_metrics = metrics()
+        misses, hits = [], 0
+        for bibl in root.iterfind(BIBLS):
+            record = bibl_record(bibl)
+            if not record["title"]:
+                continue
+            match = self.find(record)
+            if match is not None:
+                apply_record(bibl, match)
+                # The reference may know the date or the authors of a record that was built from a paper
+                self.add(bibl_record(bibl))
+                hits += 1
+            elif record["identifiers"]:
+                # GROBID found an identifier in the reference itself
+                self.add(record)
+            else:
+                misses.append(bibl)
+        run_metrics.count("consolidation_hits", hits)
+        run_metrics.count("consolidation_misses", len(misses))
+        return misses
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,193 @@
+from iri_registry import normalize_key
+from ontology_classes import Author, Affiliation, Journal
+
+FIELDS = ("author", "affiliation", "journal", "cluster", "topic", "acknowledges", "physical")
+
+
+def author_key(author):
+    """
+    Returns the index key of an author, given as an Author or as a (forename, surname) tuple.
+    """
+    if isinstance(author, Author):
+        return normalize_key(author.forename, author.surname)
+    return normalize_key(*author)
+
+
+def name_key(entity):
+    """
+    Returns the index key of an affiliation or journal, given as an object or as its name.
+    """
+    if isinstance(entity, (Affiliation, Journal)):
+        return normalize_key(entity.name)
+    return normalize_key(entity)
+
+
+def acknowledged_key(entity):
+    """
+    Returns the index key of an acknowledged entity: an Affiliation or organization name, or an Author or
+    (forename, surname) tuple.
+    """
+    if isinstance(entity, (Author, tuple)):
+        return ("person",) + author_key(entity)
+    return ("org",) + name_key(entity)
+
+
+class CorpusIndex:
+    """
+    This class keeps hash indexes from authors, affiliations, journals, clusters, topics and acknowledged
+    organizations and people to the keys of the papers of a paper space, so that these lookups do not need the RDF
+    graph.
+
+    Every index maps a key to a set of paper keys; a query intersects the sets of its filters starting from the
+    smallest one, so it costs about the size of the smallest set. Papers can be added, removed and re-indexed one at
+    a time, which keeps the indexes current without rebuilding them.
+
+    Usage:
+        index = CorpusIndex(paper_set.papers)
+        index.papers(cluster=1, topic="models, learning", physical=True)
+    """
+
+    def __init__(self, papers=None):
+        self.papers_by_key = {}
+        self.indexes = {field: {} for field in FIELDS}
+        self.entries = {}
+        for key, paper in (papers or {}).items():
+            self.add_paper(key, paper)
+
+    def __len__(self):
+        return len(self.papers_by_key)
+
+    def __contains__(self, key):
+        return key in self.papers_by_key
+
+    def paper_entries(self, paper):
+        """
+        Returns the (field, key) pairs under which a paper is indexed.
+        """
+        entries = {("physical", bool(paper.physical))}
+        for author in paper.authors:
+            entries.add(("author", author_key(author)))
+            if author.affiliation is not None and author.affiliation.name != "unknown":
+                entries.add(("affiliation", name_key(author.affiliation)))
+        if paper.journal is not None and paper.journal.name != "unknown":
+            entries.add(("journal", name_key(paper.journal)))
+        if paper.cluster is not None:
+            entries.add(("cluster", int(paper.cluster)))
+        if paper.topic is not None:
+            entries.add(("topic", paper.topic))
+        if paper.acknowledgements is not None:
+            for organization in paper.acknowledgements.acknowledges_org:
+                entries.add(("acknowledges", acknowledged_key(organization)))
+            for person in paper.acknowledgements.acknowledges_people:
+                entries.add(("acknowledges", acknowledged_key(person)))
+        return entries
+
+    def add_paper(self, key, paper):
+        """
+        Indexes a paper, replacing the previous entries of the same key.
+
+        Parameters:
+            key: The key of the paper in the paper space (its title).
+            paper (Paper): The paper.
+        """
+        if key in self.papers_by_key:
+            self.remove_paper(key)
+        self.papers_by_key[key] = paper
+        entries = self.paper_entries(paper)
+        self.entries[key] = entries
+        for field, value in entries:
+            self.indexes[field].setdefault(value, set()).add(key)
+
+    def update_paper(self, key):
+        """
+        Re-indexes a paper after its attributes (cluster, topic, authors...) changed.
+        """
+        self.add_paper(key, self.papers_by_key[key])
+
+    def remove_paper(self, key):
+        """
+        Removes a paper from all the indexes.
+        """
+        self.papers_by_key.pop(key, None)
+        for field, value in self.entries.pop(key, ()):
+            keys = self.indexes[field][value]
+            keys.discard(key)
+            if not keys:
+                del self.indexes[field][value]
+
+    def lookup(self, field, value):
+        """
+        Returns the keys of the papers indexed under a single value of a field.
+        """
+        if field == "author":
+            value = author_key(value)
+        elif field in ("affiliation", "journal"):
+            value = name_key(value)
+        elif field == "acknowledges":
+            value = acknowledged_key(value)
+        elif field == "cluster":
+            value = int(value)
+        elif field == "physical":
+            value = bool(value)
+        elif field not in self.indexes:
+            raise ValueError(f'Unknown index {field}, expected one of {FIELDS}')
+        return self.indexes[field].get(value, set())
+
+    def keys(self, **filters):
+        """
+        Returns the keys of the papers that match all the filters.
+
+        Parameters:
+            filters: One or more of author, affiliation, journal, cluster, topic, acknowledges and physical. A list of
+            values matches papers indexed under any of them.
+
+        Returns:
+            set: The matching paper keys.
+        """
+        if not filters:
+            return set(self.papers_by_key)
+        candidates = []
+        for field, value in filters.items():
+            if isinstance(value, list):
+                candidates.append(set().union(*(self.lookup(field, item) for item in value)))
+            else:
+                candidates.append(self.lookup(field, value))
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for keys in candidates[1:]:
+            result &= keys
+            if not result:
+                break
+        return result
+
+    def papers(self, **filters):
+        """
+        Returns the papers that match all the filters (see keys), sorted by key.
+        """
+        return [self.papers_by_key[key] for key in sorted(self.keys(**filters))]
+
+    def authors(self, **filters):
+        """
+        Returns the distinct authors of the papers that match all the filters.
+        """
+        authors = {}
+        for paper in self.papers(**filters):
+            for author in paper.authors:
+                authors.setdefault(author_key(author), author)
+        return list(authors.values())
+
+    def acknowledged_people(self, organization):
+        """
+        Returns the people acknowledged together with an organization, in the acknowledgements that mention it.
+        """
+        people = {}
+        for paper in self.papers(acknowledges=organization):
+            for person in paper.acknowledgements.acknowledges_people:
+                people.setdefault(author_key(person), person)
+        return list(people.values())
+
+    def values(self, field):
+        """
+        Returns the indexed values of a field with the number of papers of each, e.g. the size of every cluster.
+        """
+        return {value: len(keys) for value, keys in self.indexes[field].items()}
@@ -0,0 +1,302 @@
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from instrumentation import metrics
+from title_index import normalize_title
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PdfDigests:
+    """
+    This class remembers the SHA-256 digest of every PDF that GROBID processed, so that byte-identical copies (e.g.
+    "paper (2).pdf") are skipped before they are processed again. A PDF is only recorded once it was processed, so the
+    copies of a PDF that GROBID could not process are still tried.
+    """
+
+    def __init__(self):
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def duplicate_of(self, path, digest=None):
+        """
+        Looks a PDF up.
+
+        Parameters:
+            path (str): The path of the PDF.
+            digest (str, optional): Its SHA-256 hex digest, computed from the file if not given.
+
+        Returns:
+            str: The path of the processed PDF with the same content, or None if the content is new.
+        """
+        with self.lock:
+            first = self.paths.get(digest or file_digest(path))
+        if first is None or first == path:
+            return None
+        logging.info(f'{path} is a copy of {first}')
+        metrics().count("duplicate_pdfs")
+        return first
+
+    def record(self, path, digest=None):
+        """
+        Records a processed PDF, unless a PDF with the same content was recorded first.
+        """
+        digest = digest or file_digest(path)
+        with self.lock:
+            self.paths.setdefault(digest, path)
+
+
+def paper_text(paper, body=True):
+    """
+    Returns the abstract and body text of a paper (or its abstract alone with body=False), normalized as titles are.
+    """
+    parts = [paper.abstract or ""]
+    if body and paper.tree:
+        body = paper.tree.find(f"{paper.schema}text/{paper.schema}body")
+        if body is not None:
+            parts.extend(body.itertext())
+    return normalize_title(" ".join(parts))
+
+
+def simhash(tokens, shingle_size=3):
+    """
+    Computes the 64 bit SimHash of a text: every word shingle votes with the bits of its hash, so that texts sharing
+    most of their shingles get fingerprints that differ in a few bits.
+
+    Parameters:
+        tokens (list): The words of the text.
+        shingle_size (int): The number of words of a shingle.
+
+    Returns:
+        int: The fingerprint.
+    """
+    shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))}
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    This class finds the fingerprints within max_distance bits of a query. The 64 bits are split into bands, and two
+    fingerprints that differ in fewer bits than there are bands agree on at least one band, so only the keys that
+    share a band with the query are compared.
+
+    Parameters:
+        bands (int): The number of bands, greater than max_distance.
+        max_distance (int): The maximum Hamming distance of near-duplicates.
+    """
+
+    def __init__(self, bands=4, max_distance=3):
+        if max_distance >= bands:
+            raise ValueError("max_distance must be lower than the number of bands")
+        self.width = 64 // bands
+        self.bands = bands
+        self.max_distance = max_distance
+        self.tables = [{} for _ in range(bands)]
+        self.fingerprints = {}
+
+    def _bands(self, fingerprint):
+        mask = (1 << self.width) - 1
+        return [(fingerprint >> (band * self.width)) & mask for band in range(self.bands)]
+
+    def add(self, key, fingerprint):
+        self.fingerprints[key] = fingerprint
+        for table, value in zip(self.tables, self._bands(fingerprint)):
+            table.setdefault(value, []).append(key)
+
+    def query(self, fingerprint):
+        """
+        Returns the keys of the near-duplicates of a fingerprint, closest first.
+        """
+        candidates = {key for table, value in zip(self.tables, self._bands(fingerprint))
+                      for key in table.get(value, ())}
+        distances = ((hamming(fingerprint, self.fingerprints[key]), key) for key in candidates)
+        return [key for distance, key in sorted(distances, key=lambda pair: pair[0]) if distance <= self.max_distance]
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+
+class DisjointSet:
+    """
+    Union-find over the integers 0..size-1, with path halving and union by size.
+    """
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def groups(self):
+        groups = {}
+        for item in range(len(self.parent)):
+            groups.setdefault(self.find(item), []).append(item)
+        return list(groups.values())
+
+
+def version(paper):
+    return {"filename": paper.filename, "title": paper.title, "identifiers": dict(paper.identifiers)}
+
+
+def add_version(canonical, paper):
+    """
+    Records a near-duplicate of a paper as one of its versions and adds the identifiers it does not have (e.g. the
+    arXiv id of a preprint to the DOI of the published version).
+    """
+    if not canonical.versions:
+        canonical.versions.append(version(canonical))
+    canonical.versions.append(version(paper))
+    for scheme, value in paper.identifiers.items():
+        canonical.identifiers.setdefault(scheme, value)
+
+
+def merge_versions(papers):
+    """
+    Merges near-duplicate papers into the most complete one: the one with the most references, then identifiers,
+    then the longest abstract.
+
+    Returns:
+        Paper: The canonical paper, with all of them in its versions.
+    """
+    canonical = max(papers, key=lambda paper: (len(paper.references), len(paper.identifiers),
+                                               len(paper.abstract or "")))
+    for paper in papers:
+        if paper is not canonical:
+            add_version(canonical, paper)
+    return canonical
+
+
+class Deduplicator:
+    """
+    This class merges the near-duplicate papers of a corpus (preprint and published version, renamed copies...)
+    before they reach the paper space, by the SimHash of their abstract and body text.
+
+    Parameters:
+        max_distance (int): The maximum Hamming distance between the fingerprints of near-duplicates.
+        bands (int): The number of bands of the SimHashIndex.
+        min_words (int): Papers with fewer words of text are not fingerprinted, as their fingerprints are not
+            reliable.
+        body (bool): Whether to fingerprint the body text with the abstract. Papers processed from their header
+            alone (tiered ingestion) have no body text, so all papers are then fingerprinted by their abstract.
+    """
+
+    def __init__(self, max_distance=3, bands=4, min_words=20, body=True):
+        self.max_distance = max_distance
+        self.bands = bands
+        self.min_words = min_words
+        self.body = body
+        self.index = SimHashIndex(bands, max_distance)
+        self.papers = []
+
+    def fingerprint(self, paper):
+        """
+        Returns the SimHash of a paper, or None if it has too little text.
+        """
+        tokens = paper_text(paper, body=self.body).split()
+        return simhash(tokens) if len(tokens) >= self.min_words else None
+
+    def register(self, paper, fingerprint):
+        self.index.add(len(self.papers), fingerprint)
+        self.papers.append(paper)
+
+    def deduplicate(self, papers):
+        """
+        Groups the near-duplicates of a list of papers and merges every group into its canonical paper.
+
+        Parameters:
+            papers (list): Physical Paper instances.
+
+        Returns:
+            list: The canonical papers and the papers without near-duplicates, in the order of the first paper of
+            every group.
+        """
+        with metrics().stage("deduplicate", items=len(papers)):
+            fingerprints = [self.fingerprint(paper) for paper in papers]
+            index = SimHashIndex(self.bands, self.max_distance)
+            groups = DisjointSet(len(papers))
+            for position, fingerprint in enumerate(fingerprints):
+                if fingerprint is not None:
+                    for other in index.query(fingerprint):
+                        groups.union(position, other)
+                    index.add(position, fingerprint)
+            unique = []
+            for group in sorted(groups.groups()):
+                canonical = merge_versions([papers[position] for position in group])
+                fingerprint = next(fingerprints[position] for position in group if papers[position] is canonical)
+                if fingerprint is not None:
+                    self.register(canonical, fingerprint)
+                unique.append(canonical)
+        merged = len(papers) - len(unique)
+        metrics().count("near_duplicates", merged)
+        logging.info(f'Merged {merged} near-duplicate papers')
+        return unique
+
+    def match(self, paper):
+        """
+        Returns the known near-duplicate of a new paper, or registers it.
+
+        Returns:
+            Paper: The known paper, or None if it is new.
+        """
+        fingerprint = self.fingerprint(paper)
+        if fingerprint is None:
+            return None
+        matches = self.index.query(fingerprint)
+        if not matches:
+            self.register(paper, fingerprint)
+            return None
+        return self.papers[matches[0]]
+
+    def absorb(self, paper):
+        """
+        Merges a new paper into a known near-duplicate, or registers it.
+
+        Returns:
+            Paper: The known paper it was merged into, or None if it is new.
+        """
+        canonical = self.match(paper)
+        if canonical is not None:
+            add_version(canonical, paper)
+            metrics().count("near_duplicates")
+        return canonical
+
+    def filter(self, papers):
+        """
+        Yields the papers of an iterable that are not near-duplicates of a previous one, which keeps the first copy
+        (for the streaming paper space, which cannot wait for the whole group).
+        """
+        for paper in papers:
+            if self.absorb(paper) is None:
+                yield paper
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+from title_index import normalize_title
+
+# Marker written in the fake PDF files of the load test; FakeGrobid answers with the TEI of that synthetic paper.
+PDF_MARKER = re.compile(rb"synthetic-paper:(\d+)")
+_TEI_TEXT = re.compile(r"<text[ >].*</text>", re.DOTALL)
+
+
+def fake_pdf(index):
+    """
+    Returns the content of a fake PDF file that FakeGrobid turns into the TEI of synthetic paper index.
+    """
+    return b"%PDF-1.4\n% synthetic-paper:" + str(index).encode("ascii") + b"\n%%EOF\n"
+
+
+def _stable(text, modulo):
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16) % modulo
+
+
+class Faults:
+    """
+    This class describes how a fake service misbehaves: every request waits latency seconds plus an exponentially
+    distributed jitter (mean jitter seconds, which gives the latency distribution a long tail), a fraction error_rate
+    of the requests fail with a 500, and, when burst_every is set, every burst_every seconds the service answers
+    503 to everything for burst_length seconds, as an overloaded GROBID or Wikidata does.
+
+    The faults are drawn from a seeded generator, so a load test is reproducible.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, burst_every=None, burst_length=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self, elapsed):
+        """
+        Returns the delay and the forced status (None, 500 or 503) of a request arriving elapsed seconds after the
+        service started.
+        """
+        with self.lock:
+            delay = self.latency + (self.rng.expovariate(1 / self.jitter) if self.jitter else 0.0)
+            failed = self.rng.random() < self.error_rate
+        if self.burst_every and elapsed % self.burst_every < self.burst_length:
+            return delay, 503
+        return delay, 500 if failed else None
+
+
+class FakeService:
+    """
+    This class is a local HTTP server standing in for an external service, with the faults of a Faults instance.
+    Subclasses implement respond. Every request is recorded as (path, status, seconds) for the load test report.
+
+    Usage:
+        with FakeOpenAlex(Faults(latency=0.05, error_rate=0.01)) as openalex:
+            configure_services(openalex_url=openalex.url)
+    """
+
+    name = "service"
+    # Paths answered without faults, e.g. health checks
+    exempt = ()
+
+    def __init__(self, faults=None, host="127.0.0.1", port=0):
+        self.faults = faults if faults is not None else Faults()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.started = None
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_request(self):
+                start = time.perf_counter()
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update({key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()})
+                delay, forced = (0.0, None) if url.path in service.exempt else \
+                    service.faults.draw(start - service.started)
+                time.sleep(service.delay(url.path, delay))
+                if forced is not None:
+                    status, content_type, content = forced, "text/plain", b"Service unavailable"
+                else:
+                    status, content_type, content = service.respond(self.command, url.path, params, body)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                if status == 503:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(content)
+                with service.lock:
+                    service.requests.append((url.path, status, time.perf_counter() - start))
+
+            do_GET = handle_request
+            do_POST = handle_request
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, path, delay):
+        """
+        Returns the delay of a request to path, given the one drawn from the faults.
+        """
+        return delay
+
+    def respond(self, method, path, params, body):
+        """
+        Returns the (status, content type, content) of a request that is not failed by the faults.
+        """
+        raise NotImplementedError
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), name=f"fake-{self.name}",
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stats(self):
+        """
+        Returns the number of requests and errors and the exact latency percentiles seen by the server.
+        """
+        with self.lock:
+            requests = list(self.requests)
+        latencies = sorted(seconds for _, _, seconds in requests)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+        return {"requests": len(requests), "errors": sum(status >= 500 for _, status, _ in requests),
+                "unavailable": sum(status == 503 for _, status, _ in requests),
+                "p50_seconds": percentile(0.5), "p95_seconds": percentile(0.95), "p99_seconds": percentile(0.99),
+                "max_seconds": latencies[-1] if latencies else None}
+
+
+def _json(payload, status=200):
+    return status, "application/json", json.dumps(payload).encode("utf-8")
+
+
+class FakeGrobid(FakeService):
+    """
+    Stands in for GROBID: /api/isalive, and /api/processFulltextDocument answering with the TEI of the synthetic
+    paper named by the marker of the uploaded fake PDF (see fake_pdf). /api/processHeaderDocument answers with the
+    same TEI without its text (body, acknowledgement and references), after header_latency times the drawn delay.
+    /api/processCitationList consolidates raw references that name a title of the corpus or one of its external works,
+    answering with their DOI.
+    """
+
+    name = "grobid"
+    # A busy GROBID answers 503 to the processing requests but is still alive
+    exempt = ("/api/isalive",)
+
+    def __init__(self, faults=None, corpus=None, header_latency=0.1, **kwargs):
+        super().__init__(faults, **kwargs)
+        self.corpus = corpus if corpus is not None else SyntheticCorpus(CorpusSpec(papers=100))
+        self.header_latency = header_latency
+        self.works = {}
+        for index, title in enumerate(self.corpus.titles):
+            self.works[normalize_title(title)] = (title, self.corpus.doi(index))
+        for index, title in enumerate(self.corpus.external_titles):
+            self.works[normalize_title(title)] = (title, f"10.9999/ext.{index}")
+
+    def delay(self, path, delay):
+        return delay * self.header_latency if path == "/api/processHeaderDocument" else delay
+
+    def respond(self, method, path, params, body):
+        if path == "/api/isalive":
+            return 200, "text/plain", b"true"
+        if path in ("/api/processFulltextDocument", "/api/processHeaderDocument") and method == "POST":
+            match = PDF_MARKER.search(body)
+            if match is None or int(match.group(1)) >= self.corpus.spec.papers:
+                return 500, "text/plain", b"[GENERAL] An exception occurred while running Grobid."
+            document = self.corpus.document(int(match.group(1)))
+            if path == "/api/processHeaderDocument":
+                document = _TEI_TEXT.sub("", document)
+            return 200, "application/xml", document.encode("utf-8")
+        if path == "/api/processCitationList" and method == "POST":
+            return 200, "application/xml", self.citation_list(parse_qs(body.decode("utf-8")).get("citations", []))
+        return 404, "text/plain", b"Not found"
+
+    def citation_list(self, citations):
+        bibls = []
+        for citation in citations:
+            work = next((self.works[part] for part in map(normalize_title, citation.split(". "))
+                         if part in self.works), None)
+            if work is None:
+                bibls.append(f"<biblStruct><monogr><title>{escape(citation)}</title></monogr></biblStruct>")
+            else:
+                bibls.append(f'<biblStruct><analytic><title level="a" type="main">{escape(work[0])}</title>'
+                             f'<idno type="DOI">{work[1]}</idno></analytic><monogr><imprint/></monogr></biblStruct>')
+        return (f'<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><back><div><listBibl>{"".join(bibls)}'
+                f'</listBibl></div></back></text></TEI>').encode("utf-8")
+
+
+class FakeOpenAlex(FakeService):
+    """
+    Stands in for the OpenAlex /authors endpoint, answering display_name searches with one author whose counts are
+    derived from the name.
+    """
+
+    name = "openalex"
+
+    def respond(self, method, path, params, body):
+        if path.rstrip("/") != "/authors":
+            return _json({"error": "Not found"}, 404)
+        match = re.search(r"display_name\.search:([^,]+)", params.get("filter", ""))
+        if match is None:
+            return _json({"meta": {"count": 0, "page": 1, "per_page": 25}, "results": []})
+        name = match.group(1)
+        author = {"id": f"https://openalex.org/A{_stable(name, 10 ** 9)}", "display_name": name,
+                  "works_count": _stable(name, 300), "cited_by_count": _stable(name[::-1], 20000)}
+        return _json({"meta": {"count": 1, "page": 1, "per_page": 25}, "results": [author]})
+
+
+class FakeWikidata(FakeService):
+    """
+    Stands in for the Wikidata SPARQL endpoint, answering the label lookups and the detail queries of Affiliation
+    and Journal. Most labels resolve to an item; the ones whose hash is a multiple of 5 do not.
+    """
+
+    name = "wikidata"
+
+    def respond(self, method, path, params, body):
+        query = params.get("query", "")
+        label = re.search(r'rdfs:label "(.*)"@en', query)
+        if label:
+            if _stable(label.group(1), 5) == 0:
+                bindings = []
+            else:
+                item = f"Q{_stable(label.group(1), 10 ** 8)}"
+                bindings = [{"item": {"type": "uri", "value": f"http://www.wikidata.org/entity/{item}"}}]
+            return _json({"head": {"vars": ["item"]}, "results": {"bindings": bindings}})
+        item = re.search(r"wd:(Q\d+)", query)
+        if item is None:
+            return _json({"head": {"vars": []}, "results": {"bindings": []}})
+        item = item.group(1)
+        year = 1800 + _stable(item, 220)
+        binding = {"website": {"type": "uri", "value": f"https://{item.lower()}.example.org"},
+                   "established": {"type": "literal", "value": f"{year}-01-01T00:00:00Z"},
+                   "description": {"type": "literal", "value": f"Fake entity {item}"},
+                   "country_of_origin": {"type": "literal", "value": "Spain"}}
+        return _json({"head": {"vars": list(binding)}, "results": {"bindings": [binding]}})
@@ -0,0 +1,202 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import metrics
+from rdf_writer import open_text, triple_nt
+
+
+def make_session(pool_size=4, retries=5, backoff_factor=0.5, auth=None):
+    """
+    Creates a pooled HTTP session that retries failed requests (including POSTs) with exponential backoff.
+
+    Parameters:
+        pool_size (int): Number of connections kept open to the server.
+        retries (int): Maximum number of retries per request.
+        backoff_factor (float): Base of the exponential backoff between retries, in seconds.
+        auth (tuple, optional): (user, password) for HTTP basic authentication.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=None, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = auth
+    return session
+
+
+class FusekiLoader:
+    """
+    This class bulk loads triples into a Fuseki dataset through the SPARQL Graph Store Protocol.
+
+    Triples are sent as N-Triples chunks of at most chunk_size triples (and about max_chunk_bytes bytes) by a pool of
+    workers sharing one pooled, retrying session. At most 2 * workers chunks are buffered at any time, so memory does
+    not depend on the size of the graph. It can be used as the sink of an RDFParser or fed from an N-Triples file, and
+    close() waits for the pending chunks and verifies the triple count of the dataset.
+    """
+
+    def __init__(self, url="http://localhost:3030", dataset="kg", graph=None, chunk_size=50000,
+                 max_chunk_bytes=16 * 1024 * 1024, workers=4, retries=5, backoff_factor=0.5, auth=None, timeout=300):
+        self.url = url.rstrip("/")
+        self.dataset = dataset
+        self.graph = graph
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.workers = workers
+        self.timeout = timeout
+        self.session = make_session(pool_size=workers, retries=retries, backoff_factor=backoff_factor, auth=auth)
+        self.executor = None
+        self.pending = set()
+        self.lines = []
+        self.chunk_bytes = 0
+        self.sent = 0
+        self.chunks = 0
+        self.count_before = None
+        self.report = None
+        self.start = None
+
+    @property
+    def data_url(self):
+        return f"{self.url}/{self.dataset}/data"
+
+    @property
+    def query_url(self):
+        return f"{self.url}/{self.dataset}/query"
+
+    def open(self):
+        """
+        Starts the worker pool and records the triple count of the dataset before loading.
+        """
+        if self.executor is None:
+            self.start = time.perf_counter()
+            self.count_before = self.count()
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def count(self):
+        """
+        Counts the triples of the target graph with a SPARQL query.
+
+        Returns:
+            int: The number of triples.
+        """
+        pattern = f"GRAPH <{self.graph}> {{ ?s ?p ?o }}" if self.graph else "?s ?p ?o"
+        resp = self.session.post(self.query_url, data={"query": f"SELECT (COUNT(*) AS ?n) WHERE {{ {pattern} }}"},
+                                 headers={"Accept": "application/sparql-results+json"}, timeout=self.timeout)
+        resp.raise_for_status()
+        return int(resp.json()["results"]["bindings"][0]["n"]["value"])
+
+    def post_chunk(self, body):
+        """
+        Appends an N-Triples chunk to the target graph.
+        """
+        params = {"graph": self.graph} if self.graph else {"default": ""}
+        with metrics().request("fuseki"):
+            resp = self.session.post(self.data_url, params=params, data=body.encode("utf-8"),
+                                     headers={"Content-Type": "application/n-triples"}, timeout=self.timeout)
+            resp.raise_for_status()
+
+    def add_line(self, line):
+        """
+        Buffers one N-Triples line and submits the buffer once it is full.
+        """
+        self.lines.append(line)
+        self.chunk_bytes += len(line)
+        if len(self.lines) >= self.chunk_size or self.chunk_bytes >= self.max_chunk_bytes:
+            self.submit()
+
+    def addN(self, quads):
+        """
+        Buffers a batch of quads, ignoring their context, so the loader can be used as an RDFParser sink.
+        """
+        self.open()
+        for s, p, o, _ in quads:
+            self.add_line(triple_nt(s, p, o))
+
+    def submit(self):
+        if not self.lines:
+            return
+        self.open()
+        while len(self.pending) >= 2 * self.workers:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        self.pending.add(self.executor.submit(self.post_chunk, "".join(self.lines)))
+        self.sent += len(self.lines)
+        self.chunks += 1
+        self.lines = []
+        self.chunk_bytes = 0
+
+    def load_file(self, path):
+        """
+        Loads an N-Triples file (optionally .gz or .zst compressed) and verifies the result.
+
+        Parameters:
+            path (str): The path of the file.
+
+        Returns:
+            dict: The load report (see close).
+        """
+        return self.load_files([path])
+
+    def load_files(self, paths):
+        """
+        Loads several N-Triples files, e.g. the partitions written by the sharded builder, and verifies the result.
+
+        Returns:
+            dict: The load report (see close).
+        """
+        self.open()
+        for path in paths:
+            with open_text(path, "rt") as f:
+                for line in f:
+                    if line.strip() and not line.startswith("#"):
+                        self.add_line(line)
+        return self.close()
+
+    def close(self):
+        """
+        Sends the remaining triples, waits for all the chunks and verifies the triple count of the dataset.
+
+        Returns:
+            dict: The number of triples and chunks sent, the count before and after loading, the elapsed seconds and
+            whether the dataset is non empty and grew by at most the number of triples sent (duplicates and triples
+            that were already present are not counted twice by Fuseki).
+        """
+        if self.report is not None:
+            return self.report
+        self.submit()
+        if self.executor is None:
+            self.report = {"sent": 0, "chunks": 0, "verified": True}
+            return self.report
+        try:
+            for future in self.pending:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.pending = set()
+        after = self.count()
+        loaded = after - self.count_before
+        self.report = {"sent": self.sent, "chunks": self.chunks, "before": self.count_before, "after": after,
+                       "seconds": time.perf_counter() - self.start,
+                       "verified": 0 <= loaded <= self.sent and (after > 0 or self.sent == 0)}
+        if loaded != self.sent:
+            logging.warning(f'Fuseki load: sent {self.sent} triples but the dataset grew by {loaded}')
+        logging.info(f'Fuseki load: {self.report}')
+        return self.report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,242 @@
+import copy
+
+from dedup import add_version
+from instrumentation import metrics
+from paper_index import link_references, resolve_new_papers
+
+
+class IncrementalPaperSpace:
+    """
+    This class holds the steps that add papers to a built paper space (PaperSet) without processing the existing
+    papers again, or completing the papers added from their header with their full text: resolving them against the
+    paper index, linking their entities to the existing ones and indexing them. The steps that need the NLP models are
+    left to the subclass:
+
+    - assign_clusters(papers): sets the cluster of new physical papers.
+    - assign_topics(papers): sets their topic.
+    - recognize_entities(papers): sets the organizations and people their acknowledgements thank.
+
+    It uses the paper_index, papers, citation_papers, duplicate_papers, all_authors, all_affiliations, all_journals
+    and corpus_index attributes of the paper space.
+    """
+
+    def assign_clusters(self, papers):
+        raise NotImplementedError
+
+    def assign_topics(self, papers):
+        raise NotImplementedError
+
+    def recognize_entities(self, papers):
+        raise NotImplementedError
+
+    def add_papers(self, papers):
+        """
+        Adds newly processed papers to the paper space without processing the existing papers again: the new papers
+        are resolved against the paper index, given the cluster of their most similar paper and a topic of the
+        already fitted model, and their entities are recognized, linked to the existing ones and, if they are new,
+        enriched. Network metrics are not recomputed.
+
+        Args:
+            papers (list): List of new physical Paper instances.
+
+        Returns:
+            dict: The new unique papers ("papers"), the duplicates ("duplicates"), the new citation papers
+            ("citation_papers"), the (citation paper, new paper) pairs of the superseded citation papers
+            ("superseded") and the existing entities that gained relations to the new ones ("touched").
+        """
+        run_metrics = metrics()
+        with run_metrics.stage("index_papers", items=len(papers)):
+            new_papers, duplicates, citation_papers, superseded = resolve_new_papers(
+                self.paper_index, self.papers, self.citation_papers, papers)
+            self.duplicate_papers.extend(duplicates)
+        if new_papers:
+            with run_metrics.stage("clusterize", items=len(new_papers)):
+                self.assign_clusters(new_papers)
+            with run_metrics.stage("topic_modeling", items=len(new_papers)):
+                self.assign_topics(new_papers)
+            with run_metrics.stage("find_entities", items=len(new_papers)):
+                self.recognize_entities(new_papers)
+
+        new_set = set(map(id, new_papers + citation_papers))
+        touched = {}
+        for placeholder, paper in superseded:
+            for author in placeholder.authors or []:
+                if placeholder in author.writes:
+                    author.writes.remove(placeholder)
+            if placeholder.journal is not None and placeholder in placeholder.journal.publishes:
+                placeholder.journal.publishes.remove(placeholder)
+            self.corpus_index.remove_paper(placeholder.title)
+            for citation in paper.cited_by:
+                touched[id(citation)] = citation
+        for paper in new_papers:
+            for citation in paper.references:
+                if id(citation.cites) not in new_set:
+                    touched[id(citation.cites)] = citation.cites
+
+        self.link_new_papers(new_papers + citation_papers, touched)
+        return {"papers": new_papers, "duplicates": duplicates, "citation_papers": citation_papers,
+                "superseded": superseded, "touched": list(touched.values())}
+
+    def complete_papers(self, pairs):
+        """
+        Completes papers that were added from their header only (see PaperProcessor.process with header_only) with
+        the references and acknowledgement of their full text: the references are resolved against the paper index,
+        the acknowledgement goes through entity recognition and the new citation papers are linked and enriched. The
+        papers keep their cluster and topic.
+
+        Args:
+            pairs (list): (paper, full paper) pairs of a paper of the paper space and the paper processed from the full
+                text of the same PDF.
+
+        Returns:
+            dict: The same keys as add_papers. The completed papers are given as superseded (previous state, paper)
+            pairs, so that their header triples are replaced.
+        """
+        run_metrics = metrics()
+        completed, superseded = [], []
+        for paper, full in pairs:
+            # A copy of the citations, since the references of other completed papers may add to them
+            previous = copy.copy(paper)
+            previous.cited_by = list(paper.cited_by)
+            superseded.append((previous, paper))
+            paper.tree = full.tree
+            paper.filename = full.filename
+            paper.references = full.references
+            for citation in paper.references:
+                citation.source = paper
+            paper.acknowledgements = full.acknowledgements
+            if paper.acknowledgements is not None:
+                paper.acknowledgements.source = paper
+            self.paper_index.add_identifiers(paper, full.identifiers)
+            completed.append(paper)
+        with run_metrics.stage("index_papers", items=len(completed)):
+            citation_papers = link_references(self.paper_index, completed, self.papers, self.citation_papers)
+        with run_metrics.stage("find_entities", items=len(completed)):
+            self.recognize_entities(completed)
+
+        new_set = set(map(id, citation_papers))
+        touched = {}
+        for paper in completed:
+            # Their edges to the completed papers are replaced too
+            for entity in (paper.authors or []) + ([paper.journal] if paper.journal is not None else []):
+                touched[id(entity)] = entity
+            for citation in paper.references:
+                if id(citation.cites) not in new_set:
+                    touched[id(citation.cites)] = citation.cites
+        self.link_new_papers(citation_papers, touched)
+        for paper in completed:
+            self.corpus_index.add_paper(paper.title, paper)
+        return {"papers": [], "duplicates": [], "citation_papers": citation_papers, "superseded": superseded,
+                "touched": list(touched.values())}
+
+    def add_versions(self, pairs):
+        """
+        Merges new near-duplicates (e.g. the published version of a preprint) into the papers of the paper space they
+        duplicate: they are listed in the versions of the paper, whose identifiers they complete and which are indexed.
+
+        Args:
+            pairs (list): (paper, near-duplicate) pairs of a paper of the paper space and a new physical Paper.
+
+        Returns:
+            dict: The same keys as add_papers. The merged papers are given as superseded (previous state, paper) pairs,
+            so that their triples are replaced.
+        """
+        superseded = {}
+        for paper, duplicate in pairs:
+            if id(paper) not in superseded:
+                previous = copy.copy(paper)
+                previous.identifiers = dict(paper.identifiers)
+                previous.versions = list(paper.versions)
+                previous.cited_by = list(paper.cited_by)
+                superseded[id(paper)] = (previous, paper)
+            add_version(paper, duplicate)
+            self.paper_index.add_identifiers(paper, duplicate.identifiers)
+        touched = {}
+        for _, paper in superseded.values():
+            # Their edges to the merged papers are replaced too
+            for entity in (paper.authors or []) + ([paper.journal] if paper.journal is not None else []):
+                touched[id(entity)] = entity
+            for citation in paper.cited_by:
+                touched[id(citation)] = citation
+        return {"papers": [], "duplicates": [], "citation_papers": [], "superseded": list(superseded.values()),
+                "touched": list(touched.values())}
+
+    def link_new_papers(self, papers, touched):
+        """
+        Links the authors, affiliations and journals of papers added to the paper space to the existing ones, indexes
+        the papers in the corpus index and enriches the entities that are new.
+
+        Args:
+            papers (list): The new papers, physical or citation papers.
+            touched (dict): The existing entities that gained relations, by id, updated in place.
+
+        Returns:
+            None
+        """
+        run_metrics = metrics()
+        with run_metrics.stage("link_authors") as stage:
+            authors = {author: author for author in self.all_authors}
+            new_authors = []
+            for paper in papers:
+                for index, author in enumerate(paper.authors or []):
+                    linked = authors.get(author)
+                    if linked is None:
+                        authors[author] = author
+                        self.all_authors.append(author)
+                        new_authors.append(author)
+                    elif linked is not author:
+                        paper.authors[index] = linked
+                        if paper not in linked.writes:
+                            linked.writes.append(paper)
+                        linked.ackowledged_by.extend(author.ackowledged_by)
+                        touched[id(linked)] = linked
+            stage.items = len(new_authors)
+        with run_metrics.stage("link_affiliations") as stage:
+            new_affiliations = []
+            for author in new_authors:
+                linked = self.all_affiliations.get(author.affiliation)
+                if linked is None:
+                    self.all_affiliations[author.affiliation] = author.affiliation
+                    new_affiliations.append(author.affiliation)
+                elif linked is not author.affiliation:
+                    if author.affiliation.acknowledged_by:
+                        linked.acknowledged_by.extend(author.affiliation.acknowledged_by)
+                        touched[id(linked)] = linked
+                    author.affiliation = linked
+            stage.items = len(new_affiliations)
+        with run_metrics.stage("link_journals") as stage:
+            journals = {journal: journal for journal in self.all_journals}
+            new_journals = []
+            for paper in papers:
+                if paper.journal:
+                    linked = journals.get(paper.journal)
+                    if linked is None:
+                        journals[paper.journal] = paper.journal
+                        self.all_journals.append(paper.journal)
+                        new_journals.append(paper.journal)
+                    elif linked is not paper.journal:
+                        paper.journal = linked
+                        linked.publishes.append(paper)
+                        touched[id(linked)] = linked
+            stage.items = len(new_journals)
+        with run_metrics.stage("corpus_index", items=len(papers)):
+            for paper in papers:
+                self.corpus_index.add_paper(paper.title, paper)
+
+        with run_metrics.stage("enrich"):
+            self.enrich_entities(new_affiliations, new_authors, new_journals)
+
+    def enrich_entities(self, affiliations, authors, journals):
+        """
+        Enriches the affiliations, authors and journals that are new to the paper space.
+        """
+        run_metrics = metrics()
+        with run_metrics.stage("affiliations", items=len(affiliations)):
+            for affiliation in affiliations:
+                affiliation.enrich()
+        with run_metrics.stage("authors", items=len(authors)):
+            for author in authors:
+                author.enrich()
+        with run_metrics.stage("journals", items=len(journals)):
+            for journal in journals:
+                journal.enrich()
@@ -0,0 +1,416 @@
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Upper bounds (in seconds) of the HTTP latency histogram buckets, the defaults of the Prometheus clients plus 30s
+# and 60s for slow GROBID documents.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of the process so far (ru_maxrss is in KiB on Linux and in bytes on macOS).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LatencyHistogram:
+    """
+    This class counts request latencies in fixed buckets, as a Prometheus histogram does, so the distribution is
+    kept in constant memory however many requests are observed.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.errors += bool(error)
+
+    def cumulative(self):
+        """
+        Returns (upper bound, number of requests at most that slow) pairs, the last bound being +Inf.
+        """
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in, or None without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+    def as_dict(self):
+        return {"count": self.count, "errors": self.errors, "sum_seconds": self.sum,
+                "mean_seconds": self.sum / self.count if self.count else None,
+                "p50_seconds": self.quantile(0.5), "p95_seconds": self.quantile(0.95),
+                "p99_seconds": self.quantile(0.99),
+                "buckets": {_bound(bound): total for bound, total in self.cumulative()}}
+
+
+def _bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class SamplingProfiler:
+    """
+    This class samples the Python stack of one thread every interval seconds from a background thread and counts the
+    collapsed stacks ("module:function;module:function count" lines, the input of flamegraph.pl and speedscope).
+    Unlike cProfile it does not slow the profiled code down, so it can be left on for long stages.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Stage:
+    """
+    The handle of a running stage; the number of items it processed can be set or increased while it runs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.items = 0
+
+
+class RunMetrics:
+    """
+    This class records what a run spends its time and memory on: per-stage wall and CPU time, peak RSS (and, with
+    trace_memory, the peak of the memory allocated by Python in the stage), item counts, counters, cache hit rates and
+    per-service HTTP latency histograms. It writes them as a JSON run report and as a Prometheus textfile (for the
+    node_exporter textfile collector).
+
+    Stages nest: a stage opened while another one runs is reported as "outer/inner". A stage that runs several times
+    accumulates its calls, times and items.
+
+    profile_stage names one stage (by name or path) to profile with cProfile (profile_mode="cprofile", a .prof file
+    for pstats or snakeviz) or with the SamplingProfiler (profile_mode="sampling", a .folded file), written to
+    profile_dir.
+
+    The modules of the pipeline record into the active instance, see metrics() and activate().
+
+    Usage:
+        run_metrics = activate(RunMetrics(profile_stage="paper_space/find_entities"))
+        with run_metrics.stage("paper_space") as stage:
+            ...
+            stage.items = len(papers)
+        run_metrics.write_json("metrics.json")
+    """
+
+    def __init__(self, trace_memory=False, profile_stage=None, profile_mode="cprofile", profile_dir="."):
+        if profile_mode not in ("cprofile", "sampling"):
+            raise ValueError(f"Unknown profile mode {profile_mode}, use cprofile or sampling")
+        self.trace_memory = trace_memory
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self.counters = Counter()
+        self.caches = {}
+        self.http = {}
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = datetime.now(timezone.utc)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+
+    def close(self):
+        """
+        Stops tracemalloc if this instance started it.
+        """
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def stage(self, name, items=0):
+        """
+        Times a stage of the run.
+
+        Parameters:
+            name (str): The name of the stage.
+            items (int): The number of items the stage processes, if known in advance.
+
+        Yields:
+            Stage: The handle of the stage, to set the number of items once it is known.
+        """
+        stack = self._stack()
+        path = f"{stack[-1][0].path}/{name}" if stack else name
+        handle = Stage(path)
+        handle.items = items
+        trace_memory = self.trace_memory and tracemalloc.is_tracing()
+        if trace_memory and stack:
+            # The peak is reset for the inner stage, so the outer one keeps the peak it reached until now
+            stack[-1][1] = max(stack[-1][1], tracemalloc.get_traced_memory()[1])
+        frame = [handle, 0]
+        stack.append(frame)
+        if trace_memory:
+            tracemalloc.reset_peak()
+        profiler = self._start_profile(name, path)
+        rss = peak_rss_bytes()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield handle
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._stop_profile(path, profiler)
+            stack.pop()
+            traced = None
+            if trace_memory:
+                traced = max(frame[1], tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], traced)
+            self._record_stage(path, wall, cpu, handle.items, rss, traced)
+
+    def _record_stage(self, path, wall, cpu, items, rss_before, traced):
+        peak = peak_rss_bytes()
+        with self.lock:
+            stats = self.stages.setdefault(path, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "items": 0,
+                                                  "peak_rss_bytes": 0, "rss_growth_bytes": 0})
+            stats["calls"] += 1
+            stats["wall_seconds"] += wall
+            stats["cpu_seconds"] += cpu
+            stats["items"] += items or 0
+            stats["peak_rss_bytes"] = max(stats["peak_rss_bytes"], peak)
+            stats["rss_growth_bytes"] += peak - rss_before
+            if traced is not None:
+                stats["traced_peak_bytes"] = max(stats.get("traced_peak_bytes", 0), traced)
+        logging.debug(f'Stage {path}: {wall:.3f}s wall, {cpu:.3f}s CPU, {items or 0} items')
+
+    def _start_profile(self, name, path):
+        if self.profile_stage not in (name, path):
+            return None
+        if self.profile_mode == "sampling":
+            profiler = self.profiles.setdefault(path, SamplingProfiler())
+            profiler.start()
+        else:
+            profiler = self.profiles.setdefault(path, cProfile.Profile())
+            profiler.enable()
+        return profiler
+
+    def _stop_profile(self, path, profiler):
+        if profiler is None:
+            return
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+        else:
+            profiler.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        output = self.profile_path(path)
+        if isinstance(profiler, SamplingProfiler):
+            profiler.write(output)
+        else:
+            profiler.dump_stats(output)
+        logging.info(f'Profile of stage {path} written to {output}')
+
+    def profile_path(self, path):
+        extension = "folded" if self.profile_mode == "sampling" else "prof"
+        return os.path.join(self.profile_dir, f"profile-{path.replace('/', '-')}.{extension}")
+
+    def count(self, name, n=1):
+        """
+        Increases a counter, e.g. count("grobid_errors").
+        """
+        with self.lock:
+            self.counters[name] += n
+
+    def cache(self, name, hits=0, misses=0):
+        """
+        Adds lookups to the hit rate of a cache.
+        """
+        with self.lock:
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def observe(self, service, seconds, error=False):
+        """
+        Adds the latency of one HTTP request to the histogram of a service.
+        """
+        with self.lock:
+            self.http.setdefault(service, LatencyHistogram()).observe(seconds, error)
+
+    @contextmanager
+    def request(self, service):
+        """
+        Times an HTTP request to a service. Requests that raise are counted as errors; requests that fail without
+        raising can be reported with observe(..., error=True) instead.
+        """
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe(service, time.perf_counter() - start, error)
+
+    def report(self):
+        """
+        Returns:
+            dict: The run report, as written by write_json.
+        """
+        with self.lock:
+            return {
+                "started": self.started.isoformat(),
+                "wall_seconds": time.perf_counter() - self.start_wall,
+                "cpu_seconds": time.process_time() - self.start_cpu,
+                "peak_rss_bytes": peak_rss_bytes(),
+                "stages": {path: dict(stats, items_per_second=stats["items"] / stats["wall_seconds"]
+                                      if stats["items"] and stats["wall_seconds"] else None)
+                           for path, stats in self.stages.items()},
+                "counters": dict(self.counters),
+                "caches": {name: {"hits": hits, "misses": misses,
+                                  "hit_rate": hits / (hits + misses) if hits + misses else None}
+                           for name, (hits, misses) in self.caches.items()},
+                "http": {service: histogram.as_dict() for service, histogram in self.http.items()},
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def prometheus(self, prefix="openscience"):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value, *suffix in samples:
+                label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{prefix}_{name}{suffix[0] if suffix else ''}"
+                             f"{'{' + label_text + '}' if label_text else ''} {float(value)!r}")
+
+        metric("run_wall_seconds", "gauge", "Wall time of the run.", [({}, report["wall_seconds"])])
+        metric("run_cpu_seconds", "gauge", "CPU time of the run.", [({}, report["cpu_seconds"])])
+        metric("run_peak_rss_bytes", "gauge", "Peak resident set size of the run.",
+               [({}, report["peak_rss_bytes"])])
+        stages = report["stages"]
+        for field, help_text in (("wall_seconds", "Wall time spent in a stage."),
+                                 ("cpu_seconds", "CPU time spent in a stage."),
+                                 ("calls", "Number of times a stage ran."),
+                                 ("items", "Number of items a stage processed."),
+                                 ("peak_rss_bytes", "Peak resident set size at the end of a stage.")):
+            metric(f"stage_{field}", "gauge", help_text,
+                   [({"stage": path}, stats[field]) for path, stats in stages.items()])
+        metric("events_total", "counter", "Events counted during the run.",
+               [({"event": name}, value) for name, value in report["counters"].items()])
+        metric("cache_hits_total", "counter", "Cache hits.",
+               [({"cache": name}, cache["hits"]) for name, cache in report["caches"].items()])
+        metric("cache_misses_total", "counter", "Cache misses.",
+               [({"cache": name}, cache["misses"]) for name, cache in report["caches"].items()])
+        samples = []
+        for service, histogram in self.http.items():
+            samples.extend(({"service": service, "le": _bound(bound)}, total, "_bucket")
+                           for bound, total in histogram.cumulative())
+            samples.append(({"service": service}, histogram.sum, "_sum"))
+            samples.append(({"service": service}, histogram.count, "_count"))
+        metric("http_request_duration_seconds", "histogram", "Latency of the HTTP requests to a service.", samples)
+        metric("http_request_errors_total", "counter", "Failed HTTP requests to a service.",
+               [({"service": service}, histogram.errors) for service, histogram in self.http.items()])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes the Prometheus textfile atomically, so the collector never reads a partial file.
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".prom.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_ACTIVE = RunMetrics()
+
+
+def metrics():
+    """
+    Returns the RunMetrics the pipeline records into.
+    """
+    return _ACTIVE
+
+
+def activate(run_metrics):
+    """
+    Makes run_metrics the RunMetrics the pipeline records into and returns it.
+    """
+    global _ACTIVE
+    _ACTIVE = run_metrics
+    return run_metrics
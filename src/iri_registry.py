@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import re
+
+from rdflib import URIRef
+
+_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]')
+_NON_ALNUM_RUN = re.compile(r'[^a-z0-9]+')
+
+
+def slugify(text):
+    """
+    Turns a text into the identifier used in the instances namespace.
+
+    Parameters:
+        text (str): The text to slugify.
+
+    Returns:
+        str: The lowercased text with everything that is not a letter or a digit removed.
+    """
+    return _NON_ALNUM.sub('', text.lower())
+
+
+def normalize_key(*parts):
+    """
+    Normalizes the parts of an entity key so that case and punctuation differences map to the same key.
+
+    Returns:
+        tuple: The lowercased parts with runs of punctuation and whitespace collapsed to a single space.
+    """
+    return tuple(_NON_ALNUM_RUN.sub(' ', str(part).lower()).strip() for part in parts)
+
+
+class IRIRegistry:
+    """
+    This class mints the IRI of every entity of the knowledge graph exactly once.
+
+    IRIs are memoized by object identity (so an entity reached through several edges is slugified only once) and by
+    normalized key (so distinct objects that represent the same entity share an IRI). When two different keys produce
+    the same slug (e.g. a paper and a journal with the same name), the collision is logged and the later key gets a
+    suffix with a short digest of its key instead of silently merging two entities, so its IRI is the same in every
+    run that mints the keys in the same order, whatever the other colliding keys were. With hashed=True the identifier is a short digest of the key, which keeps IRIs such as citations, that
+    otherwise concatenate two full titles, compact, and makes them independent of the order in which they are minted.
+    """
+
+    def __init__(self, namespace, hashed=False, digest_size=8):
+        self.namespace = namespace
+        self.hashed = hashed
+        self.digest_size = digest_size
+        self.by_object = {}
+        self.by_key = {}
+        self.owners = {}
+        self.collisions = []
+        self.hits = 0
+        self.misses = 0
+
+    def mint(self, kind, entity, *parts):
+        """
+        Returns the IRI of an entity, minting it the first time the entity or its key is seen.
+
+        Parameters:
+            kind (str): The entity type (paper, author, citation...).
+            entity: The entity object, used for the identity cache. None for entities that only exist as a key.
+            parts: The values that identify the entity (e.g. the title of a paper).
+
+        Returns:
+            URIRef: The IRI of the entity.
+        """
+        if entity is not None:
+            cached = self.by_object.get((kind, id(entity)))
+            if cached is not None:
+                self.hits += 1
+                return cached[1]
+        key = (kind,) + normalize_key(*parts)
+        iri = self.by_key.get(key)
+        if iri is None:
+            self.misses += 1
+            iri = URIRef(self.namespace[self._identifier(key, parts)])
+            self.by_key[key] = iri
+        else:
+            self.hits += 1
+        if entity is not None:
+            # The entity is kept alive so that its id cannot be reused by another object.
+            self.by_object[(kind, id(entity))] = (entity, iri)
+        return iri
+
+    @staticmethod
+    def _digest(key, digest_size):
+        return hashlib.blake2b("\x1f".join(key).encode("utf-8"), digest_size=digest_size).hexdigest()
+
+    def _identifier(self, key, parts):
+        if self.hashed:
+            identifier = f"{key[0]}_{self._digest(key, self.digest_size)}"
+        else:
+            identifier = slugify("".join(str(part) for part in parts))
+        owner = self.owners.get(identifier)
+        if owner is not None and owner != key:
+            logging.warning(f'IRI collision: {key} and {owner} both map to {identifier}')
+            self.collisions.append((identifier, key, owner))
+            identifier = f"{identifier}_{self._digest(key, 4)}"
+        self.owners[identifier] = key
+        return identifier
+
+    def lookup(self, kind, *parts):
+        """
+        Returns the IRI already minted for a key, without minting one.
+
+        Returns:
+            URIRef: The IRI, or None if no entity of that kind and key has been minted.
+        """
+        return self.by_key.get((kind,) + normalize_key(*parts))
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self.by_key)
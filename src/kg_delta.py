@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+
+from rdflib.util import from_n3
+
+from fuseki import make_session
+from rdf_writer import open_text
+
+
+class KGDelta:
+    """
+    This class holds the difference between two versions of the knowledge graph: the triples to insert and delete
+    (as N-Triples lines) and the papers whose contribution was added, removed or changed.
+    """
+
+    def __init__(self, added=None, removed=None, added_papers=None, removed_papers=None, changed_papers=None):
+        self.added = added if added is not None else set()
+        self.removed = removed if removed is not None else set()
+        self.added_papers = added_papers if added_papers is not None else []
+        self.removed_papers = removed_papers if removed_papers is not None else []
+        self.changed_papers = changed_papers if changed_papers is not None else []
+
+    def __len__(self):
+        return len(self.added) + len(self.removed)
+
+    def __repr__(self):
+        return (f"KGDelta(+{len(self.added)} -{len(self.removed)} triples, {len(self.added_papers)} new, "
+                f"{len(self.removed_papers)} removed, {len(self.changed_papers)} changed papers)")
+
+
+class TripleLedger:
+    """
+    This class records, for every source paper, the triples it contributes to the knowledge graph, so that a later
+    run can compute the delta against the previous one and load only that instead of reloading the whole graph.
+
+    Triples are stored as N-Triples lines. Entities shared by several papers (authors, journals...) are attributed to
+    the paper through which the RDFParser first reached them; the delta is computed on the union of all the papers,
+    so a triple is only deleted when no paper contributes it any more.
+    """
+
+    def __init__(self, papers=None):
+        self.papers = papers if papers is not None else {}
+
+    def record(self, paper_key, line):
+        """
+        Attributes an N-Triples line to a paper.
+        """
+        contribution = self.papers.get(paper_key)
+        if contribution is None:
+            contribution = self.papers[paper_key] = set()
+        contribution.add(line)
+
+    def triples(self):
+        """
+        Returns the set of all the N-Triples lines contributed by any paper.
+        """
+        union = set()
+        for contribution in self.papers.values():
+            union.update(contribution)
+        return union
+
+    def diff(self, new):
+        """
+        Computes the delta that turns the graph recorded by this ledger into the one recorded by another.
+
+        Parameters:
+            new (TripleLedger): The ledger of the new build.
+
+        Returns:
+            KGDelta: The triples to insert and delete and the papers that were added, removed or changed.
+        """
+        old_triples, new_triples = self.triples(), new.triples()
+        return KGDelta(added=new_triples - old_triples, removed=old_triples - new_triples,
+                       added_papers=[key for key in new.papers if key not in self.papers],
+                       removed_papers=[key for key in self.papers if key not in new.papers],
+                       changed_papers=[key for key, contribution in new.papers.items()
+                                       if key in self.papers and self.papers[key] != contribution])
+
+    def save(self, path):
+        """
+        Persists the ledger as (optionally .gz or .zst compressed) JSON.
+        """
+        tmp_path = f"{path}.tmp"
+        with open_text(tmp_path, "wt", compression=_compression(path)) as f:
+            json.dump({key: sorted(lines) for key, lines in self.papers.items()}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a ledger saved with save, or returns an empty ledger if the file does not exist.
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open_text(path, "rt") as f:
+            return cls({key: set(lines) for key, lines in json.load(f).items()})
+
+
+def _compression(path):
+    return "gzip" if path.endswith(".gz") else "zstd" if path.endswith(".zst") else None
+
+
+def parse_nt_line(line):
+    """
+    Parses an N-Triples line as written by rdf_writer into an rdflib triple.
+    """
+    body = line.strip()[:-1].strip()
+    subject, rest = body.split(" ", 1)
+    predicate, obj = rest.split(" ", 1)
+    return from_n3(subject), from_n3(predicate), from_n3(obj.strip())
+
+
+def apply_to_graph(graph, delta):
+    """
+    Applies a delta to an rdflib graph (in memory or backed by a persistent store).
+    """
+    for line in delta.removed:
+        graph.remove(parse_nt_line(line))
+    graph.addN((*parse_nt_line(line), graph) for line in delta.added)
+
+
+def apply_to_ntriples(path, delta):
+    """
+    Applies a delta to an N-Triples file (optionally .gz or .zst compressed) by streaming it once, dropping the
+    removed lines and appending the added ones. A delta without removals is appended to a plain or gzip file in place.
+    """
+    compression = _compression(path)
+    if not delta.removed and compression != "zstd":
+        with open_text(path, "at", compression=compression) as out:
+            out.writelines(sorted(delta.added))
+        return
+    tmp_path = f"{path}.tmp"
+    with open_text(tmp_path, "wt", compression=compression) as out:
+        if os.path.exists(path):
+            with open_text(path, "rt") as f:
+                for line in f:
+                    if line not in delta.removed:
+                        out.write(line)
+        out.writelines(sorted(delta.added))
+    os.replace(tmp_path, path)
+
+
+class SPARQLUpdater:
+    """
+    This class applies a delta to a SPARQL 1.1 Update endpoint (e.g. http://localhost:3030/kg/update) as batches of
+    DELETE DATA and INSERT DATA requests.
+    """
+
+    def __init__(self, update_url, batch_size=5000, retries=5, backoff_factor=0.5, auth=None, timeout=300):
+        self.update_url = update_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = make_session(pool_size=1, retries=retries, backoff_factor=backoff_factor, auth=auth)
+
+    def update(self, operation, lines):
+        lines = sorted(lines)
+        for i in range(0, len(lines), self.batch_size):
+            resp = self.session.post(self.update_url,
+                                     data={"update": f"{operation} {{\n{''.join(lines[i:i + self.batch_size])}}}"},
+                                     timeout=self.timeout)
+            resp.raise_for_status()
+
+    def apply(self, delta):
+        """
+        Deletes the removed triples and then inserts the added ones.
+        """
+        self.update("DELETE DATA", delta.removed)
+        self.update("INSERT DATA", delta.added)
+        logging.info(f'Applied {delta} to {self.update_url}')
@@ -0,0 +1,212 @@
+import json
+import os
+
+import numpy as np
+from rdflib import Graph
+from rdflib.util import from_n3
+
+from rdf_writer import term_nt
+
+FORMAT_VERSION = 1
+
+
+class SnapshotWriter:
+    """
+    This class writes a dictionary-encoded binary snapshot of the knowledge graph. It can be used as the sink of an
+    RDFParser.
+
+    A snapshot is a folder with:
+        terms.bin     the N-Triples form of every distinct term, UTF-8 encoded, sorted and concatenated
+        offsets.npy   the start of every term in terms.bin, plus the end of the last one (int64)
+        triples.npy   the distinct triples as rows of term ids (s, p, o), sorted, as the smallest unsigned ints that fit
+        meta.json     format version and sizes
+
+    Since the terms are sorted, the id of a term is its rank, so readers can look it up with a binary search instead of
+    building a dictionary of the whole graph.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = {}
+        self.rows = []
+        self.closed = False
+
+    def term_id(self, term):
+        n3 = term_nt(term)
+        term_id = self.ids.get(n3)
+        if term_id is None:
+            term_id = self.ids[n3] = len(self.ids)
+        return term_id
+
+    def add(self, triple):
+        """
+        Adds a single triple.
+        """
+        self.rows.extend(self.term_id(term) for term in triple)
+
+    def addN(self, quads):
+        """
+        Adds a batch of quads, ignoring their context.
+        """
+        for s, p, o, _ in quads:
+            self.rows.extend((self.term_id(s), self.term_id(p), self.term_id(o)))
+
+    def close(self):
+        """
+        Sorts the terms and triples and writes the snapshot.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        os.makedirs(self.path, exist_ok=True)
+        terms = sorted(self.ids)
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[[self.ids[n3] for n3 in terms]] = np.arange(len(terms))
+        dtype = np.uint16 if len(terms) <= 2 ** 16 else np.uint32 if len(terms) <= 2 ** 32 else np.uint64
+        triples = rank[np.asarray(self.rows, dtype=np.int64).reshape(-1, 3)].astype(dtype)
+        if len(triples):
+            triples = np.unique(triples, axis=0)
+        encoded = [n3.encode("utf-8") for n3 in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        with open(os.path.join(self.path, "terms.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(self.path, "offsets.npy"), offsets)
+        np.save(os.path.join(self.path, "triples.npy"), triples)
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"version": FORMAT_VERSION, "terms": len(terms), "triples": len(triples)}, f)
+        self.ids = {}
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_snapshot(triples, path):
+    """
+    Writes a snapshot of an rdflib graph or of any iterable of triples.
+
+    Parameters:
+        triples: The triples to write.
+        path (str): The snapshot folder.
+    """
+    with SnapshotWriter(path) as writer:
+        for triple in triples:
+            writer.add(triple)
+
+
+class KGSnapshot:
+    """
+    This class reads a snapshot written by SnapshotWriter. The triple array and the term dictionary are memory mapped,
+    so opening a snapshot is immediate and only the terms that are actually used get decoded.
+
+    Usage:
+        snapshot = KGSnapshot("kg.snapshot")
+        for s, p, o in snapshot.triples((None, RDF.type, schema["paper"])): ...
+        graph = snapshot.to_graph()
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f'Unsupported snapshot version {self.meta["version"]} in {path}')
+        mmap_mode = "r" if mmap else None
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode=mmap_mode)
+        self.ids = np.load(os.path.join(path, "triples.npy"), mmap_mode=mmap_mode)
+        self.blob = np.memmap(os.path.join(path, "terms.bin"), dtype=np.uint8, mode="r") \
+            if mmap and self.offsets[-1] else np.fromfile(os.path.join(path, "terms.bin"), dtype=np.uint8)
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def num_terms(self):
+        return len(self.offsets) - 1
+
+    def n3(self, term_id):
+        """
+        Returns the N-Triples form of the term with the given id.
+        """
+        return self.blob[self.offsets[term_id]:self.offsets[term_id + 1]].tobytes().decode("utf-8")
+
+    def term(self, term_id):
+        """
+        Returns the rdflib term with the given id.
+        """
+        term_id = int(term_id)
+        term = self.cache.get(term_id)
+        if term is None:
+            term = self.cache[term_id] = from_n3(self.n3(term_id))
+        return term
+
+    def term_id(self, term):
+        """
+        Looks a term up with a binary search over the sorted dictionary.
+
+        Returns:
+            int: The id of the term, or None if it is not in the snapshot.
+        """
+        key = term_nt(term)
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self.n3(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.num_terms and self.n3(low) == key else None
+
+    def match(self, pattern):
+        """
+        Returns the rows of term ids matching a (s, p, o) pattern where None is a wildcard.
+
+        Returns:
+            numpy.ndarray: The matching rows.
+        """
+        ids = [None if term is None else self.term_id(term) for term in pattern]
+        if any(term is not None and term_id is None for term, term_id in zip(pattern, ids)):
+            return self.ids[:0]
+        rows = self.ids
+        if ids[0] is not None:
+            # Triples are sorted by subject, so the subject selects a contiguous range.
+            rows = rows[np.searchsorted(rows[:, 0], ids[0], "left"):np.searchsorted(rows[:, 0], ids[0], "right")]
+        mask = None
+        for column in (1, 2):
+            if ids[column] is not None:
+                column_mask = rows[:, column] == ids[column]
+                mask = column_mask if mask is None else mask & column_mask
+        return rows if mask is None else rows[mask]
+
+    def triples(self, pattern=(None, None, None)):
+        """
+        Yields the rdflib triples matching a (s, p, o) pattern where None is a wildcard.
+        """
+        for s, p, o in self.match(pattern):
+            yield self.term(s), self.term(p), self.term(o)
+
+    def count(self, pattern=(None, None, None)):
+        return len(self.match(pattern))
+
+    def to_graph(self, graph=None):
+        """
+        Loads the whole snapshot into an rdflib graph.
+
+        Parameters:
+            graph (Graph, optional): The graph to load into, e.g. one backed by a persistent store. A new in-memory
+            graph by default.
+
+        Returns:
+            Graph: The graph.
+        """
+        graph = graph if graph is not None else Graph()
+        blob = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        terms = [from_n3(blob[start:end].decode("utf-8")) for start, end in zip(offsets, offsets[1:])]
+        graph.addN((terms[s], terms[p], terms[o], graph) for s, p, o in self.ids.tolist())
+        return graph
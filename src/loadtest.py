@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_services import Faults, FakeGrobid, FakeOpenAlex, FakeWikidata, fake_pdf
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def prepare(res_folder, papers):
+    """
+    Lays out a RES_FOLDER for main.py whose raw folder holds one fake PDF per synthetic paper and whose grobid
+    folder is empty, so the run goes through GROBID.
+    """
+    raw = os.path.join(res_folder, "datasets", "space", "raw")
+    os.makedirs(raw, exist_ok=True)
+    os.makedirs(os.path.join(res_folder, "datasets", "space", "grobid"), exist_ok=True)
+    for index in range(papers):
+        with open(os.path.join(raw, f"paper-{index:06d}.pdf"), "wb") as f:
+            f.write(fake_pdf(index))
+
+
+class LoadTest:
+    """
+    This class runs the whole pipeline (main.py) over a synthetic corpus against local stand-ins of GROBID, OpenAlex
+    and Wikidata with the given faults, and reports the throughput, the tail latencies seen by the services and by
+    the pipeline, and the peak memory.
+
+    Parameters:
+        spec (CorpusSpec): Shape of the synthetic corpus.
+        grobid, openalex, wikidata (Faults, optional): Faults of each service.
+        extra_args (list, optional): Further arguments of main.py, e.g. ["--HASHED_IRIS"].
+    """
+
+    def __init__(self, spec, grobid=None, openalex=None, wikidata=None, extra_args=None):
+        self.spec = spec
+        self.faults = {"grobid": grobid, "openalex": openalex, "wikidata": wikidata}
+        self.extra_args = extra_args or []
+
+    def run(self, workdir=None, timeout=None):
+        """
+        Runs the load test in workdir (a temporary folder if None).
+
+        Returns:
+            dict: The report, see print_report.
+        """
+        with tempfile.TemporaryDirectory() as temporary:
+            workdir = workdir or temporary
+            res_folder = os.path.join(workdir, "res")
+            prepare(res_folder, self.spec.papers)
+            metrics_path = os.path.join(workdir, "metrics.json")
+            services = {"grobid": FakeGrobid(self.faults["grobid"], corpus=SyntheticCorpus(self.spec)),
+                        "openalex": FakeOpenAlex(self.faults["openalex"]),
+                        "wikidata": FakeWikidata(self.faults["wikidata"])}
+            for service in services.values():
+                service.start()
+            try:
+                grobid_host, grobid_port = services["grobid"].server.server_address[:2]
+                command = [sys.executable, MAIN, "--RES_FOLDER", res_folder,
+                           "--GROBID_HOST", grobid_host, "--GROBID_PORT", str(grobid_port),
+                           "--OPENALEX_URL", services["openalex"].url,
+                           "--WIKIDATA_URL", f"{services['wikidata'].url}/sparql",
+                           "--KG_OUTPUT", os.path.join(workdir, "kg.nt"), "--METRICS", metrics_path,
+                           *self.extra_args]
+                start = time.perf_counter()
+                completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True, timeout=timeout)
+                seconds = time.perf_counter() - start
+            finally:
+                for service in services.values():
+                    service.stop()
+            pipeline = {}
+            if os.path.exists(metrics_path):
+                with open(metrics_path, encoding="utf-8") as f:
+                    pipeline = json.load(f)
+        # ru_maxrss of the children is in KiB on Linux and in bytes on macOS
+        children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        children_peak = children_peak if sys.platform == "darwin" else children_peak * 1024
+        return {
+            "papers": self.spec.papers,
+            "returncode": completed.returncode,
+            "stderr": completed.stderr[-2000:] if completed.returncode else "",
+            "seconds": seconds,
+            "papers_per_second": self.spec.papers / seconds if seconds else None,
+            "peak_rss_bytes": pipeline.get("peak_rss_bytes", children_peak),
+            "services": {name: service.stats() for name, service in services.items()},
+            "client": pipeline.get("http", {}),
+            "counters": pipeline.get("counters", {}),
+            "stages": {path: stats["wall_seconds"] for path, stats in pipeline.get("stages", {}).items()},
+        }
+
+
+def _milliseconds(seconds):
+    return f"{seconds * 1000:.1f}ms" if seconds is not None else "-"
+
+
+def print_report(report):
+    print(f"{report['papers']} papers in {report['seconds']:.1f}s ({report['papers_per_second']:.2f} papers/s), "
+          f"peak RSS {report['peak_rss_bytes'] / 2 ** 20:.0f} MiB, exit code {report['returncode']}")
+    if report["stderr"]:
+        print(report["stderr"])
+    for name, stats in report["services"].items():
+        print(f"  {name}: {stats['requests']} requests, {stats['errors']} errors ({stats['unavailable']} 503), "
+              f"p50 {_milliseconds(stats['p50_seconds'])}, p95 {_milliseconds(stats['p95_seconds'])}, "
+              f"p99 {_milliseconds(stats['p99_seconds'])}")
+    for name, histogram in report["client"].items():
+        print(f"  {name} seen by the pipeline: {histogram.get('count')} requests, {histogram.get('errors')} errors, "
+              f"p95 <= {_milliseconds(histogram.get('p95_seconds'))}")
+    for name, count in report["counters"].items():
+        print(f"  {name}: {count}")
+    for path, seconds in report["stages"].items():
+        print(f"  stage {path}: {seconds:.2f}s")
+
+
+def _faults(args, service):
+    return Faults(latency=getattr(args, f"{service}_LATENCY"), jitter=getattr(args, f"{service}_JITTER"),
+                  error_rate=getattr(args, f"{service}_ERRORS"), burst_every=args.BURST_EVERY,
+                  burst_length=args.BURST_LENGTH if service in ("GROBID", "WIKIDATA") else 0.0, seed=args.SEED)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='Load test',
+                                     description='Run the pipeline against local stand-ins of GROBID, OpenAlex and '
+                                                 'Wikidata')
+    parser.add_argument("--PAPERS", type=int, default=200, help="Number of synthetic papers")
+    for service, latency, jitter in (("GROBID", 0.5, 0.5), ("OPENALEX", 0.05, 0.05), ("WIKIDATA", 0.1, 0.2)):
+        parser.add_argument(f"--{service}_LATENCY", type=float, default=latency,
+                            help=f"Base latency of {service.lower()} in seconds")
+        parser.add_argument(f"--{service}_JITTER", type=float, default=jitter,
+                            help=f"Mean of the exponential extra latency of {service.lower()} in seconds")
+        parser.add_argument(f"--{service}_ERRORS", type=float, default=0.0,
+                            help=f"Fraction of the {service.lower()} requests answered with a 500")
+    parser.add_argument("--BURST_EVERY", type=float, required=False,
+                        help="Seconds between the 503 bursts of GROBID and Wikidata")
+    parser.add_argument("--BURST_LENGTH", type=float, default=2.0, help="Length of a 503 burst in seconds")
+    parser.add_argument("--SEED", type=int, default=0, help="Random seed of the corpus and the faults")
+    parser.add_argument("--OUTPUT", required=False, help="JSON file where the report is written")
+    parser.add_argument("--WORKDIR", required=False, help="Folder kept with the inputs and outputs of the run")
+    args, extra_args = parser.parse_known_args()
+    load_test = LoadTest(CorpusSpec(papers=args.PAPERS, seed=args.SEED), grobid=_faults(args, "GROBID"),
+                         openalex=_faults(args, "OPENALEX"), wikidata=_faults(args, "WIKIDATA"),
+                         extra_args=extra_args)
+    report = load_test.run(workdir=args.WORKDIR)
+    print_report(report)
+    if args.OUTPUT:
+        with open(args.OUTPUT, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(report["returncode"])
@@ -1,6 +1,6 @@
 import argparse
-import json
 import os
+from contextlib import nullcontext
 
 import requests
 import logging
@@ -8,6 +8,22 @@ import logging
 from processor import PaperProcessor
 from paper_space import PaperSet
 from rdfparser import RDFParser
+from rdf_writer import open_writer, open_text, TeeSink
+from fuseki import FusekiLoader
+from kg_delta import KGDelta, TripleLedger, SPARQLUpdater, apply_to_graph, apply_to_ntriples, parse_nt_line
+from triple_store import open_graph
+from kg_snapshot import SnapshotWriter, write_snapshot
+from sharded_builder import build_sharded
+from parquet_export import export_parquet
+from spark_pipeline import SparkPipeline, spark_session
+from streaming_paper_space import StreamingPaperSet
+from consolidation import ConsolidationIndex
+from dedup import Deduplicator, PdfDigests
+from tei_archive import TEIArchive
+from instrumentation import RunMetrics, activate
+from ontology_classes import configure_services
+from watcher import FolderWatcher, IncrementalIngestor
+from service import IngestionService
 
 # Set up logging
 logging.basicConfig(filename=f'./log.log', encoding='utf-8', format='%(asctime)s %(message)s',
@@ -42,52 +58,435 @@ if __name__ == '__main__':
         required=False,
         help="Port for the Grobid application",
     )
+    parser.add_argument(
+        "--GROBID_HOST",
+        default="localhost",
+        required=False,
+        help="Host of the Grobid application",
+    )
+    parser.add_argument(
+        "--CONSOLIDATION_INDEX",
+        required=False,
+        help="JSON Lines file of a local reference consolidation index, which resolves the references of new PDFs "
+             "instead of GROBID's per-citation consolidation and grows across runs",
+    )
+    parser.add_argument(
+        "--TEI_ARCHIVE",
+        required=False,
+        help="Keep the GROBID TEI documents compressed in this append-only archive instead of as XML files of "
+             "RES_FOLDER/datasets/space/grobid/ (whose XML files are imported into it the first time)",
+    )
+    parser.add_argument(
+        "--DEDUP",
+        action="store_true",
+        help="Skip byte-identical PDFs before GROBID and merge near-duplicate papers (preprint and published version, "
+             "renamed copies) by the SimHash of their text",
+    )
+    parser.add_argument(
+        "--DEDUP_DISTANCE",
+        type=int,
+        default=3,
+        help="With --DEDUP, maximum number of differing bits (out of 64) between the SimHash of near-duplicates",
+    )
+    parser.add_argument(
+        "--CONSOLIDATION_OFFLINE",
+        action="store_true",
+        help="With --CONSOLIDATION_INDEX, leave the references it does not know unresolved instead of consolidating "
+             "them with GROBID",
+    )
+    parser.add_argument(
+        "--OPENALEX_URL",
+        required=False,
+        help="Base URL of the OpenAlex API, instead of https://api.openalex.org",
+    )
+    parser.add_argument(
+        "--WIKIDATA_URL",
+        required=False,
+        help="URL of the Wikidata SPARQL endpoint, instead of https://query.wikidata.org/sparql",
+    )
     parser.add_argument(
         "--FUSEKI_PORT",
         default="3030",
         required=False,
         help="Port for the Fuseki application",
     )
+    parser.add_argument(
+        "--FUSEKI_DATASET",
+        default="kg",
+        required=False,
+        help="Fuseki dataset the knowledge graph is loaded into",
+    )
+    parser.add_argument(
+        "--FUSEKI_AUTH",
+        required=False,
+        help="user:password for the Fuseki dataset, if it requires authentication",
+    )
+    parser.add_argument(
+        "--LOAD_FUSEKI",
+        action="store_true",
+        help="Load the knowledge graph into Fuseki while it is being written",
+    )
+    parser.add_argument(
+        "--INCREMENTAL",
+        action="store_true",
+        help="Build the paper space and the triples in full, but only load the triples added or removed since the "
+             "previous run, to Fuseki with --LOAD_FUSEKI or to KG_OUTPUT otherwise. To add new papers without "
+             "rebuilding, use --WATCH",
+    )
     parser.add_argument(
         "--RES_FOLDER",
         required=True,
         help="Folder where the inputs and results will be stored",
     )
+    parser.add_argument(
+        "--KG_OUTPUT",
+        required=False,
+        help="File where the knowledge graph is written (.jsonld, .nt or .nq, optionally .gz or .zst). "
+             "Defaults to RES_FOLDER/datasets/json-ld/kg.jsonld",
+    )
+    parser.add_argument(
+        "--HASHED_IRIS",
+        action="store_true",
+        help="Use compact hashed IRIs instead of slugs of titles and names",
+    )
+    parser.add_argument(
+        "--KG_STORE",
+        required=False,
+        help="SQLite file where the knowledge graph is also stored, indexed for querying without reloading it",
+    )
+    parser.add_argument(
+        "--SNAPSHOT",
+        required=False,
+        help="Folder where a compact binary snapshot of the knowledge graph is also written, see kg_snapshot",
+    )
+    parser.add_argument(
+        "--SHARDS",
+        type=int,
+        required=False,
+        help="Build the knowledge graph in this many shards on parallel processes (with hashed IRIs) and merge them "
+             "into KG_OUTPUT, which must be an N-Triples file",
+    )
+    parser.add_argument(
+        "--PARTITIONS",
+        type=int,
+        required=False,
+        help="With --SHARDS, write the knowledge graph as this many subject partitions of KG_OUTPUT plus a manifest",
+    )
+    parser.add_argument(
+        "--PARQUET",
+        required=False,
+        help="Folder where the papers, authors, citations and acknowledgements are also exported as Parquet tables",
+    )
+    parser.add_argument(
+        "--SPARK",
+        required=False,
+        help="Run the paper space and knowledge graph pipeline on this Spark master (e.g. local[*] or "
+             "spark://host:7077) with hashed IRIs, writing KG_OUTPUT, which must be an N-Triples file",
+    )
+    parser.add_argument(
+        "--SPARK_PARTITIONS",
+        type=int,
+        required=False,
+        help="With --SPARK, number of partitions of the papers and of the linked entities",
+    )
+    parser.add_argument(
+        "--STREAM_WINDOW",
+        type=int,
+        required=False,
+        help="Process the papers in windows of this many papers with bounded memory, spilling them to "
+             "RES_FOLDER/datasets/spill/, and write KG_OUTPUT, which must be an N-Triples file, with hashed IRIs",
+    )
+    parser.add_argument(
+        "--WATCH",
+        action="store_true",
+        help="After the run, keep watching RES_FOLDER/datasets/space/raw/ and append the triples of the new PDFs to "
+             "the N-Triples KG_OUTPUT in micro-batches, until interrupted with Ctrl+C",
+    )
+    parser.add_argument(
+        "--WATCH_DEBOUNCE",
+        type=float,
+        default=2.0,
+        help="With --WATCH, seconds without new PDFs that close a micro-batch",
+    )
+    parser.add_argument(
+        "--WATCH_MAX_BATCH",
+        type=int,
+        default=32,
+        help="With --WATCH, maximum number of PDFs of a micro-batch",
+    )
+    parser.add_argument(
+        "--WATCH_POLL",
+        action="store_true",
+        help="With --WATCH, poll the folder instead of using inotify",
+    )
+    parser.add_argument(
+        "--SERVE",
+        type=int,
+        required=False,
+        help="After the run, keep the models loaded and serve an HTTP API on this port to ingest PDFs or TEI "
+             "documents and query the paper space, until interrupted with Ctrl+C",
+    )
+    parser.add_argument(
+        "--SERVE_HOST",
+        default="127.0.0.1",
+        help="With --SERVE, address to listen on",
+    )
+    parser.add_argument(
+        "--SERVE_MAX_BATCH",
+        type=int,
+        default=16,
+        help="With --SERVE, maximum number of concurrently submitted papers added to the paper space together",
+    )
+    parser.add_argument(
+        "--TIERED",
+        action="store_true",
+        help="With --WATCH or --SERVE, add new PDFs from a fast GROBID header pass and process their full text "
+             "(references and acknowledgements) in the background",
+    )
+    parser.add_argument(
+        "--METRICS",
+        required=False,
+        help="JSON file where the run report (time, CPU, memory and items of every stage, cache hit rates and HTTP "
+             "latencies) is written",
+    )
+    parser.add_argument(
+        "--PROMETHEUS",
+        required=False,
+        help="Prometheus textfile where the run metrics are also written, for the node_exporter textfile collector",
+    )
+    parser.add_argument(
+        "--TRACE_MEMORY",
+        action="store_true",
+        help="Also record the peak Python memory of every stage with tracemalloc (slows the run down)",
+    )
+    parser.add_argument(
+        "--PROFILE",
+        required=False,
+        help="Profile one stage of the run, by name or path (e.g. paper_space/find_entities)",
+    )
+    parser.add_argument(
+        "--PROFILE_MODE",
+        choices=["cprofile", "sampling"],
+        default="cprofile",
+        help="With --PROFILE, write a cProfile .prof file or the collapsed stacks of a sampling profiler",
+    )
 
     # Parse the arguments
     args = parser.parse_args()
+    for option in ("SHARDS", "SPARK", "STREAM_WINDOW", "WATCH", "SERVE"):
+        if getattr(args, option) and args.INCREMENTAL:
+            parser.error(f"--{option} cannot be combined with --INCREMENTAL")
+        if getattr(args, option) and not (args.KG_OUTPUT or "").endswith((".nt", ".nt.gz", ".nt.zst")):
+            parser.error(f"--{option} requires an N-Triples KG_OUTPUT (.nt, .nt.gz or .nt.zst)")
+    if args.SHARDS and args.SPARK:
+        parser.error("--SHARDS cannot be combined with --SPARK")
+    for option in ("SHARDS", "SPARK", "PARQUET"):
+        if args.STREAM_WINDOW and getattr(args, option):
+            parser.error(f"--STREAM_WINDOW cannot be combined with --{option}")
+    for option in ("SHARDS", "SPARK", "STREAM_WINDOW", "SNAPSHOT"):
+        if args.WATCH and getattr(args, option):
+            parser.error(f"--WATCH cannot be combined with --{option}")
+        if args.SERVE and getattr(args, option):
+            parser.error(f"--SERVE cannot be combined with --{option}")
+    if args.WATCH and args.SERVE:
+        parser.error("--WATCH cannot be combined with --SERVE")
+    if args.TIERED and not (args.WATCH or args.SERVE):
+        parser.error("--TIERED requires --WATCH or --SERVE")
+    for option in ("DEDUP", "TEI_ARCHIVE"):
+        if getattr(args, option) and args.SPARK:
+            parser.error(f"--{option} cannot be combined with --SPARK")
+    if args.CONSOLIDATION_OFFLINE and not args.CONSOLIDATION_INDEX:
+        parser.error("--CONSOLIDATION_OFFLINE requires --CONSOLIDATION_INDEX")
+
+    run_metrics = activate(RunMetrics(trace_memory=args.TRACE_MEMORY, profile_stage=args.PROFILE,
+                                      profile_mode=args.PROFILE_MODE,
+                                      profile_dir=os.path.dirname(os.path.abspath(args.METRICS or "log.log"))))
 
     # Define the input and output paths
     input_path = f"{args.RES_FOLDER}/datasets/space/raw/"
     output_path = f"{args.RES_FOLDER}/datasets/space/grobid/"
 
     # Initialize the paper processor
-    processor = PaperProcessor(output_path=output_path)
+    consolidation = ConsolidationIndex(args.CONSOLIDATION_INDEX) if args.CONSOLIDATION_INDEX else None
+    deduplicator = Deduplicator(max_distance=args.DEDUP_DISTANCE, bands=args.DEDUP_DISTANCE + 1,
+                                body=not args.TIERED) if args.DEDUP else None
+    archive = TEIArchive(args.TEI_ARCHIVE) if args.TEI_ARCHIVE else None
+    if archive is not None and len(archive) == 0 and os.path.isdir(output_path):
+        imported = archive.import_folder(output_path)
+        if imported:
+            print(f'Imported {imported} XML files into {args.TEI_ARCHIVE}')
+    processor = PaperProcessor(output_path=output_path, grobid_port=args.GROBID_PORT, grobid_host=args.GROBID_HOST,
+                               consolidation=consolidation, external_consolidation=not args.CONSOLIDATION_OFFLINE,
+                               digests=PdfDigests() if args.DEDUP else None, archive=archive)
+    configure_services(openalex_url=args.OPENALEX_URL, wikidata_url=args.WIKIDATA_URL)
 
     # Process the PDFs or XMLs
-    if len(os.listdir(output_path)) == 0:
-        logging.info('Processing PDFs')
-        print('Processing PDFs')
-        papers = processor.process_folder(input_path)
-    else:
-        logging.info('Processing XMLs')
-        print('Processing XMLs')
-        papers = processor.process_folder_from_xml(pdf_path=input_path)
+    with run_metrics.stage("process"):
+        if args.STREAM_WINDOW:
+            # The streaming paper space pulls the papers one window at a time
+            papers = processor.iter_folder(input_path) if not processor.xml_names() else \
+                processor.iter_folder_from_xml(pdf_path=input_path)
+        elif not processor.xml_names():
+            logging.info('Processing PDFs')
+            print('Processing PDFs')
+            papers = processor.process_folder(input_path)
+        elif args.SPARK:
+            # The Spark executors parse the XMLs themselves
+            papers = None
+        else:
+            logging.info('Processing XMLs')
+            print('Processing XMLs')
+            papers = processor.process_folder_from_xml(pdf_path=input_path)
+    if deduplicator is not None and papers is not None:
+        papers = deduplicator.filter(papers) if args.STREAM_WINDOW else deduplicator.deduplicate(papers)
 
     # Create the paper space
-    logging.info('Creating paper space')
-    print('Creating paper space')
-    paper_space = PaperSet(papers, res_path=args.RES_FOLDER)
+    paper_space = None
+    if not args.SPARK and not args.STREAM_WINDOW:
+        logging.info('Creating paper space')
+        print('Creating paper space')
+        with run_metrics.stage("paper_space", items=len(papers)):
+            paper_space = PaperSet(papers, res_path=args.RES_FOLDER)
 
-    # Serialize the paper space
+    if args.PARQUET and paper_space is not None:
+        logging.info('Exporting paper space to Parquet')
+        print('Exporting paper space to Parquet')
+        with run_metrics.stage("parquet"):
+            counts = export_parquet(paper_space, args.PARQUET)
+        print(f"Exported {', '.join(f'{rows} {name}' for name, rows in counts.items())}")
+
+    # Serialize the paper space, streaming the triples to the output file
     logging.info('Serializing paper space')
     print('Serializing paper space')
-    kg = RDFParser(paper_space)
-    json_ld = kg.g.serialize(format='json-ld', indent=4)
+    kg_output = args.KG_OUTPUT if args.KG_OUTPUT else f'{args.RES_FOLDER}/datasets/json-ld/kg.jsonld'
+    os.makedirs(os.path.dirname(os.path.abspath(kg_output)), exist_ok=True)
+    fuseki_url = f"http://localhost:{args.FUSEKI_PORT}"
+    fuseki_auth = tuple(args.FUSEKI_AUTH.split(":", 1)) if args.FUSEKI_AUTH else None
+    store = open_graph(args.KG_STORE) if args.KG_STORE else None
+    with run_metrics.stage("serialize"):
+        if args.INCREMENTAL:
+            # The whole graph is built again, since clusters, topics and network metrics depend on the whole corpus;
+            # only what is loaded into the outputs is incremental
+            ledger_path = f'{kg_output}.ledger.json.gz'
+            ledger = TripleLedger()
+            kg = RDFParser(paper_space, hashed_iris=args.HASHED_IRIS, sink=TeeSink(), ledger=ledger)
+            first_run = not os.path.exists(ledger_path)
+            delta = TripleLedger.load(ledger_path).diff(ledger)
+            logging.info(f'Applying {delta}')
+            print(f'Applying {delta}')
+            if store is not None:
+                if first_run or len(store) == 0:
+                    # A store that never received this ledger is loaded from scratch
+                    store.remove((None, None, None))
+                    with store.store.bulk_load():
+                        apply_to_graph(store, KGDelta(added=ledger.triples()))
+                else:
+                    apply_to_graph(store, delta)
+            if args.LOAD_FUSEKI:
+                SPARQLUpdater(f"{fuseki_url}/{args.FUSEKI_DATASET}/update", auth=fuseki_auth).apply(delta)
+            elif not first_run and kg_output.endswith((".nt", ".nt.gz", ".nt.zst")):
+                apply_to_ntriples(kg_output, delta)
+            elif first_run or len(delta):
+                # Other formats cannot be patched in place, so they are rewritten from the ledger without a rebuild
+                with open_writer(kg_output) as writer:
+                    writer.addN((*parse_nt_line(line), None) for line in sorted(ledger.triples()))
+            if args.SNAPSHOT and (first_run or len(delta) or not os.path.exists(args.SNAPSHOT)):
+                write_snapshot((parse_nt_line(line) for line in ledger.triples()), args.SNAPSHOT)
+            ledger.save(ledger_path)
+        elif args.SHARDS or args.SPARK or args.STREAM_WINDOW:
+            if args.STREAM_WINDOW:
+                logging.info('Creating streaming paper space')
+                print('Creating streaming paper space')
+                streaming = StreamingPaperSet(papers, f"{args.RES_FOLDER}/datasets/spill", res_path=args.RES_FOLDER,
+                                              window_size=args.STREAM_WINDOW)
+                report = streaming.write_ntriples(kg_output)
+                streaming.close()
+                print(f"Built {report['triples']} triples of {report['papers']} papers in {report['windows']} "
+                      f"windows")
+                files = [kg_output]
+            elif args.SPARK:
+                pipeline = SparkPipeline(spark_session(args.SPARK), res_path=args.RES_FOLDER,
+                                         partitions=args.SPARK_PARTITIONS)
+                report = pipeline.run(output_path, kg_output, parquet=args.PARQUET, pdf_path=input_path)
+                print(f"Built {report['triples']} triples of {report['papers']} papers on Spark in "
+                      f"{report['seconds']:.1f}s")
+                files = [kg_output]
+            else:
+                report = build_sharded(paper_space, kg_output, shards=args.SHARDS, partitions=args.PARTITIONS)
+                print(f"Built {report['triples']} triples in {args.SHARDS} shards in {report['seconds']:.1f}s")
+                files = [os.path.join(os.path.dirname(kg_output), file["path"]) for file in report["files"]]
+            if store is not None or args.SNAPSHOT:
+                def merged_triples():
+                    for path in files:
+                        with open_text(path, "rt") as f:
+                            yield from (parse_nt_line(line) for line in f)
+
+                if store is not None:
+                    store.remove((None, None, None))
+                    with store.store.bulk_load():
+                        store.addN((*triple, store) for triple in merged_triples())
+                if args.SNAPSHOT:
+                    write_snapshot(merged_triples(), args.SNAPSHOT)
+            if args.LOAD_FUSEKI:
+                logging.info('Loading knowledge graph into Fuseki')
+                print('Loading knowledge graph into Fuseki')
+                loader = FusekiLoader(url=fuseki_url, dataset=args.FUSEKI_DATASET, auth=fuseki_auth)
+                with run_metrics.stage("fuseki"):
+                    report = loader.load_files(files)
+                print(f"Loaded {report['sent']} triples in {report['chunks']} chunks, verified: {report['verified']}")
+        else:
+            loader = None
+            if args.LOAD_FUSEKI:
+                loader = FusekiLoader(url=fuseki_url, dataset=args.FUSEKI_DATASET, auth=fuseki_auth)
+            if store is not None:
+                store.remove((None, None, None))
+            snapshot = SnapshotWriter(args.SNAPSHOT) if args.SNAPSHOT else None
+            with open_writer(kg_output) as writer, store.store.bulk_load() if store is not None else nullcontext():
+                kg = RDFParser(paper_space, hashed_iris=args.HASHED_IRIS, sink=TeeSink(writer, loader, store, snapshot),
+                               graph=store)
+            if snapshot:
+                snapshot.close()
+            if loader:
+                logging.info('Loading knowledge graph into Fuseki')
+                print('Loading knowledge graph into Fuseki')
+                with run_metrics.stage("fuseki"):
+                    report = loader.close()
+                print(f"Loaded {report['sent']} triples in {report['chunks']} chunks, verified: {report['verified']}")
+    if args.WATCH or args.SERVE:
+        if processor.digests is not None:
+            # Copies of the PDFs processed in this or a previous run (those with a GROBID output) are skipped
+            processed = processor.xml_names()
+            for name, digest in processor.pdf_order(input_path):
+                if f"{name[:-len('.pdf')]}.xml" in processed:
+                    processor.record(input_path + name, digest)
+        ingestor = IncrementalIngestor(processor, paper_space, kg, kg_output, store=store,
+                                       updater=SPARQLUpdater(f"{fuseki_url}/{args.FUSEKI_DATASET}/update",
+                                                             auth=fuseki_auth) if args.LOAD_FUSEKI else None,
+                                       hashed_iris=args.HASHED_IRIS, tiered=args.TIERED,
+                                       deduplicator=deduplicator)
+    if args.SERVE:
+        logging.info(f'Serving on {args.SERVE_HOST}:{args.SERVE}')
+        IngestionService(processor, ingestor, input_path, host=args.SERVE_HOST, port=args.SERVE,
+                         max_batch=args.SERVE_MAX_BATCH).run()
+    if args.WATCH:
+        logging.info(f'Watching {input_path}')
+        print(f'Watching {input_path} for new PDFs, press Ctrl+C to stop')
+        watcher = FolderWatcher(input_path, seen=ingestor.processed(), debounce=args.WATCH_DEBOUNCE,
+                                max_batch=args.WATCH_MAX_BATCH, mode="poll" if args.WATCH_POLL else "auto")
+        ingestor.run(watcher)
+    if store is not None:
+        print(f'Stored {len(store)} triples in {args.KG_STORE}')
+        store.close()
 
-    # Write the serialized data to a file
-    with open(f'{args.RES_FOLDER}/datasets/json-ld/kg.jsonld', 'w') as outfile:
-        json.dump(json.loads(json_ld), outfile)
+    if consolidation is not None:
+        consolidation.close()
+    if archive is not None:
+        archive.close()
 
+    if args.METRICS:
+        run_metrics.write_json(args.METRICS)
+    if args.PROMETHEUS:
+        run_metrics.write_prometheus(args.PROMETHEUS)
+    run_metrics.close()
     logging.info('Done!')
     print('Done!')
@@ -0,0 +1,252 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from corpus_index import author_key
+
+
+def _unique_edges(rows, cols, shape):
+    """
+    Builds a CSR matrix with a 1 for every distinct (row, col) pair.
+    """
+    matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.float64), (rows, cols)), shape=shape)
+    matrix.sum_duplicates()
+    matrix.data[:] = 1.0
+    return matrix
+
+
+def _off_diagonal_nnz(matrix):
+    """
+    Returns the number of non-zero entries of every row of a square matrix, not counting the diagonal.
+    """
+    matrix = matrix.tocsr()
+    counts = np.diff(matrix.indptr)
+    return counts - (matrix.diagonal() != 0)
+
+
+def pagerank(adjacency, damping=0.85, tol=1e-10, max_iter=100):
+    """
+    Computes the PageRank of every node of a directed graph by power iteration on its sparse adjacency matrix.
+    Dangling nodes (without outgoing edges) spread their rank uniformly.
+
+    Parameters:
+        adjacency (scipy.sparse matrix): adjacency[i, j] != 0 if there is an edge from i to j.
+        damping (float): Probability of following an edge instead of jumping to a random node.
+        tol (float): Stop when the L1 change between iterations is below this value.
+        max_iter (int): Maximum number of iterations.
+
+    Returns:
+        numpy.ndarray: The PageRank of every node, summing to 1.
+    """
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    inverse = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    # transition[j, i] is the probability of moving from i to j
+    transition = (sp.diags(inverse) @ adjacency).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        previous = rank
+        rank = damping * (transition @ rank + rank[dangling].sum() / n) + (1.0 - damping) / n
+        if np.abs(rank - previous).sum() < tol:
+            break
+    return rank / rank.sum()
+
+
+class CitationNetwork:
+    """
+    This class compiles the citations of a paper space into a sparse citation matrix, with stable integer node ids
+    in the order of the paper space, and computes PageRank, in/out-degree, co-citation and bibliographic coupling on
+    it with vectorized SciPy operations.
+
+    adjacency[i, j] is 1 if paper i cites paper j. Cited papers that are not in the paper space get their own nodes
+    after the papers of the paper space.
+    """
+
+    def __init__(self, papers):
+        self.keys = []
+        self.nodes = []
+        self.node_ids = {}
+        self.object_ids = {}
+        for key, paper in papers.items():
+            self.node(paper, key)
+        rows, cols = [], []
+        for paper in list(self.nodes):
+            citations = list(paper.references) + [citation for citation in paper.cited_by
+                                                  if hasattr(citation, "source")]
+            for citation in citations:
+                if citation.source is None or citation.cites is None:
+                    continue
+                rows.append(self.node(citation.source))
+                cols.append(self.node(citation.cites))
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        loops = rows == cols
+        self.adjacency = _unique_edges(rows[~loops], cols[~loops], (len(self.nodes), len(self.nodes)))
+        self._co_citation = None
+        self._coupling = None
+
+    def node(self, paper, key=None):
+        """
+        Returns the node id of a paper, adding it to the network the first time it is seen.
+        """
+        node = self.object_ids.get(id(paper))
+        if node is not None:
+            return node
+        key = key if key is not None else paper.title
+        node = self.node_ids.get(key)
+        if node is None:
+            node = self.node_ids[key] = len(self.nodes)
+            self.keys.append(key)
+            self.nodes.append(paper)
+        self.object_ids[id(paper)] = node
+        return node
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def edges(self):
+        return self.adjacency.nnz
+
+    def in_degree(self):
+        """
+        Returns the number of papers of the network that cite each paper.
+        """
+        return np.asarray(self.adjacency.sum(axis=0)).ravel().astype(np.int64)
+
+    def out_degree(self):
+        """
+        Returns the number of papers of the network that each paper cites.
+        """
+        return np.asarray(self.adjacency.sum(axis=1)).ravel().astype(np.int64)
+
+    def pagerank(self, damping=0.85):
+        return pagerank(self.adjacency, damping=damping)
+
+    def co_citation(self):
+        """
+        Returns the co-citation matrix AᵀA: entry (i, j) is the number of papers that cite both i and j.
+        """
+        if self._co_citation is None:
+            self._co_citation = (self.adjacency.T @ self.adjacency).tocsr()
+        return self._co_citation
+
+    def coupling(self):
+        """
+        Returns the bibliographic coupling matrix AAᵀ: entry (i, j) is the number of references i and j share.
+        """
+        if self._coupling is None:
+            self._coupling = (self.adjacency @ self.adjacency.T).tocsr()
+        return self._coupling
+
+    def most_related(self, key, matrix, k=10):
+        """
+        Returns the k papers with the highest count in a row of a co-citation or coupling matrix.
+
+        Returns:
+            list: (paper key, count) pairs, highest count first.
+        """
+        node = self.node_ids[key]
+        row = matrix.getrow(node)
+        pairs = [(int(count), self.keys[other]) for other, count in zip(row.indices, row.data) if other != node]
+        pairs.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [(other, count) for count, other in pairs[:k]]
+
+    def write_back(self):
+        """
+        Stores the metrics of every paper as attributes: pagerank, citation_count (in-degree), reference_count
+        (out-degree), co_cited_with and coupled_with (number of distinct papers related by co-citation and by
+        bibliographic coupling).
+        """
+        metrics = zip(self.pagerank(), self.in_degree(), self.out_degree(),
+                      _off_diagonal_nnz(self.co_citation()), _off_diagonal_nnz(self.coupling()))
+        for paper, (rank, cited, citing, co_cited, coupled) in zip(self.nodes, metrics):
+            paper.pagerank = float(rank)
+            paper.citation_count = int(cited)
+            paper.reference_count = int(citing)
+            paper.co_cited_with = int(co_cited)
+            paper.coupled_with = int(coupled)
+
+
+class CoauthorNetwork:
+    """
+    This class compiles the authorship of a paper space into a sparse author × paper incidence matrix and derives the
+    co-authorship matrix MMᵀ, the co-author degree of every author and the connected components of collaboration.
+
+    Authors are identified by their normalized name, so duplicate Author objects of the same person share a node;
+    placeholder "unknown" authors are left out.
+    """
+
+    def __init__(self, papers):
+        self.keys = []
+        self.node_ids = {}
+        self.authors = []
+        rows, cols = [], []
+        for column, paper in enumerate(papers.values()):
+            for author in paper.authors:
+                if author.forename == "unknown" and author.surname == "unknown":
+                    continue
+                key = author_key(author)
+                node = self.node_ids.get(key)
+                if node is None:
+                    node = self.node_ids[key] = len(self.keys)
+                    self.keys.append(key)
+                    self.authors.append([])
+                if all(author is not other for other in self.authors[node]):
+                    self.authors[node].append(author)
+                rows.append(node)
+                cols.append(column)
+        self.incidence = _unique_edges(np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64),
+                                       (len(self.keys), len(papers)))
+        self.coauthorship = (self.incidence @ self.incidence.T).tocsr()
+        self._components = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def degree(self):
+        """
+        Returns the number of distinct co-authors of every author.
+        """
+        return _off_diagonal_nnz(self.coauthorship)
+
+    def components(self):
+        """
+        Returns the number of collaboration components and the component of every author.
+        """
+        if self._components is None:
+            self._components = connected_components(self.coauthorship, directed=False)
+        return self._components
+
+    def write_back(self):
+        """
+        Stores coauthor_count, collaboration_component and collaboration_size (authors in the component) as
+        attributes of every Author object.
+        """
+        _, labels = self.components()
+        sizes = np.bincount(labels) if len(labels) else np.zeros(0, dtype=np.int64)
+        for objects, degree, label in zip(self.authors, self.degree(), labels):
+            for author in objects:
+                author.coauthor_count = int(degree)
+                author.collaboration_component = int(label)
+                author.collaboration_size = int(sizes[label])
+
+
+def analyze_networks(papers):
+    """
+    Builds the citation and co-authorship networks of a paper space and writes their metrics back to the papers and
+    authors.
+
+    Parameters:
+        papers (dict): The papers of the paper space.
+
+    Returns:
+        tuple: The CitationNetwork and the CoauthorNetwork.
+    """
+    citations = CitationNetwork(papers)
+    citations.write_back()
+    coauthors = CoauthorNetwork(papers)
+    coauthors.write_back()
+    return citations, coauthors
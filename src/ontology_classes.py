@@ -1,12 +1,82 @@
+import logging
 import re
 import xml.etree.ElementTree as ET
 from datetime import datetime
+from urllib.parse import urlsplit
 
 import requests
 from pyalex import Authors
 from wikidataintegrator import wdi_core, wdi_login
 from wikidataintegrator.wdi_helpers import try_write
 
+from instrumentation import metrics
+
+_DOI_PREFIX = re.compile(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+_ARXIV_ID = re.compile(r'(\d{4}\.\d{4,5}|[a-z\-]+(\.[a-z]{2})?/\d{7})', re.IGNORECASE)
+_IDENTIFIER_SCHEMES = {"doi": "doi", "arxiv": "arxiv", "pmid": "pmid", "pmcid": "pmcid", "md5": "md5"}
+# Endpoints of the services the entities are enriched with, see configure_services
+_SERVICES = {"openalex": None, "wikidata": "https://query.wikidata.org/sparql", "wikidata_retry_after": None}
+
+
+def configure_services(openalex_url=None, wikidata_url=None, wikidata_retry_after=None):
+    """
+    Points the enrichment at other OpenAlex and Wikidata endpoints, e.g. mirrors or the stand-ins of fake_services.
+
+    Parameters:
+        openalex_url (str, optional): Base URL of the OpenAlex API.
+        wikidata_url (str, optional): URL of the Wikidata SPARQL endpoint.
+        wikidata_retry_after (float, optional): Seconds to wait before retrying a Wikidata query that got a 503,
+            instead of the default of each query.
+    """
+    if openalex_url:
+        _SERVICES["openalex"] = openalex_url.rstrip("/")
+    if wikidata_url:
+        _SERVICES["wikidata"] = wikidata_url
+    if wikidata_retry_after is not None:
+        _SERVICES["wikidata_retry_after"] = wikidata_retry_after
+
+
+def wikidata_query(query, retry_after=60):
+    """
+    Runs a SPARQL query on the configured Wikidata endpoint, retrying 3 times on 503 and connection errors.
+
+    Returns:
+        dict: The SPARQL JSON results, without bindings if every attempt failed.
+    """
+    if _SERVICES["wikidata_retry_after"] is not None:
+        retry_after = _SERVICES["wikidata_retry_after"]
+    with metrics().request("wikidata"):
+        results = wdi_core.WDItemEngine.execute_sparql_query(query, endpoint=_SERVICES["wikidata"], max_retries=3,
+                                                             retry_after=retry_after)
+    return results if results is not None else {"results": {"bindings": []}}
+
+
+def normalize_identifier(scheme, value):
+    """
+    Normalizes a persistent identifier so that the same work always gets the same key.
+
+    Parameters:
+        scheme (str): The identifier type as found in the TEI idno element (DOI, arXiv, PMID, PMCID or MD5).
+        value (str): The raw identifier.
+
+    Returns:
+        tuple: A (scheme, value) pair, or None if the scheme is not supported or the value is not valid.
+    """
+    scheme = _IDENTIFIER_SCHEMES.get((scheme or "").lower())
+    value = (value or "").strip()
+    if not scheme or not value:
+        return None
+    if scheme == "doi":
+        value = _DOI_PREFIX.sub('', value).lower()
+        return (scheme, value) if value.startswith("10.") else None
+    if scheme == "arxiv":
+        match = _ARXIV_ID.search(value)
+        return (scheme, match.group(0).lower()) if match else None
+    if scheme == "pmid":
+        value = re.sub(r'\D', '', value)
+        return (scheme, value) if value else None
+    return scheme, value.upper()
+
 
 class Paper:
     """
@@ -14,7 +84,7 @@ class Paper:
     """
 
     def __init__(self, tree=None, filename=None, pdf_path=None, xml_path=None, physical=True, authors=None, title=None,
-                 journal=None, cited_by=None):
+                 journal=None, cited_by=None, identifiers=None):
 
         self.input_path = pdf_path
         self.output_path = xml_path
@@ -33,6 +103,15 @@ class Paper:
         self.authors = []
         self.journal = None
         self.schema = None
+        self.identifiers = {}
+        # The near-duplicate copies merged into this paper, set by dedup
+        self.versions = []
+        # Citation network metrics, set by network_analytics
+        self.pagerank = None
+        self.citation_count = None
+        self.reference_count = None
+        self.co_cited_with = None
+        self.coupled_with = None
 
         # If the article is physical, it obtains the details from the XML tree.
 
@@ -43,6 +122,7 @@ class Paper:
             self.acknowledgements = self.get_acknowledgements()
             self.references = self.get_references()
             self.keywords = self.get_keywords()
+            self.identifiers = self.get_identifiers()
             self.title = self.get_title()
             self.title = self.title.lower() if self.title else "unknown"
         else:
@@ -51,6 +131,7 @@ class Paper:
             self.journal = Journal(name=journal, publishes=[
                                    self]) if journal else None
             self.cited_by = [cited_by]
+            self.identifiers = identifiers if identifiers else {}
 
     def get_schema(self):
         """
@@ -104,6 +185,30 @@ class Paper:
         except:
             return ""
 
+    def get_idnos(self, bibl):
+        """
+        Retrieves the persistent identifiers (DOI, arXiv, PMID...) of a biblStruct element.
+        :param bibl: XML object of the biblStruct.
+        :return: A dictionary mapping the identifier scheme to its normalized value.
+        """
+        identifiers = {}
+        for idno in bibl.iter(f"{self.schema}idno"):
+            identifier = normalize_identifier(idno.get("type"), idno.text)
+            if identifier and identifier[0] not in identifiers:
+                identifiers[identifier[0]] = identifier[1]
+        return identifiers
+
+    def get_identifiers(self):
+        """
+        Retrieves the persistent identifiers of the paper from the header.
+        :return: A dictionary mapping the identifier scheme to its normalized value.
+        """
+        if not self.tree:
+            return {}
+        bibl = self.tree.find(
+            f"{self.schema}teiHeader/{self.schema}fileDesc/{self.schema}sourceDesc/{self.schema}biblStruct")
+        return self.get_idnos(bibl) if bibl is not None else {}
+
     def get_author(self, author, add_as_writer=False):
         """
         Retrieves information about an author.
@@ -202,6 +307,7 @@ class Paper:
                 f"{self.schema}text/{self.schema}back/{self.schema}div/{self.schema}listBibl/{self.schema}biblStruct"):
             ref_dict = {}
             ref_dict["source"] = self
+            ref_dict["identifiers"] = self.get_idnos(ref)
             if ref.find(f"{self.schema}analytic") is not None:
                 if ref.find(f"{self.schema}analytic/{self.schema}title") is not None:
                     ref_dict["title"] = ref.find(
@@ -252,9 +358,9 @@ class Citation:
         source (str): The source from which the citation is taken.
     """
 
-    def __init__(self, date=None, authors=None, title=None, journal=None, source=None):
+    def __init__(self, date=None, authors=None, title=None, journal=None, source=None, identifiers=None):
         self.cites = Paper(authors=authors, title=title,
-                           journal=journal, physical=False, cited_by=self)
+                           journal=journal, physical=False, cited_by=self, identifiers=identifiers)
         self.date = date
         self.source = source
 
@@ -291,13 +397,22 @@ class Author:
         self.email = email
         self.affiliation = Affiliation(affiliation_name, affiliation_country)
         self.ackowledged_by = acknowledged_by
+        # Co-authorship network metrics, set by network_analytics
+        self.coauthor_count = None
+        self.collaboration_component = None
+        self.collaboration_size = None
 
     def enrich(self):
         """
         Enriches the Author instance with additional information (works_count and cited_by_count) from the OpenAlex API.
         """
         if self.forename != "unknown" and self.surname != "unknown":
-            info = self.get_openalex_info(f"{self.forename} {self.surname}")
+            try:
+                info = self.get_openalex_info(f"{self.forename} {self.surname}")
+            except requests.exceptions.RequestException as e:
+                logging.warning(f'OpenAlex lookup of {self.forename} {self.surname} failed: {e}')
+                metrics().count("enrich_errors")
+                return
             if info:
                 self.works_count = info.get("works_count", self.works_count)
                 self.cited_by_count = info.get(
@@ -313,7 +428,16 @@ class Author:
         Returns:
             dict: A dictionary with information about the author's works count and cited by count. Returns none if no information could be retrieved.
         """
-        res = Authors().search_filter(display_name=author).get()
+        query = Authors().search_filter(display_name=author)
+        with metrics().request("openalex"):
+            if _SERVICES["openalex"]:
+                # pyalex always queries api.openalex.org, so its URL is sent to the configured endpoint instead
+                url = urlsplit(query.url)
+                resp = requests.get(f'{_SERVICES["openalex"]}{url.path}?{url.query}', timeout=60)
+                resp.raise_for_status()
+                res = resp.json()["results"]
+            else:
+                res = query.get()
         if res and len(res) > 0:
             res = res[0]
             return {"works_count": res.get("works_count", self.works_count),
@@ -366,9 +490,14 @@ class Affiliation:
             None
         """
         if self.name and self.name != "unknown":
-            wd_item_id = self.get_wikidata_item_id(self.name)
-            if wd_item_id:
-                affiliation_info = self.get_wikidata_info(wd_item_id)
+            try:
+                wd_item_id = self.get_wikidata_item_id(self.name)
+                affiliation_info = self.get_wikidata_info(wd_item_id) if wd_item_id else None
+            except requests.exceptions.RequestException as e:
+                logging.warning(f'Wikidata lookup of {self.name} failed: {e}')
+                metrics().count("enrich_errors")
+                return
+            if affiliation_info:
                 self.website = affiliation_info.get("website")
                 established = affiliation_info.get("established")
                 if established:
@@ -412,8 +541,7 @@ class Affiliation:
             str: The Wikidata item ID if found, None otherwise.
         """
         query = f'SELECT ?item WHERE {{ ?item rdfs:label "{name}"@en }}'
-        results = wdi_core.WDItemEngine.execute_sparql_query(
-            query, max_retries=3, retry_after=5)
+        results = wikidata_query(query, retry_after=5)
         if results["results"]["bindings"]:
             return results["results"]["bindings"][0]["item"]["value"].split("/")[-1]
         else:
@@ -431,8 +559,7 @@ class Affiliation:
             dict: A dictionary with the 'website' and 'established' details if found, None otherwise.
         """
         query = f'SELECT ?website ?established WHERE {{ wd:{wd_item_id} wdt:P856 ?website . OPTIONAL {{ wd:{wd_item_id} wdt:P571 ?established }} }}'
-        results = wdi_core.WDItemEngine.execute_sparql_query(
-            query, max_retries=3)
+        results = wikidata_query(query)
         try:
             website = results["results"]["bindings"][0]["website"]["value"] if results["results"]["bindings"][0][
                 "website"] else None
@@ -468,9 +595,14 @@ class Journal:
             None
         """
         if self.name and self.name != "unknown":
-            wd_item_id = self.get_wikidata_item_id(self.name)
-            if wd_item_id:
-                journal_info = self.get_wikidata_info(wd_item_id)
+            try:
+                wd_item_id = self.get_wikidata_item_id(self.name)
+                journal_info = self.get_wikidata_info(wd_item_id) if wd_item_id else None
+            except requests.exceptions.RequestException as e:
+                logging.warning(f'Wikidata lookup of {self.name} failed: {e}')
+                metrics().count("enrich_errors")
+                return
+            if journal_info:
                 self.country = journal_info.get("country_of_origin")
                 self.description = journal_info.get("description")
                 established = journal_info.get("established")
@@ -515,8 +647,7 @@ class Journal:
             str: The Wikidata item ID if found, None otherwise.
         """
         query = f'SELECT ?item WHERE {{ ?item rdfs:label "{name}"@en }}'
-        results = wdi_core.WDItemEngine.execute_sparql_query(
-            query, max_retries=3)
+        results = wikidata_query(query)
         if results["results"]["bindings"]:
             return results["results"]["bindings"][0]["item"]["value"].split("/")[-1]
         else:
@@ -534,8 +665,7 @@ class Journal:
             dict: A dictionary with the 'country_of_origin', 'description' and 'established' details if found, None otherwise.
         """
         query = f'SELECT ?description ?established ?country_of_origin WHERE {{ wd:{wd_item_id} wdt:P31 wd:Q5633421 . OPTIONAL {{ wd:{wd_item_id} wdt:P17 ?country . ?country rdfs:label ?country_of_origin filter(lang(?country_of_origin) = "en") }} . OPTIONAL {{ wd:{wd_item_id} schema:description ?description filter(lang(?description) = "en") }} . OPTIONAL {{ wd:{wd_item_id} wdt:P571 ?established }} }}'
-        results = wdi_core.WDItemEngine.execute_sparql_query(
-            query, max_retries=3)
+        results = wikidata_query(query)
         try:
             country_of_origin = results["results"]["bindings"][0]["country_of_origin"]["value"] if \
                 results["results"]["bindings"][0]["country_of_origin"] else None
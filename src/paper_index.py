@@ -0,0 +1,208 @@
+import logging
+
+from title_index import TitleIndex, extract_year
+
+
+def first_author_surname(paper):
+    if paper.authors and paper.authors[0].surname != "unknown":
+        return paper.authors[0].surname
+    return None
+
+
+class PaperIndex:
+    """
+    This class is a multi-key index of papers. Persistent identifiers (DOI, arXiv, PMID...) are the primary keys and
+    are resolved with a single hash lookup; the exact title and then the fuzzy title index are only used as a
+    fallback for papers without a known identifier.
+    """
+
+    def __init__(self, title_similarity_threshold=0.8):
+        self.by_identifier = {}
+        self.by_title = {}
+        self.title_index = TitleIndex(threshold=title_similarity_threshold)
+
+    def add(self, paper, year=None, first_author=None):
+        """
+        Registers a paper under its title and all its identifiers. Keys that already point to another paper are
+        left untouched.
+
+        Parameters:
+            paper (Paper): The paper to register.
+            year (int, optional): Publication year, used by the fuzzy title index.
+            first_author (str, optional): Surname of the first author, used by the fuzzy title index.
+        """
+        for identifier in paper.identifiers.items():
+            self.by_identifier.setdefault(identifier, paper)
+        if paper.title not in self.by_title:
+            self.by_title[paper.title] = paper
+            self.title_index.add(paper.title, paper.title, year=year, first_author=first_author)
+
+    def add_identifiers(self, paper, identifiers):
+        """
+        Adds identifiers learned elsewhere (e.g. from a reference to the paper) to an indexed paper.
+
+        Parameters:
+            paper (Paper): An indexed paper.
+            identifiers (dict): Identifier scheme to value mapping.
+        """
+        for scheme, value in identifiers.items():
+            if scheme not in paper.identifiers:
+                paper.identifiers[scheme] = value
+            self.by_identifier.setdefault((scheme, value), paper)
+
+    def find_by_identifier(self, identifiers):
+        """
+        Looks a paper up by any of its identifiers.
+
+        Parameters:
+            identifiers (dict): Identifier scheme to value mapping.
+
+        Returns:
+            Paper: The indexed paper, or None if no identifier is known.
+        """
+        for identifier in identifiers.items():
+            paper = self.by_identifier.get(identifier)
+            if paper is not None:
+                return paper
+        return None
+
+    def find(self, paper, year=None, first_author=None, fuzzy=True):
+        """
+        Finds the indexed paper that represents the same work as the given one.
+
+        Parameters:
+            paper (Paper): The paper to look up.
+            year (int, optional): Publication year of the paper being looked up.
+            first_author (str, optional): Surname of the first author of the paper being looked up.
+            fuzzy (bool): Whether to fall back to the fuzzy title index.
+
+        Returns:
+            Paper: The matching indexed paper, or None if there is no match.
+        """
+        found = self.find_by_identifier(paper.identifiers)
+        if found is not None:
+            return found
+        if paper.title in self.by_title:
+            return self.by_title[paper.title]
+        if fuzzy:
+            title = self.title_index.query(paper.title, year=year, first_author=first_author)
+            if title is not None:
+                return self.by_title[title]
+        return None
+
+    def __len__(self):
+        return len(self.by_title)
+
+
+def resolve_papers(papers, title_similarity_threshold=0.8):
+    """
+    Indexes the papers and updates the citations of the papers.
+
+    Papers and references are looked up by their persistent identifiers (DOI, arXiv, PMID...) first, then by exact
+    title and finally through the fuzzy title index, which accepts a title whose similarity is at least
+    title_similarity_threshold (and whose year and first author do not contradict the reference). Physical papers
+    that resolve to an already indexed paper are duplicate PDFs and are dropped. Only unmatched references become new
+    citation papers.
+
+    Parameters:
+        papers (list): List of paper instances.
+        title_similarity_threshold (float): Minimum similarity of a fuzzy title match.
+
+    Returns:
+        tuple: The PaperIndex, a dictionary with paper titles as keys and paper instances as values, the list of
+        duplicate papers and a dictionary with the citation papers by title.
+    """
+    paper_index = PaperIndex(title_similarity_threshold=title_similarity_threshold)
+    duplicate_papers = []
+    unique_papers = []
+    for paper in papers:
+        duplicate = paper_index.find(paper, fuzzy=False)
+        if duplicate is not None:
+            logging.info(f'Skipping {paper.filename}: duplicate of {duplicate.filename}')
+            paper_index.add_identifiers(duplicate, paper.identifiers)
+            duplicate_papers.append(paper)
+            continue
+        paper_index.add(paper, first_author=first_author_surname(paper))
+        unique_papers.append(paper)
+
+    papers_dict = {paper.title: paper for paper in unique_papers}
+    ref_papers = {}
+    link_references(paper_index, unique_papers, papers_dict, ref_papers)
+    return paper_index, papers_dict, duplicate_papers, ref_papers
+
+
+def link_references(paper_index, papers, papers_dict, ref_papers):
+    """
+    Points the references of the papers to the indexed papers they cite. Unmatched references are indexed and become
+    new citation papers, which are added to papers_dict and ref_papers.
+
+    Returns:
+        list: The new citation papers.
+    """
+    new_papers = []
+    for paper in papers:
+        for citation in paper.references:
+            year = extract_year(citation.date)
+            first_author = first_author_surname(citation.cites)
+            cited = paper_index.find(citation.cites, year=year, first_author=first_author)
+            if cited is not None:
+                paper_index.add_identifiers(cited, citation.cites.identifiers)
+                citation.cites = cited
+                cited.cited_by.append(citation)
+            else:
+                paper_index.add(citation.cites, year=year, first_author=first_author)
+                ref_papers[citation.cites.title] = citation.cites
+                papers_dict[citation.cites.title] = citation.cites
+                new_papers.append(citation.cites)
+    return new_papers
+
+
+def resolve_new_papers(paper_index, papers_dict, ref_papers, papers):
+    """
+    Adds new physical papers to an already resolved paper space, as resolve_papers would have if they had been part
+    of it, without resolving the existing papers again.
+
+    A new paper that matches an indexed physical paper by identifier or exact title is a duplicate. One that matches a
+    citation paper (a paper only known from references, also through the fuzzy title index) supersedes it: the
+    citations of the citation paper are pointed to the new paper, which takes its place in the index.
+
+    Parameters:
+        paper_index (PaperIndex): The index returned by resolve_papers.
+        papers_dict (dict): The papers by title returned by resolve_papers, updated in place.
+        ref_papers (dict): The citation papers by title returned by resolve_papers, updated in place.
+        papers (list): The new physical papers.
+
+    Returns:
+        tuple: The list of new unique papers, the list of duplicate papers, the list of new citation papers and the
+        list of (citation paper, new paper) pairs of the superseded citation papers.
+    """
+    unique_papers = []
+    duplicate_papers = []
+    superseded = []
+    for paper in papers:
+        first_author = first_author_surname(paper)
+        match = paper_index.find(paper, fuzzy=False)
+        if match is not None and match.physical:
+            logging.info(f'Skipping {paper.filename}: duplicate of {match.filename}')
+            paper_index.add_identifiers(match, paper.identifiers)
+            duplicate_papers.append(paper)
+            continue
+        if match is None:
+            match = paper_index.find(paper, first_author=first_author)
+        if match is not None and not match.physical:
+            for citation in match.cited_by:
+                if citation is not None:
+                    citation.cites = paper
+                    paper.cited_by.append(citation)
+            paper_index.by_title[match.title] = paper
+            for identifier in match.identifiers.items():
+                if paper_index.by_identifier.get(identifier) is match:
+                    paper_index.by_identifier[identifier] = paper
+            papers_dict.pop(match.title, None)
+            ref_papers.pop(match.title, None)
+            superseded.append((match, paper))
+        paper_index.add(paper, first_author=first_author)
+        papers_dict[paper.title] = paper
+        unique_papers.append(paper)
+    citation_papers = link_references(paper_index, unique_papers, papers_dict, ref_papers)
+    return unique_papers, duplicate_papers, citation_papers, superseded
@@ -11,7 +11,12 @@ from sklearn.cluster import AgglomerativeClustering
 from sklearn.decomposition import LatentDirichletAllocation
 from sklearn.feature_extraction.text import CountVectorizer
 
+from corpus_index import CorpusIndex
+from incremental_space import IncrementalPaperSpace
+from instrumentation import metrics
+from network_analytics import analyze_networks
 from ontology_classes import Affiliation, Author
+from paper_index import resolve_papers
 
 nltk.download('stopwords')
 nltk.download('punkt')
@@ -22,45 +27,298 @@ def _get_forename(name):
     return name.split(" ")[0] if len(name.split(" ")) > 1 else ""
 
 
-class PaperSet:
+def load_encoder():
+    """
+    Loads the Sentence Transformer model that encodes the abstracts.
+    """
+    # return SentenceTransformer("jamescalam/minilm-arxiv-encoder")
+    return SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+
+
+def load_ner():
+    """
+    Loads the Named Entity Recognition pipeline used on the acknowledgements.
+    """
+    return pipeline("ner",
+                    model=AutoModelForTokenClassification.from_pretrained("Babelscape/wikineural-multilingual-ner"),
+                    tokenizer=AutoTokenizer.from_pretrained("Babelscape/wikineural-multilingual-ner")
+                    )
+
+
+def preprocess_text(text):
+    """
+    Tokenizes the text into individual words, removes stop words, and rejoins the remaining tokens.
+
+    Args:
+        text (str): Text to preprocess.
+
+    Returns:
+        str: Preprocessed text.
+    """
+    # Tokenize the text into individual words
+    tokens = word_tokenize(text)
+    # Remove stop words from the token list
+    filtered_tokens = [word for word in tokens if not word.lower() in stop_words]
+    # Join the remaining tokens back into a single string
+    return ' '.join(filtered_tokens)
+
+
+def process_entities(entities, text):
+    """
+    Processes the recognized entities and extracts organization and people entities.
+
+    Args:
+        entities (list): List of recognized entities.
+        text (str): Text containing the entities.
+
+    Returns:
+        list: List of dictionaries with entity type and text.
+    """
+    org_start = None
+    org_end = None
+    people_start = None
+    people_end = None
+    new_entities = []
+
+    for i, entity in enumerate(entities):
+        if entity['entity'] == 'B-ORG':
+            org_start = entity['start']
+            org_end = entity['end']
+        elif entity['entity'] == 'I-ORG':
+            org_end = entity['end']
+        elif entity['entity'] == 'B-PER':
+            people_start = entity['start']
+            people_end = entity['end']
+        elif entity['entity'] == 'I-PER':
+            people_end = entity['end']
+
+        if org_start is not None and org_end is not None:
+            if i == len(entities) - 1 or entities[i + 1]['entity'] != 'I-ORG':
+                new_entities.append({'entity': 'ORG', "text": text[org_start:org_end]})
+                org_start = None
+        if people_start is not None and people_end is not None:
+            if i == len(entities) - 1 or entities[i + 1]['entity'] != 'I-PER':
+                new_entities.append({'entity': 'PER', "text": text[people_start:people_end]})
+                people_start = None
+
+    return new_entities
+
+
+def recognize_acknowledged_entities(acknowledgement, ner):
+    """
+    Runs a Named Entity Recognition pipeline on the text of an acknowledgement and sets the organizations and people
+    it acknowledges.
+
+    Args:
+        acknowledgement (Aknowledgement): The acknowledgement of a paper.
+        ner: The token classification pipeline.
+
+    Returns:
+        None
+    """
+    text = acknowledgement.text
+    processed_entities = process_entities(ner(text), text)
+    acknowledgement.acknowledges_org = list(
+        map(lambda x: Affiliation(name=x["text"], ackowledged_by=[acknowledgement]),
+            filter(lambda x: x["entity"] == "ORG", processed_entities)))
+    acknowledgement.acknowledges_people = list(
+        map(lambda x: Author(forename=_get_forename(x["text"]), surname=x["text"].split(" ")[-1],
+                             acknowledged_by=[acknowledgement]),
+            filter(lambda x: x["entity"] == "PER", processed_entities)))
+
+
+def cluster_embeddings(encoded, n_clusters=2):
+    """
+    Clusters embeddings using Agglomerative Clustering.
+
+    Args:
+        encoded (pd.DataFrame): One embedding per row.
+        n_clusters (int): Number of clusters.
+
+    Returns:
+        pd.Series: The cluster of every row, with the same index.
+    """
+    clustering = AgglomerativeClustering(n_clusters=n_clusters, affinity='cosine', linkage='complete')
+    return pd.Series(clustering.fit_predict(encoded), index=encoded.index)
+
+
+def load_topic_model(res_path):
+    """
+    Loads the vectorizer and the LDA model saved under res_path/models by a previous run.
+
+    Returns:
+        tuple: The vectorizer and the LDA model, None for the ones that were not saved.
+    """
+    vectorizer = None
+    lda_model = None
+    if os.path.exists(f"{res_path}/models/lda_model.pkl"):
+        with open(f"{res_path}/models/lda_model.pkl", "rb") as f:
+            lda_model = pickle.load(f)
+    if os.path.exists(f"{res_path}/models/vectorizer.pkl"):
+        with open(f"{res_path}/models/vectorizer.pkl", "rb") as f:
+            vectorizer = pickle.load(f)
+    return vectorizer, lda_model
+
+
+def fit_topic_model(abstracts, res_path, vectorizer=None, lda_model=None, num_topics=10):
+    """
+    Fits the vocabulary and the Latent Dirichlet Allocation model on preprocessed abstracts, unless they were already
+    loaded, and saves them under res_path/models.
+
+    Args:
+        abstracts (list): Preprocessed abstracts.
+        res_path (str): The resources folder.
+        vectorizer (CountVectorizer, optional): A fitted vectorizer.
+        lda_model (LatentDirichletAllocation, optional): A fitted model.
+        num_topics (int): Number of topics of a new model.
+
+    Returns:
+        tuple: The vectorizer and the LDA model.
+    """
+    if not vectorizer:
+        vectorizer = CountVectorizer()
+        vectorizer.fit(abstracts)
+        with open(f"{res_path}/models/vectorizer.pkl", "wb") as f:
+            pickle.dump(vectorizer, f)
+    if not lda_model:
+        lda_model = LatentDirichletAllocation(n_components=num_topics, max_iter=500, learning_method='online')
+        lda_model.fit(vectorizer.transform(abstracts))
+        with open(f"{res_path}/models/lda_model.pkl", "wb") as f:
+            pickle.dump(lda_model, f)
+    return vectorizer, lda_model
+
+
+def topic_labels(vectorizer, lda_model):
+    """
+    Names every topic of an LDA model after its two most relevant words.
+
+    Returns:
+        list: The label of every topic.
+    """
+    feature_names = vectorizer.get_feature_names_out()
+    return [", ".join([feature_names[i] for i in topic.argsort()[:-3:-1]]) for topic in lda_model.components_]
+
+
+def assign_topics(abstracts, vectorizer, lda_model, topics):
+    """
+    Returns the label of the most likely topic of every preprocessed abstract.
+    """
+    return [topics[row.argmax()] for row in lda_model.transform(vectorizer.transform(abstracts))]
+
+
+class PaperSet(IncrementalPaperSpace):
     """
     This class represents a collection of academic papers. It provides methods for indexing, 
     encoding, clustering, topic modeling, and entity recognition on the papers.
     """
-    def __init__(self, papers, res_path="../res"):
-        self.papers = self.index_papers(papers)
+    def __init__(self, papers, res_path="../res", title_similarity_threshold=0.8):
+        run_metrics = metrics()
+        self.title_similarity_threshold = title_similarity_threshold
+        with run_metrics.stage("index_papers", items=len(papers)):
+            self.papers = self.index_papers(papers)
         self.res_path = res_path
-        # self.encoder = SentenceTransformer("jamescalam/minilm-arxiv-encoder")
-        self.encoder = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
-        self.ner = pipeline("ner",
-                            model=AutoModelForTokenClassification.from_pretrained(
-                                "Babelscape/wikineural-multilingual-ner"),
-                            tokenizer=AutoTokenizer.from_pretrained("Babelscape/wikineural-multilingual-ner")
-                            )
-        self.lda_model = None
-        self.vectorizer = None
+        with run_metrics.stage("load_models"):
+            self.encoder = load_encoder()
+            self.ner = load_ner()
+            self.vectorizer, self.lda_model = load_topic_model(self.res_path)
         self.topics = []
-        if os.path.exists(f"{self.res_path}/models/lda_model.pkl"):
-            with open(f"{self.res_path}/models/lda_model.pkl", "rb") as f:
-                self.lda_model = pickle.load(f)
-        if os.path.exists(f"{self.res_path}/models/vectorizer.pkl"):
-            with open(f"{self.res_path}/models/vectorizer.pkl", "rb") as f:
-                self.vectorizer = pickle.load(f)
+        # Abstract embeddings of the physical papers, kept by clusterize for the Parquet export
+        self.embeddings = None
+        physical = len(self.get_xml_papers())
 
         print("\rClustering              ", end='')
-        self.clusterize()
+        with run_metrics.stage("clusterize", items=physical):
+            self.clusterize()
         print("\rTopic Modeling          ", end='')
-        self.topic_modeling()
+        with run_metrics.stage("topic_modeling", items=physical):
+            self.topic_modeling()
         print("\rRecognizing entities    ", end='')
-        self.find_entities()
+        with run_metrics.stage("find_entities", items=physical):
+            self.find_entities()
         print("\rLinking authors         ", end='')
-        self.all_authors = self.link_and_get_all_authors()
+        with run_metrics.stage("link_authors") as stage:
+            self.all_authors = self.link_and_get_all_authors()
+            stage.items = len(self.all_authors)
         print("\rLinking affiliations", end='')
-        self.all_affiliations = self.link_and_get_affiliations()
+        with run_metrics.stage("link_affiliations") as stage:
+            self.all_affiliations = self.link_and_get_affiliations()
+            stage.items = len(self.all_affiliations)
         print("\rLinking journals        ", end='')
-        self.all_journals = self.link_and_get_all_journals()
+        with run_metrics.stage("link_journals") as stage:
+            self.all_journals = self.link_and_get_all_journals()
+            stage.items = len(self.all_journals)
+        with run_metrics.stage("corpus_index", items=len(self.papers)):
+            self.corpus_index = CorpusIndex(self.papers)
+        print("\rAnalyzing networks      ", end='')
+        with run_metrics.stage("analyze_networks", items=len(self.papers)):
+            self.citation_network, self.coauthor_network = analyze_networks(self.papers)
+
+        with run_metrics.stage("enrich"):
+            self.enrich()
+
+    def assign_topics(self, papers):
+        """
+        Gives each new paper the most likely topic of the already fitted topic model.
+
+        Args:
+            papers (list): List of new physical Paper instances.
+
+        Returns:
+            None
+        """
+        abstracts = [self.preprocess_text(paper.abstract) for paper in papers]
+        for paper, topic in zip(papers, assign_topics(abstracts, self.vectorizer, self.lda_model, self.topics)):
+            paper.topic = topic
+
+    def recognize_entities(self, papers):
+        """
+        Recognizes the organizations and people the acknowledgements of new papers thank.
+
+        Args:
+            papers (list): List of new physical Paper instances.
 
-        self.enrich()
+        Returns:
+            None
+        """
+        for paper in papers:
+            recognize_acknowledged_entities(paper.acknowledgements, self.ner)
+
+    def assign_clusters(self, papers):
+        """
+        Gives each new paper the cluster of the most similar paper already clustered (by cosine similarity of their
+        abstract embeddings), since agglomerative clusters cannot be extended with new points, and adds their
+        embeddings to self.embeddings.
+
+        Args:
+            papers (list): List of new physical Paper instances.
+
+        Returns:
+            None
+        """
+        encoded = pd.DataFrame(self.encoder.encode([paper.abstract for paper in papers]),
+                               index=[paper.title for paper in papers])
+        if self.embeddings is not None and len(self.embeddings):
+            nearest = util.cos_sim(encoded.values, self.embeddings.values).argmax(dim=1).tolist()
+            for paper, row in zip(papers, nearest):
+                paper.cluster = self.papers[self.embeddings.index[row]].cluster
+            self.embeddings = pd.concat([self.embeddings, encoded])
+        else:
+            for paper in papers:
+                paper.cluster = 0
+            self.embeddings = encoded
+
+    def find_papers(self, **filters):
+        """
+        Returns the papers that match all the given filters, using the corpus index instead of the RDF graph.
+
+        Args:
+            filters: One or more of author, affiliation, journal, cluster, topic, acknowledges and physical
+                (see CorpusIndex.keys).
+
+        Returns:
+            list: List of Paper instances.
+        """
+        return self.corpus_index.papers(**filters)
 
     def get_xml_papers(self):
         """
@@ -93,7 +351,8 @@ class PaperSet:
 
     def index_papers(self, papers):
         """
-        Indexes the papers by their titles and updates the citations of the papers.
+        Indexes the papers and updates the citations of the papers (see paper_index.resolve_papers). Duplicate PDFs
+        are kept in duplicate_papers and the papers created from unmatched references in citation_papers.
 
         Args:
             papers (list): List of paper instances.
@@ -101,18 +360,8 @@ class PaperSet:
         Returns:
             dict: Dictionary with paper titles as keys and paper instances as values.
         """
-        papers_dict = {paper.title: paper for paper in papers}
-        ref_papers = {}
-        for paper in papers:
-            if paper.references:
-                for i in range(len(paper.references)):
-                    if paper.references[i].cites.title in papers_dict.keys():
-                        paper.references[i].cites = papers_dict[paper.references[i].cites.title]
-                        papers_dict[paper.references[i].cites.title].cited_by.append(paper.references[i])
-                    else:
-                        ref_papers[paper.references[i].cites.title] = paper.references[i].cites
-                        papers_dict[paper.references[i].cites.title] = paper.references[i].cites
-        self.citation_papers = ref_papers
+        self.paper_index, papers_dict, self.duplicate_papers, self.citation_papers = resolve_papers(
+            papers, title_similarity_threshold=self.title_similarity_threshold)
         return papers_dict
 
     def encode_paper(self, paper):
@@ -137,12 +386,7 @@ class PaperSet:
         Returns:
             str: Preprocessed text.
         """
-        # Tokenize the text into individual words
-        tokens = word_tokenize(text)
-        # Remove stop words from the token list
-        filtered_tokens = [word for word in tokens if not word.lower() in stop_words]
-        # Join the remaining tokens back into a single string
-        return ' '.join(filtered_tokens)
+        return preprocess_text(text)
 
     def clusterize(self):
         """
@@ -152,27 +396,11 @@ class PaperSet:
             None
         """
         encoded = self.encode_papers()
-        clustering = AgglomerativeClustering(n_clusters=2, affinity='cosine', linkage='complete')
-        assined_papers = pd.Series(clustering.fit_predict(encoded), index=encoded.index)
+        self.embeddings = encoded
+        assined_papers = cluster_embeddings(encoded)
         for item, cluster in assined_papers.items():
             self.papers[item].cluster = cluster
 
-    def _perform_lda(self, tokens, index):
-        num_topics = 10
-        if not self.lda_model:
-            self.lda_model = LatentDirichletAllocation(n_components=num_topics, max_iter=500, learning_method='online')
-            self.lda_model.fit(tokens)
-            with open(f"{self.res_path}/models/lda_model.pkl", "wb") as f:
-                pickle.dump(self.lda_model, f)
-
-        feature_names = self.vectorizer.get_feature_names_out()
-        for topic_idx, topic in enumerate(self.lda_model.components_):
-            top_words_idx = topic.argsort()[:-3:-1]
-            self.topics.append(", ".join([feature_names[i] for i in top_words_idx]))
-
-        for paper, token in zip(index, tokens):
-            self.papers[paper].topic = self.topics[self.lda_model.transform(token).argmax()]
-
     def topic_modeling(self):
         """
         Performs topic modeling on the abstracts of the papers in the collection using Latent Dirichlet Allocation.
@@ -183,12 +411,12 @@ class PaperSet:
         df = pd.DataFrame([{'Title': paper.title, "abstract": self.preprocess_text(paper.abstract),
                             'label': paper.cluster} for paper in
                            self.get_xml_papers().values()])
-        if not self.vectorizer:
-            self.vectorizer = CountVectorizer()
-            self.vectorizer.fit(df['abstract'])
-            with open(f"{self.res_path}/models/vectorizer.pkl", "wb") as f:
-                pickle.dump(self.vectorizer, f)
-        self._perform_lda(self.vectorizer.transform(df['abstract']), df['Title'])
+        self.vectorizer, self.lda_model = fit_topic_model(df['abstract'], self.res_path, vectorizer=self.vectorizer,
+                                                          lda_model=self.lda_model)
+        self.topics = topic_labels(self.vectorizer, self.lda_model)
+        for paper, topic in zip(df['Title'], assign_topics(df['abstract'], self.vectorizer, self.lda_model,
+                                                           self.topics)):
+            self.papers[paper].topic = topic
 
     def find_entities(self):
         """
@@ -198,16 +426,7 @@ class PaperSet:
             None
         """
         for paper in self.get_xml_papers().values():
-            text = paper.acknowledgements.text
-            ner_results = self.ner(text)
-            processed_entities = self.process_entities(ner_results, text)
-            paper.acknowledgements.acknowledges_org = list(
-                map(lambda x: Affiliation(name=x["text"], ackowledged_by=[paper.acknowledgements]),
-                    filter(lambda x: x["entity"] == "ORG", processed_entities)))
-            paper.acknowledgements.acknowledges_people = list(
-                map(lambda x: Author(forename=_get_forename(x["text"]), surname=x["text"].split(" ")[-1],
-                                     acknowledged_by=[paper.acknowledgements]),
-                    filter(lambda x: x["entity"] == "PER", processed_entities)))
+            recognize_acknowledged_entities(paper.acknowledgements, self.ner)
 
     def link_and_get_all_authors(self):
         """
@@ -279,34 +498,7 @@ class PaperSet:
         Returns:
             list: List of dictionaries with entity type and text.
         """
-        org_start = None
-        org_end = None
-        people_start = None
-        people_end = None
-        new_entities = []
-
-        for i, entity in enumerate(entities):
-            if entity['entity'] == 'B-ORG':
-                org_start = entity['start']
-                org_end = entity['end']
-            elif entity['entity'] == 'I-ORG':
-                org_end = entity['end']
-            elif entity['entity'] == 'B-PER':
-                people_start = entity['start']
-                people_end = entity['end']
-            elif entity['entity'] == 'I-PER':
-                people_end = entity['end']
-
-            if org_start is not None and org_end is not None:
-                if i == len(entities) - 1 or entities[i + 1]['entity'] != 'I-ORG':
-                    new_entities.append({'entity': 'ORG', "text": text[org_start:org_end]})
-                    org_start = None
-            if people_start is not None and people_end is not None:
-                if i == len(entities) - 1 or entities[i + 1]['entity'] != 'I-PER':
-                    new_entities.append({'entity': 'PER', "text": text[people_start:people_end]})
-                    people_start = None
-
-        return new_entities
+        return process_entities(entities, text)
 
     def enrich_journals(self):
         """
@@ -315,8 +507,9 @@ class PaperSet:
         Returns:
             None
         """
-        for journal in self.all_journals:
-            journal.enrich()
+        with metrics().stage("journals", items=len(self.all_journals)):
+            for journal in self.all_journals:
+                journal.enrich()
 
     def enrich_affiliations(self):
         """
@@ -325,8 +518,9 @@ class PaperSet:
         Returns:
             None
         """
-        for affiliation in self.all_affiliations:
-            affiliation.enrich()
+        with metrics().stage("affiliations", items=len(self.all_affiliations)):
+            for affiliation in self.all_affiliations:
+                affiliation.enrich()
 
     def enrich_authors(self):
         """
@@ -336,9 +530,10 @@ class PaperSet:
             None
         """
         print(len(self.all_authors))
-        for author in self.all_authors:
-            print("\rEnriching authors: {}, {}/{}                                              ".format(f'{author.forename} {author.surname}', self.all_authors.index(author), len(self.all_authors)), end='')
-            author.enrich()
+        with metrics().stage("authors", items=len(self.all_authors)):
+            for index, author in enumerate(self.all_authors):
+                print("\rEnriching authors: {}, {}/{}                                              ".format(f'{author.forename} {author.surname}', index, len(self.all_authors)), end='')
+                author.enrich()
 
     def enrich(self):
         """
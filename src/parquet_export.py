@@ -0,0 +1,291 @@
+import logging
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from rdflib import Namespace
+
+from iri_registry import IRIRegistry
+
+# Only the local part of the IRIs is stored, e.g. paper_1f2e3d4c5b6a7980, so the tables join with a knowledge graph
+# built with hashed IRIs.
+_NAMESPACE = Namespace("http://instances.com/")
+
+SCHEMAS = {
+    "papers": pa.schema([
+        ("paper_id", pa.string()), ("title", pa.string()), ("abstract", pa.string()), ("physical", pa.bool_()),
+        ("cluster", pa.int32()), ("topic", pa.string()), ("journal_id", pa.string()),
+        ("keywords", pa.list_(pa.string())), ("doi", pa.string()), ("arxiv", pa.string()),
+        ("pagerank", pa.float64()), ("citation_count", pa.int32()), ("reference_count", pa.int32()),
+        ("co_cited_with", pa.int32()), ("coupled_with", pa.int32()),
+    ]),
+    "authors": pa.schema([
+        ("author_id", pa.string()), ("forename", pa.string()), ("surname", pa.string()), ("email", pa.string()),
+        ("affiliation_id", pa.string()), ("works_count", pa.int64()), ("cited_by_count", pa.int64()),
+        ("coauthor_count", pa.int32()), ("collaboration_component", pa.int32()),
+    ]),
+    "affiliations": pa.schema([
+        ("affiliation_id", pa.string()), ("name", pa.string()), ("country", pa.string()), ("website", pa.string()),
+        ("established", pa.string()),
+    ]),
+    "journals": pa.schema([
+        ("journal_id", pa.string()), ("name", pa.string()), ("country", pa.string()), ("description", pa.string()),
+        ("established", pa.string()),
+    ]),
+    "authorship": pa.schema([("paper_id", pa.string()), ("author_id", pa.string()), ("position", pa.int16())]),
+    "citations": pa.schema([("source_id", pa.string()), ("cited_id", pa.string()), ("date", pa.string())]),
+    "acknowledgements": pa.schema([
+        ("paper_id", pa.string()), ("entity_type", pa.string()), ("entity_id", pa.string()), ("name", pa.string()),
+    ]),
+    "versions": pa.schema([
+        ("paper_id", pa.string()), ("position", pa.int16()), ("filename", pa.string()), ("title", pa.string()),
+        ("doi", pa.string()), ("arxiv", pa.string()),
+    ]),
+}
+# Columns with few distinct values are dictionary encoded; ids, titles and abstracts are (nearly) unique.
+DICTIONARY_COLUMNS = ["topic", "journal_id", "affiliation_id", "forename", "surname", "country", "name",
+                      "entity_type", "author_id", "cited_id", "date", "keywords", "established"]
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _int(value):
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TableBuilder:
+    """
+    This class flattens a paper space into normalized tables: papers, authors, affiliations, journals, authorship
+    and citation edges, acknowledged entities, the versions of the papers merged with their near-duplicates and, when
+    the paper space kept them, the abstract embeddings.
+
+    Entities are identified with the same hashed ids the RDFParser mints with hashed_iris=True, and every entity
+    reachable from the papers (including the ones only reached through citations) gets exactly one row.
+    """
+
+    def __init__(self, paper_space):
+        self.paper_space = paper_space
+        self.iris = IRIRegistry(_NAMESPACE, hashed=True)
+        self.rows = {name: [] for name in SCHEMAS}
+        self.seen = set()
+
+    def entity_id(self, kind, entity, *parts):
+        return str(self.iris.mint(kind, entity, *parts))[len(_NAMESPACE):]
+
+    def paper_id(self, paper):
+        return self.entity_id("paper", paper, paper.title)
+
+    def author_id(self, author):
+        return self.entity_id("author", author, author.forename, author.surname)
+
+    def affiliation_id(self, affiliation):
+        if affiliation is None or not affiliation.name:
+            return None
+        return self.entity_id("affiliation", affiliation, affiliation.name)
+
+    def journal_id(self, journal):
+        if journal is None or not journal.name:
+            return None
+        return self.entity_id("journal", journal, journal.name)
+
+    def first(self, table, entity_id):
+        # Several objects can stand for the same entity; only the first one gets a row.
+        if (table, entity_id) in self.seen:
+            return False
+        self.seen.add((table, entity_id))
+        return True
+
+    def paper_row(self, paper):
+        return {
+            "paper_id": self.paper_id(paper), "title": paper.title, "abstract": _text(paper.abstract),
+            "physical": bool(paper.physical), "cluster": _int(paper.cluster), "topic": _text(paper.topic),
+            "journal_id": self.journal_id(paper.journal),
+            "keywords": [str(keyword) for keyword in paper.keywords] if paper.keywords else [],
+            "doi": paper.identifiers.get("doi"), "arxiv": paper.identifiers.get("arxiv"),
+            "pagerank": paper.pagerank, "citation_count": paper.citation_count,
+            "reference_count": paper.reference_count, "co_cited_with": paper.co_cited_with,
+            "coupled_with": paper.coupled_with,
+        }
+
+    def authorship_rows(self, paper):
+        paper_id = self.paper_id(paper)
+        return [{"paper_id": paper_id, "author_id": self.author_id(author), "position": position}
+                for position, author in enumerate(paper.authors)]
+
+    def citation_rows(self, paper):
+        paper_id = self.paper_id(paper)
+        return [{"source_id": paper_id, "cited_id": self.paper_id(citation.cites), "date": _text(citation.date)}
+                for citation in paper.references if citation.cites is not None]
+
+    def acknowledgement_rows(self, paper):
+        if paper.acknowledgements is None:
+            return []
+        paper_id = self.paper_id(paper)
+        rows = [{"paper_id": paper_id, "entity_type": "org", "entity_id": self.affiliation_id(organization),
+                 "name": organization.name} for organization in paper.acknowledgements.acknowledges_org]
+        rows.extend({"paper_id": paper_id, "entity_type": "person", "entity_id": self.author_id(person),
+                     "name": f"{person.forename} {person.surname}"}
+                    for person in paper.acknowledgements.acknowledges_people)
+        return rows
+
+    def version_rows(self, paper):
+        paper_id = self.paper_id(paper)
+        return [{"paper_id": paper_id, "position": position, "filename": version["filename"],
+                 "title": version["title"], "doi": version["identifiers"].get("doi"),
+                 "arxiv": version["identifiers"].get("arxiv")}
+                for position, version in enumerate(paper.versions)]
+
+    def author_row(self, author):
+        return {
+            "author_id": self.author_id(author), "forename": author.forename, "surname": author.surname,
+            "email": _text(author.email), "affiliation_id": self.affiliation_id(author.affiliation),
+            "works_count": _int(author.works_count), "cited_by_count": _int(author.cited_by_count),
+            "coauthor_count": author.coauthor_count, "collaboration_component": author.collaboration_component,
+        }
+
+    def affiliation_row(self, affiliation):
+        return {"affiliation_id": self.affiliation_id(affiliation), "name": affiliation.name,
+                "country": _text(affiliation.country), "website": _text(affiliation.website),
+                "established": _text(affiliation.established)}
+
+    def journal_row(self, journal):
+        return {"journal_id": self.journal_id(journal), "name": journal.name, "country": _text(journal.country),
+                "description": _text(journal.description), "established": _text(journal.established)}
+
+    def add_paper(self, paper):
+        if not self.first("papers", self.paper_id(paper)):
+            return
+        self.rows["papers"].append(self.paper_row(paper))
+        self.add_journal(paper.journal)
+        for author in paper.authors:
+            self.add_author(author)
+        self.rows["authorship"].extend(self.authorship_rows(paper))
+        self.rows["citations"].extend(self.citation_rows(paper))
+        if paper.acknowledgements is not None:
+            for organization in paper.acknowledgements.acknowledges_org:
+                self.add_affiliation(organization)
+            for person in paper.acknowledgements.acknowledges_people:
+                self.add_author(person)
+        self.rows["acknowledgements"].extend(self.acknowledgement_rows(paper))
+        self.rows["versions"].extend(self.version_rows(paper))
+
+    def add_author(self, author):
+        if not self.first("authors", self.author_id(author)):
+            return
+        self.add_affiliation(author.affiliation)
+        self.rows["authors"].append(self.author_row(author))
+
+    def add_affiliation(self, affiliation):
+        affiliation_id = self.affiliation_id(affiliation)
+        if affiliation_id is None or not self.first("affiliations", affiliation_id):
+            return
+        self.rows["affiliations"].append(self.affiliation_row(affiliation))
+
+    def add_journal(self, journal):
+        journal_id = self.journal_id(journal)
+        if journal_id is None or not self.first("journals", journal_id):
+            return
+        self.rows["journals"].append(self.journal_row(journal))
+
+    def embeddings_table(self):
+        """
+        Returns the embeddings kept by PaperSet.clusterize as a table with a fixed size float32 list column, or None.
+        """
+        embeddings = getattr(self.paper_space, "embeddings", None)
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        papers = [self.paper_space.papers[title] for title in embeddings.index]
+        values = embeddings.to_numpy(dtype="float32")
+        return pa.table({
+            "paper_id": pa.array([self.paper_id(paper) for paper in papers], pa.string()),
+            "cluster": pa.array([_int(paper.cluster) for paper in papers], pa.int32()),
+            "topic": pa.array([_text(paper.topic) for paper in papers], pa.string()),
+            "embedding": pa.FixedSizeListArray.from_arrays(pa.array(values.ravel(), pa.float32()), values.shape[1]),
+        })
+
+    def build(self):
+        """
+        Returns:
+            dict: The pyarrow Table of every table name.
+        """
+        for paper in self.paper_space.papers.values():
+            self.add_paper(paper)
+        # Cited papers that are not in the paper space still get a row, so every citation edge resolves.
+        for paper in self.paper_space.papers.values():
+            for citation in paper.references:
+                if citation.cites is not None:
+                    self.add_paper(citation.cites)
+        tables = {name: pa.Table.from_pylist(rows, schema=SCHEMAS[name]) for name, rows in self.rows.items()}
+        embeddings = self.embeddings_table()
+        if embeddings is not None:
+            tables["embeddings"] = embeddings
+        return tables
+
+
+def export_parquet(paper_space, folder, partition_by=("cluster", "topic"), row_group_size=65536,
+                   compression="zstd"):
+    """
+    Writes the tables of a paper space as Parquet under folder: papers and embeddings as hive-partitioned datasets
+    (folder/papers/cluster=1/topic=.../part-0.parquet) and every other table as a single file
+    (folder/citations.parquet...).
+
+    Parameters:
+        paper_space (PaperSet): The paper space.
+        folder (str): The output folder. Previous exports in it are replaced.
+        partition_by (tuple): Columns to partition papers and embeddings by. Empty to write single files.
+        row_group_size (int): Maximum rows per row group, so readers can stream a file group by group.
+        compression (str): Parquet compression codec.
+
+    Returns:
+        dict: The number of rows of every table.
+    """
+    tables = TableBuilder(paper_space).build()
+    os.makedirs(folder, exist_ok=True)
+    counts = {}
+    for name, table in tables.items():
+        dictionary = [column for column in table.column_names if column in DICTIONARY_COLUMNS]
+        counts[name] = table.num_rows
+        if partition_by and name in ("papers", "embeddings"):
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            file_options = ds.ParquetFileFormat().make_write_options(compression=compression,
+                                                                     use_dictionary=dictionary)
+            ds.write_dataset(table, path, format="parquet", partitioning=list(partition_by),
+                             partitioning_flavor="hive", file_options=file_options,
+                             max_rows_per_group=row_group_size, min_rows_per_group=min(row_group_size, 1024),
+                             max_rows_per_file=0, existing_data_behavior="overwrite_or_ignore")
+        else:
+            pq.write_table(table, os.path.join(folder, f"{name}.parquet"), row_group_size=row_group_size,
+                           compression=compression, use_dictionary=dictionary)
+    logging.info(f'Parquet export to {folder}: {counts}')
+    return counts
+
+
+def read_table(folder, name, columns=None, filter=None):
+    """
+    Reads an exported table (partitioned or not) with pyarrow.
+
+    Parameters:
+        folder (str): The export folder.
+        name (str): The table name, e.g. "citations".
+        columns (list, optional): Only read these columns.
+        filter (pyarrow.compute.Expression, optional): Row filter, e.g. ds.field("cluster") == 1, which skips the
+        partitions that cannot match.
+
+    Returns:
+        pyarrow.Table: The table.
+    """
+    path = os.path.join(folder, name)
+    if os.path.isdir(path):
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    else:
+        dataset = ds.dataset(f"{path}.parquet", format="parquet")
+    return dataset.to_table(columns=columns, filter=filter)
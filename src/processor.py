@@ -1,9 +1,16 @@
-from time import sleep
+import logging
+from time import perf_counter, sleep
 
 from grobid.client import GrobidClient
 import xml.etree.ElementTree as ET
 import os
 from ontology_classes import Paper
+from instrumentation import metrics
+from consolidation import TEI, apply_record, bibl_record, citation_text
+from dedup import file_digest
+
+# Subfolder of the output path where the TEI of header-only processing is written
+HEADERS_FOLDER = "headers/"
 
 
 class PaperProcessor:
@@ -11,24 +18,39 @@ class PaperProcessor:
     This class is responsible for processing and extracting information from scientific papers using the Grobid library.
     """
 
-    def __init__(self, output_path, grobid_port=8070):
+    def __init__(self, output_path, grobid_port=8070, grobid_host="localhost", retries=3, retry_after=1.0,
+                 consolidation=None, external_consolidation=True, digests=None, archive=None):
         self.output_path = output_path
-        self.grobid = GrobidClient(host="localhost", port=grobid_port)
+        self.grobid = GrobidClient(host=grobid_host, port=grobid_port)
+        # GROBID answers 503 when its pool is busy; those requests are retried with exponential backoff
+        self.retries = retries
+        self.retry_after = retry_after
+        # With a ConsolidationIndex, GROBID does not consolidate the references: they are resolved locally and only
+        # the misses are consolidated by GROBID (unless external_consolidation is False)
+        self.consolidation = consolidation
+        self.external_consolidation = external_consolidation
+        # With PdfDigests, byte-identical copies of a PDF already processed are skipped
+        self.digests = digests
+        # With a TEIArchive, the TEI documents are kept in it instead of as XML files of the output path
+        self.archive = archive
 
     def write(self, paper, content):
         """
-        Writes the processed content of a paper to a file.
+        Writes the processed content of a paper to a file, or to the archive.
 
         Parameters:
             paper (str): The name of the paper file.
-            content (str): The processed content of the paper.
+            content (str or bytes): The processed content of the paper.
         """
-        with open(self.output_path + paper, "w") as f:
+        if self.archive is not None:
+            self.archive.add(paper, content)
+            return
+        with open(self.output_path + paper, "wb" if isinstance(content, bytes) else "w") as f:
             f.write(content)
 
     def parse(self, paper):
         """
-        Parses an XML file and returns the parsed ElementTree object.
+        Parses an XML file (or the document of the archive with its name) and returns the parsed ElementTree object.
 
         Parameters:
             paper (str): The name of the XML file.
@@ -36,38 +58,114 @@ class PaperProcessor:
         Returns:
             ElementTree: The parsed XML as an ElementTree object.
         """
+        if self.archive is not None:
+            return ET.ElementTree(ET.fromstring(self.archive.get(paper)))
         return ET.parse(self.output_path + paper)
 
-    def process(self, paper):
+    def xml_names(self):
+        """
+        Returns the names of the TEI documents of processed papers, without the header-only ones.
+        """
+        if self.archive is not None:
+            return {name for name in self.archive.keys() if not name.startswith(HEADERS_FOLDER)}
+        return {name for name in os.listdir(self.output_path) if name.endswith(".xml")}
+
+    def process(self, paper, header_only=False):
         """
         Processes a PDF paper using the Grobid server.
 
         Parameters:
             paper (str): The name of the PDF paper file.
+            header_only (bool): Only extract the header (title, authors, abstract, keywords and identifiers) with
+                processHeaderDocument and without consolidation, which is much faster than the full text. The TEI is
+                written to the headers/ folder of the output path, so it is not taken for a processed paper.
 
         Returns:
-            tuple: A tuple containing the status and the processed Paper object.
-            (status, paper_obj): The status can be either "Error" or "Success". If an error occurs during processing,
-            the status will be "Error" and paper_obj will be None. If processing is successful, the status will be
-            "Success" and paper_obj will be a Paper object initialized with the parsed XML data.
+            Paper: A Paper object initialized with the parsed XML data, or None if GROBID could not process the file.
         """
         abs_paper = os.path.abspath(paper)
-        resp = self.grobid.serve("processFulltextDocument", abs_paper, consolidate_header=True,
-                                 consolidate_citations=True)
+        service = "processHeaderDocument" if header_only else "processFulltextDocument"
+        consolidate = 0 if header_only else True
+        consolidate_citations = 0 if header_only or self.consolidation is not None else True
+        for attempt in range(self.retries + 1):
+            start, resp = perf_counter(), None
+            try:
+                resp = self.grobid.serve(service, abs_paper, consolidate_header=consolidate,
+                                         consolidate_citations=consolidate_citations)
+            finally:
+                metrics().observe("grobid_header" if header_only else "grobid", perf_counter() - start,
+                                  error=resp is None or resp[1] != 200)
+            if resp[1] != 503 or attempt == self.retries:
+                break
+            metrics().count("grobid_retries")
+            sleep(self.retry_after * 2 ** attempt)
         if resp[1] != 200:
             print(f"Error processing file {paper}!")
-            return "Error", None
+            logging.warning(f'GROBID answered {resp[1]} for {paper}')
+            metrics().count("grobid_errors")
+            return None
         else:
             input_path = "/".join(paper.split("/")[:-1])
             paper_name = paper.split("/")[-1]
             input_path = "./" if input_path == paper_name else input_path
             paper_name = paper_name.replace(".pdf", ".xml")
-            self.write(paper_name, resp[0].text)
+            if header_only:
+                if self.archive is None:
+                    os.makedirs(self.output_path + HEADERS_FOLDER, exist_ok=True)
+                paper_name = HEADERS_FOLDER + paper_name
+            tei = resp[0].text
+            if self.consolidation is not None and not header_only:
+                tei = self.consolidate(tei)
+            self.write(paper_name, tei)
             return self.process_from_xml(paper_name, input_path=input_path)
 
+    def consolidate(self, tei):
+        """
+        Resolves the references of a TEI document with the consolidation index, and the ones it does not know with
+        GROBID's processCitationList.
+
+        Parameters:
+            tei (str): The TEI document, processed without citation consolidation.
+
+        Returns:
+            str: The TEI document with the resolved references completed.
+        """
+        root = ET.fromstring(tei)
+        misses = self.consolidation.resolve(root)
+        if misses and self.external_consolidation:
+            self.consolidate_externally(misses)
+        return ET.tostring(root, encoding="unicode")
+
+    def consolidate_externally(self, bibls):
+        """
+        Consolidates references with GROBID in a single processCitationList request, completes the ones it resolved
+        and adds them to the consolidation index.
+
+        Parameters:
+            bibls (list): The biblStruct elements of the references.
+        """
+        start, resp = perf_counter(), None
+        try:
+            resp = self.grobid.post(url=f"{self.grobid.url}/api/processCitationList",
+                                    data={"citations": [citation_text(bibl_record(bibl)) for bibl in bibls],
+                                          "consolidateCitations": "1"})
+        finally:
+            metrics().observe("grobid_citations", perf_counter() - start, error=resp is None or resp[1] != 200)
+        if resp[1] != 200:
+            logging.warning(f'GROBID answered {resp[1]} to processCitationList')
+            return
+        resolved = 0
+        for bibl, consolidated in zip(bibls, ET.fromstring(resp[0].text).iter(f"{TEI}biblStruct")):
+            record = bibl_record(consolidated)
+            if record["identifiers"] and record["title"]:
+                apply_record(bibl, record)
+                self.consolidation.add(bibl_record(bibl))
+                resolved += 1
+        metrics().count("consolidation_external", resolved)
+
     def process_from_xml(self, paper_name, input_path=None):
         """
-        Processes a paper from an XML file.
+        Processes a paper from an XML file, and adds it to the consolidation index if there is one.
 
         Parameters:
             paper_name (str): The name of the XML file.
@@ -77,7 +175,12 @@ class PaperProcessor:
             Paper: A Paper object initialized with the parsed XML data.
         """
         res = self.parse(paper_name)
-        return Paper(tree=res, filename=paper_name, pdf_path=input_path, xml_path=self.output_path)
+        return self.indexed(Paper(tree=res, filename=paper_name, pdf_path=input_path, xml_path=self.output_path))
+
+    def indexed(self, paper):
+        if self.consolidation is not None:
+            self.consolidation.add_paper(paper)
+        return paper
 
     def process_folder(self, folder):
         """
@@ -87,9 +190,18 @@ class PaperProcessor:
             folder (str): The path to the folder containing the PDF papers.
 
         Returns:
-            list: A list of Paper objects representing the processed papers.
+            list: A list of Paper objects representing the processed papers. The files GROBID could not process are
+            left out.
+        """
+        with metrics().stage("grobid") as stage:
+            papers = list(self.iter_folder(folder))
+            stage.items = len(papers)
+        return papers
+
+    def wait_for_grobid(self):
+        """
+        Waits for the Grobid server to be alive, exiting after three attempts.
         """
-        papers = []
         for i in range(0, 3):
             if not self.grobid.test_alive():
                 print("INITIALIZE GROBID FIRST")
@@ -99,11 +211,58 @@ class PaperProcessor:
                     exit(-1)
             else:
                 break
-        for paper in os.listdir(folder):
-            if paper.endswith(".pdf"):
-                paper_obj = self.process(folder + paper)
-                papers.append(paper_obj)
-        return papers
+
+    def iter_folder(self, folder):
+        """
+        Processes the PDF papers of a folder one at a time, for consumers that do not keep all of them in memory.
+
+        Parameters:
+            folder (str): The path to the folder containing the PDF papers.
+
+        Yields:
+            Paper: The processed papers. The files GROBID could not process are left out.
+        """
+        self.wait_for_grobid()
+        for paper, digest in self.pdf_order(folder):
+            if self.is_copy(folder + paper, digest):
+                continue
+            paper_obj = self.process(folder + paper)
+            if paper_obj is not None:
+                self.record(folder + paper, digest)
+                yield paper_obj
+
+    def pdf_order(self, folder):
+        """
+        Returns the PDF files of a folder in name order, with their SHA-256 digests if there are digests. The
+        byte-identical copies of a file follow it, the shortest name first, so "paper.pdf" is processed rather than
+        "paper (2).pdf", which is only processed if GROBID could not process the first one.
+
+        Returns:
+            list: (file name, digest or None) pairs.
+        """
+        names = sorted(name for name in os.listdir(folder) if name.endswith(".pdf"))
+        if self.digests is None:
+            return [(name, None) for name in names]
+        groups = {}
+        for name in names:
+            groups.setdefault(file_digest(folder + name), []).append(name)
+        ordered = sorted((sorted(group, key=lambda name: (len(name), name)), digest)
+                         for digest, group in groups.items())
+        return [(name, digest) for group, digest in ordered for name in group]
+
+    def is_copy(self, paper, digest=None):
+        """
+        Returns whether a PDF is a byte-identical copy of one that was already processed (always False without
+        digests).
+        """
+        return self.digests is not None and self.digests.duplicate_of(paper, digest) is not None
+
+    def record(self, paper, digest=None):
+        """
+        Records a PDF that was processed, so that its copies are skipped.
+        """
+        if self.digests is not None:
+            self.digests.record(paper, digest)
 
     def process_folder_from_xml(self, pdf_path=None):
         """
@@ -115,9 +274,28 @@ class PaperProcessor:
         Returns:
             list: A list of Paper objects representing the processed papers.
         """
-        papers = []
+        with metrics().stage("parse_tei") as stage:
+            papers = list(self.iter_folder_from_xml(pdf_path=pdf_path))
+            stage.items = len(papers)
+        return papers
+
+    def iter_folder_from_xml(self, pdf_path=None):
+        """
+        Processes the XML papers of the output path directory one at a time, for consumers that do not keep all of
+        them in memory. With an archive, its documents are read sequentially instead.
+
+        Parameters:
+            pdf_path (str, optional): The path to the corresponding PDF files. Defaults to None.
+
+        Yields:
+            Paper: The processed papers.
+        """
+        if self.archive is not None:
+            for paper, content in self.archive.items():
+                if not paper.startswith(HEADERS_FOLDER):
+                    yield self.indexed(Paper(tree=ET.ElementTree(ET.fromstring(content)), filename=paper,
+                                             pdf_path=pdf_path, xml_path=self.output_path))
+            return
         for paper in os.listdir(self.output_path):
             if paper.endswith(".xml"):
-                paper_obj = self.process_from_xml(paper, input_path=pdf_path)
-                papers.append(paper_obj)
-        return papers
+                yield self.process_from_xml(paper, input_path=pdf_path)
@@ -0,0 +1,216 @@
+import gzip
+import json
+
+from rdflib import Literal, URIRef, BNode
+from rdflib.namespace import XSD
+
+CONTEXT = {
+    "schema": "http://schema.org/",
+    "instances": "http://instances.com/",
+    "xsd": str(XSD),
+}
+_NATIVE_JSON_TYPES = {XSD.integer: int, XSD.boolean: lambda value: value == "true", XSD.double: float}
+_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"})
+
+
+def term_nt(term):
+    """
+    Serializes an RDF term in N-Triples syntax, which is also valid in N-Quads and in SPARQL data blocks.
+
+    Parameters:
+        term: A URIRef, BNode or Literal.
+
+    Returns:
+        str: The N-Triples representation of the term.
+    """
+    if isinstance(term, Literal):
+        value = f'"{str(term).translate(_ESCAPES)}"'
+        if term.language:
+            return f"{value}@{term.language}"
+        if term.datatype:
+            return f"{value}^^<{term.datatype}>"
+        return value
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    return f"<{term}>"
+
+
+def triple_nt(subject, predicate, obj, graph=None):
+    """
+    Serializes a triple as an N-Triples line, or as an N-Quads line when a graph IRI is given.
+    """
+    if graph is not None:
+        return f"{term_nt(subject)} {term_nt(predicate)} {term_nt(obj)} {term_nt(graph)} .\n"
+    return f"{term_nt(subject)} {term_nt(predicate)} {term_nt(obj)} .\n"
+
+
+def open_text(path, mode="wt", compression=None):
+    """
+    Opens a text file, transparently compressing it with gzip or zstd.
+
+    Parameters:
+        path (str): The path of the file.
+        mode (str): "wt", "at" or "rt".
+        compression (str, optional): "gzip" or "zstd". Inferred from a .gz or .zst extension when not given.
+
+    Returns:
+        A text file object.
+    """
+    if compression is None:
+        compression = "gzip" if path.endswith(".gz") else "zstd" if path.endswith(".zst") else None
+    if compression == "gzip":
+        return gzip.open(path, mode, encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the zstandard package")
+        return zstandard.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class NTriplesWriter:
+    """
+    This class writes triples straight to an N-Triples file (or an N-Quads file when a graph IRI is given) without
+    keeping them in memory. It can be used as the sink of an RDFParser.
+    """
+
+    def __init__(self, path, compression=None, graph=None, mode="wt"):
+        self.path = path
+        self.graph = URIRef(graph) if graph else None
+        self.file = open_text(path, mode, compression)
+        self.count = 0
+
+    def add(self, triple):
+        """
+        Writes a single triple.
+        """
+        self.file.write(triple_nt(*triple, graph=self.graph))
+        self.count += 1
+
+    def addN(self, quads):
+        """
+        Writes a batch of quads, ignoring their context in favour of the writer's graph.
+        """
+        lines = [triple_nt(s, p, o, graph=self.graph) for s, p, o, _ in quads]
+        self.file.writelines(lines)
+        self.count += len(lines)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JSONLDWriter:
+    """
+    This class writes triples as a compacted JSON-LD document with a shared @context, one node object per subject,
+    without building the graph in memory. Triples of the same subject are expected to arrive consecutively, as the
+    RDFParser emits them; a subject seen again later produces a second node object, which JSON-LD merges.
+    """
+
+    def __init__(self, path, compression=None, context=None):
+        self.path = path
+        self.context = context if context else CONTEXT
+        self.file = open_text(path, "wt", compression)
+        self.file.write('{"@context": ' + json.dumps(self.context) + ', "@graph": [\n')
+        self.subject = None
+        self.node = None
+        self.nodes = 0
+        self.count = 0
+
+    def compact_iri(self, iri):
+        for prefix, namespace in self.context.items():
+            if iri.startswith(namespace):
+                return f"{prefix}:{iri[len(namespace):]}"
+        return iri
+
+    def value(self, term):
+        if isinstance(term, Literal):
+            if term.language:
+                return {"@value": str(term), "@language": term.language}
+            if term.datatype in _NATIVE_JSON_TYPES:
+                try:
+                    return _NATIVE_JSON_TYPES[term.datatype](str(term))
+                except ValueError:
+                    pass
+            if term.datatype:
+                return {"@value": str(term), "@type": self.compact_iri(str(term.datatype))}
+            return str(term)
+        return {"@id": self.compact_iri(str(term))}
+
+    def add(self, triple):
+        """
+        Adds a single triple to the node object of its subject.
+        """
+        subject, predicate, obj = triple
+        if subject != self.subject:
+            self.write_node()
+            self.subject = subject
+            self.node = {"@id": self.compact_iri(str(subject))}
+        if predicate == URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#type"):
+            key, value = "@type", self.compact_iri(str(obj))
+        else:
+            key, value = self.compact_iri(str(predicate)), self.value(obj)
+        if key in self.node:
+            if not isinstance(self.node[key], list):
+                self.node[key] = [self.node[key]]
+            self.node[key].append(value)
+        else:
+            self.node[key] = value
+        self.count += 1
+
+    def addN(self, quads):
+        """
+        Adds a batch of quads, ignoring their context.
+        """
+        for s, p, o, _ in quads:
+            self.add((s, p, o))
+
+    def write_node(self):
+        if self.node is not None:
+            self.file.write((",\n" if self.nodes else "") + json.dumps(self.node))
+            self.nodes += 1
+            self.node = None
+
+    def close(self):
+        self.write_node()
+        self.file.write("\n]}\n")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TeeSink:
+    """
+    This class forwards every batch of quads to several sinks (e.g. a file writer and a Fuseki loader).
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = [sink for sink in sinks if sink is not None]
+
+    def addN(self, quads):
+        quads = list(quads)
+        for sink in self.sinks:
+            sink.addN(quads)
+
+
+def open_writer(path, compression=None, graph=None):
+    """
+    Opens a streaming triple writer whose format is chosen from the file extension: .nt, .nq (written with the given
+    graph IRI) or .jsonld, optionally followed by .gz or .zst.
+    """
+    name = path[:-3] if path.endswith(".gz") else path[:-4] if path.endswith(".zst") else path
+    if name.endswith(".jsonld") or name.endswith(".json"):
+        return JSONLDWriter(path, compression)
+    if name.endswith(".nq"):
+        return NTriplesWriter(path, compression, graph=graph if graph else "http://instances.com/kg")
+    return NTriplesWriter(path, compression)
@@ -1,259 +1,320 @@
-import re
-from rdflib import Graph, Namespace, URIRef, Literal, RDF
+import logging
+import time
+from collections import deque
+
+from rdflib import Graph, Namespace, Literal, RDF
+from instrumentation import metrics
+from iri_registry import IRIRegistry
+from rdf_writer import triple_nt
 from ontology_classes import Paper, Author, Journal, Affiliation, Citation, Aknowledgement
 
 
-# Create a new RDF graph
+class RDFParser:
+    """
+    This class builds the RDF graph of a paper space.
 
+    The graph is built from a worklist instead of recursion: every add_* method emits the triples of one entity and
+    enqueues the neighbours that have not been defined yet, so each entity is visited exactly once and the stack depth
+    does not depend on the size of the graph. Triples are added to the graph in batches of batch_size.
 
-class RDFParser:
+    IRIs are minted once per entity by an IRIRegistry; hashed_iris=True uses compact digests instead of slugs.
+
+    By default the triples are kept in the in-memory graph g. A sink with an addN method (e.g. one of the streaming
+    writers of rdf_writer) can be given instead, in which case the triples are written to it and g stays empty.
+    A graph backed by a persistent store (e.g. triple_store.open_graph) can be given as g, so that the triples go
+    straight to disk; to combine it with other sinks, add the graph itself to a TeeSink.
+
+    When a TripleLedger is given, every triple is also recorded under the paper of the paper space whose traversal
+    emitted it, so that later runs can be applied as a delta (see kg_delta).
+
+    should_visit, if given, is called with the IRI of every entity before it is scheduled, and entities for which it
+    returns False are referenced but not expanded (the sharded builder uses it to leave other shards' papers alone).
 
-    def __init__(self, paper_space):
+    iris, if given, is the IRIRegistry of a previous build, so that a build of new papers (see watcher.DeltaParser)
+    reuses the IRIs already minted for the entities it shares with it.
+    """
+
+    def __init__(self, paper_space, batch_size=10000, hashed_iris=False, sink=None, ledger=None, graph=None,
+                 should_visit=None, iris=None):
         self.paper_space = paper_space
-        self.g = Graph()
+        self.g = graph if graph is not None else Graph()
+        self.sink = sink if sink is not None else self.g
         self.schema = Namespace('http://schema.org/')
         self.instances = Namespace('http://instances.com/')
+        self.iris = iris if iris is not None else IRIRegistry(self.instances, hashed=hashed_iris)
         self.defined_instances = set()
+        self.batch_size = batch_size
+        self.queue = deque()
+        self.ledger = ledger
+        self.should_visit = should_visit
+        self.origin = None
+        self.batch = []
+        self.triple_count = 0
+        self.build_seconds = 0.0
         self.build()
 
+    @property
+    def triples_per_second(self):
+        return self.triple_count / self.build_seconds if self.build_seconds else 0.0
+
     def build(self):
         """
         Builds the RDF graph by adding papers and related entities to the graph.
+
+        All the papers of the paper space are scheduled before any neighbour, so the papers reached through
+        references, authors or journals resolve to the paper space's own instances.
+        """
+        start = time.perf_counter()
+        triples, hits, misses = self.triple_count, self.iris.hits, self.iris.misses
+        with metrics().stage("rdf") as stage:
+            for paper in self.paper_space.papers.values():
+                self.enqueue(self.paper_id(paper), self.add_paper, paper)
+            self.process_queue()
+            self.flush()
+            stage.items = self.triple_count - triples
+        metrics().cache("iri", hits=self.iris.hits - hits, misses=self.iris.misses - misses)
+        self.build_seconds += time.perf_counter() - start
+        logging.info(f'RDF graph built: {self.triple_count} triples, {len(self.defined_instances)} instances in '
+                     f'{self.build_seconds:.2f}s ({self.triples_per_second:.0f} triples/s), '
+                     f'IRI cache hit rate {self.iris.hit_rate:.2%}, {len(self.iris.collisions)} IRI collisions')
+
+    def enqueue(self, instance_id, add, entity):
+        """
+        Schedules an entity to be added to the graph unless it has already been defined or scheduled.
+
+        Parameters:
+            instance_id: The IRI of the entity.
+            add: The add_* method that emits the triples of the entity.
+            entity: The entity to be added.
+        """
+        if instance_id not in self.defined_instances:
+            if self.should_visit is not None and not self.should_visit(instance_id):
+                return
+            self.defined_instances.add(instance_id)
+            self.queue.append((add, entity, self.origin if self.origin is not None else instance_id))
+
+    def process_queue(self):
+        """
+        Adds the scheduled entities to the graph until there is nothing left to visit.
+        """
+        while self.queue:
+            add, entity, self.origin = self.queue.popleft()
+            add(entity)
+        self.origin = None
+
+    def emit(self, subject, predicate, obj):
+        """
+        Buffers a triple and writes the buffer to the sink once it reaches batch_size triples.
         """
-        for paper in self.paper_space.papers.values():
-            self.add_paper(paper)
+        self.batch.append((subject, predicate, obj))
+        if self.ledger is not None:
+            self.ledger.record(str(self.origin), triple_nt(subject, predicate, obj))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered triples to the sink.
+        """
+        if self.batch:
+            self.sink.addN((s, p, o, self.g) for s, p, o in self.batch)
+            self.triple_count += len(self.batch)
+            self.batch = []
+
+    def paper_id(self, paper: Paper):
+        return self.iris.mint("paper", paper, paper.title)
+
+    def author_id(self, author: Author):
+        return self.iris.mint("author", author, author.forename, author.surname)
+
+    def journal_id(self, journal: Journal):
+        if journal and journal.name:
+            return self.iris.mint("journal", journal, journal.name)
+        return self.iris.mint("journal", None, "no journal")
+
+    def affiliation_id(self, affiliation: Affiliation):
+        if affiliation and affiliation.name:
+            return self.iris.mint("affiliation", affiliation, affiliation.name)
+        return self.iris.mint("affiliation", None, "no affiliation")
+
+    def citation_id(self, citation: Citation):
+        return self.iris.mint("citation", citation, citation.source.title, citation.cites.title)
+
+    def acknowledgement_id(self, acknowledgement: Aknowledgement):
+        return self.iris.mint("acknowledgement", acknowledgement, acknowledgement.source.title, "acknowledgement")
+
+    def version_id(self, paper: Paper, version):
+        return self.iris.mint("version", None, paper.title, version["filename"], version["title"])
 
     def add_paper(self, paper: Paper):
         """
-        Adds a paper and its related entities to the RDF graph.
+        Adds a paper to the RDF graph and schedules its related entities.
 
         Parameters:
             paper: The Paper object to be added to the RDF graph.
         """
-
-        paper_id = paper.title.replace(' ', '_').lower()
-        paper_id = re.sub(r'[^a-zA-Z0-9]', '', paper_id)
-        self.defined_instances.add(paper_id)
-        namespace = URIRef(self.instances[paper_id])
-        self.g.add((namespace, RDF.type, self.schema["paper"]))
-        self.g.add((namespace, self.schema["title"], Literal(paper.title)))
-        self.g.add(
-            (namespace, self.schema["abstract"], Literal(paper.abstract)))
-        self.g.add(
-            (namespace, self.schema["keywords"], Literal(paper.keywords)))
-        self.g.add((namespace, self.schema["cluster"], Literal(paper.cluster)))
-        self.g.add((namespace, self.schema["topic"], Literal(paper.topic)))
-        self.g.add(
-            (namespace, self.schema["physical"], Literal(paper.physical)))
+        namespace = self.paper_id(paper)
+        self.emit(namespace, RDF.type, self.schema["paper"])
+        self.emit(namespace, self.schema["title"], Literal(paper.title))
+        self.emit(namespace, self.schema["abstract"], Literal(paper.abstract))
+        self.emit(namespace, self.schema["keywords"], Literal(paper.keywords))
+        self.emit(namespace, self.schema["cluster"], Literal(paper.cluster))
+        self.emit(namespace, self.schema["topic"], Literal(paper.topic))
+        self.emit(namespace, self.schema["physical"], Literal(paper.physical))
+        for scheme, value in paper.identifiers.items():
+            self.emit(namespace, self.schema[scheme], Literal(value))
+        for metric in ("pagerank", "citation_count", "reference_count", "co_cited_with", "coupled_with"):
+            if getattr(paper, metric, None) is not None:
+                self.emit(namespace, self.schema[metric], Literal(getattr(paper, metric)))
+        # The near-duplicates merged into the paper (see dedup.add_version), e.g. its preprint
+        for version in paper.versions:
+            version_id = self.version_id(paper, version)
+            self.emit(namespace, self.schema["version"], version_id)
+            self.emit(version_id, RDF.type, self.schema["version"])
+            self.emit(version_id, self.schema["filename"], Literal(version["filename"]))
+            self.emit(version_id, self.schema["title"], Literal(version["title"]))
+            for scheme, value in version["identifiers"].items():
+                self.emit(version_id, self.schema[scheme], Literal(value))
 
         for author in paper.authors:
-            author_id = f"{author.forename.replace(' ', '_').lower()}_{author.surname.replace(' ', '_').lower()}"
-            author_id = re.sub(r'[^a-zA-Z0-9]', '', author_id)
-            if author_id not in self.defined_instances:
-                self.add_author(author)
-            self.g.add((namespace, self.schema["author"], URIRef(
-                self.instances[author_id])))
+            author_id = self.author_id(author)
+            self.enqueue(author_id, self.add_author, author)
+            self.emit(namespace, self.schema["author"], author_id)
 
         for citation in paper.references:
-            citation_id = f'{paper_id}_{citation.cites.title.replace(" ", "_").lower()}'
-            citation_id = re.sub(r'[^a-zA-Z0-9]', '', citation_id)
-            if id not in self.defined_instances:
-                self.add_citation(citation)
-            self.g.add((namespace, self.schema["citation"], URIRef(
-                self.instances[citation_id])))
-
-        ack_id = f'{paper_id}_acknowledgement'
-        ack_id = re.sub(r'[^a-zA-Z0-9]', '', ack_id)
-        if ack_id not in self.defined_instances:
-            if paper.acknowledgements:
-                self.add_acknowledgement(paper.acknowledgements)
-        self.g.add(
-            (namespace, self.schema["acknowledgement"], URIRef(self.instances[ack_id])))
-
-        journal_id = f'{paper.journal.name.replace(" ", "_").lower()}' if paper.journal else "no_journal"
-        journal_id = re.sub(r'[^a-zA-Z0-9]', '', journal_id)
-        if journal_id not in self.defined_instances:
-            if paper.journal:
-                self.add_journal(paper.journal)
-        self.g.add((namespace, self.schema["journal"], URIRef(
-            self.instances[journal_id])))
+            citation_id = self.citation_id(citation)
+            self.enqueue(citation_id, self.add_citation, citation)
+            self.emit(namespace, self.schema["citation"], citation_id)
+
+        ack_id = self.iris.mint("acknowledgement", paper.acknowledgements, paper.title, "acknowledgement")
+        if paper.acknowledgements:
+            self.enqueue(ack_id, self.add_acknowledgement, paper.acknowledgements)
+        self.emit(namespace, self.schema["acknowledgement"], ack_id)
+
+        journal_id = self.journal_id(paper.journal)
+        if paper.journal:
+            self.enqueue(journal_id, self.add_journal, paper.journal)
+        self.emit(namespace, self.schema["journal"], journal_id)
 
         for cited_by in paper.cited_by:
-            cited_by_id = f'{cited_by.source.title.replace(" ", "_").lower()}_{cited_by.cites.title.replace(" ", "_").lower()}'
-            cited_by_id = re.sub(r'[^a-zA-Z0-9]', '', cited_by_id)
-            if cited_by_id not in self.defined_instances:
-                self.add_citation(cited_by)
-            self.g.add((namespace, self.schema["cited_by"], URIRef(
-                self.instances[cited_by_id])))
+            cited_by_id = self.citation_id(cited_by)
+            self.enqueue(cited_by_id, self.add_citation, cited_by)
+            self.emit(namespace, self.schema["cited_by"], cited_by_id)
 
     def add_author(self, author: Author):
         """
-        Adds an author and its related entities to the RDF graph.
+        Adds an author to the RDF graph and schedules its related entities.
 
         Parameters:
             author: The Author object to be added to the RDF graph.
         """
-
-        author_id = re.sub(r'[^a-zA-Z0-9]', '',
-                           f"{author.forename.replace(' ', '_').lower()}_{author.surname.replace(' ', '_').lower()}")
-        self.defined_instances.add(author_id)
-        namespace = URIRef(self.instances[author_id])
-        self.g.add((namespace, RDF.type, self.schema["author"]))
-        self.g.add(
-            (namespace, self.schema["forename"], Literal(author.forename)))
-        self.g.add(
-            (namespace, self.schema["surname"], Literal(author.surname)))
-        self.g.add(
-            (namespace, self.schema["cited_by_count"], Literal(author.cited_by_count)))
-        self.g.add(
-            (namespace, self.schema["works_count"], Literal(author.works_count)))
-        self.g.add((namespace, self.schema["email"], Literal(author.email)))
-
-        affiliation_id = f'{author.affiliation.name.replace(" ", "_").lower()}' if author.affiliation else "no_affiliation"
-        affiliation_id = re.sub(r'[^a-zA-Z0-9]', '', affiliation_id)
-        if affiliation_id not in self.defined_instances:
-            self.add_affiliation(author.affiliation)
-        self.g.add((namespace, self.schema["affiliation"], URIRef(
-            self.instances[affiliation_id])))
+        namespace = self.author_id(author)
+        self.emit(namespace, RDF.type, self.schema["author"])
+        self.emit(namespace, self.schema["forename"], Literal(author.forename))
+        self.emit(namespace, self.schema["surname"], Literal(author.surname))
+        self.emit(namespace, self.schema["cited_by_count"], Literal(author.cited_by_count))
+        self.emit(namespace, self.schema["works_count"], Literal(author.works_count))
+        self.emit(namespace, self.schema["email"], Literal(author.email))
+        for metric in ("coauthor_count", "collaboration_component", "collaboration_size"):
+            if getattr(author, metric, None) is not None:
+                self.emit(namespace, self.schema[metric], Literal(getattr(author, metric)))
+
+        affiliation_id = self.affiliation_id(author.affiliation)
+        if author.affiliation:
+            self.enqueue(affiliation_id, self.add_affiliation, author.affiliation)
+        self.emit(namespace, self.schema["affiliation"], affiliation_id)
 
         for paper in author.writes:
-            paper_id = f'{paper.title.replace(" ", "_").lower()}'
-            paper_id = re.sub(r'[^a-zA-Z0-9]', '', paper_id)
-            if paper_id not in self.defined_instances:
-                self.add_paper(paper)
-            self.g.add(
-                (namespace, self.schema["writes"], URIRef(self.instances[paper_id])))
+            paper_id = self.paper_id(paper)
+            self.enqueue(paper_id, self.add_paper, paper)
+            self.emit(namespace, self.schema["writes"], paper_id)
 
         for ack in author.ackowledged_by:
-            ack_id = f'{ack.source.title.replace(" ", "_").lower()}_acknowledgement'
-            ack_id = re.sub(r'[^a-zA-Z0-9]', '', ack_id)
-            if ack_id not in self.defined_instances:
-                self.add_acknowledgement(ack)
-            self.g.add(
-                (namespace, self.schema["acknowledged_by"], URIRef(self.instances[ack_id])))
+            ack_id = self.acknowledgement_id(ack)
+            self.enqueue(ack_id, self.add_acknowledgement, ack)
+            self.emit(namespace, self.schema["acknowledged_by"], ack_id)
 
     def add_journal(self, journal: Journal):
         """
-        Adds a journal and its related entities to the RDF graph.
+        Adds a journal to the RDF graph and schedules its related entities.
 
         Parameters:
             journal: The Journal object to be added to the RDF graph.
         """
-
-        journal_id = f'{journal.name.replace(" ", "_").lower()}' if journal.name else "no_journal"
-        journal_id = re.sub(r'[^a-zA-Z0-9]', '', journal_id)
-        self.defined_instances.add(journal_id)
-        namespace = URIRef(self.instances[journal_id])
-        self.g.add((namespace, RDF.type, self.schema["journal"]))
-        self.g.add((namespace, self.schema["name"], Literal(journal.name)))
-        self.g.add(
-            (namespace, self.schema["country"], Literal(journal.country)))
-        self.g.add(
-            (namespace, self.schema["description"], Literal(journal.description)))
-        self.g.add(
-            (namespace, self.schema["established"], Literal(journal.established)))
+        namespace = self.journal_id(journal)
+        self.emit(namespace, RDF.type, self.schema["journal"])
+        self.emit(namespace, self.schema["name"], Literal(journal.name))
+        self.emit(namespace, self.schema["country"], Literal(journal.country))
+        self.emit(namespace, self.schema["description"], Literal(journal.description))
+        self.emit(namespace, self.schema["established"], Literal(journal.established))
 
         for paper in journal.publishes:
-            paper_id = f'{paper.title.replace(" ", "_").lower()}'
-            paper_id = re.sub(r'[^a-zA-Z0-9]', '', paper_id)
-            if paper_id not in self.defined_instances:
-                self.add_paper(paper)
-            self.g.add(
-                (namespace, self.schema["publishes"], URIRef(self.instances[paper_id])))
+            paper_id = self.paper_id(paper)
+            self.enqueue(paper_id, self.add_paper, paper)
+            self.emit(namespace, self.schema["publishes"], paper_id)
 
     def add_affiliation(self, affiliation: Affiliation):
         """
-        Adds an affiliation and its related entities to the RDF graph.
+        Adds an affiliation to the RDF graph and schedules its related entities.
 
         Parameters:
             affiliation: The Affiliation object to be added to the RDF graph.
         """
-        affiliation_id = f'{affiliation.name.replace(" ", "_").lower()}' if affiliation.name else "no_affiliation"
-        affiliation_id = re.sub(r'[^a-zA-Z0-9]', '', affiliation_id)
-        self.defined_instances.add(affiliation_id)
-        namespace = URIRef(self.instances[affiliation_id])
-        self.g.add((namespace, RDF.type, self.schema["affiliation"]))
-        self.g.add((namespace, self.schema["name"], Literal(affiliation.name)))
-        self.g.add(
-            (namespace, self.schema["country"], Literal(affiliation.country)))
-        self.g.add(
-            (namespace, self.schema["website"], Literal(affiliation.website)))
-        self.g.add(
-            (namespace, self.schema["established"], Literal(affiliation.established)))
+        namespace = self.affiliation_id(affiliation)
+        self.emit(namespace, RDF.type, self.schema["affiliation"])
+        self.emit(namespace, self.schema["name"], Literal(affiliation.name))
+        self.emit(namespace, self.schema["country"], Literal(affiliation.country))
+        self.emit(namespace, self.schema["website"], Literal(affiliation.website))
+        self.emit(namespace, self.schema["established"], Literal(affiliation.established))
 
         for ack in affiliation.acknowledged_by:
-            ack_id = f'{ack.source.title.replace(" ", "_").lower()}_acknowledgement'
-            ack_id = re.sub(r'[^a-zA-Z0-9]', '', ack_id)
-            if ack_id not in self.defined_instances:
-                self.add_acknowledgement(ack)
-            self.g.add(
-                (namespace, self.schema["acknowledged_by"], URIRef(self.instances[ack_id])))
+            ack_id = self.acknowledgement_id(ack)
+            self.enqueue(ack_id, self.add_acknowledgement, ack)
+            self.emit(namespace, self.schema["acknowledged_by"], ack_id)
 
     def add_citation(self, citation: Citation):
         """
-        Adds a citation and its related entities to the RDF graph.
+        Adds a citation to the RDF graph and schedules its related entities.
 
         Parameters:
             citation: The Citation object to be added to the RDF graph.
         """
-        citation_id = f'{citation.source.title.replace(" ", "_").lower()}_{citation.cites.title.replace(" ", "_").lower()}'
-        citation_id = re.sub(r'[^a-zA-Z0-9]', '', citation_id)
-        self.defined_instances.add(citation_id)
-        namespace = URIRef(self.instances[citation_id])
-        self.g.add((namespace, RDF.type, self.schema["citation"]))
-        self.g.add((namespace, self.schema["date"], Literal(citation.date)))
-
-        source_id = f'{citation.source.title.replace(" ", "_").lower()}'
-        source_id = re.sub(r'[^a-zA-Z0-9]', '', source_id)
-        if source_id not in self.defined_instances:
-            self.add_paper(citation.source)
-        self.g.add((namespace, self.schema["source"], URIRef(
-            self.instances[source_id])))
-
-        cites_id = f'{citation.cites.title.replace(" ", "_").lower()}'
-        cites_id = re.sub(r'[^a-zA-Z0-9]', '', cites_id)
-        if cites_id not in self.defined_instances:
-            self.add_paper(citation.cites)
-        self.g.add(
-            (namespace, self.schema["cites"], URIRef(self.instances[cites_id])))
+        namespace = self.citation_id(citation)
+        self.emit(namespace, RDF.type, self.schema["citation"])
+        self.emit(namespace, self.schema["date"], Literal(citation.date))
+
+        source_id = self.paper_id(citation.source)
+        self.enqueue(source_id, self.add_paper, citation.source)
+        self.emit(namespace, self.schema["source"], source_id)
+
+        cites_id = self.paper_id(citation.cites)
+        self.enqueue(cites_id, self.add_paper, citation.cites)
+        self.emit(namespace, self.schema["cites"], cites_id)
 
     def add_acknowledgement(self, acknowledgement: Aknowledgement):
         """
-        Adds an acknowledgement and its related entities to the RDF graph.
+        Adds an acknowledgement to the RDF graph and schedules its related entities.
 
         Parameters:
             acknowledgement: The Acknowledgement object to be added to the RDF graph.
         """
-        ack_id = f'{acknowledgement.source.title.replace(" ", "_").lower()}_acknowledgement'
-        ack_id = re.sub(r'[^a-zA-Z0-9]', '', ack_id)
-        self.defined_instances.add(ack_id)
-        namespace = URIRef(self.instances[ack_id])
-        self.g.add((namespace, RDF.type, self.schema["acknowledgement"]))
-        self.g.add(
-            (namespace, self.schema["text"], Literal(acknowledgement.text)))
-
-        source_id = f'{acknowledgement.source.title.replace(" ", "_").lower()}'
-        source_id = re.sub(r'[^a-zA-Z0-9]', '', source_id)
-        if source_id not in self.defined_instances:
-            self.add_paper(acknowledgement.source)
-        self.g.add((namespace, self.schema["source"], URIRef(
-            self.instances[source_id])))
+        namespace = self.acknowledgement_id(acknowledgement)
+        self.emit(namespace, RDF.type, self.schema["acknowledgement"])
+        self.emit(namespace, self.schema["text"], Literal(acknowledgement.text))
+
+        source_id = self.paper_id(acknowledgement.source)
+        self.enqueue(source_id, self.add_paper, acknowledgement.source)
+        self.emit(namespace, self.schema["source"], source_id)
 
         for author in acknowledgement.acknowledges_people:
-            author_id = f"{author.forename.replace(' ', '_').lower()}_{author.surname.replace(' ', '_').lower()}"
-            author_id = re.sub(r'[^a-zA-Z0-9]', '', author_id)
-            if author_id not in self.defined_instances:
-                self.add_author(author)
-            self.g.add((namespace, self.schema["acknowledges_people"], URIRef(
-                self.instances[author_id])))
+            author_id = self.author_id(author)
+            self.enqueue(author_id, self.add_author, author)
+            self.emit(namespace, self.schema["acknowledges_people"], author_id)
 
         for affiliation in acknowledgement.acknowledges_org:
-            affiliation_id = f'{affiliation.name.replace(" ", "_").lower()}' if affiliation.name else "no_affiliation"
-            affiliation_id = re.sub(r'[^a-zA-Z0-9]', '', affiliation_id)
-            if affiliation_id not in self.defined_instances:
-                self.add_affiliation(affiliation)
-            self.g.add((namespace, self.schema["acknowledges_org"], URIRef(
-                self.instances[affiliation_id])))
+            affiliation_id = self.affiliation_id(affiliation)
+            self.enqueue(affiliation_id, self.add_affiliation, affiliation)
+            self.emit(namespace, self.schema["acknowledges_org"], affiliation_id)
 
     def get_paper_by_title(self, title: str):
         """
@@ -263,8 +324,12 @@ class RDFParser:
             title: The title of the paper.
 
         Returns:
-            URIRef: The URIRef of the paper in the RDF graph.
+            URIRef: The URIRef of the paper in the RDF graph, or None if there is no paper with that title.
         """
-        paper_id = f'{title.replace(" ", "_").lower()}'
-        paper_id = re.sub(r'[^a-zA-Z0-9]', '', paper_id)
-        return self.g.value(URIRef(self.instances[paper_id]), self.schema["paper"])
+        paper_id = self.iris.lookup("paper", title)
+        if paper_id is not None and (paper_id, RDF.type, self.schema["paper"]) in self.g:
+            return paper_id
+        for paper_id in self.g.subjects(self.schema["title"], Literal(title)):
+            if (paper_id, RDF.type, self.schema["paper"]) in self.g:
+                return paper_id
+        return None
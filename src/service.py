@@ -0,0 +1,393 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import types
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from dedup import file_digest
+from instrumentation import metrics
+from rdf_writer import CONTEXT
+from rdfparser import RDFParser
+
+_FILENAME = re.compile(r'[^A-Za-z0-9._ ()-]')
+MAX_UPLOAD_BYTES = 100 * 2 ** 20
+
+
+class MicroBatcher:
+    """
+    This class collects the items submitted by concurrent threads and hands them to a function in batches, so that
+    concurrent requests share one model call. A batch is closed when it holds max_batch items or max_delay seconds
+    after its first item arrived.
+
+    Parameters:
+        function: Called with a list of items from a single worker thread; returns the list of their results.
+        max_batch (int): Maximum number of items of a batch.
+        max_delay (float): Maximum seconds the first item of a batch waits for others.
+    """
+
+    def __init__(self, function, max_batch=16, max_delay=0.05):
+        self.function = function
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.work, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, item, timeout=None):
+        """
+        Submits an item and waits for its result.
+
+        Raises:
+            Exception: The exception raised by the function for the batch of the item.
+        """
+        future = Future()
+        self.queue.put((item, future))
+        return future.result(timeout)
+
+    def work(self):
+        while not self.stopped.is_set():
+            try:
+                batch = [self.queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.perf_counter() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            metrics().count("service_batches")
+            try:
+                results = self.function([item for item, _ in batch])
+            except Exception as e:
+                logging.exception('Batch failed')
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class PaperDescriber(RDFParser):
+    """
+    This class builds the triples of a single paper, referencing but not expanding its neighbours, with the IRIs of
+    the knowledge graph.
+    """
+
+    def __init__(self, paper, iris, **kwargs):
+        self.paper = paper
+        self.target = None
+        super().__init__(types.SimpleNamespace(papers={paper.title: paper}), iris=iris,
+                         should_visit=lambda iri: iri == self.target, **kwargs)
+
+    def build(self):
+        self.target = self.paper_id(self.paper)
+        super().build()
+
+
+def _name(author):
+    return f"{author.forename} {author.surname}"
+
+
+def _query_filters(params):
+    """
+    Turns the query parameters of GET /papers and GET /authors into CorpusIndex filters.
+    """
+    filters = {}
+    for field, values in params.items():
+        if field in ("author", "acknowledges_person"):
+            values = [tuple(value.rsplit(" ", 1)) if " " in value else ("", value) for value in values]
+        elif field == "cluster":
+            values = [int(value) for value in values]
+        elif field == "physical":
+            values = [value.lower() in ("1", "true", "yes") for value in values]
+        elif field not in ("affiliation", "journal", "topic", "acknowledges"):
+            continue
+        field = "acknowledges" if field == "acknowledges_person" else field
+        values = filters.get(field, []) + values
+        filters[field] = values if len(values) > 1 else values[0]
+    return filters
+
+
+class IngestionService:
+    """
+    This class is a long-running HTTP service over a resident paper space, so the models (encoder, NER, topic
+    model) are loaded once instead of on every run.
+
+    Endpoints:
+        POST /papers: Ingests a PDF (sent to GROBID) or a TEI document (application/xml), optionally named with
+            ?filename=, and returns the paper with its cluster, topic, acknowledged entities and JSON-LD.
+            Papers submitted concurrently are added to the paper space in micro-batches (see MicroBatcher).
+        GET /papers: The papers matching the filters author ("forename surname"), affiliation, journal, cluster,
+            topic, acknowledges (organization), acknowledges_person and physical, or title; limit caps the result.
+        GET /authors: The authors of the papers matching the same filters.
+        GET /clusters, GET /topics: The number of papers of every cluster or topic.
+        GET /health: Liveness and the size of the paper space.
+        GET /metrics: The run metrics in the Prometheus text format.
+
+    Parameters:
+        processor (PaperProcessor): The processor of the run.
+        ingestor (IncrementalIngestor): Adds the papers to the paper space and the knowledge graph.
+        pdf_path (str): Folder where uploaded PDFs are stored (the raw folder of the run).
+        host (str), port (int): Address to listen on.
+        max_batch (int), max_delay (float): Micro-batching of the ingestion, see MicroBatcher.
+    """
+
+    def __init__(self, processor, ingestor, pdf_path, host="127.0.0.1", port=8080, max_batch=16, max_delay=0.05):
+        self.processor = processor
+        self.ingestor = ingestor
+        self.paper_space = ingestor.paper_space
+        self.pdf_path = pdf_path
+        # Held while the paper space is changed or read, since requests are served from several threads and the
+        # ingestor may complete papers in the background
+        self.lock = ingestor.lock
+        self.batcher = MicroBatcher(self.ingest_batch, max_batch=max_batch, max_delay=max_delay)
+        # Held while the name of an upload is chosen and its file written
+        self.names_lock = threading.Lock()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, status, payload, content_type="application/json"):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                try:
+                    self.reply(*service.get(url.path.rstrip("/"), parse_qs(url.query)))
+                except (ValueError, KeyError) as e:
+                    self.reply(400, {"error": str(e)})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path.rstrip("/") != "/papers":
+                    return self.reply(404, {"error": "Not found"})
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_UPLOAD_BYTES:
+                    return self.reply(413, {"error": f"Documents are limited to {MAX_UPLOAD_BYTES} bytes"})
+                content = self.rfile.read(length)
+                filename = parse_qs(url.query).get("filename", [None])[0]
+                start = time.perf_counter()
+                try:
+                    status, payload = service.submit(content, filename, self.headers.get("Content-Type", ""))
+                except requests.exceptions.RequestException as e:
+                    logging.warning(f'GROBID could not be reached: {e}')
+                    status, payload = 502, {"error": f"GROBID could not be reached: {e}"}
+                except Exception as e:
+                    logging.exception('Ingestion failed')
+                    status, payload = 500, {"error": f"Ingestion failed: {e}"}
+                metrics().observe("service", time.perf_counter() - start, error=status >= 500)
+                self.reply(status, payload)
+
+            def log_message(self, format, *args):
+                logging.info(f'{self.address_string()} {format % args}')
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, content, filename=None, content_type=""):
+        """
+        Parses a PDF or TEI document in the calling thread and waits for its micro-batch to be ingested.
+
+        Returns:
+            tuple: The HTTP status and the JSON payload.
+        """
+        if not content:
+            return 400, {"error": "Empty document"}
+        stem = _FILENAME.sub("", os.path.splitext(os.path.basename(filename))[0]) if filename else ""
+        digest = hashlib.sha256(content).hexdigest()
+        stem = stem or f"upload-{digest[:16]}"
+        if content.startswith(b"%PDF"):
+            # Checked before the upload is written, so that duplicates are not left in the PDF folder
+            first = self.processor.digests.duplicate_of(os.path.join(self.pdf_path, f"{stem}.pdf"), digest) \
+                if self.processor.digests is not None else None
+            if first is not None:
+                return 200, {"status": "duplicate", "filename": os.path.basename(first)}
+            with self.names_lock:
+                path = os.path.join(self.pdf_path, f"{self.upload_stem(stem, digest)}.pdf")
+                with open(path, "wb") as f:
+                    f.write(content)
+            paper = self.processor.process(path, header_only=self.ingestor.tiered)
+            if paper is None:
+                return 502, {"error": "GROBID could not process the document"}
+            self.processor.record(path, digest)
+        elif "xml" in content_type or content.lstrip().startswith(b"<"):
+            try:
+                ET.fromstring(content)
+            except ET.ParseError as e:
+                return 400, {"error": f"Invalid TEI document: {e}"}
+            with self.names_lock:
+                stem = self.upload_stem(stem, digest)
+                self.processor.write(f"{stem}.xml", content)
+            paper = self.processor.process_from_xml(f"{stem}.xml")
+            path = None
+        else:
+            return 415, {"error": "Expected a PDF or a TEI document"}
+        return self.batcher.submit((paper, path))
+
+    def upload_stem(self, stem, digest):
+        """
+        Returns the name an upload is saved under: its own, unless a different PDF or a GROBID output already has it,
+        in which case the start of the digest of the upload is appended, so that the files of another paper are not
+        overwritten.
+        """
+        pdf = os.path.join(self.pdf_path, f"{stem}.pdf")
+        if os.path.exists(pdf):
+            return stem if file_digest(pdf) == digest else f"{stem}-{digest[:12]}"
+        return f"{stem}-{digest[:12]}" if f"{stem}.xml" in self.processor.xml_names() else stem
+
+    def ingest_batch(self, uploads):
+        """
+        Adds a micro-batch of parsed papers to the paper space and the knowledge graph. With a tiered ingestor, the full
+        text of the new papers uploaded as PDFs is processed afterwards.
+
+        Parameters:
+            uploads (list): (paper, PDF path or None) pairs.
+
+        Returns:
+            list: The (status, payload) response of every paper.
+        """
+        with self.lock:
+            # Near-duplicates of known papers (a preprint and its published version) are merged into them
+            canonical = {}
+            if self.ingestor.deduplicator is not None:
+                canonical = self.ingestor.merge_duplicates([paper for paper, _ in uploads])
+            update, _ = self.ingestor.ingest_papers([paper for paper, _ in uploads if id(paper) not in canonical])
+            duplicates = set(map(id, update["duplicates"]))
+            responses, deferred = [], []
+            for paper, path in uploads:
+                if id(paper) in canonical:
+                    responses.append((200, dict(self.describe(canonical[id(paper)]), status="duplicate")))
+                elif id(paper) in duplicates:
+                    existing = self.paper_space.paper_index.find(paper, fuzzy=False)
+                    responses.append((200, dict(self.describe(existing), status="duplicate")))
+                else:
+                    responses.append((201, dict(self.describe(paper), status="added")))
+                    if path is not None and self.ingestor.tiered:
+                        deferred.append((path, paper))
+            if deferred:
+                self.ingestor.defer(deferred)
+            return responses
+
+    def summary(self, paper):
+        acknowledgements = paper.acknowledgements
+        return {
+            "title": paper.title,
+            "filename": paper.filename,
+            "physical": bool(paper.physical),
+            "cluster": int(paper.cluster) if paper.cluster is not None else None,
+            "topic": paper.topic,
+            "identifiers": paper.identifiers,
+            "versions": paper.versions,
+            "authors": [_name(author) for author in paper.authors or []],
+            "journal": paper.journal.name if paper.journal else None,
+            "entities": {
+                "organizations": [org.name for org in acknowledgements.acknowledges_org] if acknowledgements else [],
+                "people": [_name(person) for person in acknowledgements.acknowledges_people]
+                if acknowledgements else [],
+            },
+        }
+
+    def describe(self, paper):
+        """
+        Returns the summary of a paper with the JSON-LD of its triples.
+        """
+        graph = PaperDescriber(paper, self.ingestor.iris, hashed_iris=self.ingestor.hashed_iris).g
+        return dict(self.summary(paper), jsonld=json.loads(graph.serialize(format="json-ld", context=CONTEXT)))
+
+    def get(self, path, params):
+        """
+        Answers a GET request.
+
+        Returns:
+            tuple: The HTTP status, the payload and optionally its content type.
+        """
+        if path == "/health":
+            return 200, {"status": "ok", "papers": len(self.paper_space.papers),
+                         "physical": len(self.paper_space.get_xml_papers()), "pending": self.batcher.pending()}
+        if path == "/metrics":
+            return 200, metrics().prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        with self.lock:
+            if path == "/clusters":
+                return 200, {str(cluster): count for cluster, count in
+                             self.paper_space.corpus_index.values("cluster").items()}
+            if path == "/topics":
+                return 200, self.paper_space.corpus_index.values("topic")
+            limit = int(params.pop("limit", ["100"])[0])
+            if path == "/papers":
+                if "title" in params:
+                    paper = self.paper_space.papers.get(params["title"][0].lower())
+                    if paper is None:
+                        return 404, {"error": "Unknown paper"}
+                    return 200, self.describe(paper)
+                papers = self.paper_space.find_papers(**_query_filters(params))
+                return 200, {"count": len(papers), "papers": [self.summary(paper) for paper in papers[:limit]]}
+            if path == "/authors":
+                authors = self.paper_space.corpus_index.authors(**_query_filters(params))
+                return 200, {"count": len(authors), "authors": [
+                    {"name": _name(author), "affiliation": author.affiliation.name if author.affiliation else None,
+                     "works_count": author.works_count, "cited_by_count": author.cited_by_count}
+                    for author in authors[:limit]]}
+        return 404, {"error": "Not found"}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.1,), name="service", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.batcher.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def run(self):
+        """
+        Serves requests until interrupted with Ctrl+C.
+        """
+        print(f"Serving on {self.url}, press Ctrl+C to stop")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped serving")
+        finally:
+            self.server.server_close()
+            self.batcher.stop()
+            self.ingestor.close()
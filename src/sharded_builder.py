@@ -0,0 +1,198 @@
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+from contextlib import ExitStack
+
+from rdf_writer import open_text, triple_nt
+from rdfparser import RDFParser
+
+# The paper space is handed to forked workers through this global instead of being pickled.
+_PAPER_SPACE = None
+
+
+class SortedRunWriter:
+    """
+    This class collects triples as N-Triples lines and writes them to a file sorted and without duplicates, spilling
+    sorted runs of run_size lines to temporary files and merging them at the end, so memory stays bounded. It can be
+    used as the sink of an RDFParser.
+    """
+
+    def __init__(self, path, run_size=1000000, tmp_dir=None):
+        self.path = path
+        self.run_size = run_size
+        self.tmp_dir = tmp_dir
+        self.lines = set()
+        self.runs = []
+        self.count = 0
+
+    def addN(self, quads):
+        """
+        Buffers a batch of quads, ignoring their context.
+        """
+        for s, p, o, _ in quads:
+            self.lines.add(triple_nt(s, p, o))
+        if len(self.lines) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        fd, path = tempfile.mkstemp(suffix=".nt", dir=self.tmp_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(sorted(self.lines))
+        self.runs.append(path)
+        self.lines = set()
+
+    def close(self):
+        """
+        Writes the sorted, deduplicated triples to path.
+
+        Returns:
+            int: The number of triples written.
+        """
+        if not self.runs:
+            with open_text(self.path, "wt") as f:
+                f.writelines(sorted(self.lines))
+            self.count = len(self.lines)
+        else:
+            if self.lines:
+                self.spill()
+            self.count = merge_sorted(self.runs, self.path)[0]
+            for path in self.runs:
+                os.remove(path)
+        self.lines = set()
+        self.runs = []
+        return self.count
+
+
+def partition_path(path, index):
+    """
+    Returns the path of a partition of an N-Triples output, e.g. kg.nt.gz -> kg-part-00003.nt.gz.
+    """
+    folder, name = os.path.split(path)
+    stem, dot, extension = name.partition(".")
+    return os.path.join(folder, f"{stem}-part-{index:05d}{dot}{extension}")
+
+
+def merge_sorted(paths, output, partitions=None):
+    """
+    Merges sorted N-Triples files into one sorted file without duplicates, or into partitions of it.
+
+    Parameters:
+        paths (list): The sorted input files (optionally .gz or .zst compressed).
+        output (str): The output file.
+        partitions (int, optional): If given, the triples are split by subject into this many files named after output
+        (see partition_path). Each partition is sorted and no triple appears in two of them.
+
+    Returns:
+        tuple: The number of triples written and the list of (path, count) of the files written.
+    """
+    outputs = [partition_path(output, i) for i in range(partitions)] if partitions else [output]
+    counts = [0] * len(outputs)
+    with ExitStack() as stack:
+        inputs = [stack.enter_context(open_text(path, "rt")) for path in paths]
+        files = [stack.enter_context(open_text(path, "wt")) for path in outputs]
+        previous = None
+        for line in heapq.merge(*inputs):
+            if line == previous:
+                continue
+            previous = line
+            index = zlib.crc32(line.split(" ", 1)[0].encode("utf-8")) % len(files) if partitions else 0
+            files[index].write(line)
+            counts[index] += 1
+    return sum(counts), list(zip(outputs, counts))
+
+
+class ShardParser(RDFParser):
+    """
+    This class builds the part of the RDF graph reachable from one shard of the papers of a paper space.
+
+    Paper IRIs are assigned round robin in the order of paper_space.papers. Papers of other shards are referenced but not
+    expanded; shared entities (authors, journals, affiliations...) are expanded by every shard that reaches them and
+    the duplicates are removed when the shards are merged. All the paper IRIs are minted first, in the same order as
+    a single RDFParser does, so the shards agree on them.
+
+    When the paper space holds several objects for the same entity (e.g. one Journal object per paper), a single
+    RDFParser only expands the first one it reaches, whereas different shards may reach different ones: the merged
+    graph is then a superset of the single-process graph. It only depends on the paper space and the number of
+    shards, not on the number of workers.
+    """
+
+    def __init__(self, paper_space, shard, shards, **kwargs):
+        self.shard = shard
+        self.shards = shards
+        self.foreign = set()
+        super().__init__(paper_space, should_visit=lambda iri: iri not in self.foreign, **kwargs)
+
+    def build(self):
+        # A paper IRI belongs to the shard of its first paper, which is the object a single RDFParser expands.
+        owners = {}
+        for paper in self.paper_space.papers.values():
+            owners.setdefault(self.paper_id(paper), len(owners) % self.shards)
+        self.foreign = {iri for iri, shard in owners.items() if shard != self.shard}
+        super().build()
+
+
+def _build_shard(shard, shards, hashed_iris, run_size, tmp_dir):
+    path = os.path.join(tmp_dir, f"shard-{shard:05d}.nt")
+    sink = SortedRunWriter(path, run_size=run_size, tmp_dir=tmp_dir)
+    start = time.perf_counter()
+    ShardParser(_PAPER_SPACE, shard, shards, hashed_iris=hashed_iris, sink=sink)
+    return path, sink.close(), time.perf_counter() - start
+
+
+def build_sharded(paper_space, output, shards=None, workers=None, partitions=None, hashed_iris=True,
+                  run_size=1000000, tmp_dir=None):
+    """
+    Builds the RDF graph of a paper space in parallel shards and merges them into a single sorted N-Triples file
+    without duplicates, or into subject partitions of it listed in a manifest (output + ".manifest.json") that
+    loaders can ingest in parallel.
+
+    Workers are forked processes that inherit the paper space, so nothing is pickled; where fork is not available the
+    shards are built one after the other. IRIs must be the same in every shard, which hashed IRIs guarantee; slug IRIs
+    only agree as long as no two entities collide.
+
+    Parameters:
+        paper_space (PaperSet): The linked paper space.
+        output (str): The N-Triples output file (optionally .gz or .zst).
+        shards (int, optional): Number of shards. Defaults to the number of workers.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        partitions (int, optional): Write this many subject partitions and a manifest instead of a single file.
+        hashed_iris (bool): Whether to mint hashed IRIs.
+        run_size (int): Number of triples a shard keeps in memory before spilling a sorted run to disk.
+        tmp_dir (str, optional): Folder for the shard files and runs. Defaults to the system temporary folder.
+
+    Returns:
+        dict: The number of triples, the files written with their counts, and per-shard counts and timings.
+    """
+    global _PAPER_SPACE
+    workers = workers if workers else os.cpu_count() or 1
+    shards = shards if shards else workers
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as folder:
+        jobs = [(shard, shards, hashed_iris, run_size, folder) for shard in range(shards)]
+        _PAPER_SPACE = paper_space
+        try:
+            if workers > 1 and shards > 1 and "fork" in multiprocessing.get_all_start_methods():
+                with multiprocessing.get_context("fork").Pool(min(workers, shards)) as pool:
+                    results = pool.starmap(_build_shard, jobs)
+            else:
+                results = [_build_shard(*job) for job in jobs]
+        finally:
+            _PAPER_SPACE = None
+        build_seconds = time.perf_counter() - start
+        count, files = merge_sorted([path for path, _, _ in results], output, partitions)
+    report = {"triples": count, "shards": shards, "workers": workers,
+              "shard_triples": [shard_count for _, shard_count, _ in results],
+              "shard_seconds": [seconds for _, _, seconds in results],
+              "build_seconds": build_seconds, "seconds": time.perf_counter() - start,
+              "files": [{"path": os.path.basename(path), "triples": file_count} for path, file_count in files]}
+    if partitions:
+        with open(f"{output}.manifest.json", "w") as f:
+            json.dump({"format": "application/n-triples", "triples": count, "partitioned_by": "subject",
+                       "files": report["files"]}, f, indent=2)
+    logging.info(f'Sharded RDF build: {count} triples from {shards} shards in {report["seconds"]:.2f}s')
+    return report
@@ -0,0 +1,702 @@
+import glob
+import logging
+import os
+import shutil
+import time
+import types
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pyarrow as pa
+
+from iri_registry import normalize_key
+from network_analytics import analyze_networks
+from ontology_classes import Affiliation, Author, Journal, Paper
+from paper_index import resolve_papers
+from parquet_export import SCHEMAS, TableBuilder
+from rdf_writer import triple_nt
+from rdfparser import RDFParser
+from sharded_builder import merge_sorted
+
+# paper_space imports the NLP libraries, so it is only imported by WindowModels (streaming_paper_space) when a model
+# is first used: on the executors and for the clustering and topic models on the driver.
+
+# Models loaded by this Python worker, reused by all the partitions it processes.
+_MODELS = {}
+
+# Relations that are the union of all the contributions to an entity; every other field comes from the contribution
+# with the lowest rank.
+_RELATIONS = {"paper": ("cited_by",), "author": ("writes", "acknowledged_by"), "affiliation": ("acknowledged_by",),
+              "journal": ("publishes",)}
+_PAPER_METRICS = ("pagerank", "citation_count", "reference_count", "co_cited_with", "coupled_with")
+_AUTHOR_METRICS = ("coauthor_count", "collaboration_component", "collaboration_size")
+# Rank of the contributions that only add relations
+_RELATION_ONLY = (9,)
+
+EMBEDDINGS_SCHEMA = pa.schema([("paper_id", pa.string()), ("cluster", pa.int32()), ("topic", pa.string()),
+                               ("embedding", pa.list_(pa.float32()))])
+
+
+def spark_session(master="local[*]", app_name="openscience-kg"):
+    """
+    Returns a Spark session, locating a Spark installation with findspark when pyspark is not importable.
+
+    Parameters:
+        master (str): The Spark master, e.g. local[*] or spark://host:7077.
+        app_name (str): The application name.
+    """
+    try:
+        from pyspark.sql import SparkSession
+    except ImportError:
+        import findspark
+        findspark.init()
+        from pyspark.sql import SparkSession
+    return SparkSession.builder.master(master).appName(app_name).getOrCreate()
+
+
+def spark_schema(schema):
+    """
+    Converts a pyarrow schema of parquet_export into the equivalent Spark schema.
+    """
+    from pyspark.sql import types as T
+
+    def convert(arrow_type):
+        if pa.types.is_list(arrow_type) or pa.types.is_fixed_size_list(arrow_type):
+            return T.ArrayType(convert(arrow_type.value_type))
+        simple = {pa.string(): T.StringType(), pa.bool_(): T.BooleanType(), pa.int16(): T.ShortType(),
+                  pa.int32(): T.IntegerType(), pa.int64(): T.LongType(), pa.float32(): T.FloatType(),
+                  pa.float64(): T.DoubleType()}
+        return simple[arrow_type]
+
+    return T.StructType([T.StructField(field.name, convert(field.type), True) for field in schema])
+
+
+def extract_partition(files, pdf_path=None, xml_path=None):
+    """
+    Parses TEI documents into Paper objects.
+
+    Parameters:
+        files: (path, content) pairs, as given by SparkContext.binaryFiles.
+        pdf_path (str, optional): The folder of the corresponding PDF files.
+        xml_path (str, optional): The folder of the TEI documents.
+
+    Yields:
+        Paper: The papers. Their XML tree is dropped once parsed, so it is not shipped between stages.
+    """
+    for path, content in files:
+        tree = ET.ElementTree(ET.fromstring(content))
+        paper = Paper(tree=tree, filename=os.path.basename(path), pdf_path=pdf_path, xml_path=xml_path)
+        paper.tree = None
+        yield paper
+
+
+def infer_partition(papers, models):
+    """
+    Encodes the abstracts of a partition in one batch, preprocesses them for topic modeling and recognizes the
+    organizations and people of the acknowledgements, with one instance of each model per worker.
+
+    Parameters:
+        papers: The papers of the partition.
+        models (WindowModels): The models. The first instance a worker receives is kept, so the encoder and the NER
+            pipeline are loaded once per worker.
+
+    Yields:
+        tuple: (paper, embedding, preprocessed abstract).
+    """
+    papers = list(papers)
+    if not papers:
+        return
+    models = _MODELS.setdefault("window", models)
+    embeddings = models.encode([paper.abstract for paper in papers])
+    for paper, embedding in zip(papers, embeddings):
+        models.recognize(paper.acknowledgements)
+        yield paper, embedding, models.preprocess(paper.abstract)
+
+
+def cluster_centroids(embeddings, labels):
+    """
+    Returns the clusters of a sample of embeddings and their centroids, normalized so that the nearest centroid of an
+    embedding is the most similar one by cosine.
+
+    Parameters:
+        embeddings (np.ndarray): The sampled embeddings, one per row.
+        labels (np.ndarray): The cluster of every sampled embedding.
+
+    Returns:
+        tuple: The clusters and their centroids, one per row.
+    """
+    clusters = np.unique(labels)
+    normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    centroids = np.vstack([normalized[labels == cluster].mean(axis=0) for cluster in clusters]) \
+        if len(clusters) else normalized
+    # The mean of unit vectors is shorter the more they are spread, so the centroids are normalized again
+    return clusters, centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+
+def nearest_clusters(embeddings, clusters, centroids):
+    """
+    Returns the cluster of the nearest centroid of every embedding (see cluster_centroids), or None for all of them if
+    there are no clusters.
+    """
+    if not len(clusters):
+        return [None] * len(embeddings)
+    return clusters[np.argmax(np.asarray(embeddings, dtype=np.float32) @ centroids.T, axis=1)]
+
+
+def label_partition(records, sampled, clusters, centroids, models):
+    """
+    Sets the cluster and the topic of the papers of a partition. The papers of the sample keep the cluster the
+    clustering gave them and the others take the cluster whose centroid is the most similar to their embedding.
+
+    Parameters:
+        records: (paper, embedding, preprocessed abstract) tuples.
+        sampled (dict): The cluster of every sampled paper, by filename.
+        clusters, centroids: The clusters and their centroids, as returned by cluster_centroids.
+        models (WindowModels): The models, with the topic model fitted.
+
+    Yields:
+        tuple: (paper, embedding).
+    """
+    records = list(records)
+    if not records:
+        return
+    labels = models.topics([text for _, _, text in records])
+    nearest = nearest_clusters(np.vstack([embedding for _, embedding, _ in records]), clusters, centroids)
+    for (paper, embedding, _), cluster, topic in zip(records, nearest, labels):
+        cluster = sampled.get(paper.filename, cluster)
+        paper.cluster = int(cluster) if cluster is not None else None
+        paper.topic = topic
+        yield paper, embedding
+
+
+def _light_paper(paper, filename=None):
+    return types.SimpleNamespace(
+        title=paper.title, filename=filename, identifiers=dict(paper.identifiers or {}), references=[], cited_by=[],
+        authors=[Author(forename=author.forename, surname=author.surname) for author in paper.authors or []])
+
+
+def paper_header(paper):
+    """
+    Returns a light copy of a physical paper with what paper resolution and the network metrics need: its title,
+    identifiers and author names, and the date and cited paper (title, identifiers and authors) of its references.
+    """
+    header = _light_paper(paper, filename=paper.filename)
+    header.references = [types.SimpleNamespace(date=citation.date, source=header, cites=_light_paper(citation.cites))
+                         for citation in paper.references]
+    return header
+
+
+class PaperResolution:
+    """
+    This class resolves the papers of the whole corpus from the headers of the physical papers, with the same
+    resolve_papers as the single-process PaperSet: which physical papers are duplicates, which paper every reference
+    cites and which references introduce a new citation paper. It also computes the citation and co-authorship
+    network metrics, which need the whole graph.
+
+    Only titles, identifiers, author names and citation edges are kept, so it is small enough to be broadcast to the
+    executors.
+    """
+
+    def __init__(self, headers, title_similarity_threshold=0.8):
+        headers = sorted(headers, key=lambda header: header.filename)
+        origins = {id(citation.cites): (header.filename, position) for header in headers
+                   for position, citation in enumerate(header.references)}
+        _, papers, duplicates, citation_papers = resolve_papers(headers, title_similarity_threshold)
+        physical = [paper for paper in papers.values() if paper.filename is not None]
+        self.kept = {paper.filename for paper in physical}
+        self.duplicates = sorted(paper.filename for paper in duplicates)
+        self.targets = {(paper.filename, position): citation.cites.title for paper in physical
+                        for position, citation in enumerate(paper.references)}
+        self.defining = {origins[id(paper)] for paper in citation_papers.values()}
+        self.identifiers = {title: dict(paper.identifiers) for title, paper in papers.items()}
+
+        citation_network, coauthor_network = analyze_networks(papers)
+        self.paper_metrics = {
+            paper_key(title): {metric: getattr(paper, metric) for metric in _PAPER_METRICS}
+            for title, paper in zip(citation_network.keys, citation_network.nodes)}
+        self.author_metrics = {
+            ("author",) + key: {metric: getattr(authors[0], metric) for metric in _AUTHOR_METRICS}
+            for key, authors in zip(coauthor_network.keys, coauthor_network.authors)}
+
+    def __len__(self):
+        return len(self.identifiers)
+
+
+def paper_key(title):
+    return ("paper",) + normalize_key(title)
+
+
+def _record(kind, rank, enrich=False, **fields):
+    record = {"kind": kind, "rank": rank, "enrich": enrich}
+    for relation in _RELATIONS[kind]:
+        record[relation] = set()
+    record.update(fields)
+    return record
+
+
+def _name(author):
+    return author.forename, author.surname
+
+
+def _acknowledging(entity, attribute):
+    return {acknowledgement.source.title for acknowledgement in getattr(entity, attribute)
+            if acknowledgement.source is not None}
+
+
+def _affiliation_contribution(affiliation, rank, enrich):
+    key = ("affiliation",) + normalize_key(affiliation.name)
+    return key, _record("affiliation", rank, enrich=enrich, name=affiliation.name, country=affiliation.country,
+                        website=affiliation.website, established=affiliation.established,
+                        acknowledged_by=_acknowledging(affiliation, "acknowledged_by"))
+
+
+def _author_contributions(author, rank, writes, enrich):
+    affiliation = author.affiliation.name if author.affiliation is not None else None
+    yield ("author",) + normalize_key(author.forename, author.surname), _record(
+        "author", rank, enrich=enrich, forename=author.forename, surname=author.surname, email=author.email,
+        works_count=author.works_count, cited_by_count=author.cited_by_count, affiliation=affiliation,
+        writes=set(writes), acknowledged_by=_acknowledging(author, "ackowledged_by"))
+    if author.affiliation is not None:
+        yield _affiliation_contribution(author.affiliation, rank, enrich)
+
+
+def paper_contributions(paper, resolution):
+    """
+    Splits a physical paper into (key, record) contributions to the entities of the knowledge graph: the paper, its
+    authors and their affiliations, its citations, the citation papers its references introduce with their authors
+    and journals, and the people and organizations of its acknowledgement. Keys are the IRI keys of the entities, so
+    contributions from different papers to the same entity are merged (linked) by merge_records.
+
+    Parameters:
+        paper (Paper): A physical paper that resolution kept.
+        resolution (PaperResolution): The resolution of the corpus.
+
+    Yields:
+        tuple: (key, record) pairs.
+    """
+    filename = paper.filename
+    references = [(resolution.targets[(filename, position)], citation.date)
+                  for position, citation in enumerate(paper.references)]
+    acknowledgement = None
+    if paper.acknowledgements is not None:
+        acknowledgement = (paper.acknowledgements.text,
+                           [_name(person) for person in paper.acknowledgements.acknowledges_people],
+                           [organization.name for organization in paper.acknowledgements.acknowledges_org])
+    yield paper_key(paper.title), _record(
+        "paper", (0, filename), title=paper.title, abstract=paper.abstract, keywords=list(paper.keywords or []),
+        cluster=paper.cluster, topic=paper.topic, physical=True, identifiers=resolution.identifiers[paper.title],
+        journal=paper.journal.name if paper.journal else None, authors=[_name(author) for author in paper.authors],
+        references=references, acknowledgement=acknowledgement, versions=list(paper.versions))
+    for position, author in enumerate(paper.authors):
+        yield from _author_contributions(author, (0, filename, position), {paper.title}, enrich=True)
+
+    for position, (citation, (target, _)) in enumerate(zip(paper.references, references)):
+        yield paper_key(target), _record("paper", _RELATION_ONLY, cited_by={paper.title})
+        if (filename, position) not in resolution.defining:
+            continue
+        cited = citation.cites
+        rank = (1, filename, position)
+        authors = cited.authors or []
+        yield paper_key(target), _record(
+            "paper", rank, title=cited.title, abstract=cited.abstract, keywords=list(cited.keywords or []),
+            cluster=cited.cluster, topic=cited.topic, physical=False, identifiers=resolution.identifiers[target],
+            journal=cited.journal.name if cited.journal else None, authors=[_name(author) for author in authors],
+            references=[], acknowledgement=None, versions=[])
+        for index, author in enumerate(authors):
+            yield from _author_contributions(author, rank + (index,), {target}, enrich=True)
+        if cited.journal:
+            journal = cited.journal
+            yield ("journal",) + normalize_key(journal.name), _record(
+                "journal", rank, enrich=True, name=journal.name, country=journal.country,
+                description=journal.description, established=journal.established, publishes={target})
+
+    if paper.acknowledgements is not None:
+        for index, person in enumerate(paper.acknowledgements.acknowledges_people):
+            yield from _author_contributions(person, (2, filename, index), (), enrich=False)
+        for index, organization in enumerate(paper.acknowledgements.acknowledges_org):
+            yield _affiliation_contribution(organization, (2, filename, index), enrich=False)
+
+
+def merge_records(a, b):
+    """
+    Merges two contributions to the same entity: the fields come from the one with the lowest rank (the first one the
+    single-process linking would keep) and the relations are the union of both. It is commutative and associative,
+    so the result does not depend on the order Spark combines them in.
+    """
+    first, second = (a, b) if a["rank"] <= b["rank"] else (b, a)
+    merged = dict(first)
+    for relation in _RELATIONS[first["kind"]]:
+        merged[relation] = first[relation] | second[relation]
+    merged["enrich"] = a["enrich"] or b["enrich"]
+    return merged
+
+
+def reduce_records(pairs):
+    """
+    Merges (key, record) pairs by key as reduceByKey(merge_records) does, for small corpora processed without Spark.
+
+    Returns:
+        dict: The merged record of every key.
+    """
+    records = {}
+    for key, record in pairs:
+        records[key] = merge_records(records[key], record) if key in records else record
+    return records
+
+
+def held_affiliation(record):
+    """
+    Returns the key of the affiliation of a merged author record, or None.
+    """
+    if record["kind"] != "author" or not record["affiliation"]:
+        return None
+    return ("affiliation",) + normalize_key(record["affiliation"])
+
+
+def keep_record(key, record, held):
+    """
+    Every author contributes its affiliation, but only the affiliation of the record that wins the merge is linked,
+    as PaperSet replaces the duplicate Author objects with the first one. Affiliations that no merged author holds
+    and nobody acknowledges are dropped.
+
+    Parameters:
+        key (tuple): The key of the record.
+        record (dict): A merged record.
+        held (set): The keys returned by held_affiliation for every author record.
+    """
+    return record["kind"] != "affiliation" or bool(record["acknowledged_by"]) or key in held
+
+
+def prune_records(records):
+    """
+    Applies keep_record to the merged records of reduce_records.
+    """
+    held = {held_affiliation(record) for record in records.values()}
+    return {key: record for key, record in records.items() if keep_record(key, record, held)}
+
+
+def attach_metrics(key, record, resolution):
+    """
+    Adds the network metrics of the resolution to a paper or author record.
+    """
+    if record["kind"] == "paper":
+        metrics = resolution.paper_metrics.get(key)
+    elif record["kind"] == "author":
+        metrics = resolution.author_metrics.get(key)
+    else:
+        return record
+    return dict(record, **metrics) if metrics else record
+
+
+def enrich_record(record):
+    """
+    Enriches an author, affiliation or journal record with OpenAlex or Wikidata, as PaperSet.enrich does for the
+    linked entities of the paper space.
+    """
+    if not record["enrich"]:
+        return record
+    record = dict(record)
+    if record["kind"] == "author":
+        author = Author(forename=record["forename"], surname=record["surname"], works_count=record["works_count"],
+                        cited_by_count=record["cited_by_count"])
+        author.enrich()
+        record.update(works_count=author.works_count, cited_by_count=author.cited_by_count)
+    elif record["kind"] == "affiliation":
+        affiliation = Affiliation(name=record["name"], country=record["country"], website=record["website"],
+                                  established=record["established"])
+        affiliation.enrich()
+        record.update(website=affiliation.website, established=affiliation.established)
+    elif record["kind"] == "journal":
+        journal = Journal(name=record["name"], country=record["country"], description=record["description"],
+                          established=record["established"])
+        journal.enrich()
+        record.update(country=journal.country, description=journal.description, established=journal.established)
+    return record
+
+
+def _titled(title):
+    return types.SimpleNamespace(title=title)
+
+
+def _acknowledgement_of(title):
+    return types.SimpleNamespace(source=_titled(title))
+
+
+def _person(name):
+    forename, surname = name
+    return types.SimpleNamespace(forename=forename, surname=surname)
+
+
+def entity_from_record(record):
+    """
+    Rebuilds an entity from its merged record, with the attributes RDFParser and TableBuilder read. Neighbours only
+    carry the fields their IRIs are minted from.
+    """
+    kind = record["kind"]
+    if kind == "paper":
+        paper = types.SimpleNamespace(**{field: record.get(field) for field in (
+            "title", "abstract", "keywords", "cluster", "topic", "physical", "identifiers") + _PAPER_METRICS})
+        paper.authors = [_person(name) for name in record["authors"]]
+        paper.versions = record.get("versions") or []
+        paper.references = [types.SimpleNamespace(source=paper, cites=_titled(target), date=date)
+                            for target, date in record["references"]]
+        paper.cited_by = [types.SimpleNamespace(source=_titled(source), cites=paper)
+                          for source in sorted(record["cited_by"])]
+        paper.journal = types.SimpleNamespace(name=record["journal"]) if record["journal"] else None
+        paper.acknowledgements = None
+        if record["acknowledgement"] is not None:
+            text, people, organizations = record["acknowledgement"]
+            paper.acknowledgements = types.SimpleNamespace(
+                text=text, source=paper, acknowledges_people=[_person(name) for name in people],
+                acknowledges_org=[types.SimpleNamespace(name=name) for name in organizations])
+        return paper
+    if kind == "author":
+        author = types.SimpleNamespace(**{field: record.get(field) for field in (
+            "forename", "surname", "email", "works_count", "cited_by_count") + _AUTHOR_METRICS})
+        author.affiliation = types.SimpleNamespace(name=record["affiliation"]) if record["affiliation"] else None
+        author.writes = [_titled(title) for title in sorted(record["writes"])]
+        author.ackowledged_by = [_acknowledgement_of(title) for title in sorted(record["acknowledged_by"])]
+        return author
+    if kind == "affiliation":
+        affiliation = types.SimpleNamespace(name=record["name"], country=record["country"],
+                                            website=record["website"], established=record["established"])
+        affiliation.acknowledged_by = [_acknowledgement_of(title) for title in sorted(record["acknowledged_by"])]
+        return affiliation
+    journal = types.SimpleNamespace(name=record["name"], country=record["country"],
+                                    description=record["description"], established=record["established"])
+    journal.publishes = [_titled(title) for title in sorted(record["publishes"])]
+    return journal
+
+
+class _LineSink:
+    def __init__(self):
+        self.lines = []
+
+    def addN(self, quads):
+        self.lines.extend(triple_nt(s, p, o)[:-1] for s, p, o, _ in quads)
+
+
+class RecordParser(RDFParser):
+    """
+    This class emits the triples of merged entity records with the add_* methods of RDFParser, so they are the same
+    triples a single RDFParser with hashed IRIs writes for the entity. Neighbours are referenced but not expanded:
+    every entity is emitted from its own record, and citations and acknowledgements from the record of their paper.
+    """
+
+    def __init__(self, batch_size=10000):
+        self.lines = _LineSink()
+        super().__init__(types.SimpleNamespace(papers={}), batch_size=batch_size, hashed_iris=True, sink=self.lines,
+                         should_visit=lambda instance_id: False)
+
+    def add_record(self, record):
+        entity = entity_from_record(record)
+        if record["kind"] == "paper":
+            self.add_paper(entity)
+            for citation in entity.references:
+                self.add_citation(citation)
+            if entity.acknowledgements is not None:
+                self.add_acknowledgement(entity.acknowledgements)
+        else:
+            getattr(self, f"add_{record['kind']}")(entity)
+        # The entities are short lived, so their ids must not be served from the identity cache later on
+        self.iris.by_object.clear()
+
+    def take_lines(self):
+        self.flush()
+        lines, self.lines.lines = self.lines.lines, []
+        return lines
+
+
+def record_triples(records):
+    """
+    Emits the N-Triples lines (without line breaks) of a partition of (key, record) pairs.
+    """
+    parser = RecordParser()
+    for _, record in records:
+        parser.add_record(record)
+        yield from parser.take_lines()
+
+
+def record_rows(records):
+    """
+    Yields the (table name, row) pairs of a partition of (key, record) pairs, with the schemas of parquet_export.
+    """
+    builder = TableBuilder(types.SimpleNamespace(papers={}))
+    for _, record in records:
+        entity = entity_from_record(record)
+        kind = record["kind"]
+        if kind == "paper":
+            yield "papers", builder.paper_row(entity)
+            yield from (("authorship", row) for row in builder.authorship_rows(entity))
+            yield from (("citations", row) for row in builder.citation_rows(entity))
+            yield from (("acknowledgements", row) for row in builder.acknowledgement_rows(entity))
+            yield from (("versions", row) for row in builder.version_rows(entity))
+        elif kind == "author":
+            yield "authors", builder.author_row(entity)
+        elif kind == "affiliation":
+            yield "affiliations", builder.affiliation_row(entity)
+        else:
+            yield "journals", builder.journal_row(entity)
+        builder.iris.by_object.clear()
+
+
+def embedding_rows(records):
+    """
+    Yields the rows of the embeddings table of a partition of (paper, embedding) pairs.
+    """
+    builder = TableBuilder(types.SimpleNamespace(papers={}))
+    for paper, embedding in records:
+        yield {"paper_id": builder.paper_id(_titled(paper.title)),
+               "cluster": int(paper.cluster) if paper.cluster is not None else None, "topic": paper.topic,
+               "embedding": [float(value) for value in embedding]}
+        builder.iris.by_object.clear()
+
+
+class SparkPipeline:
+    """
+    This class runs the paper space and knowledge graph pipeline on Spark (local[*] or a cluster):
+
+    1. TEI parsing, text preprocessing, embedding and NER run on the executors with mapPartitions, with one
+       instance of each model per worker.
+    2. The driver resolves duplicate papers and references (PaperResolution) from light headers and computes the
+       network metrics; these steps need the whole corpus at once. The clustering and, unless a previous run saved
+       one, the topic model are fitted on a sample of at most sample_size papers, so only the headers and the sample
+       are collected to the driver. The executors then give the other papers the cluster whose centroid is the most
+       similar to their embedding and infer the topic of every paper, as StreamingPaperSet does.
+    3. Every paper is split into contributions to the entities it mentions, which reduceByKey links into one record
+       per author, affiliation, journal and paper; the records are enriched on the executors.
+    4. Every record emits its own triples with the RDFParser methods (hashed IRIs), which are deduplicated, sorted and
+       merged into the output file, and the records are written as the Parquet tables of parquet_export.
+
+    The graph has the triples of a single-process run with hashed IRIs, except that the fields of an entity come from
+    its lowest-ranked contribution and its relations from all of them, whereas PaperSet keeps the first object it
+    links: authors of citation papers therefore also write the papers they are listed on. Papers are processed in
+    filename order, whereas PaperSet uses the order of the folder listing. With a sample as large as the corpus the
+    clusters are the ones PaperSet finds.
+
+    Parameters:
+        spark (SparkSession): The Spark session.
+        res_path (str): The resources folder.
+        partitions (int, optional): Number of partitions.
+        title_similarity_threshold (float): Minimum similarity of a fuzzy title match.
+        enrich (bool): Whether to enrich the authors, affiliations and journals with OpenAlex and Wikidata.
+        sample_size (int): Maximum number of papers the clustering and the topic model are fitted on.
+        models (WindowModels, optional): The models, WindowModels(res_path) by default.
+        seed (int): Seed of the sample.
+
+    Usage:
+        pipeline = SparkPipeline(spark_session("local[*]"), res_path="../res")
+        pipeline.run("../res/datasets/space/grobid/", "../res/datasets/kg.nt.gz", parquet="../res/datasets/parquet")
+    """
+
+    def __init__(self, spark, res_path="../res", partitions=None, title_similarity_threshold=0.8, enrich=True,
+                 sample_size=5000, models=None, seed=0):
+        from streaming_paper_space import WindowModels
+        self.spark = spark
+        self.res_path = res_path
+        self.partitions = partitions
+        self.title_similarity_threshold = title_similarity_threshold
+        self.enrich = enrich
+        self.sample_size = sample_size
+        self.models = models if models is not None else WindowModels(res_path)
+        self.seed = seed
+        self.resolution = None
+
+    def run(self, xml_path, kg_output, parquet=None, pdf_path=None):
+        """
+        Runs the pipeline on the TEI documents of a folder.
+
+        Parameters:
+            xml_path (str): Folder (local, HDFS, S3...) with the TEI documents produced by GROBID.
+            kg_output (str): The N-Triples output. The sorted part files are written to kg_output.parts first and,
+            when that folder is local, merged into kg_output.
+            parquet (str, optional): Folder where the Parquet tables are written.
+            pdf_path (str, optional): The folder of the PDF files, recorded in the papers.
+
+        Returns:
+            dict: The number of papers, duplicates, entities and triples, and the seconds taken.
+        """
+        from pyspark import StorageLevel
+
+        start = time.perf_counter()
+        sc = self.spark.sparkContext
+        models = self.models
+        files = sc.binaryFiles(os.path.join(xml_path, "*.xml"), minPartitions=self.partitions)
+        inferred = (files.mapPartitions(lambda part: extract_partition(part, pdf_path=pdf_path, xml_path=xml_path))
+                    .mapPartitions(lambda part: infer_partition(part, models))
+                    .persist(StorageLevel.MEMORY_AND_DISK))
+
+        logging.info('Spark pipeline: resolving papers')
+        resolution = PaperResolution(inferred.map(lambda record: paper_header(record[0])).collect(),
+                                     self.title_similarity_threshold)
+        self.resolution = resolution
+        state = sc.broadcast(resolution)
+        kept = inferred.filter(lambda record: record[0].filename in state.value.kept)
+
+        # Only a sample of the embeddings and abstracts reaches the driver, as in StreamingPaperSet.label
+        logging.info('Spark pipeline: fitting the clustering and the topic model on a sample')
+        sample = sorted(kept.map(lambda record: (record[0].filename, record[1], record[2]))
+                        .takeSample(False, self.sample_size, seed=self.seed))
+        embeddings = np.vstack([embedding for _, embedding, _ in sample]) if sample else np.zeros((0, 0))
+        labels = self.models.cluster(embeddings) if sample else np.zeros(0)
+        if sample:
+            self.models.fit_topics([text for _, _, text in sample])
+        clusters, centroids = cluster_centroids(embeddings, labels)
+        sampled = {filename: cluster for (filename, _, _), cluster in zip(sample, labels)}
+        del sample, embeddings
+        fitted = sc.broadcast((sampled, clusters, centroids, self.models))
+
+        labelled = (kept.mapPartitions(lambda part: label_partition(part, *fitted.value))
+                    .persist(StorageLevel.MEMORY_AND_DISK))
+        merged = (labelled.flatMap(lambda record: paper_contributions(record[0], state.value))
+                  .reduceByKey(merge_records, numPartitions=self.partitions)
+                  .persist(StorageLevel.MEMORY_AND_DISK))
+        held = sc.broadcast(set(
+            merged.values().map(held_affiliation).filter(lambda key: key is not None).distinct().collect()))
+        records = (merged.filter(lambda pair: keep_record(pair[0], pair[1], held.value))
+                   .map(lambda pair: (pair[0], attach_metrics(pair[0], pair[1], state.value))))
+        if self.enrich:
+            records = records.mapValues(enrich_record)
+        records = records.persist(StorageLevel.MEMORY_AND_DISK)
+
+        logging.info('Spark pipeline: writing triples')
+        parts = f"{kg_output}.parts"
+        if os.path.isdir(parts):
+            shutil.rmtree(parts)
+        records.mapPartitions(record_triples).distinct().sortBy(lambda line: line).saveAsTextFile(parts)
+        triples = None
+        if os.path.isdir(parts):
+            triples = merge_sorted(sorted(glob.glob(os.path.join(parts, "part-*"))), kg_output)[0]
+            shutil.rmtree(parts)
+        if parquet:
+            self.write_tables(records, labelled, parquet)
+
+        report = {"papers": len(resolution.kept), "duplicates": len(resolution.duplicates),
+                  "entities": records.count(), "triples": triples, "seconds": time.perf_counter() - start}
+        inferred.unpersist()
+        labelled.unpersist()
+        records.unpersist()
+        merged.unpersist()
+        logging.info(f'Spark pipeline: {report}')
+        return report
+
+    def write_tables(self, records, labelled, folder, partition_by=("cluster", "topic")):
+        """
+        Writes the records as the Parquet tables of parquet_export, with papers and embeddings partitioned like
+        export_parquet does, so read_table reads both exports.
+        """
+        rows = records.mapPartitions(record_rows).persist()
+        for name, schema in SCHEMAS.items():
+            table = rows.filter(lambda row, name=name: row[0] == name).map(lambda row: row[1])
+            self.write_table(self.spark.createDataFrame(table, spark_schema(schema)), folder, name,
+                             partition_by if name == "papers" else ())
+        embeddings = self.spark.createDataFrame(labelled.mapPartitions(embedding_rows), spark_schema(EMBEDDINGS_SCHEMA))
+        self.write_table(embeddings, folder, "embeddings", partition_by)
+        rows.unpersist()
+
+    @staticmethod
+    def write_table(frame, folder, name, partition_by):
+        writer = frame.write.mode("overwrite").option("compression", "zstd")
+        if partition_by:
+            writer = writer.partitionBy(*partition_by)
+        writer.parquet(os.path.join(folder, name))
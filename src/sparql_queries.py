@@ -0,0 +1,249 @@
+import argparse
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+import numpy as np
+from rdflib import BNode, Graph, Literal, URIRef, Variable
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.store import TripleAddedEvent, TripleRemovedEvent
+from rdflib.util import from_n3
+
+from fuseki import make_session
+from rdf_writer import term_nt
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "queries", "sparql_queries.txt")
+_SEPARATOR = re.compile(r'^#{10,}\s*$', re.MULTILINE)
+_NAME = re.compile(r'^#\s*name:\s*(\S+)\s*$', re.MULTILINE)
+_PARAM = re.compile(r'^#\s*param:\s*(\w+)\s*(?:=\s*(.+?))?\s*$', re.MULTILINE)
+_WHERE = re.compile(r'\bWHERE\s*{', re.IGNORECASE)
+
+
+class NamedQuery:
+    """
+    This class holds one query of the library: its name, text, parameters with their default values and the
+    prepared (parsed and algebra-translated) form used against local graphs.
+
+    rdflib orders the triple patterns of a group when the query is prepared, while the parameters are still unbound,
+    but evaluates nested groups in text order. The patterns that use parameters are therefore written first, in their
+    own group, so that they are evaluated first once the parameters are bound.
+    """
+
+    def __init__(self, name, text, params=None):
+        self.name = name
+        self.text = text
+        self.params = params if params is not None else {}
+        self.prepared = prepareQuery(text)
+
+    def bindings(self, **values):
+        """
+        Returns the bindings of the query parameters, using the defaults for the ones not given.
+
+        Parameters:
+            values: Values of the parameters, either rdflib terms or Python values turned into literals.
+
+        Returns:
+            dict: The rdflib term bound to each parameter that has a value.
+        """
+        unknown = set(values) - set(self.params)
+        if unknown:
+            raise ValueError(f'Unknown parameters {sorted(unknown)} for query {self.name}')
+        bindings = {}
+        for param, default in self.params.items():
+            value = values.get(param, default)
+            if value is not None:
+                bindings[param] = value if isinstance(value, (URIRef, Literal, BNode)) else Literal(value)
+        return bindings
+
+    def with_values(self, bindings):
+        """
+        Returns the query text with the bindings inlined as a VALUES block, for SPARQL endpoints.
+        """
+        if not bindings:
+            return self.text
+        variables = " ".join(f"?{param}" for param in bindings)
+        values = " ".join(term_nt(term) for term in bindings.values())
+        match = _WHERE.search(self.text)
+        if match is None:
+            raise ValueError(f'Query {self.name} has no WHERE clause to bind parameters in')
+        return f"{self.text[:match.end()]}\n    VALUES ({variables}) {{ ({values}) }}{self.text[match.end():]}"
+
+
+def load_queries(path=QUERIES_PATH):
+    """
+    Loads the named queries of a query file. Queries are separated by lines of #, and each one is introduced by a
+    "# name: <name>" comment and one "# param: <variable> = <default in N-Triples syntax>" comment per parameter.
+    Blocks without a name are ignored.
+
+    Parameters:
+        path (str): The query file.
+
+    Returns:
+        dict: The NamedQuery of each name, in file order.
+    """
+    with open(path, encoding="utf-8") as f:
+        blocks = _SEPARATOR.split(f.read())
+    queries = {}
+    for block in blocks:
+        name = _NAME.search(block)
+        if name is None:
+            continue
+        params = {param: from_n3(default) if default else None for param, default in _PARAM.findall(block)}
+        queries[name.group(1)] = NamedQuery(name.group(1), block.strip(), params)
+    return queries
+
+
+class QueryLibrary:
+    """
+    This class runs the named queries against a local rdflib graph (in memory or backed by a store) or a SPARQL
+    endpoint, and keeps the results of the last cache_size distinct calls in an LRU cache.
+
+    For a local graph the cache is cleared whenever the store reports a triple added or removed. Stores that do not
+    report removals (rdflib's in-memory store) or remote endpoints need invalidate() after they change.
+
+    Usage:
+        library = QueryLibrary(graph=kg.g)
+        rows = library.run("authors_of_paper", title="a generative model for audio in the frequency domain")
+    """
+
+    def __init__(self, graph=None, endpoint=None, path=QUERIES_PATH, cache_size=256, auth=None, timeout=60):
+        if (graph is None) == (endpoint is None):
+            raise ValueError("QueryLibrary needs either a graph or an endpoint")
+        self.graph = graph
+        self.endpoint = endpoint
+        self.queries = load_queries(path)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.timeout = timeout
+        self.session = make_session(pool_size=1, auth=auth) if endpoint is not None else None
+        if graph is not None:
+            graph.store.dispatcher.subscribe(TripleAddedEvent, self.invalidate)
+            graph.store.dispatcher.subscribe(TripleRemovedEvent, self.invalidate)
+
+    def invalidate(self, event=None):
+        """
+        Clears the result cache.
+        """
+        self.cache.clear()
+
+    def run(self, name, /, cached=True, **values):
+        """
+        Runs a named query.
+
+        Parameters:
+            name (str): The name of the query.
+            cached (bool): Whether to use the result cache.
+            values: Values of the query parameters (see NamedQuery.bindings).
+
+        Returns:
+            list: The result rows as tuples of rdflib terms (None for unbound variables).
+        """
+        query = self.queries[name]
+        bindings = query.bindings(**values)
+        key = (name, tuple(sorted((param, term_nt(term)) for param, term in bindings.items())))
+        if cached:
+            rows = self.cache.get(key)
+            if rows is not None:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return rows
+            self.misses += 1
+        rows = self.execute(query, bindings)
+        if cached:
+            self.cache[key] = rows
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return rows
+
+    def execute(self, query, bindings):
+        if self.graph is not None:
+            result = self.graph.query(query.prepared,
+                                      initBindings={Variable(param): term for param, term in bindings.items()})
+            return [tuple(row) for row in result]
+        resp = self.session.post(self.endpoint, data={"query": query.with_values(bindings)},
+                                 headers={"Accept": "application/sparql-results+json"}, timeout=self.timeout)
+        resp.raise_for_status()
+        result = resp.json()
+        variables = result["head"]["vars"]
+        return [tuple(_json_term(binding.get(variable)) for variable in variables)
+                for binding in result["results"]["bindings"]]
+
+    def benchmark(self, repeats=20, cached=False, **values):
+        """
+        Runs every query repeats times and reports its latency.
+
+        Parameters:
+            repeats (int): Number of runs per query.
+            cached (bool): Whether to measure cached runs (after a first, uncached one) instead of uncached runs.
+            values: Values of the query parameters, passed to the queries that have them.
+
+        Returns:
+            dict: For each query, the number of rows and the p50, p99 and mean latency in milliseconds.
+        """
+        report = {}
+        for name, query in self.queries.items():
+            params = {param: value for param, value in values.items() if param in query.params}
+            if cached:
+                self.run(name, **params)
+            latencies = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                rows = self.run(name, cached=cached, **params)
+                latencies.append((time.perf_counter() - start) * 1000)
+            report[name] = {"rows": len(rows), "p50_ms": float(np.percentile(latencies, 50)),
+                            "p99_ms": float(np.percentile(latencies, 99)), "mean_ms": float(np.mean(latencies))}
+            logging.info(f'Query {name}: {report[name]}')
+        return report
+
+
+def _json_term(value):
+    if value is None:
+        return None
+    if value["type"] == "uri":
+        return URIRef(value["value"])
+    if value["type"] == "bnode":
+        return BNode(value["value"])
+    return Literal(value["value"], lang=value.get("xml:lang"),
+                   datatype=URIRef(value["datatype"]) if "datatype" in value else None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='SPARQL benchmark',
+        description='Reports the latency of the queries of the query library over the knowledge graph',
+    )
+    parser.add_argument(
+        "--KG",
+        required=False,
+        help="Knowledge graph file (.jsonld, .nt, .nq, .ttl) or SQLite store (.sqlite)",
+    )
+    parser.add_argument(
+        "--ENDPOINT",
+        required=False,
+        help="SPARQL endpoint to query instead, e.g. http://localhost:3030/kg/query",
+    )
+    parser.add_argument(
+        "--REPEATS",
+        type=int,
+        default=20,
+        help="Number of runs per query",
+    )
+    args = parser.parse_args()
+
+    if args.ENDPOINT:
+        library = QueryLibrary(endpoint=args.ENDPOINT)
+    elif args.KG and args.KG.endswith(".sqlite"):
+        from triple_store import open_graph
+        library = QueryLibrary(graph=open_graph(args.KG, create=False))
+    elif args.KG:
+        library = QueryLibrary(graph=Graph().parse(args.KG))
+    else:
+        parser.error("either --KG or --ENDPOINT is required")
+    for cached in (False, True):
+        print("cached" if cached else "uncached")
+        for name, stats in library.benchmark(repeats=args.REPEATS, cached=cached).items():
+            print(f"  {name:32} {stats['rows']:6} rows  p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms")
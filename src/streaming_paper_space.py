@@ -0,0 +1,345 @@
+import logging
+import os
+import pickle
+import random
+import shutil
+import time
+import zlib
+from contextlib import ExitStack
+from itertools import islice
+
+import numpy as np
+
+from instrumentation import metrics
+from sharded_builder import SortedRunWriter
+from spark_pipeline import (PaperResolution, RecordParser, attach_metrics, cluster_centroids, enrich_record,
+                            held_affiliation, keep_record, nearest_clusters, paper_contributions, paper_header,
+                            reduce_records)
+
+# paper_space imports the NLP libraries, so it is only imported by WindowModels when a model is first used.
+
+
+def windows(papers, size):
+    """
+    Splits an iterable of papers into lists of at most size papers, pulling them from it one window at a time.
+    """
+    papers = iter(papers)
+    while True:
+        window = list(islice(papers, size))
+        if not window:
+            return
+        yield window
+
+
+def _load_pairs(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class WindowModels:
+    """
+    This class holds the models a StreamingPaperSet runs on every window: the sentence encoder, the text
+    preprocessing and the NER pipeline of paper_space, and the clustering and topic model fitted on a sample of the
+    corpus. They are loaded the first time they are used.
+
+    Parameters:
+        res_path (str): The resources folder, where the topic model of a previous run is loaded from or saved to.
+        n_clusters (int): Number of clusters.
+    """
+
+    def __init__(self, res_path="../res", n_clusters=2):
+        self.res_path = res_path
+        self.n_clusters = n_clusters
+        self.encoder = None
+        self.ner = None
+        self.vectorizer = None
+        self.lda_model = None
+        self.labels = []
+
+    def encode(self, abstracts):
+        """
+        Returns the embeddings of a window of abstracts as a float32 array.
+        """
+        if self.encoder is None:
+            from paper_space import load_encoder
+            self.encoder = load_encoder()
+        return np.asarray(self.encoder.encode(abstracts), dtype=np.float32)
+
+    def preprocess(self, text):
+        from paper_space import preprocess_text
+        return preprocess_text(text)
+
+    def recognize(self, acknowledgement):
+        """
+        Sets the organizations and people an acknowledgement thanks.
+        """
+        from paper_space import load_ner, recognize_acknowledged_entities
+        if self.ner is None:
+            self.ner = load_ner()
+        recognize_acknowledged_entities(acknowledgement, self.ner)
+
+    def cluster(self, embeddings):
+        """
+        Clusters the sampled embeddings as PaperSet.clusterize does.
+
+        Returns:
+            np.ndarray: The cluster of every row.
+        """
+        import pandas as pd
+        from paper_space import cluster_embeddings
+        return cluster_embeddings(pd.DataFrame(embeddings), n_clusters=self.n_clusters).to_numpy()
+
+    def fit_topics(self, abstracts):
+        """
+        Fits the topic model on the sampled preprocessed abstracts, unless a previous run saved one.
+        """
+        from paper_space import fit_topic_model, load_topic_model, topic_labels
+        self.vectorizer, self.lda_model = fit_topic_model(abstracts, self.res_path, *load_topic_model(self.res_path))
+        self.labels = topic_labels(self.vectorizer, self.lda_model)
+
+    def topics(self, abstracts):
+        """
+        Returns the topic of every preprocessed abstract of a window.
+        """
+        from paper_space import assign_topics
+        return assign_topics(abstracts, self.vectorizer, self.lda_model, self.labels)
+
+
+class StreamingPaperSet:
+    """
+    This class builds the paper space and knowledge graph of a corpus that does not fit in memory. Papers are
+    consumed from an iterable (e.g. PaperProcessor.iter_folder_from_xml) in windows of window_size, so the papers,
+    their XML trees, embeddings and abstracts are only held a window at a time:
+
+    1. spill: every window is encoded, preprocessed and goes through NER, and its papers (without their XML tree),
+       embeddings and headers (the linking keys: titles, identifiers, author names and references) are written to
+       spill_path before the next window is read.
+    2. resolve: duplicates and references are resolved from the headers alone, and the network metrics computed
+       from them (see spark_pipeline.PaperResolution).
+    3. label: the clustering and, unless a previous run saved one, the topic model are fitted on a sample of at
+       most sample_size papers read back from the spill. Sampled papers keep their cluster and the others take the
+       cluster whose centroid is the most similar to their embedding; topics are then inferred window by window. Each
+       paper is split into contributions to the entities it mentions (see spark_pipeline.paper_contributions), which
+       are spilled to buckets by entity key.
+    4. link: the contributions of every bucket are merged into one record per paper, author, affiliation and journal,
+       one bucket at a time, then enriched.
+
+    What still grows with the corpus is the resolution: the headers of every paper, which are read together, and the
+    PaperResolution built from them (its PaperIndex, the reference lists and the network metrics), plus the sample.
+    These are small per paper next to the embeddings and the XML trees, but memory is not bounded by the window size
+    alone. With a sample as large as the corpus the graph is the one SparkPipeline writes, i.e. the triples of a
+    single-process run with hashed IRIs.
+
+    Parameters:
+        papers: Iterable of physical Paper instances.
+        spill_path (str): Folder for the spilled windows and buckets. Previous contents are replaced.
+        res_path (str): The resources folder.
+        window_size (int): Number of papers processed at once.
+        sample_size (int): Maximum number of papers the clustering and the topic model are fitted on.
+        buckets (int): Number of buckets the entities are linked in.
+        title_similarity_threshold (float): Minimum similarity of a fuzzy title match.
+        enrich (bool): Whether to enrich the authors, affiliations and journals with OpenAlex and Wikidata.
+        models (WindowModels, optional): The models, WindowModels(res_path) by default.
+        seed (int): Seed of the sample.
+
+    Usage:
+        space = StreamingPaperSet(processor.iter_folder_from_xml(), "../res/datasets/spill", window_size=512)
+        space.write_ntriples("../res/datasets/kg.nt.gz")
+    """
+
+    def __init__(self, papers, spill_path, res_path="../res", window_size=256, sample_size=5000, buckets=16,
+                 title_similarity_threshold=0.8, enrich=True, models=None, seed=0):
+        self.spill_path = spill_path
+        self.window_size = window_size
+        self.sample_size = sample_size
+        self.buckets = buckets
+        self.title_similarity_threshold = title_similarity_threshold
+        self.enrich = enrich
+        self.models = models if models is not None else WindowModels(res_path)
+        self.seed = seed
+        self.windows = 0
+        self.resolution = None
+        if os.path.isdir(spill_path):
+            shutil.rmtree(spill_path)
+        os.makedirs(spill_path)
+
+        run_metrics = metrics()
+        with run_metrics.stage("spill") as stage:
+            stage.items = self.spill(papers)
+        with run_metrics.stage("resolve") as stage:
+            self.resolve()
+            stage.items = len(self.resolution)
+        with run_metrics.stage("label", items=len(self.resolution.kept)):
+            self.label()
+        with run_metrics.stage("link") as stage:
+            stage.items = self.link()
+
+    def path(self, name):
+        return os.path.join(self.spill_path, name)
+
+    def spill(self, papers):
+        """
+        Runs the per-window models and writes every window to the spill folder.
+
+        Returns:
+            int: The number of papers read.
+        """
+        count = 0
+        for window in windows(papers, self.window_size):
+            with metrics().stage("window", items=len(window)):
+                for paper in window:
+                    paper.tree = None
+                embeddings = self.models.encode([paper.abstract for paper in window])
+                abstracts = [self.models.preprocess(paper.abstract) for paper in window]
+                for paper in window:
+                    self.models.recognize(paper.acknowledgements)
+                np.save(self.path(f"window-{self.windows:05d}.npy"), embeddings)
+                with open(self.path(f"window-{self.windows:05d}.pkl"), "wb") as f:
+                    pickle.dump((window, abstracts), f, protocol=pickle.HIGHEST_PROTOCOL)
+                with open(self.path(f"window-{self.windows:05d}.headers.pkl"), "wb") as f:
+                    pickle.dump([paper_header(paper) for paper in window], f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.windows += 1
+            count += len(window)
+            logging.info(f'Streaming paper space: spilled window {self.windows} ({count} papers)')
+        return count
+
+    def spilled_windows(self):
+        """
+        Reads the spilled windows back one at a time.
+
+        Yields:
+            tuple: The papers of the window, their preprocessed abstracts and their embeddings (memory mapped).
+        """
+        for index in range(self.windows):
+            with open(self.path(f"window-{index:05d}.pkl"), "rb") as f:
+                papers, abstracts = pickle.load(f)
+            yield papers, abstracts, np.load(self.path(f"window-{index:05d}.npy"), mmap_mode="r")
+
+    def resolve(self):
+        """
+        Resolves the duplicates and references of the corpus from the spilled headers. The headers of all the windows
+        are loaded together, as duplicates and references are resolved across the whole corpus.
+        """
+        headers = []
+        for index in range(self.windows):
+            with open(self.path(f"window-{index:05d}.headers.pkl"), "rb") as f:
+                headers.extend(pickle.load(f))
+        self.resolution = PaperResolution(headers, self.title_similarity_threshold)
+
+    def label(self):
+        """
+        Fits the clustering and the topic model on a sample, sets the cluster and topic of every kept paper and
+        spills its contributions to the entity buckets.
+        """
+        kept = self.resolution.kept
+        sample = set(random.Random(self.seed).sample(range(len(kept)), min(self.sample_size, len(kept))))
+        sampled_embeddings, sampled_abstracts = [], []
+        position = 0
+        for papers, abstracts, embeddings in self.spilled_windows():
+            for row, (paper, abstract) in enumerate(zip(papers, abstracts)):
+                if paper.filename in kept:
+                    if position in sample:
+                        sampled_embeddings.append(np.array(embeddings[row]))
+                        sampled_abstracts.append(abstract)
+                    position += 1
+        sampled_embeddings = np.vstack(sampled_embeddings) if sampled_embeddings else np.zeros((0, 0))
+        sampled_clusters = self.models.cluster(sampled_embeddings) if len(sampled_embeddings) else np.zeros(0)
+        if sampled_abstracts:
+            self.models.fit_topics(sampled_abstracts)
+        del sampled_abstracts
+
+        clusters, centroids = cluster_centroids(sampled_embeddings, sampled_clusters)
+        sample_clusters = dict(zip(sorted(sample), sampled_clusters))
+        del sampled_embeddings
+
+        position = 0
+        with ExitStack() as stack:
+            buckets = [stack.enter_context(open(self.path(f"bucket-{index:03d}.pkl"), "wb"))
+                       for index in range(self.buckets)]
+            for papers, abstracts, embeddings in self.spilled_windows():
+                rows = [row for row, paper in enumerate(papers) if paper.filename in kept]
+                if not rows:
+                    continue
+                nearest = nearest_clusters(embeddings[rows], clusters, centroids)
+                topics = self.models.topics([abstracts[row] for row in rows])
+                for row, cluster, topic in zip(rows, nearest, topics):
+                    paper = papers[row]
+                    cluster = sample_clusters.get(position, cluster)
+                    paper.cluster = int(cluster) if cluster is not None else None
+                    paper.topic = topic
+                    position += 1
+                    for key, record in paper_contributions(paper, self.resolution):
+                        bucket = buckets[zlib.crc32(repr(key).encode("utf-8")) % self.buckets]
+                        pickle.dump((key, record), bucket, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def link(self):
+        """
+        Merges the contributions of every bucket into entity records, then prunes, annotates and enriches them.
+
+        Returns:
+            int: The number of entities.
+        """
+        held = set()
+        for index in range(self.buckets):
+            records = reduce_records(_load_pairs(self.path(f"bucket-{index:03d}.pkl")))
+            held.update(key for key in map(held_affiliation, records.values()) if key is not None)
+            with open(self.path(f"merged-{index:03d}.pkl"), "wb") as f:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.remove(self.path(f"bucket-{index:03d}.pkl"))
+
+        entities = 0
+        for index in range(self.buckets):
+            with open(self.path(f"merged-{index:03d}.pkl"), "rb") as f:
+                records = pickle.load(f)
+            records = {key: attach_metrics(key, record, self.resolution) for key, record in records.items()
+                       if keep_record(key, record, held)}
+            if self.enrich:
+                records = {key: enrich_record(record) for key, record in records.items()}
+            with open(self.path(f"merged-{index:03d}.pkl"), "wb") as f:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+            entities += len(records)
+        return entities
+
+    def records(self):
+        """
+        Yields the (key, record) pairs of the linked entities, one bucket at a time.
+        """
+        for index in range(self.buckets):
+            with open(self.path(f"merged-{index:03d}.pkl"), "rb") as f:
+                yield from pickle.load(f).items()
+
+    def write_ntriples(self, kg_output, run_size=1000000):
+        """
+        Writes the triples of the linked entities to a sorted N-Triples file (optionally .gz or .zst), spilling sorted
+        runs of run_size triples.
+
+        Returns:
+            dict: The number of papers, duplicates, windows, entities and triples, and the seconds taken.
+        """
+        start = time.perf_counter()
+        writer = SortedRunWriter(kg_output, run_size=run_size, tmp_dir=self.spill_path)
+        parser = RecordParser()
+        parser.sink = writer
+        entities = 0
+        with metrics().stage("rdf") as stage:
+            for _, record in self.records():
+                parser.add_record(record)
+                entities += 1
+            parser.flush()
+            triples = writer.close()
+            stage.items = triples
+        report = {"papers": len(self.resolution.kept), "duplicates": len(self.resolution.duplicates),
+                  "windows": self.windows, "entities": entities, "triples": triples,
+                  "seconds": time.perf_counter() - start}
+        logging.info(f'Streaming paper space: {report}')
+        return report
+
+    def close(self):
+        """
+        Removes the spill folder.
+        """
+        shutil.rmtree(self.spill_path)
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+_TOPIC_WORDS = [
+    "neural", "graph", "knowledge", "semantic", "retrieval", "embedding", "transformer", "citation", "ontology",
+    "bayesian", "sparse", "scalable", "federated", "adversarial", "contrastive", "temporal", "causal", "probabilistic",
+    "quantum", "distributed", "streaming", "incremental", "multilingual", "biomedical", "molecular", "protein",
+    "climate", "satellite", "robotic", "autonomous", "speech", "audio", "visual", "spatial", "relational", "symbolic",
+    "hierarchical", "recurrent", "convolutional", "variational", "generative", "discriminative", "explainable",
+    "robust", "efficient", "lightweight", "interpretable", "self-supervised", "reinforcement", "evolutionary",
+]
+_OBJECT_WORDS = [
+    "networks", "models", "representations", "inference", "learning", "search", "parsing", "linking", "reasoning",
+    "classification", "segmentation", "detection", "translation", "summarization", "clustering", "ranking",
+    "recommendation", "alignment", "completion", "extraction", "generation", "forecasting", "optimization",
+    "compression", "indexing", "matching", "tracking", "planning", "verification", "annotation",
+]
+_DOMAIN_WORDS = [
+    "scholarly documents", "scientific literature", "knowledge graphs", "medical records", "social media",
+    "source code", "legal texts", "news articles", "sensor data", "genomic sequences", "point clouds", "time series",
+    "open data", "digital libraries", "question answering", "dialogue systems", "remote sensing", "drug discovery",
+    "materials science", "energy systems",
+]
+_FORENAMES = [
+    "Ada", "Alan", "Grace", "Edsger", "Barbara", "Donald", "Frances", "John", "Margaret", "Tim", "Radia", "Ken",
+    "Shafi", "Leslie", "Yoshua", "Fei", "Daphne", "Judea", "Silvio", "Maria", "Carlos", "Lucia", "Javier", "Elena",
+    "Pablo", "Sofia", "Diego", "Ana", "Wei", "Mei", "Hiro", "Aiko", "Omar", "Layla", "Ivan", "Olga", "Kofi", "Amara",
+    "Lars", "Ingrid",
+]
+_SURNAMES = [
+    "Lovelace", "Turing", "Hopper", "Dijkstra", "Liskov", "Knuth", "Allen", "McCarthy", "Hamilton", "Berners",
+    "Perlman", "Thompson", "Goldwasser", "Lamport", "Bengio", "Li", "Koller", "Pearl", "Micali", "Garcia", "Lopez",
+    "Martinez", "Fernandez", "Gonzalez", "Rodriguez", "Sanchez", "Perez", "Gomez", "Wang", "Zhang", "Tanaka",
+    "Suzuki", "Haddad", "Nasser", "Petrov", "Ivanova", "Mensah", "Okafor", "Larsen", "Nilsson",
+]
+_INSTITUTIONS = ["University", "Institute of Technology", "Research Center", "Polytechnic University", "Laboratory"]
+_CITIES = ["Madrid", "Boston", "Zurich", "Kyoto", "Toronto", "Lagos", "Oslo", "Cairo", "Lima", "Seoul", "Prague",
+           "Sydney", "Nairobi", "Austin", "Lyon", "Delhi"]
+_COUNTRIES = ["Spain", "USA", "Switzerland", "Japan", "Canada", "Nigeria", "Norway", "Egypt", "Peru", "Korea",
+              "Czechia", "Australia", "Kenya", "USA", "France", "India"]
+_JOURNAL_WORDS = ["Journal of", "Transactions on", "Proceedings of", "Annals of", "Letters on"]
+_FIELDS = ["Artificial Intelligence", "Machine Learning Research", "Data Engineering", "Web Semantics",
+           "Information Retrieval", "Computational Linguistics", "Bioinformatics", "Digital Libraries",
+           "Pattern Recognition", "Knowledge Discovery"]
+_FUNDERS = ["European Research Council", "National Science Foundation", "Wellcome Trust", "Google Research",
+            "Agencia Estatal de Investigacion", "Japan Science and Technology Agency"]
+
+TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
+
+
+class CorpusSpec:
+    """
+    This class holds the shape of a synthetic corpus.
+
+    Parameters:
+        papers (int): Number of TEI documents.
+        authors_per_paper (tuple): Minimum and maximum number of authors of a paper.
+        references_per_paper (tuple): Minimum and maximum number of references of a paper.
+        internal_references (float): Fraction of the references that cite another paper of the corpus.
+        title_overlap (float): Fraction of those that write the cited title differently (casing, punctuation or a
+            typo), so that they are only resolved by the fuzzy title matching.
+        citations_per_external_work (int): Average number of references to every work outside the corpus, which
+            controls how many citation papers are shared between documents.
+        papers_per_author (int): Average number of papers of every author, which controls how many authors are
+            shared between papers.
+        affiliations (int): Number of distinct affiliations shared by the authors (default: papers / 20).
+        journals (int): Number of distinct journals of the references.
+        duplicates (float): Fraction of documents that are a second copy of another one (same MD5 and DOI).
+        acknowledgements (float): Fraction of documents with an acknowledgement section.
+        seed (int): Random seed; the same spec always generates the same corpus.
+    """
+
+    def __init__(self, papers=1000, authors_per_paper=(1, 6), references_per_paper=(10, 40),
+                 internal_references=0.3, title_overlap=0.2, citations_per_external_work=3, papers_per_author=4,
+                 affiliations=None, journals=50, duplicates=0.02, acknowledgements=0.6, seed=0):
+        self.papers = papers
+        self.authors_per_paper = authors_per_paper
+        self.references_per_paper = references_per_paper
+        self.internal_references = internal_references
+        self.title_overlap = title_overlap
+        self.citations_per_external_work = citations_per_external_work
+        self.papers_per_author = papers_per_author
+        self.affiliations = affiliations if affiliations is not None else max(5, papers // 20)
+        self.journals = journals
+        self.duplicates = duplicates
+        self.acknowledgements = acknowledgements
+        self.seed = seed
+
+
+class SyntheticCorpus:
+    """
+    This class generates GROBID-style TEI documents (header with authors, affiliations, identifiers, abstract and
+    keywords; body; acknowledgement; bibliography with analytic and monograph parts) for benchmarks and load tests.
+
+    The pools of titles, people, affiliations and journals are drawn up front, so references, authors and
+    affiliations recur across documents the way they do in a real corpus.
+
+    Usage:
+        corpus = SyntheticCorpus(CorpusSpec(papers=10000))
+        for filename, content in corpus.documents():
+            ...
+        corpus.write("../res/datasets/synthetic/grobid/")
+    """
+
+    def __init__(self, spec=None):
+        self.spec = spec if spec is not None else CorpusSpec()
+        rng = random.Random(self.spec.seed)
+        self.rng = rng
+        used = set()
+        self.titles = [self.new_title(rng, used) for _ in range(self.spec.papers)]
+        references = self.spec.papers * sum(self.spec.references_per_paper) / 2
+        external = max(1, int(references * (1 - self.spec.internal_references)
+                              / max(1, self.spec.citations_per_external_work)))
+        self.external_titles = [self.new_title(rng, used) for _ in range(external)]
+        self.affiliations = [(f"{rng.choice(_CITIES)} {rng.choice(_INSTITUTIONS)} {index}",
+                              rng.choice(_COUNTRIES)) for index in range(self.spec.affiliations)]
+        self.journals = [f"{rng.choice(_JOURNAL_WORDS)} {rng.choice(_FIELDS)}" + (f" {index // len(_FIELDS)}"
+                                                                                  if index >= len(_FIELDS) else "")
+                         for index in range(self.spec.journals)]
+        people = max(1, int(self.spec.papers * sum(self.spec.authors_per_paper) / 2
+                            / max(1, self.spec.papers_per_author)))
+        self.people = [self.new_person(rng, index) for index in range(people)]
+        # People of the external works are drawn from a separate, larger pool, as most cited authors are not
+        # authors of the corpus
+        self.external_people = [self.new_person(rng, people + index) for index in range(people * 2)]
+
+    @staticmethod
+    def new_title(rng, used):
+        while True:
+            title = (f"{rng.choice(_TOPIC_WORDS).capitalize()} {rng.choice(_TOPIC_WORDS)} "
+                     f"{rng.choice(_OBJECT_WORDS)} for {rng.choice(_DOMAIN_WORDS)}")
+            if rng.random() < 0.5:
+                title += f" with {rng.choice(_TOPIC_WORDS)} {rng.choice(_OBJECT_WORDS)}"
+            if title.lower() not in used:
+                used.add(title.lower())
+                return title
+
+    def new_person(self, rng, index):
+        # The index keeps people with the same name apart, as their letters survive the Author name cleaning
+        suffix = "".join(chr(ord("a") + int(digit)) for digit in str(index))
+        forename = rng.choice(_FORENAMES)
+        surname = f"{rng.choice(_SURNAMES)}{suffix.capitalize()}"
+        affiliation = self.affiliations[rng.randrange(len(self.affiliations))] if self.affiliations else None
+        email = f"{forename.lower()}.{surname.lower()}@example.org"
+        return forename, surname, email, affiliation
+
+    def variant(self, rng, title):
+        """
+        Writes a title differently: other casing and punctuation, or a typo in one word.
+        """
+        if rng.random() < 0.5:
+            return title.upper().replace(" for ", ": for ") + "."
+        words = title.split(" ")
+        index = max(range(len(words)), key=lambda i: len(words[i]))
+        words[index] = words[index][:-1]
+        return " ".join(words)
+
+    @staticmethod
+    def person_xml(person, with_affiliation=True):
+        forename, surname, email, affiliation = person
+        parts = [f'<author><persName><forename type="first">{escape(forename)}</forename>'
+                 f'<surname>{escape(surname)}</surname></persName>']
+        if with_affiliation:
+            parts.append(f"<email>{escape(email)}</email>")
+            if affiliation is not None:
+                name, country = affiliation
+                parts.append(f'<affiliation><orgName type="institution">{escape(name)}</orgName>'
+                             f'<address><country>{escape(country)}</country></address></affiliation>')
+        parts.append("</author>")
+        return "".join(parts)
+
+    def reference_xml(self, rng, index, position):
+        if self.spec.papers > 1 and rng.random() < self.spec.internal_references:
+            cited = rng.randrange(self.spec.papers - 1)
+            cited = cited + 1 if cited >= index else cited
+            title = self.titles[cited]
+            if rng.random() < self.spec.title_overlap:
+                title = self.variant(rng, title)
+            crng = random.Random(f"{self.spec.seed}-{cited}")
+            authors = [self.people[crng.randrange(len(self.people))]
+                       for _ in range(crng.randint(*self.spec.authors_per_paper))]
+            doi = self.doi(cited) if rng.random() < 0.5 else None
+        else:
+            external = rng.randrange(len(self.external_titles))
+            title = self.external_titles[external]
+            crng = random.Random(f"{self.spec.seed}-external-{external}")
+            authors = [self.external_people[crng.randrange(len(self.external_people))]
+                       for _ in range(crng.randint(1, 4))]
+            doi = f"10.9999/ext.{external}" if crng.random() < 0.4 else None
+        journal = self.journals[crng.randrange(len(self.journals))] if self.journals else None
+        year = crng.randint(1990, 2023)
+        parts = [f'<biblStruct xml:id="b{position}"><analytic><title level="a" type="main">{escape(title)}</title>']
+        parts.extend(self.person_xml(author, with_affiliation=False) for author in authors)
+        if doi:
+            parts.append(f'<idno type="DOI">{escape(doi)}</idno>')
+        parts.append("</analytic><monogr>")
+        if journal:
+            parts.append(f'<title level="j">{escape(journal)}</title>')
+        parts.append(f'<imprint><biblScope unit="volume">{crng.randint(1, 60)}</biblScope>'
+                     f'<date type="published" when="{year}">{year}</date></imprint></monogr></biblStruct>')
+        return "".join(parts)
+
+    def doi(self, index):
+        return f"10.5555/synthetic.{self.spec.seed}.{index}"
+
+    def document(self, index):
+        """
+        Returns the TEI document of a paper of the corpus.
+
+        Parameters:
+            index (int): The index of the paper.
+
+        Returns:
+            str: The TEI XML.
+        """
+        rng = random.Random(f"{self.spec.seed}-{index}")
+        title = self.titles[index]
+        authors = [self.people[rng.randrange(len(self.people))]
+                   for _ in range(rng.randint(*self.spec.authors_per_paper))]
+        keywords = rng.sample(_TOPIC_WORDS + _OBJECT_WORDS, 4)
+        abstract = " ".join(
+            f"We study {rng.choice(_TOPIC_WORDS)} {rng.choice(_OBJECT_WORDS)} for {rng.choice(_DOMAIN_WORDS)} and "
+            f"show that {rng.choice(_TOPIC_WORDS)} {rng.choice(_OBJECT_WORDS)} improve {rng.choice(_OBJECT_WORDS)}."
+            for _ in range(rng.randint(3, 8)))
+        md5 = hashlib.md5(f"{self.spec.seed}-{index}".encode("utf-8")).hexdigest().upper()
+        references = "".join(self.reference_xml(rng, index, position)
+                             for position in range(rng.randint(*self.spec.references_per_paper)))
+        acknowledgement = ""
+        if rng.random() < self.spec.acknowledgements:
+            person = self.people[rng.randrange(len(self.people))]
+            acknowledgement = (f'<div type="acknowledgement"><div><head>Acknowledgements</head><p>We thank '
+                               f'{escape(person[0])} {escape(person[1])} for the discussions. This work was funded by '
+                               f'the {escape(rng.choice(_FUNDERS))}.</p></div></div>')
+        body = "".join(f"<div><head>{escape(head)}</head><p>{escape(abstract)}</p></div>"
+                       for head in ("Introduction", "Method", "Results", "Conclusion"))
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<TEI xml:space="preserve" xmlns={quoteattr(TEI_NAMESPACE)}>'
+                f'<teiHeader xml:lang="en"><fileDesc><titleStmt><title level="a" type="main">{escape(title)}</title>'
+                f'</titleStmt><publicationStmt><publisher/><availability status="unknown"><licence/></availability>'
+                f'</publicationStmt><sourceDesc><biblStruct><analytic>'
+                f'{"".join(self.person_xml(author) for author in authors)}'
+                f'<title level="a" type="main">{escape(title)}</title></analytic><monogr><imprint/></monogr>'
+                f'<idno type="MD5">{md5}</idno><idno type="DOI">{self.doi(index)}</idno></biblStruct></sourceDesc>'
+                f'</fileDesc><encodingDesc><appInfo><application version="0.7.3" ident="GROBID"/></appInfo>'
+                f'</encodingDesc><profileDesc><textClass><keywords>'
+                f'{"".join(f"<term>{escape(keyword)}</term>" for keyword in keywords)}</keywords></textClass>'
+                f'<abstract><div><p>{escape(abstract)}</p></div></abstract></profileDesc></teiHeader>'
+                f'<text xml:lang="en"><body>{body}</body><back>{acknowledgement}'
+                f'<div type="references"><listBibl>{references}</listBibl></div></back></text></TEI>\n')
+
+    def documents(self):
+        """
+        Generates the documents of the corpus, followed by the duplicate copies.
+
+        Yields:
+            tuple: (filename, UTF-8 encoded TEI) pairs.
+        """
+        for index in range(self.spec.papers):
+            yield f"paper-{index:06d}.xml", self.document(index).encode("utf-8")
+        rng = random.Random(f"{self.spec.seed}-duplicates")
+        for copy in range(int(self.spec.papers * self.spec.duplicates)):
+            index = rng.randrange(self.spec.papers)
+            yield f"paper-{index:06d}-copy{copy}.xml", self.document(index).encode("utf-8")
+
+    def write(self, folder):
+        """
+        Writes the documents of the corpus to a folder.
+
+        Returns:
+            int: The number of documents written.
+        """
+        os.makedirs(folder, exist_ok=True)
+        count = 0
+        for filename, content in self.documents():
+            with open(os.path.join(folder, filename), "wb") as f:
+                f.write(content)
+            count += 1
+        return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='Synthetic corpus', description='Generate GROBID-style TEI documents')
+    parser.add_argument("--PAPERS", type=int, default=1000, help="Number of documents")
+    parser.add_argument("--OUTPUT", required=True, help="Folder where the TEI documents are written")
+    parser.add_argument("--AUTHORS", default="1,6", help="Minimum and maximum authors per paper")
+    parser.add_argument("--REFERENCES", default="10,40", help="Minimum and maximum references per paper")
+    parser.add_argument("--TITLE_OVERLAP", type=float, default=0.2,
+                        help="Fraction of the references to corpus papers with a differently written title")
+    parser.add_argument("--AFFILIATIONS", type=int, required=False, help="Number of shared affiliations")
+    parser.add_argument("--SEED", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    spec = CorpusSpec(papers=args.PAPERS, authors_per_paper=tuple(map(int, args.AUTHORS.split(","))),
+                      references_per_paper=tuple(map(int, args.REFERENCES.split(","))),
+                      title_overlap=args.TITLE_OVERLAP, affiliations=args.AFFILIATIONS, seed=args.SEED)
+    print(f"Wrote {SyntheticCorpus(spec).write(args.OUTPUT)} documents to {args.OUTPUT}")
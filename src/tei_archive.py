@@ -0,0 +1,233 @@
+import argparse
+import gzip
+import logging
+import os
+import struct
+import threading
+
+MAGIC = b"TEIPACK1"
+# Record header: key length, compressed length and codec of the document
+_RECORD = struct.Struct("<HIB")
+_CODECS = {"gzip": 1, "zstd": 2}
+# Documents are read sequentially in large blocks when the archive is iterated
+READ_BUFFER = 8 << 20
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression requires the zstandard package")
+    return zstandard
+
+
+def default_compression():
+    """
+    Returns "zstd" if the zstandard package is installed, which decompresses several times faster, and "gzip"
+    otherwise.
+    """
+    try:
+        _zstandard()
+    except ImportError:
+        return "gzip"
+    return "zstd"
+
+
+class TEIArchive:
+    """
+    This class stores GROBID TEI documents in a single append-only file instead of one XML file per paper. Every
+    document is compressed on its own, so it can be read by key through an offset index, and the archive is iterated
+    with large sequential reads. Adding a document again appends a new version that replaces the previous one.
+
+    The index is kept in a .index file next to the archive, one "offset key" line per document. Records written after
+    the last index line (e.g. after a crash) are recovered by scanning the end of the archive.
+
+    Parameters:
+        path (str): The archive file, created if it does not exist.
+        compression (str, optional): "zstd" or "gzip" for the new documents. Defaults to default_compression().
+        level (int, optional): The compression level.
+    """
+
+    def __init__(self, path, compression=None, level=None):
+        self.path = path
+        self.index_path = path + ".index"
+        self.compression = compression or default_compression()
+        if self.compression not in _CODECS:
+            raise ValueError(f"Unknown compression {self.compression}")
+        self.level = level
+        self.offsets = {}
+        self.lock = threading.Lock()
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+            open(self.index_path, "w").close()
+        self.file = open(path, "r+b")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a TEI archive")
+        self.load_index()
+        self.file.seek(0, os.SEEK_END)
+        self.index_file = open(self.index_path, "a", encoding="utf-8")
+
+    def load_index(self):
+        end = len(MAGIC)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        offset, key = line[:-1].split(" ", 1)
+                        self.offsets[key] = int(offset)
+                        end = max(end, int(offset))
+        if self.offsets:
+            end = self.record_end(end)
+        size = os.fstat(self.file.fileno()).st_size
+        recovered = 0
+        while end < size:
+            key, record_end = self.read_header(end) if end + _RECORD.size <= size else (None, size + 1)
+            if record_end > size:
+                # A record cut short by a crash is dropped
+                self.file.truncate(end)
+                break
+            self.offsets[key] = end
+            end, recovered = record_end, recovered + 1
+        if recovered:
+            logging.warning(f'Recovered {recovered} documents missing from {self.index_path}')
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{offset} {key}\n" for key, offset in self.offsets.items())
+
+    def read_header(self, offset):
+        self.file.seek(offset)
+        key_length, length, _ = _RECORD.unpack(self.file.read(_RECORD.size))
+        key = self.file.read(key_length).decode("utf-8")
+        return key, offset + _RECORD.size + key_length + length
+
+    def record_end(self, offset):
+        return self.read_header(offset)[1]
+
+    def compress(self, data):
+        if self.compression == "zstd":
+            zstandard = _zstandard()
+            return zstandard.ZstdCompressor(level=self.level or 3).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    @staticmethod
+    def decompress(codec, data):
+        if codec == _CODECS["zstd"]:
+            return _zstandard().ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def add(self, key, content):
+        """
+        Appends a document.
+
+        Parameters:
+            key (str): The key of the document, its XML file name (e.g. "paper.xml").
+            content (str or bytes): The TEI document.
+        """
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        encoded_key = key.encode("utf-8")
+        compressed = self.compress(data)
+        record = _RECORD.pack(len(encoded_key), len(compressed), _CODECS[self.compression]) + encoded_key + compressed
+        with self.lock:
+            self.file.seek(0, os.SEEK_END)
+            offset = self.file.tell()
+            self.file.write(record)
+            self.file.flush()
+            self.index_file.write(f"{offset} {key}\n")
+            self.index_file.flush()
+            self.offsets[key] = offset
+
+    def get(self, key):
+        """
+        Returns the TEI document of a key as bytes, with a single read.
+        """
+        with self.lock:
+            offset = self.offsets[key]
+            self.file.seek(offset)
+            header = self.file.read(_RECORD.size)
+            key_length, length, codec = _RECORD.unpack(header)
+            data = self.file.read(key_length + length)[key_length:]
+        return self.decompress(codec, data)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def keys(self):
+        return list(self.offsets)
+
+    def items(self):
+        """
+        Yields the (key, TEI bytes) pairs of the latest version of every document, reading the archive sequentially.
+        """
+        with open(self.path, "rb", buffering=READ_BUFFER) as f:
+            f.seek(len(MAGIC))
+            offset = len(MAGIC)
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return
+                key_length, length, codec = _RECORD.unpack(header)
+                key = f.read(key_length).decode("utf-8")
+                data = f.read(length)
+                if len(data) < length:
+                    return
+                if self.offsets.get(key) == offset:
+                    yield key, self.decompress(codec, data)
+                offset += _RECORD.size + key_length + length
+
+    def import_folder(self, folder, overwrite=False):
+        """
+        Adds the loose XML files of a folder (the layout PaperProcessor writes without an archive).
+
+        Returns:
+            int: The number of documents added.
+        """
+        added = 0
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".xml") and (overwrite or name not in self):
+                with open(os.path.join(folder, name), "rb") as f:
+                    self.add(name, f.read())
+                added += 1
+        return added
+
+    def export_folder(self, folder):
+        """
+        Writes every document as a loose XML file of a folder.
+
+        Returns:
+            int: The number of documents written.
+        """
+        written = 0
+        for key, content in self.items():
+            path = os.path.join(folder, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+            written += 1
+        return written
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack GROBID TEI documents into a TEI archive or unpack them")
+    parser.add_argument("--ARCHIVE", required=True, help="The archive file")
+    parser.add_argument("--IMPORT", help="Folder of loose XML files to add to the archive")
+    parser.add_argument("--EXPORT", help="Folder where the documents of the archive are written as loose XML files")
+    parser.add_argument("--COMPRESSION", choices=sorted(_CODECS), help="Compression of the added documents")
+    args = parser.parse_args()
+    with TEIArchive(args.ARCHIVE, compression=args.COMPRESSION) as archive:
+        if args.IMPORT:
+            print(f"Added {archive.import_folder(args.IMPORT)} documents to {args.ARCHIVE}")
+        if args.EXPORT:
+            print(f"Wrote {archive.export_folder(args.EXPORT)} documents to {args.EXPORT}")
@@ -0,0 +1,174 @@
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_YEAR = re.compile(r'(1[5-9]|20)\d{2}')
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_title(title):
+    """
+    Normalizes a title so that small typographic differences do not matter when comparing titles.
+
+    Parameters:
+        title (str): The title to normalize.
+
+    Returns:
+        str: The lowercased title with punctuation removed and whitespace collapsed.
+    """
+    if not title:
+        return ""
+    return _NON_ALNUM.sub(' ', title.lower()).strip()
+
+
+def extract_year(date):
+    """
+    Extracts a four digit year from a free text date as produced by GROBID (e.g. "2013a" or "24 Apr 2016").
+
+    Parameters:
+        date (str): The date text.
+
+    Returns:
+        int: The year, or None if the text does not contain one.
+    """
+    if not date:
+        return None
+    match = _YEAR.search(str(date))
+    return int(match.group(0)) if match else None
+
+
+def shingles(text, size=3):
+    """
+    Computes the set of hashed character shingles of a normalized text.
+
+    Parameters:
+        text (str): The normalized text.
+        size (int): The length of each shingle.
+
+    Returns:
+        set: A set of 32 bit integers, one per distinct shingle.
+    """
+    text = text.replace(' ', '_')
+    if len(text) <= size:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    return {zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    """
+    Computes the Jaccard similarity of two sets.
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class TitleIndex:
+    """
+    This class is a blocking index over normalized titles. Each title is turned into a MinHash signature over its
+    character shingles and the signature is split into bands that are hashed into buckets (locality sensitive
+    hashing), so a query only compares against titles that share at least one bucket instead of every indexed title.
+
+    Candidates are verified with the exact Jaccard similarity of their shingle sets against the threshold and,
+    when both sides know them, the publication year and the first author's surname.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3, match_year=True,
+                 match_first_author=True, seed=1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.match_year = match_year
+        self.match_first_author = match_first_author
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+        self.entries = {}
+
+    def signature(self, shingle_set):
+        """
+        Computes the MinHash signature of a set of hashed shingles.
+
+        Parameters:
+            shingle_set (set): The hashed shingles.
+
+        Returns:
+            np.ndarray: An array of num_perm hash minimums.
+        """
+        values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        hashes = (np.outer(self._a, values) + self._b[:, None]) % _MERSENNE_PRIME
+        return hashes.min(axis=1)
+
+    def _bands(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, title, year=None, first_author=None):
+        """
+        Adds a title to the index.
+
+        Parameters:
+            key: The value returned by query when this title matches (e.g. the paper title in the paper dictionary).
+            title (str): The title to index.
+            year (int, optional): Publication year used to reject false matches.
+            first_author (str, optional): Surname of the first author used to reject false matches.
+        """
+        normalized = normalize_title(title)
+        if not normalized or key in self.entries:
+            return
+        shingle_set = shingles(normalized, self.shingle_size)
+        self.entries[key] = (shingle_set, year, first_author.lower() if first_author else None)
+        for band, bucket in self._bands(self.signature(shingle_set)):
+            self.buckets[band][bucket].append(key)
+
+    def candidates(self, shingle_set):
+        """
+        Returns the keys that share at least one LSH bucket with the given shingles.
+        """
+        found = set()
+        for band, bucket in self._bands(self.signature(shingle_set)):
+            found.update(self.buckets[band].get(bucket, ()))
+        return found
+
+    def query(self, title, year=None, first_author=None):
+        """
+        Finds the indexed title most similar to the given one.
+
+        Parameters:
+            title (str): The title to look up.
+            year (int, optional): Publication year of the title being looked up.
+            first_author (str, optional): Surname of the first author of the title being looked up.
+
+        Returns:
+            The key of the best match whose similarity is at least the threshold, or None if there is no match.
+        """
+        normalized = normalize_title(title)
+        if not normalized:
+            return None
+        shingle_set = shingles(normalized, self.shingle_size)
+        first_author = first_author.lower() if first_author else None
+        best_key, best_score = None, self.threshold
+        for key in self.candidates(shingle_set):
+            other_shingles, other_year, other_author = self.entries[key]
+            if self.match_year and year and other_year and year != other_year:
+                continue
+            if self.match_first_author and first_author and other_author and first_author != other_author:
+                continue
+            score = jaccard(shingle_set, other_shingles)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -0,0 +1,231 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from rdflib import Graph, URIRef, plugin
+from rdflib.store import Store, VALID_STORE, NO_STORE, TripleAddedEvent, TripleRemovedEvent
+from rdflib.util import from_n3
+
+from rdf_writer import term_nt
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, n3 TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS triples (s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL,
+                                    PRIMARY KEY (s, p, o)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL);
+"""
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+"""
+_DROP_INDEXES = """
+DROP INDEX IF EXISTS triples_pos;
+DROP INDEX IF EXISTS triples_osp;
+"""
+
+
+class SQLiteStore(Store):
+    """
+    This class is an rdflib store that keeps the knowledge graph in a SQLite file, so the graph can be opened and
+    queried (also with SPARQL through rdflib) without parsing it into memory.
+
+    Terms are dictionary encoded in a terms table and triples are stored as integer ids in a table clustered on
+    (s, p, o), with (p, o, s) and (o, s, p) indexes so that any triple pattern is an index range scan. bulk_load()
+    drops the secondary indexes while loading and rebuilds them once at the end.
+
+    Usage:
+        graph = open_graph("kg.sqlite")
+    """
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None, term_cache_size=1000000):
+        self.conn = None
+        self.bulk = False
+        self.term_cache_size = term_cache_size
+        self.term_ids = {}
+        self.terms = {}
+        super().__init__(configuration, identifier)
+
+    def open(self, configuration, create=True):
+        """
+        Opens (and with create=True creates) the SQLite database at the path given as configuration.
+        """
+        if not create and not os.path.exists(configuration):
+            return NO_STORE
+        self.conn = sqlite3.connect(configuration, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA + _INDEXES)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=True):
+        if self.conn is not None:
+            if commit_pending_transaction:
+                self.conn.commit()
+            self.conn.close()
+            self.conn = None
+        self.term_ids = {}
+        self.terms = {}
+
+    def destroy(self, configuration):
+        self.close(commit_pending_transaction=False)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(configuration + suffix):
+                os.remove(configuration + suffix)
+
+    def commit(self):
+        if not self.bulk:
+            self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        Context manager for loading many triples: the secondary indexes are dropped, everything is written in a
+        single transaction without fsyncs, and the indexes are built once at the end.
+        """
+        self.conn.executescript(_DROP_INDEXES)
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.bulk = True
+        try:
+            yield self
+        finally:
+            self.bulk = False
+            self.conn.executescript(_INDEXES)
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.commit()
+            self.conn.execute("ANALYZE")
+
+    def term_id(self, term, create=False):
+        """
+        Returns the integer id of a term, adding it to the dictionary when create is True.
+
+        Returns:
+            int: The id, or None if the term is unknown and create is False.
+        """
+        n3 = term_nt(term)
+        term_id = self.term_ids.get(n3)
+        if term_id is not None:
+            return term_id
+        row = self.conn.execute("SELECT id FROM terms WHERE n3 = ?", (n3,)).fetchone()
+        if row is None:
+            if not create:
+                return None
+            term_id = self.conn.execute("INSERT INTO terms (n3) VALUES (?)", (n3,)).lastrowid
+        else:
+            term_id = row[0]
+        if len(self.term_ids) >= self.term_cache_size:
+            self.term_ids = {}
+        self.term_ids[n3] = term_id
+        return term_id
+
+    def term(self, term_id, n3):
+        term = self.terms.get(term_id)
+        if term is None:
+            if len(self.terms) >= self.term_cache_size:
+                self.terms = {}
+            term = self.terms[term_id] = from_n3(n3)
+        return term
+
+    def _listened(self):
+        # Events are only dispatched when someone listens (e.g. a query cache), so bulk loads do not pay for them.
+        return bool(self.dispatcher._dispatch_map)
+
+    def add(self, triple, context=None, quoted=False):
+        s, p, o = triple
+        self.conn.execute("INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)",
+                          (self.term_id(s, True), self.term_id(p, True), self.term_id(o, True)))
+        self.commit()
+        if self._listened():
+            self.dispatcher.dispatch(TripleAddedEvent(triple=triple, context=context))
+
+    def addN(self, quads):
+        quads = list(quads)
+        rows = [(self.term_id(s, True), self.term_id(p, True), self.term_id(o, True)) for s, p, o, _ in quads]
+        self.conn.executemany("INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)", rows)
+        self.commit()
+        if self._listened():
+            for s, p, o, c in quads:
+                self.dispatcher.dispatch(TripleAddedEvent(triple=(s, p, o), context=c))
+
+    def _where(self, triple_pattern):
+        clauses, params = [], []
+        for column, term in zip(("s", "p", "o"), triple_pattern):
+            if term is not None:
+                term_id = self.term_id(term)
+                if term_id is None:
+                    return None, None
+                clauses.append(f"t.{column} = ?")
+                params.append(term_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def remove(self, triple_pattern, context=None):
+        where, params = self._where(triple_pattern)
+        if where is None:
+            return
+        if self._listened():
+            for triple, _ in list(self.triples(triple_pattern)):
+                self.dispatcher.dispatch(TripleRemovedEvent(triple=triple, context=context))
+        self.conn.execute(f"DELETE FROM triples AS t{where}", params)
+        self.commit()
+
+    def triples(self, triple_pattern, context=None):
+        where, params = self._where(triple_pattern)
+        if where is None:
+            return
+        cursor = self.conn.execute(
+            "SELECT t.s, ts.n3, t.p, tp.n3, t.o, tob.n3 FROM triples AS t "
+            "JOIN terms AS ts ON ts.id = t.s JOIN terms AS tp ON tp.id = t.p JOIN terms AS tob ON tob.id = t.o"
+            f"{where}", params)
+        for s_id, s, p_id, p, o_id, o in cursor:
+            yield (self.term(s_id, s), self.term(p_id, p), self.term(o_id, o)), iter(())
+
+    def __len__(self, context=None):
+        return self.conn.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        if override or self.namespace(prefix) is None:
+            self.conn.execute("DELETE FROM namespaces WHERE uri = ?", (str(namespace),))
+            self.conn.execute("INSERT OR REPLACE INTO namespaces (prefix, uri) VALUES (?, ?)",
+                              (prefix, str(namespace)))
+            self.commit()
+
+    def namespace(self, prefix):
+        row = self.conn.execute("SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        row = self.conn.execute("SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        for prefix, uri in self.conn.execute("SELECT prefix, uri FROM namespaces").fetchall():
+            yield prefix, URIRef(uri)
+
+
+plugin.register("SQLite", Store, "triple_store", "SQLiteStore")
+
+
+def open_graph(path, create=True):
+    """
+    Opens an rdflib Graph backed by a SQLiteStore.
+
+    Parameters:
+        path (str): The path of the SQLite file.
+        create (bool): Whether to create the file if it does not exist.
+
+    Returns:
+        Graph: The opened graph. Call graph.close() when done.
+    """
+    graph = Graph(store=SQLiteStore())
+    if graph.open(path, create=create) != VALID_STORE:
+        raise FileNotFoundError(path)
+    return graph
@@ -0,0 +1,566 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+import types
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from rdflib import URIRef
+
+from instrumentation import metrics
+from kg_delta import KGDelta, apply_to_graph, apply_to_ntriples
+from ontology_classes import Affiliation, Author, Citation, Journal, Paper
+from rdf_writer import triple_nt
+from rdfparser import RDFParser
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    This class is a minimal binding of Linux inotify through ctypes, reporting the files of a folder that were closed
+    after writing or moved into it (so half-written files are not reported).
+
+    Raises:
+        OSError: If inotify is not available (not Linux, or the watch limit is reached).
+    """
+
+    def __init__(self, folder):
+        if not hasattr(os, "O_NONBLOCK") or not os.uname().sysname == "Linux":
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout):
+        """
+        Waits up to timeout seconds for events.
+
+        Returns:
+            tuple: The names of the files reported and whether the kernel queue overflowed (events were lost).
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return [], False
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return [], False
+        names, overflow, offset = [], False, 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif length:
+                names.append(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    This class watches a folder for new files and groups their arrivals into micro-batches.
+
+    New files are detected with inotify on Linux and by polling the folder elsewhere (or with mode="poll"); a polled
+    file is only reported once its size and modification time are the same in two consecutive scans. A batch is
+    emitted when no file arrived for debounce seconds, when it holds max_batch files, or when its first file has
+    waited max_wait seconds, so a steady trickle of files cannot postpone it forever.
+
+    Parameters:
+        folder (str): The folder to watch.
+        suffixes (tuple): Extensions of the files to report.
+        seen (set, optional): Names of files that must not be reported (e.g. already processed ones). The files
+            already in the folder and not in seen are reported in the first batch.
+        debounce (float): Seconds without arrivals that close a batch.
+        max_batch (int): Maximum number of files of a batch.
+        max_wait (float): Maximum seconds the first file of a batch waits.
+        poll_interval (float): Seconds between scans when polling.
+        mode (str): "auto", "inotify" or "poll".
+        retry_after (float): Seconds before a file that failed (see retry) is reported again, doubled on every
+            failure.
+        max_retries (int): Number of times a file that keeps failing is reported again before it is skipped.
+
+    Usage:
+        watcher = FolderWatcher("../res/datasets/space/raw/")
+        for batch in watcher.batches():
+            process([path for path, arrived in batch])
+    """
+
+    def __init__(self, folder, suffixes=(".pdf",), seen=None, debounce=2.0, max_batch=32, max_wait=10.0,
+                 poll_interval=1.0, mode="auto", retry_after=5.0, max_retries=3):
+        self.folder = folder
+        self.suffixes = suffixes
+        self.seen = set(seen) if seen is not None else set()
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.stopped = False
+        self.sizes = {}
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        # Paths of failed files, with the time they are reported again and the number of failures
+        self.retries = {}
+        self.failures = {}
+        self.inotify = None
+        if mode in ("auto", "inotify"):
+            try:
+                self.inotify = Inotify(folder)
+            except OSError as e:
+                if mode == "inotify":
+                    raise
+                logging.info(f'inotify unavailable ({e}), polling {folder}')
+        self.mode = "inotify" if self.inotify is not None else "poll"
+
+    def scan(self):
+        """
+        Returns the names of the files of the folder that were not reported yet and are complete.
+        """
+        sizes = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.suffixes) and entry.name not in self.seen and entry.is_file():
+                    stat = entry.stat()
+                    sizes[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        if self.inotify is not None:
+            # inotify only reports files once they are closed, so the ones already there are complete
+            return list(sizes)
+        ready = [name for name, size in sizes.items() if self.sizes.get(name) == size]
+        self.sizes = {name: size for name, size in sizes.items() if name not in ready}
+        return ready
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds and returns the names of the files that arrived.
+        """
+        if self.inotify is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return self.scan()
+        names, overflow = self.inotify.read(timeout)
+        if overflow:
+            logging.warning(f'inotify queue overflow, rescanning {self.folder}')
+            return self.scan()
+        return [name for name in names if name.endswith(self.suffixes)]
+
+    def batches(self):
+        """
+        Generates the micro-batches until stop is called.
+
+        Yields:
+            list: (path, arrival time) pairs, in order of arrival.
+        """
+        pending = {}
+        last_arrival = None
+        arrivals = self.scan()
+        if self.inotify is None:
+            # The files already in the folder are taken as they are instead of waiting for a second scan
+            arrivals += list(self.sizes)
+            self.sizes = {}
+        try:
+            while not self.stopped:
+                now = time.time()
+                for name in arrivals:
+                    if name not in self.seen:
+                        self.seen.add(name)
+                        pending[os.path.join(self.folder, name)] = now
+                        last_arrival = now
+                for path in [path for path, due in self.retries.items() if due <= now]:
+                    del self.retries[path]
+                    pending[path] = now
+                    last_arrival = now
+                if pending and (len(pending) >= self.max_batch or now - last_arrival >= self.debounce
+                                or now - min(pending.values()) >= self.max_wait):
+                    batch = sorted(pending.items(), key=lambda item: item[1])[:self.max_batch]
+                    for path, _ in batch:
+                        del pending[path]
+                    yield batch
+                    arrivals = []
+                    continue
+                if pending:
+                    timeout = max(0.0, min(last_arrival + self.debounce, min(pending.values()) + self.max_wait)
+                                  - time.time())
+                else:
+                    timeout = self.poll_interval
+                if self.retries:
+                    timeout = max(0.0, min(timeout, min(self.retries.values()) - time.time()))
+                arrivals = self.wait(timeout)
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
+
+    def retry(self, paths):
+        """
+        Reports files that could not be ingested (e.g. while GROBID restarts) again in a later batch, after a backoff
+        of retry_after seconds doubled on every failure, or skips them once they failed max_retries times.
+        """
+        now = time.time()
+        for path in paths:
+            failures = self.failures.get(path, 0)
+            if failures >= self.max_retries:
+                logging.error(f'Skipping {path} after {failures + 1} failed attempts')
+                metrics().count("watch_skipped")
+                continue
+            self.failures[path] = failures + 1
+            self.retries[path] = now + self.retry_after * 2 ** failures
+
+    def stop(self):
+        self.stopped = True
+
+
+class DeltaParser(RDFParser):
+    """
+    This class builds only the triples that a batch of new papers adds to an already built knowledge graph.
+
+    The new papers, the new citation papers and every entity that was not defined by a previous build are expanded
+    as an RDFParser does. The existing entities that gained relations to the new ones (the touched entities of
+    PaperSet.add_papers) are expanded too, but of their triples only the ones that point to a new entity are kept;
+    other existing entities are referenced but not expanded. A citation paper superseded by a new physical paper is
+    replaced: its own triples and the edges pointing to it are removed and the ones of the new paper added. A paper
+    completed with its full text (PaperSet.complete_papers) is replaced the same way, together with its
+    acknowledgement.
+
+    Parameters:
+        update (dict): The result of PaperSet.add_papers.
+        known (set): The IRIs defined by the previous builds (their defined_instances).
+        iris (IRIRegistry): The IRI registry of the previous builds.
+        kwargs: Other RDFParser arguments (batch_size, hashed_iris...).
+
+    Attributes:
+        delta (KGDelta): The N-Triples lines to add and remove and the titles of the added papers.
+    """
+
+    def __init__(self, update, known, iris, **kwargs):
+        self.update = update
+        self.known = known
+        self.touched = set()
+        self.renewed = set()
+        self.triples = []
+        self.delta = None
+        papers = update["papers"] + update["citation_papers"] + [paper for _, paper in update["superseded"]]
+        super().__init__(types.SimpleNamespace(papers={paper.title: paper for paper in papers}), sink=self,
+                         iris=iris, should_visit=lambda iri: iri not in self.known or iri in self.touched, **kwargs)
+
+    def addN(self, quads):
+        self.triples.extend((s, p, o) for s, p, o, _ in quads)
+
+    def entity_id(self, entity):
+        if isinstance(entity, Paper):
+            return self.paper_id(entity)
+        if isinstance(entity, Author):
+            return self.author_id(entity)
+        if isinstance(entity, Journal):
+            return self.journal_id(entity)
+        if isinstance(entity, Affiliation):
+            return self.affiliation_id(entity)
+        if isinstance(entity, Citation):
+            return self.citation_id(entity)
+        return self.acknowledgement_id(entity)
+
+    def replaced_triples(self, placeholder):
+        """
+        Returns the triples of a superseded paper: the ones add_paper and add_acknowledgement emit for it and the
+        edges of its authors, journal and citations to it.
+        """
+        batch, should_visit = self.batch, self.should_visit
+        self.batch, self.should_visit = [], lambda iri: False
+        try:
+            self.add_paper(placeholder)
+            if placeholder.acknowledgements is not None:
+                self.add_acknowledgement(placeholder.acknowledgements)
+            triples = self.batch
+        finally:
+            self.batch, self.should_visit = batch, should_visit
+        iri = self.paper_id(placeholder)
+        triples.extend((self.author_id(author), self.schema["writes"], iri) for author in placeholder.authors or [])
+        if placeholder.journal is not None:
+            triples.append((self.journal_id(placeholder.journal), self.schema["publishes"], iri))
+        triples.extend((self.citation_id(citation), self.schema["cites"], iri)
+                       for citation in placeholder.cited_by if citation is not None)
+        return triples
+
+    def build(self):
+        removed = []
+        for placeholder, paper in self.update["superseded"]:
+            removed.extend(self.replaced_triples(placeholder))
+            self.renewed.add(self.paper_id(paper))
+            self.renewed.update(self.version_id(paper, version) for version in paper.versions)
+            if paper.acknowledgements is not None:
+                self.renewed.add(self.acknowledgement_id(paper.acknowledgements))
+        self.touched = {self.entity_id(entity) for entity in self.update["touched"]} | self.renewed
+        super().build()
+        new = self.defined_instances - self.known
+        added = set()
+        for s, p, o in self.triples:
+            if s not in self.known or s in self.renewed or (isinstance(o, URIRef) and (o in new or o in self.renewed)):
+                added.add(triple_nt(s, p, o))
+        removed = {triple_nt(s, p, o) for s, p, o in removed}
+        self.triples = []
+        self.delta = KGDelta(added=added - removed, removed=removed - added,
+                             added_papers=[paper.title for paper in self.update["papers"]],
+                             changed_papers=[paper.title for _, paper in self.update["superseded"]])
+
+
+class IncrementalIngestor:
+    """
+    This class pushes micro-batches of new PDFs through GROBID, the paper space (PaperSet.add_papers) and a
+    DeltaParser, and applies the resulting delta to the N-Triples output and, if given, to a triple store and a
+    SPARQL Update endpoint.
+
+    With tiered=True the PDFs of a batch only go through GROBID's header processing, without consolidation, so the
+    papers are in the knowledge graph with their title, authors, abstract, cluster and topic as soon as possible. Their
+    full text is processed afterwards on a background thread, and their references and acknowledgement are added as
+    another delta (PaperSet.complete_papers).
+
+    Parameters:
+        processor (PaperProcessor): The processor of the run.
+        paper_space (PaperSet): The paper space of the run.
+        kg (RDFParser): The parser that built the knowledge graph of the paper space.
+        kg_output (str): The N-Triples output of the run (optionally .gz or .zst).
+        store (Graph, optional): A triple store to apply the deltas to.
+        updater (SPARQLUpdater, optional): A SPARQL Update endpoint to apply the deltas to.
+        hashed_iris (bool): Whether the knowledge graph uses hashed IRIs.
+        tiered (bool): Whether to defer the full text processing.
+        deduplicator (Deduplicator, optional): Merges the new papers that are near-duplicates of known ones into them.
+    """
+
+    def __init__(self, processor, paper_space, kg, kg_output, store=None, updater=None, hashed_iris=False,
+                 tiered=False, deduplicator=None):
+        self.processor = processor
+        self.paper_space = paper_space
+        self.kg_output = kg_output
+        self.store = store
+        self.updater = updater
+        self.hashed_iris = hashed_iris
+        self.iris = kg.iris
+        self.known = set(kg.defined_instances)
+        self.tiered = tiered
+        self.deduplicator = deduplicator
+        # Held while the paper space and the outputs are changed, which the background completion also does
+        self.lock = threading.RLock()
+        self.background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="full-text") if tiered else None
+        # The scheduled full text processing that has not finished yet, removed from the set once done
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+
+    def processed(self):
+        """
+        Returns the names of the PDFs that already have a GROBID output, which do not need to be ingested again.
+        """
+        return {f"{name[:-len('.xml')]}.pdf" for name in self.processor.xml_names()}
+
+    def apply(self, update):
+        """
+        Builds the delta of a paper space update and applies it to the outputs.
+
+        Returns:
+            KGDelta: The applied delta.
+        """
+        with self.lock:
+            parser = DeltaParser(update, self.known, self.iris, hashed_iris=self.hashed_iris)
+            self.known |= parser.defined_instances
+            delta = parser.delta
+            with metrics().stage("apply", items=len(delta)):
+                apply_to_ntriples(self.kg_output, delta)
+                if self.store is not None:
+                    apply_to_graph(self.store, delta)
+                if self.updater is not None:
+                    self.updater.apply(delta)
+            return delta
+
+    def ingest_papers(self, papers):
+        """
+        Adds parsed papers to the paper space and applies the triples they add to the outputs.
+
+        Parameters:
+            papers (list): New physical Paper instances.
+
+        Returns:
+            tuple: The result of PaperSet.add_papers and the applied KGDelta.
+        """
+        run_metrics = metrics()
+        with self.lock:
+            with run_metrics.stage("paper_space", items=len(papers)):
+                update = self.paper_space.add_papers(papers)
+            delta = self.apply(update)
+        run_metrics.count("ingested_papers", len(update["papers"]))
+        return update, delta
+
+    def merge_duplicates(self, papers):
+        """
+        Merges the new papers that are near-duplicates of known ones into them (see Deduplicator.match and
+        PaperSet.add_versions) and applies the versions and identifiers the known papers gained to the outputs. The
+        other papers are registered with the deduplicator.
+
+        Parameters:
+            papers (list): New physical Paper instances.
+
+        Returns:
+            dict: The known paper every near-duplicate was merged into, by the id of the near-duplicate.
+        """
+        merged, pairs = {}, []
+        with self.lock:
+            for paper in papers:
+                known = self.deduplicator.match(paper)
+                if known is None:
+                    continue
+                # The registered paper may itself have been a duplicate of a paper of the paper space
+                known = self.paper_space.paper_index.find(known, fuzzy=False) or known
+                merged[id(paper)] = known
+                pairs.append((known, paper))
+            if pairs:
+                self.apply(self.paper_space.add_versions(pairs))
+        metrics().count("near_duplicates", len(merged))
+        return merged
+
+    def defer(self, pairs):
+        """
+        Schedules the full text processing of papers added from their header.
+
+        Parameters:
+            pairs (list): (PDF path, paper) pairs.
+        """
+        if pairs:
+            future = self.background.submit(self.complete, pairs)
+            with self.pending_lock:
+                self.pending.add(future)
+            future.add_done_callback(self.finished)
+
+    def finished(self, future):
+        with self.pending_lock:
+            self.pending.discard(future)
+
+    def complete(self, pairs):
+        """
+        Processes the full text of papers added from their header and applies their references and acknowledgement.
+
+        Parameters:
+            pairs (list): (PDF path, paper) pairs.
+        """
+        run_metrics = metrics()
+        try:
+            with run_metrics.stage("complete", items=len(pairs)):
+                with run_metrics.stage("process", items=len(pairs)):
+                    completed = [(paper, self.processor.process(path)) for path, paper in pairs]
+                completed = [(paper, full) for paper, full in completed if full is not None]
+                if not completed:
+                    return
+                with self.lock:
+                    with run_metrics.stage("paper_space", items=len(completed)):
+                        update = self.paper_space.complete_papers(completed)
+                    delta = self.apply(update)
+            run_metrics.count("completed_papers", len(completed))
+            logging.info(f'Completed {len(completed)} papers with their full text: {delta}')
+        except Exception:
+            logging.exception('Full text processing failed')
+            run_metrics.count("complete_errors")
+            raise
+
+    def wait(self):
+        """
+        Waits for the scheduled full text processing to finish.
+        """
+        with self.pending_lock:
+            pending = set(self.pending)
+        futures.wait(pending)
+
+    def close(self):
+        if self.background is not None:
+            self.wait()
+            self.background.shutdown(wait=True)
+
+    def ingest(self, batch):
+        """
+        Ingests a micro-batch.
+
+        Parameters:
+            batch (list): (path, arrival time) pairs, as generated by FolderWatcher.batches.
+
+        Returns:
+            dict: The number of files, new papers and duplicates (including copies and near-duplicates of known papers),
+            the delta, the number of papers whose full text was deferred, the latency from the arrival of the first
+            and the last file of the batch until the delta was applied, and the paths of the files that failed with
+            an error (e.g. GROBID could not be reached or returned a malformed TEI).
+        """
+        run_metrics = metrics()
+        with run_metrics.stage("ingest", items=len(batch)):
+            with run_metrics.stage("process", items=len(batch)):
+                processed, copies, failed = [], 0, []
+                for path, _ in batch:
+                    try:
+                        # Checked one file at a time, so that a copy in the same batch is skipped too
+                        if self.processor.is_copy(path):
+                            copies += 1
+                            continue
+                        paper = self.processor.process(path, header_only=self.tiered)
+                    except Exception:
+                        logging.exception(f'Could not process {path}')
+                        run_metrics.count("ingest_errors")
+                        failed.append(path)
+                        continue
+                    if paper is not None:
+                        self.processor.record(path)
+                        processed.append((path, paper))
+            if self.deduplicator is not None:
+                merged = self.merge_duplicates([paper for _, paper in processed])
+                copies += len(merged)
+                processed = [(path, paper) for path, paper in processed if id(paper) not in merged]
+            update, delta = self.ingest_papers([paper for _, paper in processed])
+        done = time.time()
+        deferred = []
+        if self.tiered:
+            added = set(map(id, update["papers"]))
+            deferred = [(path, paper) for path, paper in processed if id(paper) in added]
+            self.defer(deferred)
+        report = {"files": len(batch), "papers": len(update["papers"]),
+                  "duplicates": len(update["duplicates"]) + copies, "delta": delta, "deferred": len(deferred),
+                  "failed": failed,
+                  "max_latency": done - min(arrived for _, arrived in batch),
+                  "min_latency": done - max(arrived for _, arrived in batch)}
+        logging.info(f'Ingested {report["papers"]} new papers ({report["duplicates"]} duplicates): {delta}, '
+                     f'latency {report["min_latency"]:.1f}-{report["max_latency"]:.1f}s')
+        return report
+
+    def run(self, watcher):
+        """
+        Ingests the batches of a FolderWatcher until it is stopped or interrupted with Ctrl+C. The files that failed,
+        or the whole batch if adding it to the paper space failed, are given back to the watcher to be retried.
+        """
+        try:
+            for batch in watcher.batches():
+                try:
+                    report = self.ingest(batch)
+                except Exception:
+                    logging.exception(f'Could not ingest a batch of {len(batch)} files')
+                    metrics().count("ingest_errors")
+                    watcher.retry([path for path, _ in batch])
+                    continue
+                watcher.retry(report["failed"])
+                print(f"Ingested {report['papers']} papers ({report['duplicates']} duplicates), "
+                      f"+{len(report['delta'].added)} -{len(report['delta'].removed)} triples, "
+                      f"latency {report['min_latency']:.1f}-{report['max_latency']:.1f}s"
+                      + (f", full text of {report['deferred']} deferred" if self.tiered else ""))
+        except KeyboardInterrupt:
+            watcher.stop()
+            print("Stopped watching")
+        finally:
+            if self.tiered:
+                print("Waiting for the deferred full text processing")
+            self.close()
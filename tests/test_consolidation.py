@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from consolidation import TEI, ConsolidationIndex, bibl_record, paper_record
+from fake_services import FakeGrobid, fake_pdf
+from instrumentation import RunMetrics, activate, metrics
+from processor import PaperProcessor
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+
+
+def document(*bibls):
+    return ET.fromstring(f'<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><back><div><listBibl>{"".join(bibls)}'
+                         f'</listBibl></div></back></text></TEI>')
+
+
+def bibl(title, surname=None, year=None, doi=None):
+    author = f"<author><persName><surname>{surname}</surname></persName></author>" if surname else ""
+    idno = f'<idno type="DOI">{doi}</idno>' if doi else ""
+    date = f'<date when="{year}">{year}</date>' if year else ""
+    return (f"<biblStruct><analytic><title>{title}</title>{author}{idno}</analytic>"
+            f"<monogr><imprint>{date}</imprint></monogr></biblStruct>")
+
+
+class TestConsolidationIndex(unittest.TestCase):
+    def test_resolves_by_identifier_or_title_author_and_year(self):
+        index = ConsolidationIndex()
+        index.add(bibl_record(document(bibl("Graph Embeddings for Citations", "Lovelace", 2019,
+                                            "https://doi.org/10.1/ABC")).find(f".//{TEI}biblStruct")))
+        root = document(bibl("GRAPH EMBEDDINGS: for citations.", "Lovelace"),
+                        bibl("Graph embeddings for citations", year=2019),
+                        bibl("Graph embedding for citation", doi="10.1/abc"),
+                        bibl("Graph embeddings for citations", "Lovelace", 2003),
+                        bibl("Graph embeddings for citations"),
+                        bibl("Another title", "Lovelace", 2019))
+        misses = index.resolve(root)
+        records = [bibl_record(element) for element in root.iter(f"{TEI}biblStruct")]
+        self.assertEqual([record["identifiers"].get("doi") for record in records],
+                         ["10.1/abc", "10.1/abc", "10.1/abc", None, None, None])
+        self.assertEqual(records[2]["title"], "Graph Embeddings for Citations")
+        self.assertEqual((records[1]["authors"], records[0]["date"]), ([[None, "Lovelace"]], "2019"))
+        self.assertEqual([bibl_record(element)["title"] for element in misses],
+                         ["Graph embeddings for citations", "Graph embeddings for citations", "Another title"])
+
+    def test_records_are_appended_and_reloaded(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "consolidation.jsonl")
+            index = ConsolidationIndex(path)
+            record = bibl_record(document(bibl("A title", "Hopper", 2001)).find(f".//{TEI}biblStruct"))
+            self.assertTrue(index.add(dict(record, identifiers={"doi": "10.1/a"})))
+            self.assertFalse(index.add(dict(record, identifiers={"doi": "10.1/a"})))
+            self.assertTrue(index.add(dict(record, identifiers={"arxiv": "2101.00001"})))
+            index.close()
+            reloaded = ConsolidationIndex(path)
+        self.assertEqual(len(reloaded), 1)
+        self.assertEqual(reloaded.find(dict(record, identifiers={}))["identifiers"],
+                         {"doi": "10.1/a", "arxiv": "2101.00001"})
+
+
+class TestProcessorConsolidation(unittest.TestCase):
+    def setUp(self):
+        self.previous = metrics()
+
+    def tearDown(self):
+        activate(self.previous)
+
+    def process(self, grobid, folder, index_path):
+        host, port = grobid.server.server_address[:2]
+        raw, output = os.path.join(folder, "raw/"), os.path.join(folder, "grobid/")
+        os.makedirs(raw)
+        os.makedirs(output)
+        for index in range(grobid.corpus.spec.papers):
+            with open(os.path.join(raw, f"paper-{index}.pdf"), "wb") as f:
+                f.write(fake_pdf(index))
+        run_metrics = activate(RunMetrics())
+        consolidation = ConsolidationIndex(index_path)
+        processor = PaperProcessor(output, grobid_port=port, grobid_host=host, consolidation=consolidation)
+        papers = processor.process_folder(raw)
+        consolidation.close()
+        references = {paper.title: sorted((citation.cites.title, citation.cites.identifiers.get("doi", ""))
+                                          for citation in paper.references) for paper in papers}
+        return references, run_metrics.report()["counters"]
+
+    def test_known_references_are_resolved_locally(self):
+        corpus = SyntheticCorpus(CorpusSpec(papers=6, references_per_paper=(4, 8), seed=5))
+        with FakeGrobid(corpus=corpus) as grobid, tempfile.TemporaryDirectory() as folder:
+            index_path = os.path.join(folder, "consolidation.jsonl")
+            first, first_counters = self.process(grobid, os.path.join(folder, "first"), index_path)
+            second, second_counters = self.process(grobid, os.path.join(folder, "second"), index_path)
+        self.assertGreater(first_counters["consolidation_external"], 0)
+        self.assertEqual(second_counters.get("consolidation_external", 0), 0)
+        self.assertGreater(second_counters["consolidation_hits"], first_counters.get("consolidation_hits", 0))
+        self.assertEqual(second, first)
+        dois = [doi for references in first.values() for _, doi in references]
+        self.assertTrue(all(doi.startswith(("10.5555/", "10.9999/")) for doi in dois if doi))
+
+    def test_papers_parsed_from_xml_are_indexed(self):
+        corpus = SyntheticCorpus(CorpusSpec(papers=4, references_per_paper=(4, 8), seed=6))
+        with FakeGrobid(corpus=corpus) as grobid, tempfile.TemporaryDirectory() as folder:
+            self.process(grobid, folder, os.path.join(folder, "consolidation.jsonl"))
+            index = ConsolidationIndex()
+            processor = PaperProcessor(os.path.join(folder, "grobid/"), consolidation=index)
+            papers = processor.process_folder_from_xml()
+        resolved = [bibl_record(bibl) for paper in papers for bibl in paper.tree.iter(f"{TEI}biblStruct")
+                    if bibl_record(bibl)["identifiers"]]
+        self.assertTrue(resolved)
+        self.assertTrue(all(index.find(record) is not None for record in resolved))
+        self.assertTrue(all(index.find(paper_record(paper)) is not None for paper in papers))
+
+
+if __name__ == '__main__':
+    unittest.main()
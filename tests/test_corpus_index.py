@@ -0,0 +1,77 @@
+import unittest
+
+from corpus_index import CorpusIndex
+from ontology_classes import Affiliation, Aknowledgement, Author, Journal, Paper
+
+
+def make_paper(title, authors, cluster=None, topic=None, journal=None, orgs=(), people=()):
+    paper = Paper(physical=False, title=title, authors=authors)
+    paper.physical = True
+    paper.cluster = cluster
+    paper.topic = topic
+    paper.journal = Journal(name=journal) if journal else None
+    paper.acknowledgements = Aknowledgement(text="thanks", source=paper)
+    paper.acknowledgements.acknowledges_org = [Affiliation(name=org) for org in orgs]
+    paper.acknowledgements.acknowledges_people = [Author(forename=forename, surname=surname)
+                                                  for forename, surname in people]
+    return paper
+
+
+class TestCorpusIndex(unittest.TestCase):
+    def setUp(self):
+        ada = Author(forename="Ada", surname="Lovelace", affiliation_name="Analytical Society")
+        alan = Author(forename="Alan", surname="Turing", affiliation_name="Bletchley Park")
+        self.papers = {
+            "notes": make_paper("notes", [ada], cluster=1, topic="models, learning", journal="Taylor's Memoirs",
+                                orgs=["Royal Society"], people=[("Charles", "Babbage")]),
+            "computable numbers": make_paper("computable numbers", [alan], cluster=1, topic="logic",
+                                             journal="Proceedings LMS", orgs=["Royal Society"]),
+            "machinery": make_paper("machinery", [alan, ada], cluster=0, topic="models, learning",
+                                    people=[("Max", "Newman")]),
+        }
+        self.papers["stub"] = Paper(physical=False, title="stub", authors=[Author(forename="Ada", surname="Lovelace")])
+        self.index = CorpusIndex(self.papers)
+
+    def titles(self, **filters):
+        return [paper.title for paper in self.index.papers(**filters)]
+
+    def test_single_field_lookups(self):
+        self.assertEqual(self.titles(author=("Ada", "Lovelace")), ["machinery", "notes", "stub"])
+        self.assertEqual(self.titles(author=Author(forename="alan", surname="TURING")),
+                         ["computable numbers", "machinery"])
+        self.assertEqual(self.titles(affiliation="bletchley park"), ["computable numbers", "machinery"])
+        self.assertEqual(self.titles(journal="TAYLOR'S memoirs"), ["notes"])
+        self.assertEqual(self.titles(acknowledges="Royal Society"), ["computable numbers", "notes"])
+        self.assertEqual(self.titles(acknowledges=("Max", "Newman")), ["machinery"])
+        self.assertEqual(self.titles(author=("Grace", "Hopper")), [])
+
+    def test_compound_filters(self):
+        self.assertEqual(self.titles(cluster=1, topic="models, learning"), ["notes"])
+        self.assertEqual(self.titles(author=("Ada", "Lovelace"), physical=True), ["machinery", "notes"])
+        self.assertEqual(self.titles(topic=["logic", "models, learning"], cluster=1), ["computable numbers", "notes"])
+        self.assertEqual(len(self.index.keys()), 4)
+        with self.assertRaises(ValueError):
+            self.index.keys(venue="x")
+
+    def test_authors_and_acknowledged_people(self):
+        self.assertEqual({author.surname for author in self.index.authors(cluster=1)}, {"Lovelace", "Turing"})
+        self.assertEqual([person.surname for person in self.index.acknowledged_people("royal society")],
+                         ["Babbage"])
+        self.assertEqual(self.index.values("cluster"), {0: 1, 1: 2})
+
+    def test_incremental_updates(self):
+        paper = self.papers["machinery"]
+        paper.cluster = 1
+        self.index.update_paper("machinery")
+        self.assertEqual(self.titles(cluster=1, topic="models, learning"), ["machinery", "notes"])
+        self.assertNotIn(0, self.index.values("cluster"))
+        self.index.remove_paper("notes")
+        self.assertNotIn("notes", self.index)
+        self.assertEqual(self.titles(acknowledges="Royal Society"), ["computable numbers"])
+        self.assertEqual(self.titles(journal="TAYLOR'S memoirs"), [])
+        self.index.add_paper("notes", self.papers["notes"])
+        self.assertEqual(self.titles(journal="TAYLOR'S memoirs"), ["notes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
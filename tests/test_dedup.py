@@ -0,0 +1,117 @@
+import os
+import random
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from dedup import Deduplicator, DisjointSet, PdfDigests, SimHashIndex, hamming, simhash
+from fake_services import FakeGrobid, fake_pdf
+from instrumentation import RunMetrics, activate, metrics
+from ontology_classes import Paper
+from processor import PaperProcessor
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+
+_WORDS = ["graph", "model", "data", "learning", "neural", "citation", "network", "entity", "topic", "embedding",
+          "query", "corpus", "author", "journal", "method", "result"]
+
+
+def text(seed, words=2000):
+    rng = random.Random(seed)
+    return [f"{rng.choice(_WORDS)}{rng.randrange(40)}" for _ in range(words)]
+
+
+def paper(title, words, idno="", references=0):
+    bibls = "".join(f"<biblStruct><analytic><title>Reference {index}</title></analytic></biblStruct>"
+                    for index in range(references))
+    tei = (f'<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt><title>{title}</title>'
+           f'</titleStmt><sourceDesc><biblStruct>{idno}</biblStruct></sourceDesc></fileDesc><profileDesc><abstract>'
+           f'<p>{" ".join(words[:150])}</p></abstract></profileDesc></teiHeader><text><body><p>{" ".join(words[150:])}'
+           f'</p></body><back><div><listBibl>{bibls}</listBibl></div></back></text></TEI>')
+    return Paper(tree=ET.ElementTree(ET.fromstring(tei)), filename=f"{title}.xml")
+
+
+def edited(words, every=400):
+    return [word if index % every else "edited" for index, word in enumerate(words)]
+
+
+class TestSimHash(unittest.TestCase):
+    def test_near_duplicates_differ_in_few_bits(self):
+        words = text(1)
+        self.assertLessEqual(hamming(simhash(words), simhash(edited(words))), 3)
+        self.assertGreater(hamming(simhash(words), simhash(text(2))), 10)
+
+    def test_index_finds_fingerprints_within_the_distance(self):
+        index = SimHashIndex(bands=4, max_distance=3)
+        base = simhash(text(3))
+        index.add("same", base)
+        index.add("three", base ^ (1 << 2 | 1 << 30 | 1 << 63))
+        index.add("four", base ^ (1 << 1 | 1 << 20 | 1 << 40 | 1 << 60))
+        self.assertEqual(index.query(base), ["same", "three"])
+        with self.assertRaises(ValueError):
+            SimHashIndex(bands=4, max_distance=4)
+
+    def test_disjoint_set_groups(self):
+        groups = DisjointSet(5)
+        groups.union(0, 3)
+        groups.union(3, 4)
+        self.assertEqual(sorted(groups.groups()), [[0, 3, 4], [1], [2]])
+
+
+class TestDeduplicator(unittest.TestCase):
+    def test_versions_are_merged_into_the_most_complete_paper(self):
+        words = text(4)
+        published = paper("Published title", words, '<idno type="DOI">10.1/pub</idno>', references=5)
+        preprint = paper("Preprint title", edited(words), '<idno type="arXiv">arXiv:2101.00001</idno>')
+        other = paper("Other title", text(5))
+        deduplicator = Deduplicator()
+        unique = deduplicator.deduplicate([preprint, other, published])
+        self.assertEqual(unique, [published, other])
+        self.assertEqual(published.identifiers, {"doi": "10.1/pub", "arxiv": "2101.00001"})
+        self.assertEqual([version["title"] for version in published.versions], ["published title", "preprint title"])
+
+        renamed = paper("Renamed copy", words)
+        self.assertIs(deduplicator.absorb(renamed), published)
+        self.assertIsNone(deduplicator.absorb(paper("Short", ["too", "short"])))
+        self.assertEqual(len(published.versions), 3)
+
+
+class TestPdfDigests(unittest.TestCase):
+    def setUp(self):
+        self.previous = metrics()
+
+    def tearDown(self):
+        activate(self.previous)
+
+    def test_byte_identical_pdfs_are_not_processed(self):
+        with tempfile.TemporaryDirectory() as folder, \
+                FakeGrobid(corpus=SyntheticCorpus(CorpusSpec(papers=2))) as grobid:
+            raw, output = os.path.join(folder, "raw/"), os.path.join(folder, "grobid/")
+            os.makedirs(raw)
+            os.makedirs(output)
+            for name, index in (("a.pdf", 0), ("b.pdf", 1), ("a (2).pdf", 0)):
+                with open(os.path.join(raw, name), "wb") as f:
+                    f.write(fake_pdf(index))
+            run_metrics = activate(RunMetrics())
+            host, port = grobid.server.server_address[:2]
+            processor = PaperProcessor(output, grobid_port=port, grobid_host=host, digests=PdfDigests())
+            papers = processor.process_folder(raw)
+            self.assertEqual(sorted(os.listdir(output)), ["a.xml", "b.xml"])
+        self.assertEqual(len(papers), 2)
+        self.assertEqual(run_metrics.report()["counters"]["duplicate_pdfs"], 1)
+
+    def test_only_processed_pdfs_are_recorded(self):
+        with tempfile.TemporaryDirectory() as folder:
+            paths = [os.path.join(folder, name) for name in ("a.pdf", "a (2).pdf")]
+            for path in paths:
+                with open(path, "wb") as f:
+                    f.write(fake_pdf(0))
+            digests = PdfDigests()
+            # GROBID could not process the first copy
+            self.assertIsNone(digests.duplicate_of(paths[0]))
+            self.assertIsNone(digests.duplicate_of(paths[1]))
+            digests.record(paths[1])
+            self.assertEqual(digests.duplicate_of(paths[0]), paths[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
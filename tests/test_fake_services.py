@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+
+from fake_services import Faults, FakeGrobid, FakeOpenAlex, FakeWikidata, fake_pdf
+from instrumentation import RunMetrics, activate, metrics
+from ontology_classes import Affiliation, Author, Journal, _SERVICES, configure_services
+from processor import PaperProcessor
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+
+
+class TestFakeServices(unittest.TestCase):
+    def setUp(self):
+        self.previous = metrics()
+        self.services = dict(_SERVICES)
+
+    def tearDown(self):
+        activate(self.previous)
+        _SERVICES.update(self.services)
+
+    def test_faults(self):
+        with FakeOpenAlex(Faults(latency=0.05, error_rate=0.5, seed=1)) as openalex:
+            statuses = [requests.get(f"{openalex.url}/authors").status_code for _ in range(20)]
+        stats = openalex.stats()
+        self.assertEqual(set(statuses), {200, 500})
+        self.assertEqual((stats["requests"], stats["errors"]), (20, statuses.count(500)))
+        self.assertGreaterEqual(stats["p50_seconds"], 0.05)
+        with FakeWikidata(Faults(burst_every=10, burst_length=5)) as wikidata:
+            self.assertEqual(requests.get(f"{wikidata.url}/sparql").status_code, 503)
+
+    def test_processor_retries_and_skips_failures(self):
+        corpus = SyntheticCorpus(CorpusSpec(papers=3, references_per_paper=(2, 4)))
+        with tempfile.TemporaryDirectory() as folder:
+            raw, output = os.path.join(folder, "raw/"), os.path.join(folder, "grobid/")
+            os.makedirs(raw)
+            os.makedirs(output)
+            for index in range(3):
+                with open(os.path.join(raw, f"paper-{index}.pdf"), "wb") as f:
+                    f.write(fake_pdf(index))
+            with open(os.path.join(raw, "broken.pdf"), "wb") as f:
+                f.write(b"%PDF-1.4\n%%EOF\n")
+            run_metrics = activate(RunMetrics())
+            # The first 0.3 seconds are a 503 burst, which the backoff of the processor outlasts
+            with FakeGrobid(Faults(burst_every=1000, burst_length=0.3), corpus=corpus) as grobid:
+                host, port = grobid.server.server_address[:2]
+                processor = PaperProcessor(output, grobid_port=port, grobid_host=host, retry_after=0.1)
+                papers = processor.process_folder(raw)
+            self.assertEqual(sorted(paper.title for paper in papers),
+                             sorted(title.lower() for title in corpus.titles[:3]))
+            self.assertEqual(len(os.listdir(output)), 3)
+            counters = run_metrics.report()["counters"]
+            self.assertGreater(counters["grobid_retries"], 0)
+            self.assertEqual(counters["grobid_errors"], 1)
+
+    def test_enrichment_against_fakes(self):
+        with FakeOpenAlex() as openalex, FakeWikidata() as wikidata:
+            configure_services(openalex_url=openalex.url, wikidata_url=f"{wikidata.url}/sparql")
+            author = Author("Ada", "Lovelace")
+            author.enrich()
+            self.assertIsNotNone(author.works_count)
+            self.assertIsNotNone(author.cited_by_count)
+            names = [f"University of {city}" for city in ("Madrid", "Boston", "Zurich", "Kyoto", "Oslo", "Lima")]
+            affiliations = [Affiliation(name) for name in names]
+            journal = Journal("Journal of Web Semantics")
+            for entity in [*affiliations, journal]:
+                entity.enrich()
+        self.assertTrue(any(affiliation.website for affiliation in affiliations))
+        self.assertTrue(all(affiliation.website is None for affiliation in affiliations
+                            if affiliation.established is None))
+        self.assertEqual(journal.country is None, journal.description is None)
+
+    def test_enrichment_tolerates_failures(self):
+        run_metrics = activate(RunMetrics())
+        with FakeOpenAlex(Faults(error_rate=1.0)) as openalex, \
+                FakeWikidata(Faults(burst_every=1000, burst_length=1000)) as wikidata:
+            configure_services(openalex_url=openalex.url, wikidata_url=f"{wikidata.url}/sparql",
+                               wikidata_retry_after=0)
+            author, affiliation = Author("Grace", "Hopper", works_count=3), Affiliation("University of Madrid")
+            start = time.perf_counter()
+            author.enrich()
+            affiliation.enrich()
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual(author.works_count, 3)
+        self.assertIsNone(affiliation.website)
+        self.assertEqual(run_metrics.report()["counters"]["enrich_errors"], 1)
+        self.assertEqual(wikidata.stats()["unavailable"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
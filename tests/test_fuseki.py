@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from rdflib import Literal, URIRef
+
+from fuseki import FusekiLoader
+from rdf_writer import open_writer
+
+
+class FakeFuseki(BaseHTTPRequestHandler):
+    """
+    Stand-in for a Fuseki dataset: stores the N-Triples lines it receives and answers COUNT queries.
+    """
+    triples = set()
+    chunks = []
+    failures = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        path = urlparse(self.path).path
+        if path == "/kg/data":
+            with self.lock:
+                if FakeFuseki.failures:
+                    FakeFuseki.failures -= 1
+                    return self.reply(503)
+                lines = [line for line in body.splitlines() if line]
+                FakeFuseki.chunks.append(len(lines))
+                FakeFuseki.triples.update(lines)
+            self.reply(200)
+        elif path == "/kg/query":
+            query = parse_qs(body)["query"][0]
+            assert "COUNT" in query
+            result = {"results": {"bindings": [{"n": {"value": str(len(FakeFuseki.triples))}}]}}
+            self.reply(200, json.dumps(result).encode("utf-8"))
+        else:
+            self.reply(404)
+
+
+class TestFusekiLoader(unittest.TestCase):
+    def setUp(self):
+        FakeFuseki.triples = set()
+        FakeFuseki.chunks = []
+        FakeFuseki.failures = 0
+        self.server = ThreadingHTTPServer(("localhost", 0), FakeFuseki)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def triples(self, n):
+        return [(URIRef(f"http://instances.com/p{i}"), URIRef("http://schema.org/title"), Literal(f"title\n{i}"))
+                for i in range(n)]
+
+    def test_sink_loads_in_chunks_and_verifies(self):
+        FakeFuseki.failures = 2
+        with FusekiLoader(url=self.url, chunk_size=100, workers=3, backoff_factor=0) as loader:
+            loader.addN((s, p, o, None) for s, p, o in self.triples(1050))
+        self.assertEqual(loader.report["sent"], 1050)
+        self.assertEqual(loader.report["chunks"], 11)
+        self.assertTrue(loader.report["verified"])
+        self.assertEqual(len(FakeFuseki.triples), 1050)
+        self.assertEqual(max(FakeFuseki.chunks), 100)
+
+    def test_load_compressed_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "kg.nt.gz")
+            with open_writer(path) as writer:
+                writer.addN((s, p, o, None) for s, p, o in self.triples(10))
+            report = FusekiLoader(url=self.url, chunk_size=4).load_file(path)
+        self.assertEqual((report["sent"], report["after"], report["verified"]), (10, 10, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import xml.etree.ElementTree as ET
+
+from ontology_classes import Paper
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+from test_service import ResidentPaperSpace
+
+
+def parse(corpus, index):
+    return Paper(tree=ET.ElementTree(ET.fromstring(corpus.document(index))), filename=f"paper-{index}.xml")
+
+
+class TestAddPapers(unittest.TestCase):
+    def test_batches_are_linked_to_the_existing_entities(self):
+        corpus = SyntheticCorpus(CorpusSpec(papers=8, seed=11))
+        space = ResidentPaperSpace()
+        first = space.add_papers([parse(corpus, index) for index in range(4)])
+        enriched = len(space.enriched)
+        second = space.add_papers([parse(corpus, index) for index in range(3, 8)])
+
+        self.assertEqual((len(first["papers"]), len(second["papers"]), len(second["duplicates"])), (4, 4, 1))
+        self.assertEqual(space.model_batches, [4, 4])
+        authors = {}
+        for paper in space.papers.values():
+            for author in paper.authors or []:
+                self.assertIs(authors.setdefault(author, author), author)
+                if paper.physical:
+                    self.assertIn(paper, author.writes)
+        self.assertEqual(len(space.all_authors), len(authors))
+        batches = [set(map(id, first["papers"])), set(map(id, second["papers"]))]
+        shared = [author for author in space.all_authors
+                  if all(any(id(paper) in batch for paper in author.writes) for batch in batches)]
+        self.assertTrue(shared)
+        self.assertTrue(all(any(entity is author for entity in second["touched"]) for author in shared))
+        # Citation papers of the first batch that the second batch processed are replaced
+        for placeholder, paper in second["superseded"]:
+            self.assertTrue(paper.physical)
+            self.assertFalse(any(placeholder is written for author in space.all_authors for written in author.writes))
+        # Only the entities new to the paper space are enriched
+        self.assertEqual(len(space.enriched), len(set(map(id, space.enriched))))
+        self.assertGreater(len(space.enriched), enriched)
+        for paper in second["papers"]:
+            self.assertIn(paper, space.find_papers(cluster=paper.cluster, physical=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from instrumentation import LatencyHistogram, RunMetrics, activate, metrics
+from rdfparser import RDFParser
+from test_rdfparser import citation_chain
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.previous = metrics()
+
+    def tearDown(self):
+        activate(self.previous)
+        self.folder.cleanup()
+
+    def test_nested_stages_accumulate(self):
+        run_metrics = RunMetrics(trace_memory=True)
+        with run_metrics.stage("paper_space", items=3):
+            for _ in range(2):
+                with run_metrics.stage("link_authors") as stage:
+                    blob = bytearray(2 ** 20)
+                    stage.items = 5
+                    del blob
+                    with run_metrics.stage("affiliations"):
+                        pass
+        run_metrics.close()
+        stages = run_metrics.report()["stages"]
+        self.assertEqual(list(stages), ["paper_space/link_authors/affiliations", "paper_space/link_authors",
+                                        "paper_space"])
+        inner, outer = stages["paper_space/link_authors"], stages["paper_space"]
+        self.assertEqual((inner["calls"], inner["items"]), (2, 10))
+        self.assertEqual((outer["calls"], outer["items"]), (1, 3))
+        self.assertGreaterEqual(outer["wall_seconds"], inner["wall_seconds"])
+        self.assertGreaterEqual(inner["traced_peak_bytes"], 2 ** 20)
+        self.assertGreaterEqual(outer["traced_peak_bytes"], inner["traced_peak_bytes"])
+        self.assertGreater(outer["peak_rss_bytes"], 0)
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.05, 0.5, 3.0):
+            histogram.observe(seconds, error=seconds > 1)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1.0, 3), (float("inf"), 4)])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.75), 1.0)
+        self.assertEqual(histogram.errors, 1)
+
+    def test_reports(self):
+        run_metrics = RunMetrics()
+        with run_metrics.stage("enrich"):
+            with self.assertRaises(RuntimeError):
+                with run_metrics.request("openalex"):
+                    raise RuntimeError("timeout")
+            run_metrics.observe("openalex", 0.2)
+        run_metrics.count("grobid_errors")
+        run_metrics.cache("iri", hits=3, misses=1)
+        path = os.path.join(self.folder.name, "metrics.json")
+        run_metrics.write_json(path)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report["caches"]["iri"]["hit_rate"], 0.75)
+        self.assertEqual(report["counters"], {"grobid_errors": 1})
+        self.assertEqual((report["http"]["openalex"]["count"], report["http"]["openalex"]["errors"]), (2, 1))
+        path = os.path.join(self.folder.name, "metrics.prom")
+        run_metrics.write_prometheus(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertIn('openscience_http_request_duration_seconds_bucket{service="openalex",le="+Inf"} 2.0', lines)
+        self.assertIn('openscience_http_request_errors_total{service="openalex"} 1.0', lines)
+        self.assertIn('openscience_cache_hits_total{cache="iri"} 3.0', lines)
+        self.assertIn('openscience_stage_calls{stage="enrich"} 1.0', lines)
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ["metrics.json", "metrics.prom"])
+
+    def test_profiles_one_stage(self):
+        for mode in ("cprofile", "sampling"):
+            run_metrics = RunMetrics(profile_stage="build/busy", profile_mode=mode, profile_dir=self.folder.name)
+            with run_metrics.stage("build"):
+                with run_metrics.stage("busy"):
+                    busy(0.1)
+                with run_metrics.stage("idle"):
+                    pass
+            self.assertTrue(os.path.exists(run_metrics.profile_path("build/busy")))
+            self.assertFalse(os.path.exists(run_metrics.profile_path("build/idle")))
+        stats = pstats.Stats(os.path.join(self.folder.name, "profile-build-busy.prof"))
+        self.assertTrue(any(function == "busy" for _, _, function in stats.stats))
+        with open(os.path.join(self.folder.name, "profile-build-busy.folded")) as f:
+            self.assertIn("test_instrumentation.py:busy", f.read())
+
+    def test_rdf_parser_records_into_active_metrics(self):
+        run_metrics = activate(RunMetrics())
+        kg = RDFParser(citation_chain(5), hashed_iris=True)
+        report = run_metrics.report()
+        self.assertEqual(report["stages"]["rdf"]["items"], kg.triple_count)
+        self.assertEqual(report["caches"]["iri"]["hits"] + report["caches"]["iri"]["misses"],
+                         kg.iris.hits + kg.iris.misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
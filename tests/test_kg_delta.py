@@ -0,0 +1,74 @@
+import gzip
+import os
+import tempfile
+import types
+import unittest
+
+from rdflib import Graph
+
+from kg_delta import TripleLedger, apply_to_graph, apply_to_ntriples
+from ontology_classes import Author, Paper
+from rdf_writer import TeeSink, open_writer
+from rdfparser import RDFParser
+
+
+def paper_space(titles):
+    author = Author(forename="Ada", surname="Lovelace")
+    papers = {}
+    for title in titles:
+        paper = Paper(physical=False, title=title, authors=[author])
+        paper.cited_by = []
+        paper.abstract = f"abstract of {title}\nwith a second line"
+        author.writes.append(paper)
+        papers[title] = paper
+    return types.SimpleNamespace(papers=papers)
+
+
+def build(titles):
+    ledger = TripleLedger()
+    graph = RDFParser(paper_space(titles), ledger=ledger).g
+    return ledger, graph
+
+
+class TestKGDelta(unittest.TestCase):
+    def setUp(self):
+        self.old_ledger, self.old_graph = build(["paper a", "paper b", "paper c"])
+        self.new_ledger, self.new_graph = build(["paper a", "paper c", "paper d"])
+
+    def test_ledger_attributes_triples_to_papers(self):
+        self.assertEqual(len(self.old_ledger.papers), 3)
+        lines = self.old_graph.serialize(format="nt").splitlines(True)
+        self.assertEqual(self.old_ledger.triples(), {line for line in lines if line.strip()})
+
+    def test_diff(self):
+        delta = self.old_ledger.diff(self.new_ledger)
+        self.assertEqual(delta.added_papers, ["http://instances.com/paperd"])
+        self.assertEqual(delta.removed_papers, ["http://instances.com/paperb"])
+        self.assertTrue(all("paperd" in line for line in delta.added))
+        self.assertTrue(all("paperb" in line for line in delta.removed))
+        self.assertEqual(len(self.new_ledger.diff(self.new_ledger)), 0)
+
+    def test_apply_to_graph_and_ntriples(self):
+        delta = self.old_ledger.diff(self.new_ledger)
+        apply_to_graph(self.old_graph, delta)
+        self.assertEqual(set(self.old_graph), set(self.new_graph))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "kg.nt.gz")
+            with open_writer(path) as writer:
+                RDFParser(paper_space(["paper a", "paper b", "paper c"]), sink=TeeSink(writer))
+            apply_to_ntriples(path, delta)
+            graph = Graph()
+            with gzip.open(path, "rt") as f:
+                graph.parse(data=f.read(), format="nt")
+            self.assertEqual(set(graph), set(self.new_graph))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "kg.ledger.json.gz")
+            self.old_ledger.save(path)
+            self.assertEqual(TripleLedger.load(path).papers, self.old_ledger.papers)
+            self.assertEqual(TripleLedger.load(os.path.join(folder, "missing")).papers, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from rdflib import RDF, Graph, Literal, URIRef
+
+from kg_snapshot import KGSnapshot, SnapshotWriter, write_snapshot
+from rdfparser import RDFParser
+from test_rdfparser import citation_chain
+
+
+class TestKGSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "kg.snapshot")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_round_trip_through_parser_sink(self):
+        paper_space = citation_chain(40)
+        paper_space.papers["paper 0"].abstract = 'línea uno\nline "two"'
+        expected = set(RDFParser(paper_space).g)
+        with SnapshotWriter(self.path) as writer:
+            RDFParser(paper_space, sink=writer, batch_size=9)
+        snapshot = KGSnapshot(self.path)
+        self.assertEqual(len(snapshot), len(expected))
+        self.assertEqual(set(snapshot.triples()), expected)
+        self.assertEqual(set(snapshot.to_graph()), expected)
+        self.assertEqual(set(KGSnapshot(self.path, mmap=False).triples()), expected)
+
+    def test_pattern_queries(self):
+        kg = RDFParser(citation_chain(10))
+        write_snapshot(kg.g, self.path)
+        snapshot = KGSnapshot(self.path)
+        for pattern in [(None, RDF.type, kg.schema["paper"]),
+                        (URIRef(kg.instances["paper3"]), None, None),
+                        (URIRef(kg.instances["paper3"]), kg.schema["title"], None),
+                        (None, None, Literal("paper 7")),
+                        (URIRef(kg.instances["missing"]), None, None)]:
+            self.assertEqual(set(snapshot.triples(pattern)), set(kg.g.triples(pattern)), pattern)
+        self.assertEqual(snapshot.count((None, RDF.type, kg.schema["paper"])), 10)
+
+    def test_duplicates_and_empty_graph(self):
+        triple = (URIRef("http://instances.com/a"), URIRef("http://schema.org/name"), Literal(1))
+        write_snapshot([triple, triple], self.path)
+        self.assertEqual(list(KGSnapshot(self.path).triples()), [triple])
+        write_snapshot(Graph(), self.path)
+        self.assertEqual(len(KGSnapshot(self.path).to_graph()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+from rdflib import Literal, URIRef
+
+from network_analytics import CitationNetwork, CoauthorNetwork, analyze_networks, pagerank
+from ontology_classes import Author, Citation, Paper
+from rdfparser import RDFParser
+
+
+def cite(source, cited):
+    citation = Citation(source=source, title=cited.title)
+    citation.cites = cited
+    source.references.append(citation)
+    cited.cited_by.append(citation)
+
+
+def small_space():
+    """
+    a and d both cite b and c, c cites b; a and b share an author, d is written by someone else.
+    """
+    ada, alan, grace = (Author(forename="Ada", surname="Lovelace"), Author(forename="Alan", surname="Turing"),
+                        Author(forename="Grace", surname="Hopper"))
+    papers = {title: Paper(physical=False, title=title, authors=authors)
+              for title, authors in (("a", [ada, alan]), ("b", [alan]), ("c", [Author()]), ("d", [grace]))}
+    for paper in papers.values():
+        paper.cited_by = []
+    for source, cited in (("a", "b"), ("a", "c"), ("d", "b"), ("d", "c"), ("c", "b"), ("c", "b")):
+        cite(papers[source], papers[cited])
+    return papers
+
+
+def dense_pagerank(adjacency, damping=0.85):
+    n = adjacency.shape[0]
+    out = adjacency.sum(axis=1)
+    transition = np.where(out[:, None] > 0, adjacency / np.maximum(out, 1)[:, None], 1.0 / n)
+    google = damping * transition + (1 - damping) / n
+    values, vectors = np.linalg.eig(google.T)
+    rank = np.real(vectors[:, np.argmax(np.real(values))])
+    return rank / rank.sum()
+
+
+class TestNetworkAnalytics(unittest.TestCase):
+    def test_citation_metrics(self):
+        papers = small_space()
+        network = CitationNetwork(papers)
+        self.assertEqual(network.keys, ["a", "b", "c", "d"])
+        self.assertEqual(network.edges, 5)
+        self.assertEqual(network.in_degree().tolist(), [0, 3, 2, 0])
+        self.assertEqual(network.out_degree().tolist(), [2, 0, 1, 2])
+        self.assertEqual(network.co_citation()[1, 2], 2)
+        self.assertEqual(network.coupling()[0, 3], 2)
+        self.assertEqual(network.most_related("b", network.co_citation()), [("c", 2)])
+        np.testing.assert_allclose(network.pagerank(), dense_pagerank(network.adjacency.toarray()), atol=1e-8)
+
+    def test_pagerank_of_random_graph(self):
+        adjacency = sp.random(60, 60, density=0.05, random_state=1, format="csr")
+        adjacency.data[:] = 1
+        rank = pagerank(adjacency)
+        self.assertAlmostEqual(rank.sum(), 1.0)
+        np.testing.assert_allclose(rank, dense_pagerank(adjacency.toarray()), atol=1e-8)
+        self.assertEqual(len(pagerank(sp.csr_matrix((0, 0)))), 0)
+
+    def test_coauthor_metrics(self):
+        network = CoauthorNetwork(small_space())
+        self.assertEqual(len(network), 3)
+        degree = dict(zip(network.keys, network.degree().tolist()))
+        self.assertEqual(degree, {("ada", "lovelace"): 1, ("alan", "turing"): 1, ("grace", "hopper"): 0})
+        self.assertEqual(network.components()[0], 2)
+
+    def test_write_back_and_rdf(self):
+        papers = small_space()
+        analyze_networks(papers)
+        self.assertEqual(papers["b"].citation_count, 3)
+        self.assertEqual(papers["b"].co_cited_with, 1)
+        self.assertGreater(papers["b"].pagerank, papers["a"].pagerank)
+        ada = papers["a"].authors[0]
+        self.assertEqual((ada.coauthor_count, ada.collaboration_size), (1, 2))
+        self.assertIsNone(papers["c"].authors[0].coauthor_count)
+
+        kg = RDFParser(type("PaperSpace", (), {"papers": papers}))
+        paper_b = URIRef(kg.instances["b"])
+        self.assertEqual(kg.g.value(paper_b, kg.schema["citation_count"]), Literal(3))
+        self.assertEqual(kg.g.value(URIRef(kg.instances["adalovelace"]), kg.schema["coauthor_count"]), Literal(1))
+        self.assertIsNone(kg.g.value(URIRef(kg.instances["unknownunknown"]), kg.schema["coauthor_count"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import xml.etree.ElementTree as ET
+
+from ontology_classes import Paper, normalize_identifier
+from paper_index import PaperIndex, resolve_new_papers, resolve_papers
+
+TEI = """<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc>
+<titleStmt><title>{title}</title></titleStmt>
+<sourceDesc><biblStruct><analytic/><monogr/>
+<idno type="MD5">{md5}</idno><idno type="arXiv">arXiv:1511.01844v3[stat.ML]</idno>
+</biblStruct></sourceDesc></fileDesc></teiHeader>
+<text><back><div><listBibl>
+<biblStruct><analytic><title>Auto-encoding variational bayes</title></analytic>
+<monogr><imprint><date when="2014">2014</date></imprint></monogr>
+<idno type="DOI">https://doi.org/10.48550/ARXIV.1312.6114</idno></biblStruct>
+</listBibl></div></back></text></TEI>"""
+
+
+def make_paper(title, md5="A622A6A4329DF1248A45C0318FC7057A"):
+    tree = ET.ElementTree(ET.fromstring(TEI.format(title=title, md5=md5)))
+    return Paper(tree=tree, filename=f"{title}.xml")
+
+
+class TestIdentifiers(unittest.TestCase):
+    def test_normalize_identifier(self):
+        self.assertEqual(normalize_identifier("DOI", "doi:10.1000/ABC"), ("doi", "10.1000/abc"))
+        self.assertEqual(normalize_identifier("arXiv", "arXiv:1511.01844v3[stat.ML]"), ("arxiv", "1511.01844"))
+        self.assertEqual(normalize_identifier("PMID", "PMID: 123"), ("pmid", "123"))
+        self.assertIsNone(normalize_identifier("ORCID", "0000-0001"))
+
+    def test_paper_and_reference_identifiers(self):
+        paper = make_paper("A note on the evaluation of generative models")
+        self.assertEqual(paper.identifiers["arxiv"], "1511.01844")
+        self.assertEqual(paper.references[0].cites.identifiers, {"doi": "10.48550/arxiv.1312.6114"})
+
+
+class TestPaperIndex(unittest.TestCase):
+    def test_identifier_takes_precedence_over_title(self):
+        index = PaperIndex()
+        paper = make_paper("A note on the evaluation of generative models")
+        index.add(paper)
+        renamed = make_paper("Completely different title", md5="0")
+        self.assertIs(index.find(renamed), paper)
+
+    def test_title_fallback_and_identifier_merge(self):
+        index = PaperIndex()
+        stub = Paper(physical=False, title="Auto-Encoding Variational Bayes")
+        index.add(stub)
+        reference = make_paper("x").references[0].cites
+        self.assertIs(index.find(reference), stub)
+        index.add_identifiers(stub, reference.identifiers)
+        self.assertIs(index.find_by_identifier({"doi": "10.48550/arxiv.1312.6114"}), stub)
+
+    def test_resolve_new_papers(self):
+        original = make_paper("A note on the evaluation of generative models")
+        index, papers, _, citation_papers = resolve_papers([original])
+        placeholder = original.references[0].cites
+        new = make_paper("Auto-Encoding Variational Bayes", md5="1")
+        new.identifiers, new.references = {}, []
+        copy = make_paper("A note on the evaluation of generative models", md5="2")
+        unique, duplicates, new_citation_papers, superseded = resolve_new_papers(index, papers, citation_papers,
+                                                                                 [new, copy])
+        self.assertEqual((unique, duplicates, new_citation_papers), ([new], [copy], []))
+        self.assertEqual(superseded, [(placeholder, new)])
+        self.assertIs(original.references[0].cites, new)
+        self.assertEqual(new.cited_by, [original.references[0]])
+        self.assertEqual(citation_papers, {})
+        self.assertIs(papers["auto-encoding variational bayes"], new)
+        self.assertIs(index.find_by_identifier({"doi": "10.48550/arxiv.1312.6114"}), new)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from rdflib import RDF
+
+from dedup import add_version
+from ontology_classes import Aknowledgement, Affiliation, Author, Paper
+from parquet_export import SCHEMAS, export_parquet, read_table
+from rdfparser import RDFParser
+from test_rdfparser import citation_chain
+
+
+def exported_space(length=6):
+    paper_space = citation_chain(length)
+    for i, paper in enumerate(paper_space.papers.values()):
+        paper.physical = i < 4
+        paper.cluster = i % 2 if paper.physical else None
+        paper.topic = "models, learning" if paper.physical else None
+    first = paper_space.papers["paper 0"]
+    first.acknowledgements = Aknowledgement(text="thanks", source=first)
+    first.acknowledgements.acknowledges_org.append(Affiliation(name="Fundación X"))
+    first.acknowledgements.acknowledges_people.append(Author(forename="Grace", surname="Hopper"))
+    titles = [title for title, paper in paper_space.papers.items() if paper.physical]
+    paper_space.embeddings = pd.DataFrame(np.arange(len(titles) * 3, dtype=float).reshape(-1, 3), index=titles)
+    return paper_space
+
+
+class TestParquetExport(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_tables_and_partitions(self):
+        counts = export_parquet(exported_space(), self.folder.name)
+        self.assertEqual(counts["papers"], 6)
+        self.assertEqual(counts["authors"], 2)
+        self.assertEqual(counts["authorship"], 6)
+        self.assertEqual(counts["citations"], 5)
+        self.assertEqual(counts["acknowledgements"], 2)
+        self.assertEqual(counts["embeddings"], 4)
+        self.assertTrue(os.path.isdir(os.path.join(self.folder.name, "papers", "cluster=1")))
+        citations = read_table(self.folder.name, "citations")
+        self.assertEqual(citations.schema, SCHEMAS["citations"])
+        cluster = read_table(self.folder.name, "papers", columns=["title"], filter=ds.field("cluster") == 1)
+        self.assertEqual(sorted(cluster.column("title").to_pylist()), ["paper 1", "paper 3"])
+        embeddings = read_table(self.folder.name, "embeddings", filter=ds.field("cluster") == 0)
+        self.assertEqual(embeddings.num_rows, 2)
+        self.assertEqual(len(embeddings.column("embedding")[0]), 3)
+
+    def test_versions_table(self):
+        paper_space = exported_space()
+        first = paper_space.papers["paper 0"]
+        first.filename, first.identifiers = "published.xml", {"doi": "10.1/x"}
+        preprint = Paper(physical=False, title="a preprint", filename="preprint.xml")
+        preprint.identifiers = {"arxiv": "2101.00001"}
+        add_version(first, preprint)
+        export_parquet(paper_space, self.folder.name, partition_by=())
+        versions = read_table(self.folder.name, "versions").to_pylist()
+        paper_id = read_table(self.folder.name, "papers", filter=ds.field("title") == "paper 0").column("paper_id")[0]
+        self.assertEqual([(row["paper_id"], row["position"], row["filename"]) for row in versions],
+                         [(paper_id.as_py(), 0, "published.xml"), (paper_id.as_py(), 1, "preprint.xml")])
+        self.assertEqual([(row["doi"], row["arxiv"]) for row in versions], [("10.1/x", None), (None, "2101.00001")])
+
+    def test_ids_match_hashed_knowledge_graph(self):
+        paper_space = exported_space()
+        export_parquet(paper_space, self.folder.name, partition_by=())
+        kg = RDFParser(paper_space, hashed_iris=True)
+        local = {str(paper)[len(kg.instances):] for paper in kg.g.subjects(RDF.type, kg.schema["paper"])}
+        papers = read_table(self.folder.name, "papers")
+        self.assertEqual(set(papers.column("paper_id").to_pylist()), local)
+        citations = read_table(self.folder.name, "citations")
+        self.assertTrue(set(citations.column("cited_id").to_pylist()) <= local)
+
+    def test_export_replaces_previous_partitions(self):
+        paper_space = exported_space()
+        export_parquet(paper_space, self.folder.name)
+        for paper in paper_space.papers.values():
+            paper.topic = "audio, speech" if paper.physical else None
+        export_parquet(paper_space, self.folder.name)
+        topics = set(read_table(self.folder.name, "papers", columns=["topic"]).column("topic").to_pylist())
+        self.assertEqual(topics, {"audio, speech", None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import types
+import unittest
+
+from rdflib import RDF, Dataset, Literal, Namespace, URIRef
+
+from iri_registry import IRIRegistry
+from ontology_classes import Author, Citation, Paper
+from rdf_writer import open_writer
+from rdfparser import RDFParser
+
+
+def citation_chain(length):
+    """
+    Builds papers that cite each other in a chain, sharing a single author, as a linked paper space would.
+    """
+    author = Author(forename="Ada", surname="Lovelace")
+    papers = [Paper(physical=False, title=f"paper {i}", authors=[author]) for i in range(length)]
+    for paper in papers:
+        paper.cited_by = []
+        author.writes.append(paper)
+    for source, cited in zip(papers, papers[1:]):
+        citation = Citation(source=source, title=cited.title)
+        citation.cites = cited
+        source.references.append(citation)
+        cited.cited_by.append(citation)
+    return types.SimpleNamespace(papers={paper.title: paper for paper in papers})
+
+
+class TestRDFParser(unittest.TestCase):
+    def test_long_citation_chain_does_not_recurse(self):
+        kg = RDFParser(citation_chain(5000), batch_size=1000)
+        schema = kg.schema
+        self.assertEqual(len(list(kg.g.subjects(RDF.type, schema["paper"]))), 5000)
+        self.assertEqual(len(list(kg.g.subjects(RDF.type, schema["citation"]))), 4999)
+        self.assertEqual(len(list(kg.g.objects(URIRef(kg.instances["adalovelace"]), schema["writes"]))), 5000)
+        self.assertEqual(kg.triple_count, len(kg.g))
+        self.assertGreater(kg.triples_per_second, 0)
+
+    def test_get_paper_by_title(self):
+        kg = RDFParser(citation_chain(3))
+        self.assertEqual(kg.get_paper_by_title("paper 1"), URIRef(kg.instances["paper1"]))
+        self.assertEqual(kg.get_paper_by_title("Paper 1!"), URIRef(kg.instances["paper1"]))
+        self.assertIsNone(kg.get_paper_by_title("paper 9"))
+
+    def test_versions_are_emitted(self):
+        paper_space = citation_chain(2)
+        paper = paper_space.papers["paper 0"]
+        paper.versions = [{"filename": "published.xml", "title": "paper 0", "identifiers": {"doi": "10.1/x"}},
+                          {"filename": "preprint.xml", "title": "a preprint", "identifiers": {"arxiv": "2101.00001"}}]
+        kg = RDFParser(paper_space)
+        versions = list(kg.g.objects(kg.paper_id(paper), kg.schema["version"]))
+        self.assertEqual(len(versions), 2)
+        self.assertEqual({str(kg.g.value(version, kg.schema["filename"])) for version in versions},
+                         {"published.xml", "preprint.xml"})
+        preprint = next(version for version in versions if (version, kg.schema["arxiv"], None) in kg.g)
+        self.assertEqual(str(kg.g.value(preprint, kg.schema["title"])), "a preprint")
+
+    def test_each_entity_is_visited_once(self):
+        paper_space = citation_chain(3)
+        kg = RDFParser(paper_space)
+        visits = []
+        kg.add_citation = lambda citation: visits.append(citation)
+        kg.defined_instances = set()
+        kg.build()
+        self.assertEqual(len(visits), 2)
+
+
+class TestStreamingWriters(unittest.TestCase):
+    def test_streamed_outputs_match_in_memory_graph(self):
+        paper_space = citation_chain(20)
+        paper_space.papers["paper 0"].abstract = 'line one\nline "two"'
+        expected = set(RDFParser(paper_space).g)
+        with tempfile.TemporaryDirectory() as folder:
+            for name, fmt in (("kg.nt", "nt"), ("kg.nt.gz", None), ("kg.jsonld", "json-ld"), ("kg.nq", "nquads")):
+                path = os.path.join(folder, name)
+                with open_writer(path) as writer:
+                    kg = RDFParser(paper_space, sink=writer)
+                self.assertEqual(len(kg.g), 0)
+                if fmt is None:
+                    continue
+                dataset = Dataset()
+                dataset.parse(path, format=fmt)
+                self.assertEqual({(s, p, o) for s, p, o, _ in dataset.quads()}, expected, name)
+
+    def test_jsonld_uses_native_values(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "kg.jsonld")
+            with open_writer(path) as writer:
+                writer.add((URIRef("http://instances.com/x"), URIRef("http://schema.org/cluster"), Literal(1)))
+            with open(path) as f:
+                self.assertIn('"schema:cluster": 1', f.read())
+
+
+class TestIRIRegistry(unittest.TestCase):
+    def setUp(self):
+        self.instances = Namespace('http://instances.com/')
+
+    def test_same_key_same_iri(self):
+        registry = IRIRegistry(self.instances)
+        first = registry.mint("author", Author(forename="Lucas", surname="Theis"), "Lucas", "Theis")
+        second = registry.mint("author", Author(forename="lucas", surname="theis"), "lucas", "theis")
+        self.assertEqual(first, URIRef(self.instances["lucastheis"]))
+        self.assertEqual(first, second)
+
+    def test_identity_cache(self):
+        registry = IRIRegistry(self.instances)
+        paper = Paper(physical=False, title="a title")
+        registry.mint("paper", paper, paper.title)
+        registry.mint("paper", paper, paper.title)
+        self.assertEqual((registry.hits, registry.misses), (1, 1))
+
+    def test_slug_collision_is_disambiguated(self):
+        registry = IRIRegistry(self.instances)
+        first = registry.mint("author", None, "Tsz", "Chiukwok")
+        second = registry.mint("author", None, "Tszchiu", "Kwok")
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(registry.collisions), 1)
+
+    def test_collision_suffix_does_not_depend_on_the_other_keys(self):
+        first = IRIRegistry(self.instances)
+        first.mint("paper", None, "Graph Learning")
+        first.mint("author", None, "Graph", "Learning")
+        suffixed = first.mint("journal", None, "Graph learning")
+        second = IRIRegistry(self.instances)
+        second.mint("paper", None, "Graph Learning")
+        self.assertEqual(second.mint("journal", None, "Graph learning"), suffixed)
+
+    def test_hashed_iris_are_compact_and_deterministic(self):
+        title = "a very long title " * 10
+        first = IRIRegistry(self.instances, hashed=True).mint("citation", None, title, title)
+        second = IRIRegistry(self.instances, hashed=True).mint("citation", None, title, title)
+        self.assertEqual(first, second)
+        self.assertLess(len(first), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from corpus_index import CorpusIndex
+from incremental_space import IncrementalPaperSpace
+from dedup import Deduplicator
+from fake_services import fake_pdf
+from paper_index import PaperIndex
+from processor import PaperProcessor
+from rdf_writer import triple_nt
+from rdfparser import RDFParser
+from service import IngestionService, MicroBatcher
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+from watcher import IncrementalIngestor
+
+
+class ResidentPaperSpace(IncrementalPaperSpace):
+    """
+    Stands in for a PaperSet with its models loaded: the papers are added and linked by the IncrementalPaperSpace
+    steps of PaperSet, the model steps give every new paper a cluster and a topic and record the size of every batch
+    that reaches the models, and the new entities are recorded instead of enriched.
+    """
+
+    def __init__(self):
+        self.papers, self.citation_papers, self.duplicate_papers = {}, {}, []
+        self.all_authors, self.all_affiliations, self.all_journals = [], {}, []
+        self.paper_index = PaperIndex()
+        self.corpus_index = CorpusIndex()
+        self.model_batches = []
+        self.enriched = []
+
+    def assign_clusters(self, papers):
+        self.model_batches.append(len(papers))
+        for paper in papers:
+            paper.cluster = len(paper.title) % 2
+
+    def assign_topics(self, papers):
+        for paper in papers:
+            paper.topic = "models, learning"
+
+    def recognize_entities(self, papers):
+        pass
+
+    def enrich_entities(self, affiliations, authors, journals):
+        self.enriched.extend(affiliations + authors + journals)
+
+    def find_papers(self, **filters):
+        return self.corpus_index.papers(**filters)
+
+    def get_xml_papers(self):
+        return {title: paper for title, paper in self.papers.items() if paper.physical}
+
+
+def post(url, body, content_type="application/xml", query=""):
+    request = Request(f"{url}/papers{query}", data=body, headers={"Content-Type": content_type}, method="POST")
+    try:
+        with urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def get(url, path):
+    with urlopen(f"{url}{path}") as response:
+        return json.loads(response.read())
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_concurrent_submits_share_calls(self):
+        calls = []
+
+        def double(items):
+            calls.append(len(items))
+            time.sleep(0.05)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double, max_batch=8, max_delay=0.1)
+        with ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(batcher.submit, range(16)))
+        batcher.stop()
+        self.assertEqual(results, [item * 2 for item in range(16)])
+        self.assertEqual(sum(calls), 16)
+        self.assertLess(len(calls), 16)
+        self.assertLessEqual(max(calls), 8)
+
+    def test_failed_batch_raises_in_every_submitter(self):
+        batcher = MicroBatcher(lambda items: 1 / 0, max_delay=0.01)
+        with self.assertRaises(ZeroDivisionError):
+            batcher.submit(1, timeout=5)
+        batcher.stop()
+
+
+class TestIngestionService(unittest.TestCase):
+    def setUp(self):
+        self.corpus = SyntheticCorpus(CorpusSpec(papers=4, seed=7))
+        self.start()
+
+    def start(self, deduplicator=None):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        grobid, raw = os.path.join(self.folder.name, "grobid") + "/", os.path.join(self.folder.name, "raw")
+        os.makedirs(grobid)
+        os.makedirs(raw)
+        self.paper_space = ResidentPaperSpace()
+        kg_output = os.path.join(self.folder.name, "kg.nt")
+        open(kg_output, "w").close()
+        ingestor = IncrementalIngestor(PaperProcessor(grobid), self.paper_space, RDFParser(self.paper_space),
+                                       kg_output, deduplicator=deduplicator)
+        self.service = IngestionService(ingestor.processor, ingestor, raw, port=0, max_delay=0.2).start()
+        self.addCleanup(self.service.stop)
+        self.kg_output = kg_output
+
+    def test_ingests_concurrent_documents_in_batches(self):
+        documents = [self.corpus.document(index).encode("utf-8") for index in range(4)]
+        with ThreadPoolExecutor(5) as pool:
+            responses = list(pool.map(lambda document: post(self.service.url, document), documents + documents[:1]))
+
+        self.assertEqual(sorted(status for status, _ in responses), [200, 201, 201, 201, 201])
+        self.assertLess(len(self.paper_space.model_batches), 5)
+        self.assertEqual(sum(self.paper_space.model_batches), 4)
+        added = [paper for status, paper in responses if status == 201]
+        self.assertEqual({paper["title"] for paper in added}, {title.lower() for title in self.corpus.titles})
+        for paper in added:
+            self.assertEqual(paper["topic"], "models, learning")
+            self.assertIn("@context", paper["jsonld"])
+            self.assertTrue(paper["physical"])
+        duplicate = next(paper for status, paper in responses if status == 200)
+        self.assertEqual(duplicate["status"], "duplicate")
+        with open(self.kg_output, encoding="utf-8") as f:
+            self.assertTrue(f.read())
+
+        author = added[0]["authors"][0]
+        found = get(self.service.url, f"/papers?physical=true&author={author.replace(' ', '+')}")
+        self.assertIn(added[0]["title"], [paper["title"] for paper in found["papers"]])
+        self.assertEqual(get(self.service.url, "/papers?physical=true")["count"], 4)
+        self.assertEqual(sum(get(self.service.url, "/clusters").values()), 4)
+        self.assertEqual(get(self.service.url, "/health")["physical"], 4)
+        self.assertIn(author, [a["name"] for a in get(self.service.url, "/authors?physical=true")["authors"]])
+
+    def test_near_duplicate_uploads_are_merged(self):
+        self.service.stop()
+        self.start(deduplicator=Deduplicator(body=False))
+        document = self.corpus.document(0)
+        status, added = post(self.service.url, document.encode("utf-8"))
+        renamed = document.replace(self.corpus.titles[0], "A renamed preprint").replace(
+            '<idno type="MD5">', '<idno type="arXiv">arXiv:2101.00001</idno><idno type="MD5">', 1)
+        status, duplicate = post(self.service.url, renamed.encode("utf-8"))
+        self.assertEqual((status, duplicate["status"]), (200, "duplicate"))
+        self.assertEqual(duplicate["title"], added["title"])
+        self.assertEqual(sum(self.paper_space.model_batches), 1)
+        paper = next(iter(self.paper_space.get_xml_papers().values()))
+        self.assertEqual([version["title"] for version in paper.versions], [added["title"], "a renamed preprint"])
+        self.assertEqual([version["title"] for version in duplicate["versions"]],
+                         [added["title"], "a renamed preprint"])
+
+        # The preprint identifier finds the paper, and the versions reach the knowledge graph
+        self.assertEqual(duplicate["identifiers"]["arxiv"], "2101.00001")
+        self.assertIs(self.paper_space.paper_index.find_by_identifier({"arxiv": "2101.00001"}), paper)
+        with open(self.kg_output, encoding="utf-8") as f:
+            triples = f.read()
+        self.assertEqual(triples.count("<http://schema.org/version>"), 4)
+        self.assertIn('"a renamed preprint"', triples)
+        self.assertIn('<http://schema.org/arxiv> "2101.00001"', triples)
+        expected = {triple_nt(*triple) for triple in RDFParser(self.paper_space).g}
+        self.assertEqual(set(triples.splitlines(keepends=True)), expected)
+
+    def test_uploads_do_not_overwrite_papers_with_the_same_name(self):
+        first = post(self.service.url, self.corpus.document(0).encode("utf-8"), query="?filename=paper.xml")
+        second = post(self.service.url, self.corpus.document(1).encode("utf-8"), query="?filename=paper.xml")
+        self.assertEqual((first[0], second[0]), (201, 201))
+        self.assertEqual(first[1]["filename"], "paper.xml")
+        self.assertRegex(second[1]["filename"], r"^paper-[0-9a-f]{12}\.xml$")
+        self.assertEqual(len(self.service.processor.xml_names()), 2)
+
+    def test_failed_ingestion_is_answered(self):
+        # Nothing listens on the GROBID port of the test processor
+        status, payload = post(self.service.url, fake_pdf(0), content_type="application/pdf")
+        self.assertEqual(status, 502)
+        self.assertIn("GROBID", payload["error"])
+        self.service.batcher.function = lambda items: 1 / 0
+        status, payload = post(self.service.url, self.corpus.document(0).encode("utf-8"))
+        self.assertEqual((status, payload["error"]), (500, "Ingestion failed: division by zero"))
+
+    def test_rejects_invalid_documents(self):
+        self.assertEqual(post(self.service.url, b"<TEI><unclosed></TEI>")[0], 400)
+        self.assertEqual(post(self.service.url, b"plain text", content_type="text/plain")[0], 415)
+        self.assertEqual(self.paper_space.model_batches, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import glob
+import json
+import os
+import tempfile
+import unittest
+
+from rdf_writer import open_text, open_writer
+from rdfparser import RDFParser
+from sharded_builder import SortedRunWriter, build_sharded, merge_sorted
+from test_rdfparser import citation_chain
+
+
+def read_lines(path):
+    with open_text(path, "rt") as f:
+        return f.readlines()
+
+
+class TestShardedBuilder(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.paper_space = citation_chain(60)
+        path = os.path.join(self.folder.name, "single.nt")
+        with open_writer(path) as writer:
+            RDFParser(self.paper_space, sink=writer, hashed_iris=True)
+        self.expected = sorted(set(read_lines(path)))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_sharded_build_matches_single_process(self):
+        for workers, shards in ((1, 1), (1, 4), (3, 4)):
+            output = os.path.join(self.folder.name, f"kg-{workers}-{shards}.nt.gz")
+            report = build_sharded(self.paper_space, output, shards=shards, workers=workers, run_size=50)
+            self.assertEqual(read_lines(output), self.expected)
+            self.assertEqual(report["triples"], len(self.expected))
+            self.assertEqual(len(report["shard_triples"]), shards)
+
+    def test_partitions_and_manifest(self):
+        output = os.path.join(self.folder.name, "kg.nt")
+        report = build_sharded(self.paper_space, output, shards=3, workers=2, partitions=4)
+        partitions = sorted(glob.glob(os.path.join(self.folder.name, "kg-part-*.nt")))
+        self.assertEqual(len(partitions), 4)
+        lines = [read_lines(path) for path in partitions]
+        self.assertEqual(sorted(line for part in lines for line in part), self.expected)
+        subjects = [{line.split(" ", 1)[0] for line in part} for part in lines]
+        self.assertEqual(sum(map(len, subjects)), len(set().union(*subjects)))
+        for part in lines:
+            self.assertEqual(part, sorted(part))
+        with open(f"{output}.manifest.json") as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["triples"], len(self.expected))
+        self.assertEqual(manifest["files"], report["files"])
+
+    def test_sorted_run_writer_spills_and_dedups(self):
+        path = os.path.join(self.folder.name, "runs.nt")
+        writer = SortedRunWriter(path, run_size=5, tmp_dir=self.folder.name)
+        RDFParser(self.paper_space, sink=writer, batch_size=3)
+        RDFParser(self.paper_space, sink=writer, batch_size=7)
+        self.assertGreater(len(writer.runs), 1)
+        self.assertEqual(writer.close(), len(read_lines(path)))
+        self.assertEqual(read_lines(path), sorted(set(read_lines(path))))
+        self.assertEqual(glob.glob(os.path.join(self.folder.name, "tmp*")), [])
+
+    def test_merge_sorted_dedups_across_inputs(self):
+        paths = []
+        for i, lines in enumerate((["a .\n", "c .\n"], ["a .\n", "b .\n", "c .\n"])):
+            paths.append(os.path.join(self.folder.name, f"{i}.nt"))
+            with open(paths[-1], "w") as f:
+                f.writelines(lines)
+        output = os.path.join(self.folder.name, "merged.nt")
+        self.assertEqual(merge_sorted(paths, output), (3, [(output, 3)]))
+        self.assertEqual(read_lines(output), ["a .\n", "b .\n", "c .\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+import copy
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from network_analytics import analyze_networks
+from ontology_classes import Affiliation, Author
+from paper_index import resolve_papers
+from parquet_export import TableBuilder
+from rdf_writer import triple_nt
+from rdfparser import RDFParser
+from spark_pipeline import (PaperResolution, SparkPipeline, attach_metrics, extract_partition, merge_records,
+                            paper_contributions, paper_header, prune_records, record_rows, record_triples,
+                            reduce_records)
+from streaming_paper_space import WindowModels
+
+TEI = """<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc>
+<titleStmt><title>{title}</title></titleStmt>
+<sourceDesc><biblStruct><analytic>{authors}</analytic><monogr/><idno type="MD5">{md5}</idno></biblStruct></sourceDesc>
+</fileDesc><profileDesc><abstract><p>About {title}.</p></abstract></profileDesc></teiHeader>
+<text><back>{acknowledgement}<div><listBibl>{references}</listBibl></div></back></text></TEI>"""
+AUTHOR = ("<author><persName><forename>{0}</forename><surname>{1}</surname></persName>"
+          "<affiliation><orgName>{2}</orgName></affiliation></author>")
+REFERENCE = ("<biblStruct><analytic><title>{0}</title>{1}</analytic><monogr><title>{2}</title>"
+             "<imprint><date when=\"2014\">2014</date></imprint></monogr></biblStruct>")
+ACKNOWLEDGEMENT = '<div type="acknowledgement"><div><head>Acknowledgements</head><p>{0}</p></div></div>'
+EXTERNAL = REFERENCE.format("Programming the UNIVAC", AUTHOR.format("Grace", "Hopper", "Remington"),
+                            "Journal of Computing")
+
+
+def tei(title, authors, references, md5, acknowledgement=""):
+    return TEI.format(title=title, md5=md5, authors="".join(AUTHOR.format(*author) for author in authors),
+                      references="".join(references), acknowledgement=acknowledgement).encode("utf-8")
+
+
+def tei_files():
+    """
+    a cites b and an external work, b cites a and the same external work, c is a copy of b (same MD5). a thanks a
+    person who is also the author of the external work.
+    """
+    return [
+        ("/grobid/a.xml", tei("Paper A", [("Ada", "Lovelace", "Analytical Society"), ("Alan", "Turing", "Bletchley")],
+                              [REFERENCE.format("Paper B", "", "Proceedings"), EXTERNAL], "A1",
+                              ACKNOWLEDGEMENT.format("We thank Grace Hopper and ACME."))),
+        ("/grobid/b.xml", tei("Paper B", [("Alan", "Turing", "Bletchley")],
+                              [EXTERNAL, REFERENCE.format("Paper A", "", "")], "B2")),
+        ("/grobid/c.xml", tei("Paper B (copy)", [("Alan", "Turing", "Bletchley")], [], "B2")),
+    ]
+
+
+def recognize(acknowledgement):
+    """
+    Sets the entities the NER pipeline finds in the acknowledgement of paper a.
+    """
+    if acknowledgement is None or "Grace Hopper" not in (acknowledgement.text or ""):
+        return
+    acknowledgement.acknowledges_people = [Author(forename="Grace", surname="Hopper",
+                                                  acknowledged_by=[acknowledgement])]
+    acknowledgement.acknowledges_org = [Affiliation(name="ACME", ackowledged_by=[acknowledgement])]
+
+
+def corpus():
+    papers = list(extract_partition(tei_files(), xml_path="/grobid/"))
+    for paper in papers:
+        paper.cluster = 0 if paper.filename == "a.xml" else 1
+        paper.topic = "models, learning"
+    recognize(papers[0].acknowledgements)
+    return papers
+
+
+class FakeModels(WindowModels):
+    """
+    Stands in for the NLP models with the labels corpus() gives: paper a in cluster 0, paper b in cluster 1, and the
+    acknowledged entities of recognize.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.windows = []
+        self.fitted = None
+
+    def encode(self, abstracts):
+        self.windows.append(len(abstracts))
+        return np.array([[1.0, 0.1] if "Paper A" in abstract else [0.1, 1.0] for abstract in abstracts],
+                        dtype=np.float32)
+
+    def preprocess(self, text):
+        return text.lower()
+
+    def recognize(self, acknowledgement):
+        recognize(acknowledgement)
+
+    def cluster(self, embeddings):
+        return np.argmax(embeddings, axis=1)
+
+    def fit_topics(self, abstracts):
+        self.fitted = list(abstracts)
+
+    def topics(self, abstracts):
+        return ["models, learning"] * len(abstracts)
+
+
+class SevenModels(FakeModels):
+    # Puts every sampled paper in cluster 7, so the papers outside the sample can only take it from the centroids
+    def cluster(self, embeddings):
+        return np.full(len(embeddings), 7)
+
+
+def linked_space(papers):
+    """
+    Resolves and links the papers as PaperSet does, with one object per author, affiliation and journal holding all
+    the relations of the entity.
+    """
+    _, papers, _, _ = resolve_papers(copy.deepcopy(papers))
+    authors, affiliations, journals = {}, {}, {}
+
+    def link_affiliation(affiliation):
+        linked = affiliations.setdefault(affiliation.name, affiliation)
+        if linked is not affiliation:
+            linked.acknowledged_by.extend(affiliation.acknowledged_by)
+        return linked
+
+    def link_author(author, paper=None):
+        linked = authors.setdefault((author.forename, author.surname), author)
+        if linked is not author:
+            linked.ackowledged_by.extend(author.ackowledged_by)
+        if paper is not None and all(written is not paper for written in linked.writes):
+            linked.writes.append(paper)
+        linked.affiliation = link_affiliation(linked.affiliation)
+        return linked
+
+    for paper in papers.values():
+        paper.authors = [link_author(author, paper) for author in paper.authors or []]
+        if paper.journal:
+            paper.journal = journals.setdefault(paper.journal.name, paper.journal)
+            if all(published is not paper for published in paper.journal.publishes):
+                paper.journal.publishes.append(paper)
+    for paper in papers.values():
+        if paper.physical:
+            acknowledgement = paper.acknowledgements
+            acknowledgement.acknowledges_people = [link_author(person)
+                                                   for person in acknowledgement.acknowledges_people]
+            acknowledgement.acknowledges_org = [link_affiliation(org) for org in acknowledgement.acknowledges_org]
+    analyze_networks(papers)
+    return papers
+
+
+def pipeline_records(papers):
+    resolution = PaperResolution([paper_header(paper) for paper in papers])
+    records = prune_records(reduce_records(pair for paper in papers if paper.filename in resolution.kept
+                                           for pair in paper_contributions(paper, resolution)))
+    return resolution, {key: attach_metrics(key, record, resolution) for key, record in records.items()}
+
+
+class TestSparkPipeline(unittest.TestCase):
+    def test_resolution(self):
+        resolution = PaperResolution([paper_header(paper) for paper in corpus()])
+        self.assertEqual(resolution.kept, {"a.xml", "b.xml"})
+        self.assertEqual(resolution.duplicates, ["c.xml"])
+        self.assertEqual(resolution.targets[("a.xml", 0)], "paper b")
+        self.assertEqual(resolution.targets[("b.xml", 1)], "paper a")
+        self.assertEqual(resolution.targets[("b.xml", 0)], "programming the univac")
+        self.assertEqual(resolution.defining, {("a.xml", 1)})
+        self.assertEqual(resolution.paper_metrics[("paper", "programming the univac")]["citation_count"], 2)
+        self.assertEqual(resolution.author_metrics[("author", "alan", "turing")]["coauthor_count"], 1)
+
+    def test_triples_match_single_process_graph(self):
+        papers = corpus()
+        papers[0].versions = [{"filename": "a.xml", "title": "paper a", "identifiers": {"md5": "A1"}},
+                              {"filename": "a-preprint.xml", "title": "a preprint", "identifiers": {"arxiv": "1"}}]
+        _, records = pipeline_records(papers)
+        expected = {triple_nt(*triple)[:-1] for triple in RDFParser(
+            type("PaperSpace", (), {"papers": linked_space(papers)}), hashed_iris=True).g}
+        self.assertEqual(set(record_triples(records.items())), expected)
+
+    def test_rows_match_parquet_export(self):
+        papers = corpus()
+        papers[0].versions = [{"filename": "a.xml", "title": "paper a", "identifiers": {"md5": "A1"}},
+                              {"filename": "a-preprint.xml", "title": "a preprint", "identifiers": {"arxiv": "1"}}]
+        _, records = pipeline_records(papers)
+        rows = {}
+        for name, row in record_rows(records.items()):
+            rows.setdefault(name, set()).add(tuple(sorted((column, str(value)) for column, value in row.items())))
+        space = type("PaperSpace", (), {"papers": linked_space(papers), "embeddings": None})
+        for name, table in TableBuilder(space).build().items():
+            expected = {tuple(sorted((column, str(value)) for column, value in row.items()))
+                        for row in table.to_pylist()}
+            self.assertEqual(rows.get(name, set()), expected, name)
+
+    def test_merge_is_order_independent(self):
+        papers = corpus()
+        resolution = PaperResolution([paper_header(paper) for paper in papers])
+        pairs = [pair for paper in papers if paper.filename in resolution.kept
+                 for pair in paper_contributions(paper, resolution)]
+        hopper = [record for key, record in pairs if key == ("author", "grace", "hopper")]
+        self.assertEqual(len(hopper), 2)
+        merged = merge_records(*hopper)
+        self.assertEqual(merged, merge_records(*reversed(hopper)))
+        self.assertEqual(merged["writes"], {"programming the univac"})
+        self.assertEqual(merged["acknowledged_by"], {"paper a"})
+        self.assertTrue(merged["enrich"])
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyspark") and (shutil.which("java") or os.environ.get("JAVA_HOME")),
+                     "pyspark and a Java runtime are required")
+class TestSparkPipelineRun(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from pyspark.sql import SparkSession
+        # The Python workers import the sources and the fake models by name, as the tests do
+        tests = os.path.dirname(os.path.abspath(__file__))
+        path = os.pathsep.join([os.path.join(os.path.dirname(tests), "src"), tests])
+        cls.spark = (SparkSession.builder.master("local[2]").appName("test-spark-pipeline")
+                     .config("spark.executorEnv.PYTHONPATH", path).config("spark.pyspark.python", sys.executable)
+                     .config("spark.ui.enabled", "false").getOrCreate())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.spark.stop()
+
+    def run_pipeline(self, models, sample_size):
+        with tempfile.TemporaryDirectory() as folder:
+            grobid = os.path.join(folder, "grobid")
+            os.makedirs(grobid)
+            for path, content in tei_files():
+                with open(os.path.join(grobid, os.path.basename(path)), "wb") as f:
+                    f.write(content)
+            kg_output = os.path.join(folder, "kg.nt")
+            pipeline = SparkPipeline(self.spark, res_path=folder, partitions=2, enrich=False,
+                                     sample_size=sample_size, models=models)
+            report = pipeline.run(grobid, kg_output)
+            with open(kg_output, encoding="utf-8") as f:
+                lines = set(f)
+        return report, lines
+
+    def test_triples_match_single_process_graph(self):
+        expected = {triple_nt(*triple) for triple in RDFParser(
+            type("PaperSpace", (), {"papers": linked_space(corpus())}), hashed_iris=True).g}
+        models = FakeModels()
+        report, lines = self.run_pipeline(models, sample_size=10)
+        self.assertEqual(lines, expected)
+        self.assertEqual((report["papers"], report["duplicates"]), (2, 1))
+        self.assertEqual(sorted(models.fitted), ["about paper a.", "about paper b."])
+
+    def test_unsampled_papers_take_the_nearest_cluster(self):
+        models = SevenModels()
+        _, lines = self.run_pipeline(models, sample_size=1)
+        self.assertEqual(len(models.fitted), 1)
+        clusters = [line for line in lines if "<http://schema.org/cluster>" in line and '"None"' not in line]
+        self.assertEqual(len(clusters), 2)
+        self.assertTrue(all('"7"' in line for line in clusters), clusters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from rdflib import Literal
+
+from rdfparser import RDFParser
+from sparql_queries import QueryLibrary, load_queries
+from test_rdfparser import citation_chain
+
+
+class TestQueryLibrary(unittest.TestCase):
+    def setUp(self):
+        self.kg = RDFParser(citation_chain(10))
+        self.library = QueryLibrary(graph=self.kg.g, cache_size=2)
+
+    def test_queries_file_is_named_and_parameterized(self):
+        queries = load_queries()
+        self.assertIn("paper_titles", queries)
+        self.assertEqual(queries["acknowledgements_of_author"].params,
+                         {"forename": Literal("S"), "surname": Literal("Vasquez")})
+        self.assertEqual(queries["papers_by_cluster_and_topic"].params["cluster"], Literal(1))
+
+    def test_run_with_bindings(self):
+        self.assertEqual(len(self.library.run("paper_titles")), 10)
+        self.assertEqual(self.library.run("authors_of_paper", title="paper 3"),
+                         [(Literal("Ada"), Literal("Lovelace"))])
+        self.assertEqual(self.library.run("authors_of_paper"), [])
+        with self.assertRaises(ValueError):
+            self.library.run("authors_of_paper", author="Ada")
+
+    def test_endpoint_text_matches_prepared_query(self):
+        query = self.library.queries["authors_of_paper"]
+        bindings = query.bindings(title="paper 'one\" 1")
+        self.kg.g.add((self.kg.instances["paper1"], self.kg.schema["title"], bindings["title"]))
+        rows = [tuple(row) for row in self.kg.g.query(query.with_values(bindings))]
+        self.assertEqual(rows, [(Literal("Ada"), Literal("Lovelace"))])
+        self.assertEqual(rows, self.library.execute(query, bindings))
+
+    def test_cache_hits_evictions_and_invalidation(self):
+        first = self.library.run("authors_of_paper", title="paper 3")
+        self.assertIs(self.library.run("authors_of_paper", title="paper 3"), first)
+        self.assertEqual((self.library.hits, self.library.misses), (1, 1))
+        self.library.run("authors_of_paper", title="paper 4")
+        self.library.run("authors_of_paper", title="paper 5")
+        self.assertEqual(len(self.library.cache), 2)
+        self.assertIsNot(self.library.run("authors_of_paper", title="paper 3"), first)
+        self.kg.g.add((self.kg.instances["new"], self.kg.schema["title"], Literal("new")))
+        self.assertEqual(len(self.library.cache), 0)
+        self.assertEqual(len(self.library.run("paper_titles")), 10)
+
+    def test_benchmark_reports_percentiles(self):
+        report = self.library.benchmark(repeats=3, cached=True)
+        self.assertEqual(set(report), set(self.library.queries))
+        for stats in report.values():
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+    def test_custom_query_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "queries.txt")
+            with open(path, "w") as f:
+                f.write("#" * 20 + "\nSELECT * WHERE { ?s ?p ?o }\n" + "#" * 20 +
+                        "\n# name: titled\n# param: title\nPREFIX schema: <http://schema.org/>\n"
+                        "SELECT ?paper WHERE { ?paper schema:title ?title }\n")
+            library = QueryLibrary(graph=self.kg.g, path=path)
+            self.assertEqual(list(library.queries), ["titled"])
+            self.assertEqual(len(library.run("titled")), 10)
+            self.assertEqual(library.run("titled", title="paper 2"), [(self.kg.instances["paper2"],)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from rdf_writer import triple_nt
+from rdfparser import RDFParser
+from streaming_paper_space import StreamingPaperSet
+from test_spark_pipeline import FakeModels, corpus, linked_space
+
+
+class TestStreamingPaperSet(unittest.TestCase):
+    def test_triples_match_single_process_graph(self):
+        expected = {triple_nt(*triple) for triple in RDFParser(
+            type("PaperSpace", (), {"papers": linked_space(corpus())}), hashed_iris=True).g}
+        models = FakeModels()
+        with tempfile.TemporaryDirectory() as folder:
+            space = StreamingPaperSet(corpus(), os.path.join(folder, "spill"), window_size=2, buckets=3,
+                                      enrich=False, models=models)
+            output = os.path.join(folder, "kg.nt")
+            report = space.write_ntriples(output, run_size=10)
+            with open(output, encoding="utf-8") as f:
+                lines = f.readlines()
+            space.close()
+            self.assertFalse(os.path.exists(os.path.join(folder, "spill")))
+        self.assertEqual(set(lines), expected)
+        self.assertEqual(lines, sorted(lines))
+        self.assertEqual((report["papers"], report["duplicates"], report["windows"]), (2, 1, 2))
+        self.assertEqual(models.windows, [2, 1])
+        self.assertEqual(len(models.fitted), 2)
+
+    def test_unsampled_papers_take_the_nearest_cluster(self):
+        models = FakeModels()
+        models.cluster = lambda embeddings: np.full(len(embeddings), 7)
+        with tempfile.TemporaryDirectory() as folder:
+            space = StreamingPaperSet(corpus(), folder, sample_size=1, enrich=False, models=models)
+            clusters = {record["title"]: record["cluster"] for _, record in space.records()
+                        if record["kind"] == "paper" and record["physical"]}
+        self.assertEqual(clusters, {"paper a": 7, "paper b": 7})
+        self.assertEqual(len(models.fitted), 1)
+
+    def test_papers_are_pulled_one_window_at_a_time(self):
+        pulled = []
+
+        def papers():
+            for paper in corpus():
+                pulled.append(paper.filename)
+                yield paper
+
+        class CountingModels(FakeModels):
+            def encode(self, abstracts):
+                self.windows.append(len(pulled))
+                return super().encode(abstracts)
+
+        models = CountingModels()
+        with tempfile.TemporaryDirectory() as folder:
+            space = StreamingPaperSet(papers(), folder, window_size=1, enrich=False, models=models)
+            self.assertEqual(models.windows[::2], [1, 2, 3])
+            self.assertEqual(sorted(name for name in os.listdir(folder) if name.endswith(".npy")),
+                             ["window-00000.npy", "window-00001.npy", "window-00002.npy"])
+            papers = {record["title"]: record for _, record in space.records() if record["kind"] == "paper"}
+            self.assertEqual((papers["paper a"]["cluster"], papers["paper b"]["cluster"]), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
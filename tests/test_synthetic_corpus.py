@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from ontology_classes import Paper
+from paper_index import resolve_papers
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+    def setUp(self):
+        self.spec = CorpusSpec(papers=60, references_per_paper=(5, 15), duplicates=0.05)
+        self.documents = list(SyntheticCorpus(self.spec).documents())
+
+    def test_deterministic(self):
+        self.assertEqual(self.documents, list(SyntheticCorpus(self.spec).documents()))
+        self.assertNotEqual(self.documents, list(SyntheticCorpus(CorpusSpec(papers=60, seed=1)).documents()))
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertEqual(SyntheticCorpus(self.spec).write(folder), 63)
+            self.assertEqual(len(os.listdir(folder)), 63)
+
+    def test_parses_as_grobid_output(self):
+        papers = [Paper(tree=ET.ElementTree(ET.fromstring(content)), filename=filename)
+                  for filename, content in self.documents]
+        first = papers[0]
+        self.assertEqual(first.title, SyntheticCorpus(self.spec).titles[0].lower())
+        self.assertTrue(first.abstract and first.keywords and first.references)
+        self.assertTrue(all(author.affiliation.name != "unknown" for author in first.authors))
+        self.assertEqual(set(first.identifiers), {"md5", "doi"})
+        self.assertTrue(any(paper.acknowledgements.text for paper in papers))
+
+        _, resolved, duplicates, _ = resolve_papers(papers)
+        self.assertEqual(len(duplicates), 3)
+        physical = [paper for paper in resolved.values() if paper.physical]
+        self.assertEqual(len(physical), 60)
+        internal = [citation for paper in physical for citation in paper.references if citation.cites.physical]
+        self.assertGreater(len(internal), 0)
+        self.assertTrue(any(len(paper.cited_by) > 1 for paper in resolved.values() if not paper.physical))
+
+
+if __name__ == '__main__':
+    unittest.main()
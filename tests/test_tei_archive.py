@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+
+from fake_services import FakeGrobid, fake_pdf
+from processor import PaperProcessor
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+from tei_archive import TEIArchive
+
+
+def zstandard_installed():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TestTEIArchive(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "kg.teipack")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_documents_are_read_by_key_and_in_order(self):
+        with TEIArchive(self.path, compression="gzip") as archive:
+            archive.add("a.xml", "<TEI>a</TEI>")
+            archive.add("b.xml", b"<TEI>b</TEI>")
+            archive.add("a.xml", "<TEI>a, again</TEI>")
+            self.assertEqual(archive.get("a.xml"), b"<TEI>a, again</TEI>")
+            self.assertEqual(list(archive.items()), [("b.xml", b"<TEI>b</TEI>"), ("a.xml", b"<TEI>a, again</TEI>")])
+        with TEIArchive(self.path) as archive:
+            self.assertEqual((len(archive), "b.xml" in archive), (2, True))
+            self.assertEqual(archive.get("b.xml"), b"<TEI>b</TEI>")
+
+    def test_unindexed_and_truncated_records_are_recovered(self):
+        with TEIArchive(self.path, compression="gzip") as archive:
+            archive.add("a.xml", "<TEI>a</TEI>")
+            archive.add("b.xml", "<TEI>b</TEI>")
+            archive.add("c.xml", "<TEI>c</TEI>")
+        with open(self.path + ".index") as f:
+            lines = f.readlines()
+        with open(self.path + ".index", "w") as f:
+            f.writelines(lines[:1])
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+        with self.assertLogs(level="WARNING"), TEIArchive(self.path) as archive:
+            self.assertEqual(sorted(archive.keys()), ["a.xml", "b.xml"])
+            archive.add("c.xml", "<TEI>c</TEI>")
+        with TEIArchive(self.path) as archive:
+            self.assertEqual([key for key, _ in archive.items()], ["a.xml", "b.xml", "c.xml"])
+
+    @unittest.skipUnless(zstandard_installed(), "zstandard is not installed")
+    def test_zstd_and_gzip_documents_can_be_mixed(self):
+        with TEIArchive(self.path, compression="gzip") as archive:
+            archive.add("a.xml", "<TEI>a</TEI>")
+        with TEIArchive(self.path, compression="zstd") as archive:
+            archive.add("b.xml", "<TEI>b</TEI>")
+            self.assertEqual([content for _, content in archive.items()], [b"<TEI>a</TEI>", b"<TEI>b</TEI>"])
+
+    def test_folders_are_imported_and_exported(self):
+        loose, exported = os.path.join(self.folder.name, "loose"), os.path.join(self.folder.name, "exported")
+        os.makedirs(loose)
+        for name in ("a.xml", "b.xml", "notes.txt"):
+            with open(os.path.join(loose, name), "w") as f:
+                f.write(f"<TEI>{name}</TEI>")
+        with TEIArchive(self.path) as archive:
+            self.assertEqual(archive.import_folder(loose), 2)
+            self.assertEqual(archive.import_folder(loose), 0)
+            self.assertEqual(archive.export_folder(exported), 2)
+        self.assertEqual(sorted(os.listdir(exported)), ["a.xml", "b.xml"])
+        with open(os.path.join(exported, "b.xml")) as f:
+            self.assertEqual(f.read(), "<TEI>b.xml</TEI>")
+
+
+class TestProcessorArchive(unittest.TestCase):
+    def test_papers_are_the_same_from_the_archive(self):
+        with tempfile.TemporaryDirectory() as folder, \
+                FakeGrobid(corpus=SyntheticCorpus(CorpusSpec(papers=4, seed=3))) as grobid:
+            raw, output = os.path.join(folder, "raw/"), os.path.join(folder, "grobid/")
+            os.makedirs(raw)
+            os.makedirs(output)
+            for index in range(4):
+                with open(os.path.join(raw, f"paper-{index}.pdf"), "wb") as f:
+                    f.write(fake_pdf(index))
+            host, port = grobid.server.server_address[:2]
+            loose = PaperProcessor(output, grobid_port=port, grobid_host=host)
+            expected = sorted((paper.title, len(paper.references)) for paper in loose.process_folder(raw))
+            with TEIArchive(os.path.join(folder, "kg.teipack")) as archive:
+                processor = PaperProcessor(os.path.join(folder, "unused/"), grobid_port=port, grobid_host=host,
+                                           archive=archive)
+                processor.process_folder(raw)
+                processor.process(raw + "paper-0.pdf", header_only=True)
+                self.assertEqual(processor.xml_names(), loose.xml_names())
+                papers = processor.process_folder_from_xml(pdf_path=raw)
+            self.assertFalse(os.path.exists(os.path.join(folder, "unused/")))
+        self.assertEqual(sorted((paper.title, len(paper.references)) for paper in papers), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from title_index import TitleIndex, extract_year, normalize_title
+
+
+class TestTitleIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TitleIndex(threshold=0.8)
+        self.index.add("pixelcnn", "Conditional image generation with PixelCNN decoders", year=2016,
+                       first_author="Oord")
+        self.index.add("wavenet", "WaveNet: A generative model for raw audio", year=2016)
+
+    def test_normalize_title(self):
+        self.assertEqual(normalize_title("  RNADE: The real-valued  neural-autoregressive!"),
+                         "rnade the real valued neural autoregressive")
+
+    def test_extract_year(self):
+        self.assertEqual(extract_year("2013a"), 2013)
+        self.assertEqual(extract_year("24 Apr 2016"), 2016)
+        self.assertIsNone(extract_year(None))
+
+    def test_exact_title_matches(self):
+        self.assertEqual(self.index.query("conditional image generation with pixelcnn decoders"), "pixelcnn")
+
+    def test_near_duplicate_title_matches(self):
+        self.assertEqual(self.index.query("Conditional image generation with pixel cnn decoders."), "pixelcnn")
+
+    def test_different_title_does_not_match(self):
+        self.assertIsNone(self.index.query("Adam: a method for stochastic optimization"))
+
+    def test_contradicting_year_or_author_does_not_match(self):
+        title = "Conditional image generation with PixelCNN decoders"
+        self.assertIsNone(self.index.query(title, year=2019))
+        self.assertIsNone(self.index.query(title, first_author="Smith"))
+        self.assertEqual(self.index.query(title, year=2016, first_author="oord"), "pixelcnn")
+
+
+if __name__ == '__main__':
+    unittest.main()
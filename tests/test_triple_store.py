@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from rdflib import RDF, Literal, URIRef
+from rdflib.store import TripleAddedEvent, TripleRemovedEvent
+
+from rdfparser import RDFParser
+from test_rdfparser import citation_chain
+from triple_store import open_graph
+
+
+class TestSQLiteStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "kg.sqlite")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_parser_loads_store_and_reopens(self):
+        paper_space = citation_chain(30)
+        paper_space.papers["paper 0"].abstract = 'line one\nline "two"'
+        expected = set(RDFParser(paper_space).g)
+        graph = open_graph(self.path)
+        with graph.store.bulk_load():
+            kg = RDFParser(paper_space, graph=graph, batch_size=7)
+        self.assertEqual(len(graph), len(expected))
+        graph.close()
+
+        graph = open_graph(self.path, create=False)
+        self.assertEqual(set(graph), expected)
+        paper = URIRef(kg.instances["paper0"])
+        self.assertEqual(graph.value(paper, kg.schema["abstract"]), Literal('line one\nline "two"'))
+        self.assertEqual(len(list(graph.triples((None, RDF.type, kg.schema["citation"])))), 29)
+        rows = list(graph.query("""
+            PREFIX schema: <http://schema.org/>
+            SELECT ?cited WHERE { ?paper schema:title "paper 0" .
+                                  ?citation schema:source ?paper ; schema:cites ?cited }"""))
+        self.assertEqual(rows, [(URIRef(kg.instances["paper1"]),)])
+        graph.close()
+
+    def test_open_missing_file_without_create(self):
+        with self.assertRaises(FileNotFoundError):
+            open_graph(self.path, create=False)
+
+    def test_add_remove_and_events(self):
+        graph = open_graph(self.path)
+        events = []
+        graph.store.dispatcher.subscribe(TripleAddedEvent, events.append)
+        graph.store.dispatcher.subscribe(TripleRemovedEvent, events.append)
+        s, p = URIRef("http://instances.com/a"), URIRef("http://schema.org/name")
+        graph.add((s, p, Literal("a")))
+        graph.add((s, p, Literal("a")))
+        graph.add((s, p, Literal(1)))
+        self.assertEqual(len(graph), 2)
+        graph.remove((s, p, Literal("a")))
+        self.assertEqual(list(graph.objects(s, p)), [Literal(1)])
+        graph.remove((URIRef("http://instances.com/unknown"), None, None))
+        self.assertEqual(len(graph), 1)
+        self.assertEqual([type(event) for event in events],
+                         [TripleAddedEvent, TripleAddedEvent, TripleAddedEvent, TripleRemovedEvent])
+        graph.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import requests
+
+from fake_services import FakeGrobid, fake_pdf
+from kg_delta import apply_to_ntriples
+from ontology_classes import Author, Citation, Paper
+from rdf_writer import triple_nt
+from processor import PaperProcessor
+from rdfparser import RDFParser
+from synthetic_corpus import CorpusSpec, SyntheticCorpus
+from test_rdfparser import citation_chain
+from test_service import ResidentPaperSpace
+from watcher import DeltaParser, FolderWatcher, IncrementalIngestor
+
+
+def touch(folder, name, content=b"%PDF-1.4\n"):
+    with open(os.path.join(folder, name), "wb") as f:
+        f.write(content)
+
+
+class TestFolderWatcher(unittest.TestCase):
+    def test_debounces_arrivals_into_batches(self):
+        for mode in ("poll", "inotify"):
+            with self.subTest(mode=mode), tempfile.TemporaryDirectory() as folder:
+                touch(folder, "old.pdf")
+                touch(folder, "new.pdf")
+                watcher = FolderWatcher(folder, seen={"old.pdf"}, debounce=0.2, max_batch=2, poll_interval=0.05,
+                                        mode=mode)
+                batches = watcher.batches()
+                self.assertEqual([os.path.basename(path) for path, _ in next(batches)], ["new.pdf"])
+                for name in ("a.pdf", "b.pdf", "c.pdf", "notes.txt"):
+                    touch(folder, name)
+                second, third = next(batches), next(batches)
+                self.assertEqual((len(second), len(third)), (2, 1))
+                self.assertEqual({os.path.basename(path) for path, _ in second + third}, {"a.pdf", "b.pdf", "c.pdf"})
+                self.assertLessEqual(max(arrived for _, arrived in second), min(arrived for _, arrived in third))
+                watcher.stop()
+                self.assertEqual(list(batches), [])
+
+
+class TestDeltaParser(unittest.TestCase):
+    def test_delta_matches_full_build(self):
+        paper_space = citation_chain(3)
+        kg = RDFParser(paper_space)
+        before = {triple_nt(*triple) for triple in kg.g}
+
+        ada, cited = paper_space.papers["paper 0"].authors[0], paper_space.papers["paper 0"]
+        new = Paper(physical=False, title="paper 3", authors=[ada, Author("Grace", "Hopper")])
+        new.physical, new.cited_by = True, []
+        for author in new.authors:
+            author.writes.append(new)
+        citation = Citation(source=new, title="paper 0")
+        citation.cites = cited
+        cited.cited_by.append(citation)
+        unknown = Citation(source=new, title="paper x", authors=[])
+        new.references = [citation, unknown]
+        paper_space.papers.update({"paper 3": new, "paper x": unknown.cites})
+        update = {"papers": [new], "citation_papers": [unknown.cites], "duplicates": [], "superseded": [],
+                  "touched": [ada, cited]}
+        delta = DeltaParser(update, set(kg.defined_instances), kg.iris).delta
+
+        expected = {triple_nt(*triple) for triple in RDFParser(paper_space).g}
+        self.assertFalse(delta.added & before)
+        self.assertEqual(before | delta.added, expected)
+        self.assertEqual((delta.removed, delta.added_papers), (set(), ["paper 3"]))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "kg.nt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(sorted(before))
+            apply_to_ntriples(path, delta)
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+        self.assertEqual(lines[:len(before)], sorted(before))
+        self.assertEqual(set(lines), expected)
+
+    def test_superseded_citation_paper_is_replaced(self):
+        paper_space = citation_chain(2)
+        placeholder = paper_space.papers["paper 1"]
+        kg = RDFParser(paper_space)
+        before = {triple_nt(*triple) for triple in kg.g}
+
+        physical = Paper(physical=False, title="paper 1", authors=[])
+        physical.physical, physical.cited_by, physical.abstract = True, [], "now with an abstract"
+        for citation in placeholder.cited_by:
+            citation.cites = physical
+            physical.cited_by.append(citation)
+        placeholder.authors[0].writes.remove(placeholder)
+        paper_space.papers["paper 1"] = physical
+        update = {"papers": [physical], "citation_papers": [], "duplicates": [],
+                  "superseded": [(placeholder, physical)], "touched": list(physical.cited_by)}
+        delta = DeltaParser(update, set(kg.defined_instances), kg.iris).delta
+
+        expected = {triple_nt(*triple) for triple in RDFParser(paper_space).g}
+        self.assertEqual((before - delta.removed) | delta.added, expected)
+        self.assertEqual(delta.changed_papers, ["paper 1"])
+
+
+class TestIncrementalIngestor(unittest.TestCase):
+    def ingest(self, grobid, folder, tiered):
+        host, port = grobid.server.server_address[:2]
+        output, raw = os.path.join(folder, "grobid") + "/", os.path.join(folder, "raw")
+        os.makedirs(output)
+        os.makedirs(raw)
+        batch = []
+        for index in range(3):
+            path = os.path.join(raw, f"paper-{index}.pdf")
+            with open(path, "wb") as f:
+                f.write(fake_pdf(index))
+            batch.append((path, time.time()))
+        paper_space = ResidentPaperSpace()
+        kg_output = os.path.join(folder, "kg.nt")
+        open(kg_output, "w").close()
+        ingestor = IncrementalIngestor(PaperProcessor(output, grobid_port=port, grobid_host=host), paper_space,
+                                       RDFParser(paper_space), kg_output, tiered=tiered)
+        report = ingestor.ingest(batch)
+        with open(kg_output, encoding="utf-8") as f:
+            header_lines = set(f)
+        ingestor.close()
+        self.assertEqual(ingestor.pending, set())
+        with open(kg_output, encoding="utf-8") as f:
+            lines = set(f)
+        return report, header_lines, lines, ingestor
+
+    def test_tiered_ingestion_ends_with_the_full_text_graph(self):
+        corpus = SyntheticCorpus(CorpusSpec(papers=3, seed=3))
+        with FakeGrobid(corpus=corpus) as grobid, tempfile.TemporaryDirectory() as full, \
+                tempfile.TemporaryDirectory() as tiered:
+            _, _, expected, _ = self.ingest(grobid, full, tiered=False)
+            report, header_lines, lines, ingestor = self.ingest(grobid, tiered, tiered=True)
+            self.assertEqual(sorted(os.listdir(os.path.join(tiered, "grobid", "headers"))),
+                             ["paper-0.xml", "paper-1.xml", "paper-2.xml"])
+            self.assertEqual(ingestor.processed(), {"paper-0.pdf", "paper-1.pdf", "paper-2.pdf"})
+        self.assertEqual((report["papers"], report["deferred"]), (3, 3))
+        self.assertLess(len(header_lines), len(expected))
+        self.assertEqual(lines, expected)
+
+    def test_failed_files_are_retried_and_the_daemon_keeps_ingesting(self):
+        class FlakyProcessor(PaperProcessor):
+            failures = 1
+
+            def process(self, paper, header_only=False):
+                if paper.endswith("paper-0.pdf") and FlakyProcessor.failures:
+                    FlakyProcessor.failures -= 1
+                    raise requests.exceptions.ConnectionError("GROBID is restarting")
+                return super().process(paper, header_only=header_only)
+
+        corpus = SyntheticCorpus(CorpusSpec(papers=2, seed=3))
+        with FakeGrobid(corpus=corpus) as grobid, tempfile.TemporaryDirectory() as folder:
+            host, port = grobid.server.server_address[:2]
+            output, raw = os.path.join(folder, "grobid") + "/", os.path.join(folder, "raw")
+            os.makedirs(output)
+            os.makedirs(raw)
+            paper_space = ResidentPaperSpace()
+            kg_output = os.path.join(folder, "kg.nt")
+            open(kg_output, "w").close()
+            ingestor = IncrementalIngestor(FlakyProcessor(output, grobid_port=port, grobid_host=host), paper_space,
+                                           RDFParser(paper_space), kg_output)
+            watcher = FolderWatcher(raw, debounce=0.05, poll_interval=0.02, mode="poll", retry_after=0.05)
+            daemon = threading.Thread(target=ingestor.run, args=(watcher,))
+            daemon.start()
+            touch(raw, "paper-0.pdf", fake_pdf(0))
+            deadline = time.time() + 10
+            while len(paper_space.get_xml_papers()) < 1 and time.time() < deadline:
+                time.sleep(0.02)
+            touch(raw, "paper-1.pdf", fake_pdf(1))
+            while len(paper_space.get_xml_papers()) < 2 and time.time() < deadline:
+                time.sleep(0.02)
+            watcher.stop()
+            daemon.join(5)
+        self.assertFalse(daemon.is_alive())
+        self.assertEqual(FlakyProcessor.failures, 0)
+        self.assertEqual(sorted(paper.filename for paper in paper_space.get_xml_papers().values()),
+                         ["paper-0.xml", "paper-1.xml"])
+
+
+if __name__ == '__main__':
+    unittest.main()